@@ -1,41 +1,97 @@
 """Main Flask application for the CRM - Team Kryptonite."""
 # pylint: disable=no-member,broad-exception-caught,too-many-return-statements
+import base64
+import binascii
+import csv
+import gzip
+import json
 import logging
-import sys
 from datetime import datetime, timedelta, timezone
 import secrets
 import string
-from functools import lru_cache
+import threading
+from functools import lru_cache, wraps
 import os
+import random
+import re
 import time  # Added for Epic 9 Monitoring
-
-import firebase_admin
-from firebase_admin import credentials, firestore
-from flask import Flask, request, jsonify, render_template, g  # Added 'g' for monitoring context
+import uuid
+
+import click
+try:
+    import firebase_admin
+    from firebase_admin import credentials, firestore
+except ImportError:  # local storage backends do not need the Firebase SDK
+    firebase_admin = credentials = firestore = None
+from flask import Flask, Response, request, jsonify, render_template, g  # Added 'g' for monitoring context
 from flask_jwt_extended import (
-    JWTManager, create_access_token, jwt_required, 
-    get_jwt_identity, set_access_cookies, unset_jwt_cookies, verify_jwt_in_request
+    JWTManager, create_access_token, set_access_cookies, unset_jwt_cookies, decode_token
 )
-from flask import make_response, redirect, url_for #for epic 1 
+from flask import make_response, redirect, url_for, has_request_context #for epic 1 
 from flask import g
-from flask_jwt_extended import get_jwt  # <--- Make sure this is imported!
+
+from bulk_import import FORMATS as IMPORT_FORMATS, detect_format, iter_records, open_text_stream, run_import
+from datastore_metrics import OperationRecorder, instrument
+from entity_cache import EntityCache
+import log_pipeline
+from log_report import LogAnalyzer, RouteNormalizer, format_report, rotated_files
+from log_store import LogStore, LogStoreHandler, decode_cursor as decode_log_cursor, import_text_log
+import log_tail
+import server_timing
+from memory_snapshots import GROUP_BY as MEMORY_GROUP_BY, SnapshotRegistry
+from request_metrics import CONTENT_TYPE as METRICS_CONTENT_TYPE, MetricsRegistry
+from request_profiler import CaptureStore, StackSampler, folded, parse_route_thresholds, sample_threads
+import storage
+from ticket_metrics import TICKET_FIELDS, TicketArrays, bucketed_metrics
+from timeseries import ALL_ROUTES, TimeSeriesStore
+from token_cache import VerifiedTokenCache
+import tracing
+from unit_of_work import UnitOfWork
 
 # --- Logging Configuration (Updated for Epic 9 UI) ---
-# Create a file handler to store logs so the System Monitor page can read them
-file_handler = logging.FileHandler('crm_app.log')
-file_handler.setFormatter(logging.Formatter('%(asctime)s [%(levelname)s] %(message)s'))
-
-logging.basicConfig(
-    level=logging.INFO,
-    handlers=[
-        logging.StreamHandler(sys.stdout), # Print to terminal
-        file_handler                       # Save to file for UI
-    ]
+# Store logs in a file so the System Monitor page can read them. Records go through
+# a queue and are written by a background thread, so requests never wait on disk.
+# ACCESS_LOG_FILE ("" disables it) gets one JSON record per request. Rotation is off by
+# default: each process rotates on its own, so with several workers (gunicorn -w 4) they
+# would rename the files from under each other; use logrotate (copytruncate) there. A
+# single process can opt in with LOG_MAX_BYTES and/or LOG_ROTATE_WHEN ("midnight",
+# "hourly"), keeping LOG_BACKUP_COUNT gzipped copies.
+LOG_FILE = 'crm_app.log'
+
+# LOG_STORE_PATH ("" disables it): indexed SQLite store shared by all workers, searched
+# by /api/logs?level=...&path=...; records older than LOG_STORE_RETENTION_DAYS are pruned.
+LOG_STORE_PATH = os.environ.get("LOG_STORE_PATH", "crm_logs.sqlite3")
+log_store = LogStore(LOG_STORE_PATH) if LOG_STORE_PATH else None
+
+
+class RequestContextFilter(logging.Filter):
+    """Tags records logged while handling a request with its id, method and path."""
+
+    def filter(self, record):
+        if has_request_context():
+            record.request_id = g.get('request_id')
+            record.http_method = request.method
+            record.http_path = request.path
+        return True
+
+
+log_listener = log_pipeline.configure_logging(
+    LOG_FILE,
+    access_file=os.environ.get("ACCESS_LOG_FILE", "crm_access.log"),
+    max_bytes=int(os.environ.get("LOG_MAX_BYTES", "0")),
+    when=os.environ.get("LOG_ROTATE_WHEN", ""),
+    backup_count=int(os.environ.get("LOG_BACKUP_COUNT", "14")),
+    extra_handlers=[LogStoreHandler(log_store, float(os.environ.get("LOG_STORE_RETENTION_DAYS", "31")) * 86400)]
+    if log_store else [],
+    filters=[RequestContextFilter()],
 )
 logger = logging.getLogger(__name__)
+access_logger = logging.getLogger(log_pipeline.ACCESS_LOGGER)
 
 # Initialize Flask App
 app = Flask(__name__)
+app.json = server_timing.TimedJSONProvider(app)
+server_timing.track_templates(app)
 
 # Configuration for JWT (Secure Sessions)
 app.config["JWT_SECRET_KEY"] = os.environ.get("JWT_SECRET_KEY", "super-secret-key-dev") # nosec
@@ -43,60 +99,390 @@ app.config["JWT_TOKEN_LOCATION"] = ["cookies"]
 app.config["JWT_COOKIE_CSRF_PROTECT"] = False # Disable for simple MVP
 app.config["JWT_ACCESS_COOKIE_NAME"] = "access_token_cookie"
 
+# Verified tokens are remembered (by digest) until they expire, at most this many
+# seconds, so returning sessions skip signature verification (size 0 disables it).
+app.config["AUTH_TOKEN_CACHE_SIZE"] = int(os.environ.get("AUTH_TOKEN_CACHE_SIZE", "10000"))
+app.config["AUTH_TOKEN_CACHE_TTL"] = float(os.environ.get("AUTH_TOKEN_CACHE_TTL", "300"))
+
+# KPI endpoints count/sum on the server. Set to "false" for backends (e.g. older
+# emulators) that do not support aggregation queries.
+app.config["USE_AGGREGATION_QUERIES"] = os.environ.get("USE_AGGREGATION_QUERIES", "true").lower() != "false"
+
+# Read-through cache for single customer/lead/loyalty documents (0 disables it).
+app.config["ENTITY_CACHE_SIZE"] = int(os.environ.get("ENTITY_CACHE_SIZE", "10000"))
+app.config["ENTITY_CACHE_TTL"] = float(os.environ.get("ENTITY_CACHE_TTL", "30"))
+app.config["ENTITY_CACHE_NEGATIVE_TTL"] = float(os.environ.get("ENTITY_CACHE_NEGATIVE_TTL", "5"))
+
+# Upper bound on concurrent batch commits per bulk import request.
+app.config["IMPORT_MAX_WORKERS"] = int(os.environ.get("IMPORT_MAX_WORKERS", "8"))
+
+# Datastore: "firestore" (default) or a local engine from storage.BACKENDS.
+app.config["STORAGE_BACKEND"] = os.environ.get("STORAGE_BACKEND", "firestore").lower()
+app.config["SQLITE_PATH"] = os.environ.get("SQLITE_PATH", "crm.sqlite3")
+
+# Per-request datastore accounting (X-Datastore-Ops header + access log) and the
+# number of identical query/read shapes in one request that is reported as N+1.
+app.config["DATASTORE_METRICS"] = os.environ.get("DATASTORE_METRICS", "true").lower() != "false"
+app.config["N_PLUS_ONE_THRESHOLD"] = int(os.environ.get("N_PLUS_ONE_THRESHOLD", "5"))
+
+# /metrics: with several worker processes, point METRICS_MULTIPROC_DIR at a shared,
+# initially empty directory. Scrapers send "Authorization: Bearer <METRICS_TOKEN>" instead of
+# logging in; without a METRICS_TOKEN, /metrics is only served to logged-in users.
+app.config["METRICS_MULTIPROC_DIR"] = os.environ.get("METRICS_MULTIPROC_DIR") or os.environ.get("PROMETHEUS_MULTIPROC_DIR")
+app.config["METRICS_TOKEN"] = os.environ.get("METRICS_TOKEN")
+
+# /api/logs/stream (Server-Sent Events) holds a worker while open; the stream ends
+# after LOG_STREAM_MAX_SECONDS and the browser reconnects where it left off.
+app.config["LOG_STREAM_MAX_SECONDS"] = float(os.environ.get("LOG_STREAM_MAX_SECONDS", "300"))
+app.config["LOG_STREAM_POLL_SECONDS"] = float(os.environ.get("LOG_STREAM_POLL_SECONDS", "1"))
+
+# Where `flask analyze-logs` and /api/admin/log-report keep their aggregates and how far
+# they have read each log file.
+app.config["LOG_REPORT_STATE"] = os.environ.get("LOG_REPORT_STATE", "crm_log_report.json.gz")
+
+# Fraction of successful, fast requests written to the access logs, per route rule,
+# e.g. "/api/logs=0.1,/metrics=0". Errors and slow requests are always logged.
+app.config["ACCESS_LOG_SAMPLE_RATES"] = log_pipeline.parse_sample_rates(os.environ.get("ACCESS_LOG_SAMPLE_RATES", ""))
+app.config["SLOW_REQUEST_SECONDS"] = float(os.environ.get("SLOW_REQUEST_SECONDS", "1.0"))
+
+# Per-route slow thresholds overriding SLOW_REQUEST_SECONDS, e.g. "/api/sales-kpis=0.5".
+app.config["SLOW_ROUTE_THRESHOLDS"] = parse_route_thresholds(os.environ.get("SLOW_ROUTE_THRESHOLDS", ""))
+
+# Slow-request capture (opt-in): PROFILE_SAMPLE_RATE of the requests run under a stack
+# sampler (one sample every PROFILE_INTERVAL_MS); a profiled request slower than its
+# route's threshold is saved to PROFILE_CAPTURE_DIR, keeping PROFILE_MAX_CAPTURES.
+app.config["PROFILE_SAMPLE_RATE"] = float(os.environ.get("PROFILE_SAMPLE_RATE", "0"))
+app.config["PROFILE_INTERVAL_MS"] = float(os.environ.get("PROFILE_INTERVAL_MS", "5"))
+app.config["PROFILE_CAPTURE_DIR"] = os.environ.get("PROFILE_CAPTURE_DIR", "profiles")
+app.config["PROFILE_MAX_CAPTURES"] = int(os.environ.get("PROFILE_MAX_CAPTURES", "200"))
+
+# Request tracing (opt-in): TRACE_SAMPLE_RATE of the requests are traced (a sampled
+# W3C traceparent header continues the caller's trace). Traces are appended to
+# TRACE_EXPORT_FILE as OTLP/JSON lines ("" to keep them in memory only); the newest
+# TRACE_BUFFER_SIZE of each worker are kept for /api/admin/traces.
+app.config["TRACE_SAMPLE_RATE"] = float(os.environ.get("TRACE_SAMPLE_RATE", "0"))
+app.config["TRACE_EXPORT_FILE"] = os.environ.get("TRACE_EXPORT_FILE", "crm_traces.jsonl")
+app.config["TRACE_BUFFER_SIZE"] = int(os.environ.get("TRACE_BUFFER_SIZE", "200"))
+app.config["TRACE_SERVICE_NAME"] = os.environ.get("TRACE_SERVICE_NAME", "crm-app")
+
+# Server-Timing response header with the auth/db/app/json/tpl breakdown of each request.
+app.config["SERVER_TIMING"] = os.environ.get("SERVER_TIMING", "true").lower() != "false"
+
 jwt = JWTManager(app)
 
-# --- RBAC MIDDLEWARE ---
+# --- Request Metrics (Prometheus) ---
+# Registered before the other hooks so every request is counted, including
+# ones that the auth middleware redirects.
+
+metrics = MetricsRegistry(multiprocess_dir=app.config["METRICS_MULTIPROC_DIR"])
+metrics.describe('crm_http_requests_total', 'counter', 'HTTP requests by route, method and status class.')
+metrics.describe('crm_http_request_duration_seconds', 'histogram', 'HTTP request latency by route and method.')
+metrics.describe('crm_http_requests_in_flight', 'gauge', 'HTTP requests currently being handled.')
+metrics.describe('crm_datastore_operations_total', 'counter', 'Datastore round trips by kind (reads, queries, commits, transactions).')
+metrics.describe('crm_datastore_seconds_total', 'counter', 'Time spent in datastore round trips by kind.')
+metrics.describe('crm_datastore_documents_total', 'counter', 'Datastore documents read and written.')
+metrics.describe('crm_request_datastore_seconds', 'histogram', 'Datastore time per request by route.')
+
+# Latency and throughput per route for the System Monitor charts (this worker only)
+request_series = TimeSeriesStore()
+
 
 @app.before_request
-def load_user_role():
+def start_request_metrics():
+    g.metrics_start = time.perf_counter()
+    metrics.gauge_add('crm_http_requests_in_flight', 1)
+
+
+@app.after_request
+def remember_response_status(response):
+    """Runs after every other after_request hook, so it sees the final status."""
+    g.metrics_status = response.status_code
+    return response
+
+
+@app.after_request
+def add_server_timing(response):
+    """Runs after the logging and unit-of-work hooks, so their time is included."""
+    started = g.get('metrics_start')
+    if started is None or not app.config["SERVER_TIMING"] or request.path.startswith('/static/'):
+        return response
+    phases = g.get('server_timing', {})
+    recorder = g.get('datastore_ops')
+    if recorder:
+        phases = dict(phases, db=recorder.total_seconds)
+    response.headers['Server-Timing'] = server_timing.header_value(time.perf_counter() - started, phases)
+    return response
+
+
+@app.teardown_request
+def finish_request_metrics(exc):
+    started = g.pop('metrics_start', None)
+    if started is None:
+        return
+    duration = time.perf_counter() - started
+    route = request.url_rule.rule if request.url_rule else 'unmatched'
+    status = g.pop('metrics_status', 500)
+
+    metrics.gauge_add('crm_http_requests_in_flight', -1)
+    metrics.inc('crm_http_requests_total', (('route', route), ('method', request.method),
+                                            ('status', f"{status // 100}xx")))
+    metrics.observe('crm_http_request_duration_seconds', duration, (('route', route), ('method', request.method)))
+    request_series.observe(route, duration, error=status >= 500)
+
+    recorder = g.get('datastore_ops')
+    if recorder:
+        summary = recorder.summary()
+        for kind, seconds in summary['seconds'].items():
+            if recorder.calls[kind]:
+                metrics.inc('crm_datastore_operations_total', (('kind', kind),), recorder.calls[kind])
+                metrics.inc('crm_datastore_seconds_total', (('kind', kind),), seconds)
+        metrics.inc('crm_datastore_documents_total', (('direction', 'read'),), summary['reads'])
+        metrics.inc('crm_datastore_documents_total', (('direction', 'write'),), summary['writes'])
+        metrics.observe('crm_request_datastore_seconds', recorder.total_seconds, (('route', route),))
+    metrics.maybe_flush()
+
+
+@app.route('/metrics')
+def metrics_endpoint():
+    """Prometheus scrape endpoint (all worker processes merged)."""
+    token = app.config.get("METRICS_TOKEN")
+    if token and not secrets.compare_digest(request.headers.get('Authorization', ''), f"Bearer {token}"):
+        return jsonify({"error": "Unauthorized"}), 401
+    return app.response_class(metrics.render(), mimetype=None, content_type=METRICS_CONTENT_TYPE)
+
+
+TIMESERIES_MAX_WINDOW = 30 * 86400
+
+
+@app.route('/api/timeseries', methods=['GET'])
+def get_timeseries():
     """
-    Extracts the role from the JWT (if present) and stores it in 'g.role'.
+    Request count, 5xx errors and latency (avg/max; p50/p95/p99 for all routes)
+    per slot for ?route=<rule> (default: all routes) over the last ?window=
+    seconds (default 600). Slots are 1 s up to 10 minutes, 1 min up to a day
+    and 1 h beyond, unless ?step= picks one.
     """
-    # ✅ TEST OVERRIDE: If testing, always be an Admin
-    if app.config.get('TESTING'):
-        g.role = "Admin"
-        return
-
-    g.role = None # Default to None
     try:
-        verify_jwt_in_request(optional=True)
-        claims = get_jwt()
-        if claims:
-            g.role = claims.get("role", "User")
-    except Exception: 
-        pass # nosec
+        window = int(request.args.get('window', 600))
+        step = int(request.args['step']) if 'step' in request.args else None
+    except ValueError:
+        return jsonify({"error": "window and step must be whole seconds"}), 400
+    if not 0 < window <= TIMESERIES_MAX_WINDOW:
+        return jsonify({"error": f"window must be between 1 and {TIMESERIES_MAX_WINDOW} seconds"}), 400
+    if step is not None and step not in [slot for slot, _ in request_series.resolutions]:
+        return jsonify({"error": "step must be one of "
+                                 f"{', '.join(str(slot) for slot, _ in request_series.resolutions)}"}), 400
+
+    route = request.args.get('route', ALL_ROUTES)
+    try:
+        points = request_series.series(route, window, step)
+    except KeyError:
+        return jsonify({"error": "No requests recorded for this route"}), 404
+    return jsonify({
+        "pid": os.getpid(),
+        "route": route,
+        "window": window,
+        "step": step or request_series.resolution_for(window),
+        "routes": request_series.routes(),
+        "points": points,
+    }), 200
 
-@app.context_processor
-def inject_role():
-    """Makes 'current_role' available in ALL HTML templates automatically."""
-    return dict(current_role=g.role)
+# --- Slow-Request Profiling ---
+
+stack_sampler = StackSampler(app.config["PROFILE_INTERVAL_MS"] / 1000)
+
+
+@lru_cache(maxsize=4)
+def _capture_store(directory, max_captures):
+    return CaptureStore(directory, max_captures)
+
+
+def slow_threshold(route):
+    """Seconds after which a request to this route rule counts as slow."""
+    return app.config["SLOW_ROUTE_THRESHOLDS"].get(route, app.config["SLOW_REQUEST_SECONDS"])
 
 
-# Middleware: Protect Pages (Epic 1)
 @app.before_request
-def check_auth():
-    # ✅ TEST OVERRIDE: If testing, skip security check completely
-    if app.config.get('TESTING'):
-        return
+def start_profiling():
+    rate = app.config["PROFILE_SAMPLE_RATE"]
+    if rate > 0 and random.random() < rate:  # nosec - sampling, not security
+        g.profile = stack_sampler.start()
 
-    # List of routes that do NOT require login
-    public_endpoints = ['login_page', 'api_login', 'static', 'reset_password']
-    
-    if request.endpoint in public_endpoints or (request.endpoint and request.endpoint.startswith('static')):
+
+@app.teardown_request
+def finish_profiling(exc):
+    """Saves the profile of a sampled request that exceeded its route's threshold."""
+    profile = g.pop('profile', None)
+    if profile is None:
         return
-    
-    # For all other routes, check for the token
+    stack_sampler.stop(profile)
+    duration = time.perf_counter() - profile.started
+    route = request.url_rule.rule if request.url_rule else 'unmatched'
+    threshold = slow_threshold(route)
+    if duration <= threshold:
+        return
+
+    started_at = time.time() - duration
+    request_id = g.get('request_id') or uuid.uuid4().hex
+    capture = {
+        'id': CaptureStore.capture_id(started_at, request_id),
+        'request_id': request_id,
+        'method': request.method,
+        'path': request.path,
+        'route': route,
+        'status': g.get('metrics_status', 500),
+        'duration': round(duration, 4),
+        'threshold': threshold,
+        'started_at': datetime.fromtimestamp(started_at, timezone.utc).isoformat(),
+        'pid': os.getpid(),
+        'error': repr(exc) if exc else None,
+        'datastore': None,
+        'samples': profile.samples,
+        'interval': profile.interval,
+        'folded': profile.folded(),
+    }
+    recorder = g.get('datastore_ops')
+    if recorder:
+        capture['datastore'] = dict(recorder.summary(), shapes=dict(recorder.shapes))
     try:
-        verify_jwt_in_request()
+        _capture_store(app.config["PROFILE_CAPTURE_DIR"], app.config["PROFILE_MAX_CAPTURES"]).save(capture)
     except Exception:
-        return redirect(url_for('login_page'))
+        logger.exception("Could not save the slow-request capture %s", capture['id'])
+
+# --- Request Tracing ---
+
+trace_exporter = tracing.TraceExporter(app.config["TRACE_EXPORT_FILE"], app.config["TRACE_SERVICE_NAME"],
+                                       app.config["TRACE_BUFFER_SIZE"])
+TRACE_ID_HEADER = 'X-Trace-ID'
+
+
+@app.before_request
+def start_tracing():
+    """Starts the trace of a sampled request; its datastore calls are recorded as spans."""
+    rate = app.config["TRACE_SAMPLE_RATE"]
+    if rate <= 0 or request.path.startswith('/static/'):
+        return
+    parent = tracing.parse_traceparent(request.headers.get('traceparent'))
+    if parent:
+        trace_id, parent_span_id, sampled = parent
+    else:
+        trace_id, parent_span_id, sampled = None, None, random.random() < rate  # nosec - sampling
+    if not sampled:
+        return
+    route = request.url_rule.rule if request.url_rule else 'unmatched'
+    g.trace = tracing.RequestTrace(f"{request.method} {route}", {
+        'http.request.method': request.method,
+        'http.route': route,
+        'url.path': request.path,
+    }, trace_id=trace_id, parent_span_id=parent_span_id)
+
+
+@app.teardown_request
+def finish_tracing(exc):
+    trace = g.pop('trace', None)
+    if trace is None:
+        return
+    spans = trace.finish({'http.response.status_code': g.get('metrics_status', 500),
+                          'crm.request_id': g.get('request_id')}, exc)
+    trace_exporter.export(trace, spans)
+
+# --- RBAC MIDDLEWARE ---
+
+def admin_required(view):
+    """Restricts a route to the Admin role (g.role, set by authenticate)."""
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        if g.get('role') != 'Admin':
+            return jsonify({"error": "Admin role required"}), 403
+        return view(*args, **kwargs)
+    return wrapper
+
+# Routes that do NOT require login
+PUBLIC_ENDPOINTS = frozenset(('login_page', 'api_login', 'static', 'reset_password'))
+# Routes that check a token of their own instead, once it is configured
+TOKEN_ENDPOINTS = {'metrics_endpoint': 'METRICS_TOKEN'}
+# Preflight requests carry no credentials (flask_jwt_extended exempts them too)
+AUTH_EXEMPT_METHODS = frozenset(('OPTIONS',))
+
+token_cache = VerifiedTokenCache(
+    max_entries=app.config["AUTH_TOKEN_CACHE_SIZE"],
+    max_ttl=app.config["AUTH_TOKEN_CACHE_TTL"],
+)
+
+
+def verified_claims():
+    """
+    Claims of the request's access token cookie, or None when it is missing or
+    invalid. The signature is verified once per token; later requests with the
+    same token are answered from token_cache until it expires.
+    """
+    token = request.cookies.get(app.config["JWT_ACCESS_COOKIE_NAME"])
+    if not token:
+        return None
+    claims = token_cache.get(token)
+    if claims is None:
+        try:
+            claims = decode_token(token)
+        except Exception:
+            return None # nosec - an invalid token is treated as no token
+        if claims.get("type") != "access":
+            return None
+        token_cache.put(token, claims)
+    return claims
+
+
+# Middleware: Authentication and roles (Epic 1)
+@app.before_request
+@server_timing.timed('auth')
+def authenticate():
+    """
+    Decodes the JWT once per request: stores the role in 'g.role' and sends
+    visitors without a valid token to the login page, except on public pages.
+    """
+    g.role = None
+    # Static assets need neither the role nor a login
+    if request.endpoint == 'static':
+        return None
+
+    # ✅ TEST OVERRIDE: If testing, always be an Admin and skip the security check
+    if app.config.get('TESTING'):
+        g.role = "Admin"
+        return None
+
+    if request.method in AUTH_EXEMPT_METHODS:
+        return None
+    claims = verified_claims()
+    if claims:
+        g.role = claims.get("role", "User")
+        return None
+    if request.endpoint in PUBLIC_ENDPOINTS or (request.endpoint and request.endpoint.startswith('static')):
+        return None
+    if request.endpoint in TOKEN_ENDPOINTS and app.config.get(TOKEN_ENDPOINTS[request.endpoint]):
+        return None
+    return redirect(url_for('login_page'))
+
+@app.context_processor
+def inject_role():
+    """Makes 'current_role' available in ALL HTML templates automatically."""
+    return dict(current_role=g.get('role'))
+
 
 # --- Middleware: Performance Monitoring (Epic 9) ---
 # This satisfies the "System performance" and "Monitoring" requirements
+REQUEST_ID_HEADER = 'X-Request-ID'
+_REQUEST_ID_PATTERN = re.compile(r'^[A-Za-z0-9._:-]{1,128}$')
+
 @app.before_request
 def start_timer():
-    """Starts the timer before processing the request."""
+    """Starts the timer and assigns the request id (a valid incoming X-Request-ID is kept)."""
     g.start = time.time()
+    incoming = request.headers.get(REQUEST_ID_HEADER, '')
+    g.request_id = incoming if _REQUEST_ID_PATTERN.match(incoming) else uuid.uuid4().hex
+
+def _access_sample_rate(route, status, duration):
+    if status >= 400 or duration > slow_threshold(route):
+        return 1.0
+    return app.config["ACCESS_LOG_SAMPLE_RATES"].get(route, 1.0)
 
 @app.after_request
 def log_request(response):
@@ -111,13 +497,44 @@ def log_request(response):
 
     now = time.time()
     duration = round(now - g.start, 4)
-    
-    # Log every request (Audit Trail)
-    logger.info(f"Request: {request.method} {request.path} | Status: {response.status_code} | Time: {duration}s")
-
-    # Performance Alert: If request takes > 1.0s, log a warning
-    if duration > 1.0:
-        logger.warning(f"PERFORMANCE ALERT: Slow response on {request.path} ({duration}s)")
+    response.headers[REQUEST_ID_HEADER] = g.request_id
+    trace = g.get('trace')
+    if trace is not None:
+        response.headers[TRACE_ID_HEADER] = trace.trace_id
+    recorder = g.get('datastore_ops')
+    if recorder:
+        response.headers[DATASTORE_OPS_HEADER] = recorder.header_value()
+        for shape, count in recorder.repeated_shapes(app.config["N_PLUS_ONE_THRESHOLD"]):
+            logger.warning("N+1 SUSPECT: %s %s issued '%s' %d times", request.method, request.path, shape, count)
+
+    # Log every request (Audit Trail), with its datastore operations when it used the DB;
+    # high-volume routes can be sampled
+    route = request.url_rule.rule if request.url_rule else 'unmatched'
+    sample_rate = _access_sample_rate(route, response.status_code, duration)
+    if sample_rate >= 1.0 or random.random() < sample_rate:  # nosec - sampling, not security
+        # the log store keeps the structured access record instead of this line
+        logger.info("Request: %s %s | Status: %s | Time: %ss%s", request.method, request.path,
+                    response.status_code, duration, f" | {recorder.log_fragment()}" if recorder else "",
+                    extra={'log_store': False})
+        if access_logger.isEnabledFor(logging.INFO):
+            record = {
+                'request_id': g.request_id,
+                'method': request.method,
+                'path': request.path,
+                'route': route,
+                'status': response.status_code,
+                'duration': duration,
+                'sample_rate': sample_rate,
+            }
+            if recorder:
+                record['db'] = recorder.summary()
+            if trace is not None:
+                record['trace_id'] = trace.trace_id
+            access_logger.info("access", extra={'access': record})
+
+    # Performance Alert: If request takes longer than its route's threshold (1s by default), log a warning
+    if duration > slow_threshold(route):
+        logger.warning("PERFORMANCE ALERT: Slow response on %s (%ss)", request.path, duration)
     
     return response
 
@@ -154,11 +571,25 @@ def _init_firestore_client():
 
 
 
+@lru_cache(maxsize=None)
+def _init_local_storage(backend, path):
+    """Open a local storage backend once per (backend, path)."""
+    logger.info("Using %s storage backend at %s", backend, path)
+    return storage.open_backend(backend, path=path)
+
+
 def get_db():
     """Public accessor for the DB client."""
+    backend = app.config["STORAGE_BACKEND"]
+    if backend == "firestore":
+        try:
+            return _init_firestore_client()
+        except Exception:
+            return None
     try:
-        return _init_firestore_client()
+        return _init_local_storage(backend, app.config["SQLITE_PATH"])
     except Exception:
+        logger.exception("Failed to open %s storage backend", backend)
         return None
 
 def get_db_or_raise():
@@ -174,7 +605,19 @@ def get_db_or_raise():
 
     if db_conn is None:
         raise RuntimeError("Database connection failed")
-    return db_conn
+    return instrument_for_request(db_conn)
+
+
+DATASTORE_OPS_HEADER = 'X-Datastore-Ops'
+
+
+def instrument_for_request(db_conn):
+    """Within a request, wraps the client so its operations are counted in g.datastore_ops."""
+    if not has_request_context() or not (app.config["DATASTORE_METRICS"] or 'trace' in g):
+        return db_conn
+    if 'datastore_ops' not in g:
+        g.datastore_ops = OperationRecorder(tracer=g.get('trace'))
+    return instrument(db_conn, g.datastore_ops)
 
 def generate_referral_code(name=""):
     """Generates a simple, human-readable referral code."""
@@ -183,6 +626,395 @@ def generate_referral_code(name=""):
     suffix = ''.join(secrets.choice(alphabet) for _ in range(4))
     return f"{prefix}-{suffix}"
 
+# --- Cursor Pagination (list endpoints) ---
+# List endpoints return one page at a time. The body stays a plain JSON list so
+# existing UI code keeps working; the token for the following page is sent in
+# the X-Next-Cursor header. Passing ?all=true restores the old unpaginated read.
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+NEXT_CURSOR_HEADER = 'X-Next-Cursor'
+
+
+def encode_cursor(values):
+    """Packs the sort-key values of the last returned document into an opaque token."""
+    payload = [{'ts': v.isoformat()} if isinstance(v, datetime) else v for v in values]
+    raw = json.dumps(payload, separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def decode_cursor(token):
+    """Reverses encode_cursor. Raises ValueError for anything we did not issue."""
+    try:
+        raw = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4))
+        payload = json.loads(raw.decode('utf-8'))
+        if not isinstance(payload, list):
+            raise ValueError("cursor payload is not a list")
+        return [
+            datetime.fromisoformat(v['ts']) if isinstance(v, dict) and 'ts' in v else v
+            for v in payload
+        ]
+    except (binascii.Error, UnicodeDecodeError, TypeError, ValueError) as exc:
+        raise ValueError("Invalid cursor") from exc
+
+
+def parse_page_args(default_page_size=DEFAULT_PAGE_SIZE):
+    """
+    Reads ?cursor= and ?page_size= from the current request.
+    Returns (cursor, page_size); raises ValueError on bad input.
+    """
+    raw_size = request.args.get('page_size', default_page_size)
+    try:
+        page_size = int(raw_size)
+    except (TypeError, ValueError) as exc:
+        raise ValueError("page_size must be an integer") from exc
+    if not 1 <= page_size <= MAX_PAGE_SIZE:
+        raise ValueError(f"page_size must be between 1 and {MAX_PAGE_SIZE}")
+    return request.args.get('cursor') or None, page_size
+
+
+def wants_all_pages():
+    """True when the caller explicitly asked for the legacy, unpaginated list."""
+    return request.args.get('all', '').lower() in ('1', 'true', 'yes')
+
+
+def fetch_page(query, order_fields, cursor, page_size):
+    """
+    Runs a single page of an ordered query using order_by + start_after.
+    'order_fields' is a list of (field, direction) pairs and should end with
+    '__name__' so documents sharing a sort value are never skipped or repeated.
+    Returns (items, next_cursor); next_cursor is None on the last page.
+    """
+    for field, direction in order_fields:
+        query = query.order_by(field, direction=direction)
+
+    if cursor:
+        values = decode_cursor(cursor)
+        if len(values) != len(order_fields):
+            raise ValueError("Invalid cursor")
+        query = query.start_after({field: value for (field, _), value in zip(order_fields, values)})
+
+    # Read one extra document to find out whether another page exists.
+    docs = list(query.limit(page_size + 1).stream())
+    has_more = len(docs) > page_size
+    docs = docs[:page_size]
+
+    items = []
+    for doc in docs:
+        item = doc.to_dict() or {}
+        item['id'] = doc.id
+        items.append(item)
+
+    next_cursor = None
+    if has_more and docs:
+        last_doc, last_item = docs[-1], items[-1]
+        next_cursor = encode_cursor([
+            last_doc.id if field == '__name__' else last_item.get(field)
+            for field, _ in order_fields
+        ])
+    return items, next_cursor
+
+
+def stream_all(query):
+    """Legacy behaviour: materialises every document of the query."""
+    items = []
+    for doc in query.stream():
+        item = doc.to_dict()
+        item['id'] = doc.id
+        items.append(item)
+    return items
+
+
+def page_response(items, next_cursor):
+    """Builds the JSON list response and attaches the next-page cursor header."""
+    resp = jsonify(items)
+    if next_cursor:
+        resp.headers[NEXT_CURSOR_HEADER] = next_cursor
+    return resp, 200
+
+# --- Aggregation Queries (KPI endpoints) ---
+
+# Raised by backends that cannot run count()/sum() aggregations.
+AGGREGATION_UNSUPPORTED_ERRORS = (
+    NotImplementedError,
+    storage.MethodNotImplemented,
+)
+
+
+def _aggregate_by_streaming(query, sum_field=None):
+    """Fallback: count (and optionally sum) the matching documents on the client."""
+    count, total = 0, 0.0
+    for doc in query.stream():
+        count += 1
+        if sum_field:
+            value = (doc.to_dict() or {}).get(sum_field)
+            if isinstance(value, (int, float)):
+                total += value
+    return count, total
+
+
+def aggregate(query, sum_field=None):
+    """
+    Counts the documents matched by 'query' (and sums 'sum_field' when given)
+    with a server-side aggregation query, so only the result crosses the wire.
+    Falls back to streaming when aggregations are disabled or unsupported.
+    Returns (count, total).
+    """
+    if not app.config.get("USE_AGGREGATION_QUERIES", True):
+        return _aggregate_by_streaming(query, sum_field)
+
+    try:
+        aggregation = query.count(alias='count')
+        if sum_field:
+            aggregation = aggregation.sum(sum_field, alias='total')
+        results = aggregation.get()[0]
+    except AGGREGATION_UNSUPPORTED_ERRORS:
+        logger.warning("Aggregation queries unavailable; counting on the client instead")
+        return _aggregate_by_streaming(query, sum_field)
+
+    # The results are not guaranteed to come back in request order
+    values = {result.alias: result.value for result in results}
+    count = int(values.get('count') or 0)
+    total = float(values.get('total') or 0) if sum_field else 0.0
+    return count, total
+
+
+def count_documents(query):
+    """Shortcut for aggregate() when only the count is needed."""
+    return aggregate(query)[0]
+
+# --- Entity Cache (customers, leads, loyalty profiles) ---
+# Detail views and existence checks read through a per-process LRU+TTL cache.
+# Missing documents are cached for a shorter time so repeated 404s stay cheap.
+# Every endpoint that writes one of these documents calls invalidate_entities();
+# writes from other workers show up once the TTL runs out.
+
+entity_cache = EntityCache(
+    max_entries=app.config["ENTITY_CACHE_SIZE"],
+    ttl=app.config["ENTITY_CACHE_TTL"],
+    negative_ttl=app.config["ENTITY_CACHE_NEGATIVE_TTL"],
+)
+
+
+def cached_document(db_conn, collection, doc_id):
+    """Returns the document's data as a dict, or None when it does not exist."""
+    def load():
+        snapshot = db_conn.collection(collection).document(doc_id).get()
+        return (snapshot.to_dict() or {}) if snapshot.exists else None
+
+    data = entity_cache.get_or_load((collection, doc_id), load)
+    # Hand out a copy so callers cannot modify the cached entry
+    return dict(data) if data is not None else None
+
+
+def invalidate_entities(*keys):
+    """Drops (collection, doc_id) pairs from the entity cache after a write."""
+    entity_cache.invalidate(*keys)
+
+# --- Unit of Work (one batched commit per request) ---
+# Endpoints that touch several documents queue their writes on the request's
+# UnitOfWork instead of committing themselves. The writes are committed in one
+# batch after the view returns a success status and dropped on 4xx/5xx.
+# Per-endpoint commit counts are kept for /api/commit-stats and each response
+# carries an X-Commit-Count header. They come from the request's datastore
+# recorder, so direct writes, batches and transactions count as well (and
+# nothing is counted with DATASTORE_METRICS=false).
+
+COMMIT_COUNT_HEADER = 'X-Commit-Count'
+commit_stats = {}
+_commit_stats_lock = threading.Lock()
+
+
+def unit_of_work(db_conn):
+    """Returns the current request's UnitOfWork, creating it on first use."""
+    uow = g.get('unit_of_work')
+    if uow is None:
+        uow = g.unit_of_work = UnitOfWork(db_conn)
+    return uow
+
+
+def record_commits(endpoint, commits):
+    """Adds one request's commit count to the per-endpoint statistics."""
+    with _commit_stats_lock:
+        stats = commit_stats.setdefault(endpoint, {'requests': 0, 'commits': 0, 'max_commits': 0})
+        stats['requests'] += 1
+        stats['commits'] += commits
+        stats['max_commits'] = max(stats['max_commits'], commits)
+
+
+@app.after_request
+def flush_unit_of_work(response):
+    """
+    Commits (or drops, on error responses) the writes queued during the
+    request, then records how many commits the request made in total.
+    """
+    uow = g.pop('unit_of_work', None)
+    if uow is not None and response.status_code >= 400:
+        dropped = uow.discard()
+        if dropped:
+            logger.warning("Dropped %d queued writes for %s (status %s)",
+                           dropped, request.endpoint, response.status_code)
+    elif uow is not None:
+        try:
+            uow.flush()
+        except Exception:
+            logger.exception("Unit of work commit failed for %s", request.endpoint)
+            response = make_response(jsonify({"error": "Internal Server Error"}), 500)
+
+    recorder = g.get('datastore_ops')
+    if recorder is not None:
+        record_commits(request.endpoint, recorder.commits)
+        response.headers[COMMIT_COUNT_HEADER] = str(recorder.commits)
+    return response
+
+# --- Materialized KPI Counters ---
+# Every mutating endpoint bumps a small counter document in the same batch or
+# transaction as its own write, so the dashboard reads one document per KPI
+# instead of querying whole collections. Layout of the 'kpi_counters' family:
+#   customers:     {total, created_by_day: {'YYYY-MM-DD': n}}
+#   leads:         {total, by_status: {status: n}}
+#   opportunities: {total, by_stage: {stage: n}, revenue_won}
+#   tickets:       {closed}
+# `flask rebuild-kpi-counters` recomputes them from scratch, reports drift and
+# stamps them with 'built_at'. Increments merge-create a document that holds
+# only the changes since deploy, so readers ignore counters until they are stamped.
+
+KPI_COUNTERS_COLLECTION = 'kpi_counters'
+KPI_COUNTERS_BUILT_FIELD = 'built_at'
+
+
+def kpi_counter_ref(db_conn, name):
+    """Document reference for one member of the kpi_counters family."""
+    return db_conn.collection(KPI_COUNTERS_COLLECTION).document(name)
+
+
+def day_key(moment=None):
+    """UTC calendar day used as the bucket key for daily counters."""
+    return (moment or datetime.now(timezone.utc)).astimezone(timezone.utc).strftime('%Y-%m-%d')
+
+
+def _stored_kpi_counters(db_conn, name):
+    """The counter document as stored (None if it does not exist)."""
+    snapshot = kpi_counter_ref(db_conn, name).get()
+    if not snapshot.exists:
+        return None
+    return snapshot.to_dict() or {}
+
+
+def read_kpi_counters(db_conn, name):
+    """
+    Returns the counter document as a dict, or None until rebuild-kpi-counters
+    has built it (the caller then falls back to aggregation queries).
+    """
+    counters = _stored_kpi_counters(db_conn, name)
+    if not counters or not counters.get(KPI_COUNTERS_BUILT_FIELD):
+        return None
+    return counters
+
+
+def stage_change_counter_update(old_stage, new_stage, amount):
+    """
+    Counter delta for moving an opportunity between stages. Revenue is added
+    when it becomes Won and taken back if a Won deal is moved out again.
+    Returns None when nothing changes.
+    """
+    if old_stage == new_stage:
+        return None
+    update = {'by_stage': {new_stage: storage.Increment(1)}}
+    if old_stage:
+        update['by_stage'][old_stage] = storage.Increment(-1)
+    amount = amount if isinstance(amount, (int, float)) else 0
+    if new_stage == 'Won':
+        update['revenue_won'] = storage.Increment(amount)
+    elif old_stage == 'Won':
+        update['revenue_won'] = storage.Increment(-amount)
+    return update
+
+
+def compute_kpi_counters(db_conn):
+    """Recomputes every counter document by scanning the source collections."""
+    customers = {'total': 0, 'created_by_day': {}}
+    for doc in db_conn.collection('customers').stream():
+        customers['total'] += 1
+        created_at = (doc.to_dict() or {}).get('createdAt')
+        if isinstance(created_at, datetime):
+            if created_at.tzinfo is None:
+                created_at = created_at.replace(tzinfo=timezone.utc)
+            key = day_key(created_at)
+            customers['created_by_day'][key] = customers['created_by_day'].get(key, 0) + 1
+
+    leads = {'total': 0, 'by_status': {}}
+    for doc in db_conn.collection('leads').stream():
+        status = (doc.to_dict() or {}).get('status', 'New')
+        leads['total'] += 1
+        leads['by_status'][status] = leads['by_status'].get(status, 0) + 1
+
+    opportunities = {'total': 0, 'by_stage': {}, 'revenue_won': 0.0}
+    for doc in db_conn.collection('opportunities').stream():
+        opportunity = doc.to_dict() or {}
+        stage = opportunity.get('stage', 'Qualification')
+        opportunities['total'] += 1
+        opportunities['by_stage'][stage] = opportunities['by_stage'].get(stage, 0) + 1
+        amount = opportunity.get('amount', 0)
+        if stage == 'Won' and isinstance(amount, (int, float)):
+            opportunities['revenue_won'] += amount
+
+    closed = count_documents(db_conn.collection('tickets').where('status', '==', 'Closed'))
+
+    return {
+        'customers': customers,
+        'leads': leads,
+        'opportunities': opportunities,
+        'tickets': {'closed': closed},
+    }
+
+
+def _diff_counters(stored, expected, prefix=''):
+    """Lists (field, stored, expected) for every leaf that differs."""
+    drift = []
+    for key in sorted(set(stored) | set(expected)):
+        path = f"{prefix}{key}"
+        old, new = stored.get(key), expected.get(key)
+        if isinstance(old, dict) or isinstance(new, dict):
+            drift.extend(_diff_counters(old or {}, new or {}, prefix=f"{path}."))
+        elif (old or 0) != (new or 0):
+            drift.append((path, old, new))
+    return drift
+
+
+def rebuild_kpi_counters(db_conn, dry_run=False):
+    """
+    Recomputes the kpi_counters documents, overwrites them (unless dry_run)
+    and returns the drift found per document: {name: [(field, stored, expected)]}.
+    """
+    expected = compute_kpi_counters(db_conn)
+    drift = {}
+    batch = db_conn.batch()
+    built_at = datetime.now(timezone.utc)
+    for name, values in expected.items():
+        stored = _stored_kpi_counters(db_conn, name) or {}
+        stored.pop(KPI_COUNTERS_BUILT_FIELD, None)
+        differences = _diff_counters(stored, values)
+        if differences:
+            drift[name] = differences
+        batch.set(kpi_counter_ref(db_conn, name), {**values, KPI_COUNTERS_BUILT_FIELD: built_at})
+    if not dry_run:
+        batch.commit()
+    return drift
+
+
+@app.cli.command('rebuild-kpi-counters')
+@click.option('--dry-run', is_flag=True, help='Only report drift, do not overwrite the counters.')
+def rebuild_kpi_counters_command(dry_run):
+    """Recompute the materialized KPI counters from scratch and report drift."""
+    drift = rebuild_kpi_counters(get_db_or_raise(), dry_run=dry_run)
+    if not drift:
+        click.echo("KPI counters are in sync.")
+    for name, differences in drift.items():
+        for field, stored, expected in differences:
+            click.echo(f"DRIFT {name}.{field}: stored={stored} expected={expected}")
+    click.echo("Dry run: counters left unchanged." if dry_run else "KPI counters rebuilt.")
+
 # --- HTML Rendering Routes ---
 @app.route('/')
 def dashboard():
@@ -280,6 +1112,55 @@ def leads_page():
 
 # --- API Routes (Epic 2: Customer CRUD) ---
 
+def customer_data_error(data):
+    """Validation shared by create_customer and the bulk import; returns a message or None."""
+    if not data or not data.get('name') or not data.get('email'):
+        return "Name and email are required"
+    return None
+
+
+def new_customer_documents(db_conn, data):
+    """
+    Builds a new customer and its loyalty profile, which shares the customer's ID.
+    Returns [(customer_ref, customer_data), (loyalty_ref, loyalty_data)].
+    """
+    customer_ref = db_conn.collection('customers').document()
+    loyalty_ref = db_conn.collection('loyalty_profiles').document(customer_ref.id)
+    customer_data = {
+        'name': data.get('name'),
+        'email': data.get('email'),
+        'phone': data.get('phone', ''),
+        'company': data.get('company', ''),
+        'loyalty_profile_id': loyalty_ref.id,
+        'createdAt': storage.SERVER_TIMESTAMP
+    }
+    loyalty_data = {
+        'customer_id': customer_ref.id,
+        'points': 0,
+        'tier': 'Bronze',
+        'referral_code': generate_referral_code(customer_data['name']),
+        'createdAt': storage.SERVER_TIMESTAMP
+    }
+    return [(customer_ref, customer_data), (loyalty_ref, loyalty_data)]
+
+
+def customers_created_counter_update(count):
+    """kpi_counters/customers increment for 'count' new customers created today."""
+    return {
+        'total': storage.Increment(count),
+        'created_by_day': {day_key(): storage.Increment(count)}
+    }
+
+
+def customer_deleted_counter_update(created_at):
+    """kpi_counters/customers decrement for one deleted customer created at 'created_at'."""
+    update = {'total': storage.Increment(-1)}
+    if isinstance(created_at, datetime):
+        if created_at.tzinfo is None:
+            created_at = created_at.replace(tzinfo=timezone.utc)
+        update['created_by_day'] = {day_key(created_at): storage.Increment(-1)}
+    return update
+
 @app.route('/api/customer', methods=['POST'])
 def create_customer():
     """
@@ -293,40 +1174,25 @@ def create_customer():
             return jsonify({"error": str(err)}), 503
 
         data = request.get_json(silent=True)
-        if not data or not data.get('name') or not data.get('email'):
-            return jsonify({"error": "Name and email are required"}), 400
+        error = customer_data_error(data)
+        if error:
+            return jsonify({"error": error}), 400
 
-        # Use a batch to ensure both documents are created, or neither is.
-        batch = db_conn.batch()
+        # All writes go out in the request's single batch: both documents are
+        # created, or neither is.
+        uow = unit_of_work(db_conn)
 
-        # 1. Prepare Customer Doc
-        customer_ref = db_conn.collection('customers').document()
-        customer_data = {
-            'name': data.get('name'),
-            'email': data.get('email'),
-            'phone': data.get('phone', ''),
-            'company': data.get('company', ''),
-            'createdAt': firestore.SERVER_TIMESTAMP
-        }
-        batch.set(customer_ref, customer_data)
-
-        # 2. Prepare Loyalty Profile (Epic 5)
-        referral_code = generate_referral_code(customer_data['name'])
-        loyalty_ref = db_conn.collection('loyalty_profiles').document(customer_ref.id)
-        loyalty_data = {
-            'customer_id': customer_ref.id,
-            'points': 0,
-            'tier': 'Bronze',
-            'referral_code': referral_code,
-            'createdAt': firestore.SERVER_TIMESTAMP
-        }
-        batch.set(loyalty_ref, loyalty_data)
+        # 1. Customer Doc and 2. Loyalty Profile (Epic 5)
+        (customer_ref, customer_data), (loyalty_ref, loyalty_data) = new_customer_documents(db_conn, data)
+        uow.set(customer_ref, customer_data)
+        uow.set(loyalty_ref, loyalty_data)
 
-        # 3. Commit the batch
-        batch.commit()
+        # 3. Keep the dashboard counters in step with the insert
+        uow.set(kpi_counter_ref(db_conn, 'customers'), customers_created_counter_update(1), merge=True)
 
-        # Update customer with loyalty ref (Low risk separate operation)
-        customer_ref.update({'loyalty_profile_id': loyalty_ref.id})
+        # The new IDs may have been looked up (and negatively cached) before
+        uow.after_commit(lambda: invalidate_entities(
+            ('customers', customer_ref.id), ('loyalty_profiles', customer_ref.id)))
 
         return jsonify({"success": True, "id": customer_ref.id}), 201
 
@@ -336,19 +1202,28 @@ def create_customer():
 
 @app.route('/api/customers', methods=['GET'])
 def get_customers():
-    """Gets all customers for dropdowns."""
+    """
+    Gets customers one page at a time (ordered by document ID).
+    Use ?cursor=<X-Next-Cursor>&page_size=N to page, or ?all=true for the full list.
+    """
     try:
         try:
             db_conn = get_db_or_raise()
         except RuntimeError as err:
             return jsonify({"error": str(err)}), 503
-        customers = []
-        docs = db_conn.collection('customers').stream()
-        for doc in docs:
-            customer = doc.to_dict()
-            customer['id'] = doc.id
-            customers.append(customer)
-        return jsonify(customers), 200
+
+        customers_ref = db_conn.collection('customers')
+        if wants_all_pages():
+            return jsonify(stream_all(customers_ref)), 200
+
+        try:
+            cursor, page_size = parse_page_args()
+            customers, next_cursor = fetch_page(
+                customers_ref, [('__name__', storage.ASCENDING)], cursor, page_size
+            )
+        except ValueError as err:
+            return jsonify({"error": str(err)}), 400
+        return page_response(customers, next_cursor)
     except Exception:
         logger.exception("Error fetching customers")
         return jsonify({"error": "Internal Server Error"}), 500
@@ -364,11 +1239,10 @@ def get_customer_details(customer_id):
         except RuntimeError as err:
             return jsonify({"error": str(err)}), 503
 
-        customer_ref = db_conn.collection('customers').document(customer_id)
-        customer = customer_ref.get()
-        if not customer.exists:
+        customer = cached_document(db_conn, 'customers', customer_id)
+        if customer is None:
             return jsonify({"error": "Customer not found"}), 404
-        return jsonify(customer.to_dict() or {}), 200
+        return jsonify(customer), 200
     except Exception:
         logger.exception("Error getting customer details for %s", customer_id)
         return jsonify({"error": "Internal Server Error"}), 500
@@ -387,11 +1261,13 @@ def update_customer_details(customer_id):
         if not data or not any(field in data for field in updatable_fields):
             return jsonify({"error": "No update data provided"}), 400
 
-        customer_ref = db_conn.collection('customers').document(customer_id)
-        if not customer_ref.get().exists:
+        # update() only succeeds on an existing document, so no read is needed first
+        try:
+            db_conn.collection('customers').document(customer_id).update(data)
+        except storage.NotFound:
             return jsonify({"error": "Customer not found"}), 404
-
-        customer_ref.set(data, merge=True)
+        finally:
+            invalidate_entities(('customers', customer_id))
         return jsonify({"success": True, "id": customer_id}), 200
     except Exception:
         logger.exception("Error updating customer %s", customer_id)
@@ -399,7 +1275,11 @@ def update_customer_details(customer_id):
 
 @app.route('/api/customer/<string:customer_id>', methods=['DELETE'])
 def delete_customer(customer_id):
-    """Deletes a customer by their ID."""
+    """
+    Deletes a customer by their ID and takes it off the KPI counters in the
+    same batch. The delete only applies to the version that was read, so two
+    concurrent deletes cannot both decrement the counters.
+    """
     try:
         try:
             db_conn = get_db_or_raise()
@@ -407,33 +1287,144 @@ def delete_customer(customer_id):
             return jsonify({"error": str(err)}), 503
 
         customer_ref = db_conn.collection('customers').document(customer_id)
-        if not customer_ref.get().exists:
-            return jsonify({"error": "Customer not found"}), 404
-
-        customer_ref.delete()
+        try:
+            snapshot = customer_ref.get()
+            if not snapshot.exists:
+                return jsonify({"error": "Customer not found"}), 404
+            batch = db_conn.batch()
+            batch.delete(customer_ref, option=db_conn.write_option(last_update_time=snapshot.update_time))
+            batch.set(kpi_counter_ref(db_conn, 'customers'),
+                      customer_deleted_counter_update((snapshot.to_dict() or {}).get('createdAt')), merge=True)
+            batch.commit()
+        except (storage.NotFound, storage.FailedPrecondition):
+            return jsonify({"error": "Customer was changed or deleted concurrently"}), 409
+        finally:
+            invalidate_entities(('customers', customer_id))
         return jsonify({"success": True, "id": customer_id}), 200
     except Exception:
         logger.exception("Error deleting customer %s", customer_id)
         return jsonify({"error": "Internal Server Error"}), 500
 
+# --- Bulk Customer Import ---
+# Streams CSV (header row) or NDJSON, optionally gzipped, straight from the
+# request body or a file. Each valid row becomes a customer plus loyalty profile
+# written in the same batch; batches of up to 500 writes are committed
+# concurrently. The customer counter gets a single increment once they are all
+# done, so parallel batches never contend for its document.
+
+def import_customers(db_conn, source, fmt, workers=4, compressed=None):
+    """Imports customers from a binary stream. Returns the ImportReport."""
+    def build_writes(record):
+        error = customer_data_error(record)
+        if error:
+            raise ValueError(error)
+        return [('set', ref, (document,)) for ref, document in new_customer_documents(db_conn, record)]
+
+    records = iter_records(open_text_stream(source, compressed), fmt)
+    report = run_import(db_conn, records, build_writes, workers=workers)
+    if report.imported:
+        try:
+            kpi_counter_ref(db_conn, 'customers').set(customers_created_counter_update(report.imported), merge=True)
+        except Exception:
+            logger.exception("Could not add %d imported customers to the KPI counters; "
+                             "run rebuild-kpi-counters", report.imported)
+    return report
+
+
+@app.route('/api/customers/import', methods=['POST'])
+def import_customers_endpoint():
+    """
+    Bulk-creates customers. Send the file as the raw body (Content-Type text/csv
+    or application/x-ndjson, optionally gzip-compressed) or as multipart field
+    'file'. ?format=csv|ndjson overrides detection, ?workers=N sets concurrency.
+    Responds with counts, per-row errors and rows per second.
+    """
+    try:
+        try:
+            db_conn = get_db_or_raise()
+        except RuntimeError as err:
+            return jsonify({"error": str(err)}), 503
+
+        upload = request.files.get('file')
+        source = upload.stream if upload else request.stream
+        fmt = request.args.get('format') or detect_format(
+            filename=upload.filename if upload else None,
+            content_type=upload.mimetype if upload else request.mimetype)
+        if fmt not in IMPORT_FORMATS:
+            return jsonify({"error": f"format must be one of: {', '.join(IMPORT_FORMATS)}"}), 400
+
+        try:
+            workers = int(request.args.get('workers', 4))
+        except ValueError:
+            return jsonify({"error": "workers must be an integer"}), 400
+        workers = max(1, min(workers, app.config["IMPORT_MAX_WORKERS"]))
+
+        compressed = True if request.headers.get('Content-Encoding', '').lower() == 'gzip' else None
+        report = import_customers(db_conn, source, fmt, workers=workers, compressed=compressed)
+        logger.info("Customer import: %d/%d rows imported in %.1fs (%.0f rows/s)",
+                    report.imported, report.rows, report.seconds, report.rows_per_second)
+        if report.aborted:
+            logger.warning("Customer import stopped early: %s", report.aborted)
+            if not report.imported:
+                return jsonify({"error": report.aborted}), 400
+        return jsonify(report.to_dict()), 200
+    except (OSError, UnicodeDecodeError, csv.Error) as err:
+        return jsonify({"error": f"Could not read import file: {err}"}), 400
+    except Exception:
+        logger.exception("Customer import failed")
+        return jsonify({"error": "Internal Server Error"}), 500
+
+
+@app.cli.command('import-customers')
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--format', 'fmt', type=click.Choice(IMPORT_FORMATS),
+              help="Input format (default: from the file extension).")
+@click.option('--workers', default=4, show_default=True, help="Concurrent batch commits.")
+def import_customers_command(path, fmt, workers):
+    """Bulk-import customers from a CSV or NDJSON file (optionally .gz)."""
+    fmt = fmt or detect_format(filename=path)
+    if fmt is None:
+        raise click.UsageError("Cannot tell the format from the file name; pass --format.")
+
+    db_conn = get_db_or_raise()
+    with open(path, 'rb') as source:
+        report = import_customers(db_conn, source, fmt, workers=max(1, workers))
+
+    for error in report.errors:
+        click.echo(f"row {error['row']}: {error['error']}", err=True)
+    if report.failed > len(report.errors):
+        click.echo(f"... {report.failed - len(report.errors)} more errors", err=True)
+    if report.aborted:
+        click.echo(report.aborted, err=True)
+    click.echo(f"Imported {report.imported} of {report.rows} rows in {report.seconds:.1f}s "
+               f"({report.rows_per_second:.0f} rows/s), {report.failed} failed.")
+
 # --- API Routes (Epic 3: Leads & Opportunities) ---
 
 @app.route('/api/leads', methods=['GET'])
 def get_leads():
-    """Gets all leads for display."""
+    """
+    Gets leads for display, one page at a time (ordered by document ID).
+    Supports the same ?cursor / ?page_size / ?all=true parameters as /api/customers.
+    """
     try:
         try:
             db_conn = get_db_or_raise()
         except RuntimeError as err:
             return jsonify({"error": str(err)}), 503
-        
-        leads = []
-        docs = db_conn.collection('leads').stream()
-        for doc in docs:
-            lead = doc.to_dict()
-            lead['id'] = doc.id
-            leads.append(lead)
-        return jsonify(leads), 200
+
+        leads_ref = db_conn.collection('leads')
+        if wants_all_pages():
+            return jsonify(stream_all(leads_ref)), 200
+
+        try:
+            cursor, page_size = parse_page_args()
+            leads, next_cursor = fetch_page(
+                leads_ref, [('__name__', storage.ASCENDING)], cursor, page_size
+            )
+        except ValueError as err:
+            return jsonify({"error": str(err)}), 400
+        return page_response(leads, next_cursor)
     except Exception:
         logger.exception("Error fetching leads")
         return jsonify({"error": "Internal Server Error"}), 500
@@ -455,10 +1446,15 @@ def capture_lead():
             'email': data.get('email'),
             'source': data.get('source'),
             'status': 'New',
-            'createdAt': firestore.SERVER_TIMESTAMP
+            'createdAt': storage.SERVER_TIMESTAMP
         }
         doc_ref = db_conn.collection('leads').document()
-        doc_ref.set(lead_data)
+        uow = unit_of_work(db_conn)
+        uow.set(doc_ref, lead_data)
+        uow.set(kpi_counter_ref(db_conn, 'leads'), {
+            'total': storage.Increment(1),
+            'by_status': {'New': storage.Increment(1)}
+        }, merge=True)
         return jsonify({'success': True, 'id': doc_ref.id}), 201
     except Exception:
         logger.exception("Capture Lead Failed")
@@ -480,12 +1476,19 @@ def convert_lead_to_opportunity(lead_id):
             return jsonify({"error": "Lead not found"}), 404
 
         lead_data = lead_doc.to_dict() or {}
+        uow = unit_of_work(db_conn)
 
-        lead_ref.update({
+        uow.update(lead_ref, {
             'status': 'Converted',
-            'convertedAt': firestore.SERVER_TIMESTAMP
+            'convertedAt': storage.SERVER_TIMESTAMP
         })
 
+        old_status = lead_data.get('status', 'New')
+        if old_status != 'Converted':
+            uow.set(kpi_counter_ref(db_conn, 'leads'), {
+                'by_status': {old_status: storage.Increment(-1), 'Converted': storage.Increment(1)}
+            }, merge=True)
+
         opportunity_ref = db_conn.collection('opportunities').document()
         opportunity_data = {
             'lead_id': lead_id,
@@ -494,9 +1497,14 @@ def convert_lead_to_opportunity(lead_id):
             'source': lead_data.get('source'),
             'stage': 'Qualification',
             'amount': 0.0,
-            'createdAt': firestore.SERVER_TIMESTAMP
+            'createdAt': storage.SERVER_TIMESTAMP
         }
-        opportunity_ref.set(opportunity_data)
+        uow.set(opportunity_ref, opportunity_data)
+        uow.set(kpi_counter_ref(db_conn, 'opportunities'), {
+            'total': storage.Increment(1),
+            'by_stage': {'Qualification': storage.Increment(1)}
+        }, merge=True)
+        uow.after_commit(lambda: invalidate_entities(('leads', lead_id)))
 
         return jsonify({
             "success": True,
@@ -523,16 +1531,16 @@ def assign_lead(lead_id):
         if not rep_id:
             return jsonify({"error": "Sales rep ID (rep_id) is required"}), 400
 
-        lead_ref = db_conn.collection('leads').document(lead_id)
-        lead_doc = lead_ref.get()
-        if not lead_doc.exists:
+        try:
+            db_conn.collection('leads').document(lead_id).update({
+                'assigned_to_id': rep_id,
+                'assigned_to_name': rep_name,
+                'assignedAt': storage.SERVER_TIMESTAMP
+            })
+        except storage.NotFound:
             return jsonify({"error": "Lead not found"}), 404
-
-        lead_ref.update({
-            'assigned_to_id': rep_id,
-            'assigned_to_name': rep_name,
-            'assignedAt': firestore.SERVER_TIMESTAMP
-        })
+        finally:
+            invalidate_entities(('leads', lead_id))
 
         return jsonify({
             "success": True,
@@ -565,21 +1573,12 @@ def update_opportunity_status(opportunity_id):
             }), 400
 
         opportunity_ref = db_conn.collection('opportunities').document(opportunity_id)
-        opportunity_doc = opportunity_ref.get()
+        transaction = db_conn.transaction()
 
-        if not opportunity_doc.exists:
+        if not update_stage_transaction(
+                transaction, opportunity_ref, kpi_counter_ref(db_conn, 'opportunities'), new_stage):
             return jsonify({"error": "Opportunity not found"}), 404
 
-        update_data = {
-            'stage': new_stage,
-            'updatedAt': firestore.SERVER_TIMESTAMP
-        }
-
-        if new_stage in ['Won', 'Lost']:
-            update_data['closedAt'] = firestore.SERVER_TIMESTAMP
-
-        opportunity_ref.update(update_data)
-
         return jsonify({
             "success": True,
             "message": f"Opportunity {opportunity_id} status updated to {new_stage}"
@@ -589,6 +1588,34 @@ def update_opportunity_status(opportunity_id):
         logger.exception("Error updating opportunity %s", opportunity_id)
         return jsonify({"error": "Internal Server Error"}), 500
 
+@storage.transactional
+def update_stage_transaction(transaction, opportunity_ref, counters_ref, new_stage):
+    """
+    Moves an opportunity to 'new_stage' and adjusts the KPI counters by the
+    transition from its current stage. Returns False if it does not exist.
+    """
+    snapshot = opportunity_ref.get(transaction=transaction)
+    if not snapshot.exists:
+        return False
+
+    opportunity = snapshot.to_dict() or {}
+    update_data = {
+        'stage': new_stage,
+        'updatedAt': storage.SERVER_TIMESTAMP
+    }
+
+    if new_stage in ['Won', 'Lost']:
+        update_data['closedAt'] = storage.SERVER_TIMESTAMP
+
+    transaction.update(opportunity_ref, update_data)
+
+    counter_update = stage_change_counter_update(
+        opportunity.get('stage'), new_stage, opportunity.get('amount', 0)
+    )
+    if counter_update:
+        transaction.set(counters_ref, counter_update, merge=True)
+    return True
+
 # --- API Routes (Epic 4: Support Tickets - Kaveri) ---
 
 @app.route('/api/tickets', methods=['GET', 'POST'])
@@ -603,17 +1630,23 @@ def tickets_endpoint():
             return jsonify({"error": str(err)}), 503
 
         if request.method == 'GET':
-            tickets = []
-            ticket_query = (
-                db_conn.collection('tickets')
-                .order_by('created_at', direction=firestore.Query.DESCENDING)
-                .limit(20)
-            )
-            for doc in ticket_query.stream():
-                ticket = doc.to_dict()
-                ticket['id'] = doc.id
-                tickets.append(ticket)
-            return jsonify(tickets), 200
+            # Newest first; pages of 20 by default (the old hard-coded cap).
+            tickets_ref = db_conn.collection('tickets')
+            if wants_all_pages():
+                ticket_query = tickets_ref.order_by('created_at', direction=storage.DESCENDING)
+                return jsonify(stream_all(ticket_query)), 200
+
+            try:
+                cursor, page_size = parse_page_args(default_page_size=20)
+                tickets, next_cursor = fetch_page(
+                    tickets_ref,
+                    [('created_at', storage.DESCENDING),
+                     ('__name__', storage.DESCENDING)],
+                    cursor, page_size
+                )
+            except ValueError as err:
+                return jsonify({"error": str(err)}), 400
+            return page_response(tickets, next_cursor)
 
         data = request.get_json(silent=True)
         if not data:
@@ -628,7 +1661,7 @@ def tickets_endpoint():
             "issue": data['issue'],
             "status": "Open",
             "priority": data.get("priority", "Medium"),
-            "created_at": firestore.SERVER_TIMESTAMP,
+            "created_at": storage.SERVER_TIMESTAMP,
             "sla_deadline": (now_utc + timedelta(hours=24)).isoformat()
         }
 
@@ -669,12 +1702,31 @@ def close_ticket(id):
         if not ticket_doc.exists:
             return jsonify({"error": "Ticket not found"}), 404
 
-        # Update with test-expected fields
-        ticket_ref.update({
+        # The update only applies to the version that was read, so of two
+        # concurrent closes only one can add to the counter and rollups
+        uow = unit_of_work(db)
+        uow.update(ticket_ref, {
             "status": "Closed",
-            "resolved_at": firestore.SERVER_TIMESTAMP,
-            "updated_at": firestore.SERVER_TIMESTAMP
-        })
+            "resolved_at": storage.SERVER_TIMESTAMP,
+            "updated_at": storage.SERVER_TIMESTAMP
+        }, option=db.write_option(last_update_time=ticket_doc.update_time))
+        # Re-closing an already closed ticket must not count twice
+        ticket = ticket_doc.to_dict() or {}
+        if ticket.get("status") != "Closed":
+            uow.set(kpi_counter_ref(db, 'tickets'), {'closed': storage.Increment(1)}, merge=True)
+
+            # Resolution-time rollups (day/week/month/all) for /api/ticket-metrics
+            resolved_at = datetime.now(timezone.utc)
+            created_at = to_naive_utc(ticket.get("created_at") or ticket.get("createdAt"))
+            if created_at:
+                seconds = max((resolved_at.replace(tzinfo=None) - created_at).total_seconds(), 0.0)
+                for rollup_ref, payload in ticket_rollup_writes(
+                        db, resolved_at.date(), seconds, ticket.get("priority", "Medium")):
+                    uow.set(rollup_ref, payload, merge=True)
+        try:
+            uow.flush()
+        except (storage.NotFound, storage.FailedPrecondition):
+            return jsonify({"error": "Ticket was changed or deleted concurrently"}), 409
 
         return jsonify({
             "success": True,
@@ -715,7 +1767,7 @@ def check_sla_breaches():
             batch.update(ref, {
                 'status': 'Escalated',
                 'priority': 'High',
-                'escalated_at': firestore.SERVER_TIMESTAMP
+                'escalated_at': storage.SERVER_TIMESTAMP
             })
             escalated_count += 1
 
@@ -749,13 +1801,11 @@ def get_loyalty_profile(customer_id):
         except RuntimeError as err:
             return jsonify({"error": str(err)}), 503
 
-        loyalty_ref = db_conn.collection('loyalty_profiles').document(customer_id)
-        profile_doc = loyalty_ref.get()
-
-        if not profile_doc.exists:
+        profile = cached_document(db_conn, 'loyalty_profiles', customer_id)
+        if profile is None:
             return jsonify({"error": "Loyalty profile not found"}), 404
 
-        return jsonify(profile_doc.to_dict()), 200
+        return jsonify(profile), 200
 
     except Exception:
         logger.exception("Error fetching loyalty profile for %s", customer_id)
@@ -763,7 +1813,7 @@ def get_loyalty_profile(customer_id):
 
 # --- TRANSACTIONAL HELPERS (For Epic 5 Safety) ---
 
-@firestore.transactional
+@storage.transactional
 def redeem_transaction(transaction, ref, points_to_redeem):
     snapshot = ref.get(transaction=transaction)
     if not snapshot.exists:
@@ -777,7 +1827,7 @@ def redeem_transaction(transaction, ref, points_to_redeem):
     transaction.update(ref, {'points': new_balance})
     return new_balance
 
-@firestore.transactional
+@storage.transactional
 def add_points_transaction(transaction, ref, points_earned):
     snapshot = ref.get(transaction=transaction)
     if not snapshot.exists:
@@ -828,6 +1878,7 @@ def redeem_points(customer_id):
         try:
             transaction = db_conn.transaction()
             new_balance = redeem_transaction(transaction, loyalty_ref, points)
+            invalidate_entities(('loyalty_profiles', customer_id))
             return jsonify({
                 "success": True,
             "message": "Redemption successful",
@@ -876,8 +1927,9 @@ def use_referral_code(customer_id):
         # Atomic increment for referrer (No need for full transaction if just incrementing)
         referrer_ref = db_conn.collection('loyalty_profiles').document(referrer_id)
         referrer_ref.update({
-            'points': firestore.Increment(100)
+            'points': storage.Increment(100)
         })
+        invalidate_entities(('loyalty_profiles', referrer_id))
 
         return jsonify({
             "success": True,
@@ -897,6 +1949,7 @@ def add_points_on_purchase(db_conn, customer_id, purchase_amount):
         loyalty_ref = db_conn.collection('loyalty_profiles').document(customer_id)
         transaction = db_conn.transaction()
         result = add_points_transaction(transaction, loyalty_ref, int(purchase_amount))
+        invalidate_entities(('loyalty_profiles', customer_id))
 
         if result and result['new_tier'] != 'Bronze':
             logger.info("Tier Check: %s is now %s", customer_id, result['new_tier'])
@@ -970,25 +2023,22 @@ def get_sales_kpis():
         except RuntimeError as err:
             return jsonify({"error": str(err)}), 503
 
-        opportunities_ref = db_conn.collection('opportunities')
-        all_opportunities = opportunities_ref.stream()
-
-        total_opportunities = 0
-        total_won = 0
-        total_lost = 0
-        total_revenue_won = 0.0
-
-        for doc in all_opportunities:
-            opportunity = doc.to_dict()
-            total_opportunities += 1
-            amount = opportunity.get('amount', 0.0)
+        counters = read_kpi_counters(db_conn, 'opportunities')
+        if counters is not None:
+            by_stage = counters.get('by_stage') or {}
+            total_opportunities = counters.get('total', 0)
+            total_won = by_stage.get('Won', 0)
+            total_lost = by_stage.get('Lost', 0)
+            total_revenue_won = counters.get('revenue_won', 0.0)
+        else:
+            # Counters not built yet: fall back to aggregation queries
+            opportunities_ref = db_conn.collection('opportunities')
+            total_opportunities = count_documents(opportunities_ref)
+            total_won, total_revenue_won = aggregate(
+                opportunities_ref.where('stage', '==', 'Won'), sum_field='amount'
+            )
+            total_lost = count_documents(opportunities_ref.where('stage', '==', 'Lost'))
 
-            if opportunity.get('stage') == 'Won':
-                total_won += 1
-                total_revenue_won += amount
-            elif opportunity.get('stage') == 'Lost':
-                total_lost += 1
-        
         open_opportunities = total_opportunities - (total_won + total_lost)
 
         return jsonify({
@@ -1014,32 +2064,25 @@ def get_customer_kpis():
         except RuntimeError as err:
             return jsonify({"error": str(err)}), 503
 
-        customers_ref = db_conn.collection('customers')
-        all_customers = customers_ref.stream()
-
-        total_customers = 0
-        new_customers_last_30_days = 0
         thirty_days_ago = datetime.now(timezone.utc) - timedelta(days=30)
-        
-        # NOTE: A more efficient solution for large datasets would be a Firestore query 
-        # using a range filter on 'createdAt' for the 30-day calculation, but
-        # iterating is acceptable for smaller-to-medium collections.
-
-        for doc in all_customers:
-            total_customers += 1
-            customer = doc.to_dict()
-            
-            # Check for new customers in the last 30 days
-            created_at = customer.get('createdAt')
-            if created_at and isinstance(created_at, datetime):
-                # Ensure the datetime object has timezone information for comparison
-                created_at_utc = created_at.replace(tzinfo=timezone.utc) if created_at.tzinfo is None else created_at
-                
-                if created_at_utc >= thirty_days_ago:
-                    new_customers_last_30_days += 1
-            # Handle Firestore server timestamp objects, which might be retrieved as
-            # firebase_admin.firestore.server_timestamp.ServerTimestamp in some mock/test contexts
-            # but usually as datetime in live environments.
+
+        counters = read_kpi_counters(db_conn, 'customers')
+        if counters is not None:
+            # Daily buckets: the window starts at the beginning of the day 30 days ago
+            cutoff = day_key(thirty_days_ago)
+            total_customers = counters.get('total', 0)
+            new_customers_last_30_days = sum(
+                count for day, count in (counters.get('created_by_day') or {}).items()
+                if day >= cutoff
+            )
+        else:
+            # Counters not built yet: both numbers come from server-side count()
+            # queries; the 30-day window is a range filter on 'createdAt'.
+            customers_ref = db_conn.collection('customers')
+            total_customers = count_documents(customers_ref)
+            new_customers_last_30_days = count_documents(
+                customers_ref.where('createdAt', '>=', thirty_days_ago)
+            )
 
         return jsonify({
             "total_customers": total_customers,
@@ -1056,120 +2099,434 @@ def sales_page():
     return render_template('sales.html')
 # File: app.py
 
-# ============================
-# DYNAMIC TICKET METRICS ROUTE
-# ============================
+# --- Ticket Resolution Rollups ---
+# close_ticket adds the resolution time of each ticket to small rollup documents
+# in 'ticket_rollups', one per calendar day, ISO week, month, plus an all-time
+# document. Each holds resolved count and summed/min/max resolution seconds,
+# overall and per priority, so any range costs one read per bucket.
+# `flask rebuild-ticket-rollups` stamps the all-time document with 'built_at';
+# until then the increments only cover the tickets closed since deploy, so the
+# metrics are computed from the closed tickets instead.
 
+TICKET_ROLLUPS_COLLECTION = 'ticket_rollups'
+TICKET_ROLLUPS_BUILT_FIELD = 'built_at'
+ROLLUP_GRANULARITIES = ('day', 'week', 'month')
+MAX_ROLLUP_BUCKETS = 366
 
-@app.route('/api/ticket-metrics', methods=['GET'])
 
-@app.route('/api/ticket-metrics', methods=['GET'])
-def get_ticket_metrics():
-    try:
-        db = get_db_or_raise()
-    except RuntimeError:
-        return jsonify({"error": "Database connection failed"}), 503
+def to_naive_utc(ts):
+    """Best-effort conversion of Firestore/ISO timestamps into naive UTC datetimes."""
+    if ts is None:
+        return None
+    if hasattr(ts, "to_datetime"):
+        try:
+            ts = ts.to_datetime()
+        except Exception:
+            return None
+    if isinstance(ts, str):
+        try:
+            ts = datetime.fromisoformat(ts)
+        except ValueError:
+            return None
+    if not isinstance(ts, datetime):
+        return None
+    if ts.tzinfo is not None:
+        ts = ts.astimezone(timezone.utc)
+    return ts.replace(tzinfo=None)
+
+
+def rollup_id(granularity, day):
+    """Document ID of the rollup bucket of 'granularity' that contains 'day'."""
+    if granularity == 'day':
+        return f"day-{day.isoformat()}"
+    if granularity == 'week':
+        iso_year, iso_week, _ = day.isocalendar()
+        return f"week-{iso_year}-W{iso_week:02d}"
+    if granularity == 'month':
+        return f"month-{day.year}-{day.month:02d}"
+    raise ValueError(f"granularity must be one of {', '.join(ROLLUP_GRANULARITIES)}")
+
+
+def _rollup_stats(seconds):
+    """Field transforms that fold one resolution time into a rollup."""
+    return {
+        'resolved': storage.Increment(1),
+        'total_seconds': storage.Increment(seconds),
+        'min_seconds': storage.Minimum(seconds),
+        'max_seconds': storage.Maximum(seconds),
+    }
 
-    try:
-        tickets = db.collection('tickets').stream()
 
-        total_resolved = 0
-        total_seconds = 0
+def ticket_rollup_writes(db_conn, resolved_day, seconds, priority):
+    """(ref, payload) pairs to merge into the rollups when a ticket is resolved."""
+    writes = []
+    for granularity in ROLLUP_GRANULARITIES + ('all',):
+        doc_id = 'all' if granularity == 'all' else rollup_id(granularity, resolved_day)
+        payload = _rollup_stats(seconds)
+        payload['period'] = granularity
+        payload['by_priority'] = {priority: _rollup_stats(seconds)}
+        writes.append((db_conn.collection(TICKET_ROLLUPS_COLLECTION).document(doc_id), payload))
+    return writes
+
+
+def read_rollups(db_conn, doc_ids):
+    """Fetches the given rollup documents in one round trip: {doc_id: data}."""
+    rollups_ref = db_conn.collection(TICKET_ROLLUPS_COLLECTION)
+    refs = [rollups_ref.document(doc_id) for doc_id in doc_ids]
+    return {
+        snapshot.id: snapshot.to_dict() or {}
+        for snapshot in db_conn.get_all(refs)
+        if snapshot.exists
+    }
 
-        today = datetime.now().replace(tzinfo=None)
 
-        weekly_buckets = {
-            "Week 1": [],
-            "Week 2": [],
-            "Week 3": [],
-            "Week 4": []
+def merge_rollups(rollups):
+    """Adds several rollup dicts together (used to build rolling weeks from days)."""
+    merged = {'resolved': 0, 'total_seconds': 0.0, 'min_seconds': None, 'max_seconds': None,
+              'by_priority': {}}
+
+    def fold(target, source):
+        if not source.get('resolved'):
+            return
+        target['resolved'] += source.get('resolved', 0)
+        target['total_seconds'] += source.get('total_seconds', 0.0)
+        for key, pick in (('min_seconds', min), ('max_seconds', max)):
+            if source.get(key) is not None:
+                target[key] = source[key] if target[key] is None else pick(target[key], source[key])
+
+    for rollup in rollups:
+        fold(merged, rollup)
+        for priority, stats in (rollup.get('by_priority') or {}).items():
+            target = merged['by_priority'].setdefault(
+                priority, {'resolved': 0, 'total_seconds': 0.0, 'min_seconds': None, 'max_seconds': None})
+            fold(target, stats)
+    return merged
+
+
+def summarize_rollup(rollup):
+    """Converts raw rollup seconds into the hour-based numbers the UI shows."""
+    resolved = rollup.get('resolved', 0) or 0
+
+    def hours(seconds, digits=2):
+        return round(seconds / 3600, digits) if resolved and seconds is not None else 0
+
+    summary = {
+        'resolved': resolved,
+        'avg_resolution_hours': hours(rollup.get('total_seconds', 0) / resolved if resolved else 0),
+        'min_resolution_hours': hours(rollup.get('min_seconds')),
+        'max_resolution_hours': hours(rollup.get('max_seconds')),
+    }
+    if 'by_priority' in rollup:
+        summary['by_priority'] = {
+            priority: summarize_rollup(stats)
+            for priority, stats in sorted((rollup.get('by_priority') or {}).items())
         }
+    return summary
 
-        def safe_convert(ts):
-            if ts is None:
-                return None
-            if hasattr(ts, "to_datetime"):
-                try:
-                    return ts.to_datetime().replace(tzinfo=None)
-                except Exception:
-                    return None
-            if isinstance(ts, datetime):
-                return ts.replace(tzinfo=None)
-            if isinstance(ts, str):
-                try:
-                    return datetime.fromisoformat(ts).replace(tzinfo=None)
-                except Exception:
-                    return None
-            return None
 
-        for doc in tickets:
-            ticket = doc.to_dict()
+def rollup_buckets(start, end, granularity):
+    """
+    Calendar-aligned buckets covering the dates start..end (inclusive).
+    Weeks are ISO weeks (Mon-Sun) and months are calendar months, so the
+    range is widened to whole buckets. Returns [(doc_id, label, first_day)].
+    """
+    if granularity not in ROLLUP_GRANULARITIES:
+        raise ValueError(f"granularity must be one of {', '.join(ROLLUP_GRANULARITIES)}")
+    if start > end:
+        raise ValueError("start must not be after end")
+
+    if granularity == 'week':
+        day = start - timedelta(days=start.weekday())
+    elif granularity == 'month':
+        day = start.replace(day=1)
+    else:
+        day = start
+
+    buckets = []
+    while day <= end:
+        doc_id = rollup_id(granularity, day)
+        buckets.append((doc_id, doc_id.split('-', 1)[1], day))
+        if len(buckets) > MAX_ROLLUP_BUCKETS:
+            raise ValueError(f"range spans more than {MAX_ROLLUP_BUCKETS} {granularity} buckets")
+        day = next_bucket_start(day, granularity)
+    return buckets
+
+
+def next_bucket_start(day, granularity):
+    """First day of the bucket following the one that starts on 'day'."""
+    if granularity == 'day':
+        return day + timedelta(days=1)
+    if granularity == 'week':
+        return day + timedelta(days=7)
+    return (day.replace(day=28) + timedelta(days=4)).replace(day=1)
+
+
+def rollups_built(rollups):
+    """True once rebuild-ticket-rollups has stamped the all-time rollup."""
+    return bool(rollups.get('all', {}).get(TICKET_ROLLUPS_BUILT_FIELD))
+
+
+def ticket_metrics_for_range(db_conn, start, end, granularity):
+    """
+    Ticket metrics for an arbitrary range, one rollup read per bucket (the
+    buckets are computed from the closed tickets until the rollups are built).
+    """
+    buckets = rollup_buckets(start, end, granularity)
+    rollups = read_rollups(db_conn, ['all'] + [doc_id for doc_id, _, _ in buckets])
+    if not rollups_built(rollups):
+        rollups = compute_ticket_rollups(db_conn)
+    rollups = {doc_id: rollups[doc_id] for doc_id, _, _ in buckets if doc_id in rollups}
+
+    bucket_summaries = []
+    for doc_id, label, first_day in buckets:
+        summary = summarize_rollup(rollups.get(doc_id, {'by_priority': {}}))
+        summary.update({'label': label, 'start': first_day.isoformat()})
+        bucket_summaries.append(summary)
+
+    overall = summarize_rollup(merge_rollups(rollups.values()))
+    return {
+        "granularity": granularity,
+        "start": buckets[0][2].isoformat(),
+        "end": end.isoformat(),
+        "total_resolved": overall['resolved'],
+        "avg_resolution_hours": round(overall['avg_resolution_hours'], 1),
+        "by_priority": overall['by_priority'],
+        "trend_labels": [b['label'] for b in bucket_summaries],
+        "trend_values": [b['avg_resolution_hours'] for b in bucket_summaries],
+        "buckets": bucket_summaries,
+    }
+
+
+def ticket_metrics_from_rollups(db_conn):
+    """
+    Default dashboard view: all-time totals plus a four-week trend built from
+    the last 28 daily rollups (Week 4 = the most recent 7 days).
+    Returns None until rebuild-ticket-rollups has built the rollups.
+    """
+    today = datetime.now(timezone.utc).date()
+    days = [today - timedelta(days=offset) for offset in range(27, -1, -1)]
+    rollups = read_rollups(db_conn, ['all'] + [rollup_id('day', day) for day in days])
+    if not rollups_built(rollups):
+        return None
+
+    overall = summarize_rollup(rollups['all'])
+    trend_labels, trend_values = [], []
+    for week in range(4):
+        week_days = days[week * 7:(week + 1) * 7]
+        week_rollup = merge_rollups(rollups.get(rollup_id('day', day), {}) for day in week_days)
+        trend_labels.append(f"Week {week + 1}")
+        trend_values.append(summarize_rollup(week_rollup)['avg_resolution_hours'])
+
+    return {
+        "total_resolved": overall['resolved'],
+        "avg_resolution_hours": round(overall['avg_resolution_hours'], 1),
+        "by_priority": overall.get('by_priority', {}),
+        "trend_labels": trend_labels,
+        "trend_values": trend_values
+    }
 
-            created_at_ts = ticket.get("created_at") or ticket.get("createdAt")
-            resolved_at_ts = ticket.get("resolved_at") or ticket.get("closedAt")
 
-            if ticket.get("status") != "Closed":
-                continue
+def compute_ticket_rollups(db_conn):
+    """Recomputes every rollup document from the closed tickets."""
+    rollups = {}
+
+    def fold(doc_id, granularity, seconds, priority):
+        rollup = rollups.setdefault(doc_id, {
+            'period': granularity, 'resolved': 0, 'total_seconds': 0.0,
+            'min_seconds': None, 'max_seconds': None, 'by_priority': {}})
+        targets = [rollup, rollup['by_priority'].setdefault(priority, {
+            'resolved': 0, 'total_seconds': 0.0, 'min_seconds': None, 'max_seconds': None})]
+        for target in targets:
+            target['resolved'] += 1
+            target['total_seconds'] += seconds
+            target['min_seconds'] = seconds if target['min_seconds'] is None else min(target['min_seconds'], seconds)
+            target['max_seconds'] = seconds if target['max_seconds'] is None else max(target['max_seconds'], seconds)
+
+    for doc in db_conn.collection('tickets').where('status', '==', 'Closed').stream():
+        ticket = doc.to_dict() or {}
+        created_at = to_naive_utc(ticket.get("created_at") or ticket.get("createdAt"))
+        resolved_at = to_naive_utc(ticket.get("resolved_at") or ticket.get("closedAt"))
+        if not created_at or not resolved_at:
+            continue
+        seconds = max((resolved_at - created_at).total_seconds(), 0.0)
+        priority = ticket.get("priority", "Medium")
+        for granularity in ROLLUP_GRANULARITIES:
+            fold(rollup_id(granularity, resolved_at.date()), granularity, seconds, priority)
+        fold('all', 'all', seconds, priority)
+    return rollups
+
+
+def commit_in_chunks(db_conn, operations, chunk_size=500):
+    """Applies (method, ref, args) operations in batches of at most 500 writes."""
+    committed = 0
+    for offset in range(0, len(operations), chunk_size):
+        batch = db_conn.batch()
+        for method, ref, args in operations[offset:offset + chunk_size]:
+            getattr(batch, method)(ref, *args)
+        batch.commit()
+        committed += 1
+    return committed
 
-            created_at = safe_convert(created_at_ts)
-            resolved_at = safe_convert(resolved_at_ts)
 
-            if not created_at or not resolved_at:
-                continue
+def rebuild_ticket_rollups(db_conn):
+    """
+    Replaces the rollup documents with ones recomputed from the closed tickets
+    and stamps the all-time rollup as built. Returns how many were written.
+    """
+    rollups = compute_ticket_rollups(db_conn)
+    rollups.setdefault('all', {'period': 'all', 'resolved': 0, 'total_seconds': 0.0,
+                               'min_seconds': None, 'max_seconds': None, 'by_priority': {}})
+    rollups['all'][TICKET_ROLLUPS_BUILT_FIELD] = datetime.now(timezone.utc)
+    rollups_ref = db_conn.collection(TICKET_ROLLUPS_COLLECTION)
 
-            seconds = (resolved_at - created_at).total_seconds()
-            hours = seconds / 3600
+    operations = [('delete', doc.reference, ()) for doc in rollups_ref.stream()]
+    operations += [('set', rollups_ref.document(doc_id), (data,)) for doc_id, data in rollups.items()]
+    commit_in_chunks(db_conn, operations)
+    return len(rollups)
 
-            total_resolved += 1
-            total_seconds += seconds
 
-            for i in range(4):
-                start = today - timedelta(days=(i + 1) * 7)
-                end = today - timedelta(days=i * 7)
+@app.cli.command('rebuild-ticket-rollups')
+def rebuild_ticket_rollups_command():
+    """Recompute the ticket resolution rollups from the closed tickets."""
+    written = rebuild_ticket_rollups(get_db_or_raise())
+    click.echo(f"Rebuilt {written} ticket rollup documents.")
 
-                if start <= resolved_at < end:
-                    weekly_buckets[f"Week {4 - i}"].append(hours)
-                    break
+# ============================
+# DYNAMIC TICKET METRICS ROUTE
+# ============================
 
-        avg_hours = round((total_seconds / total_resolved) / 3600, 1) if total_resolved else 0
 
-        trend_labels = list(weekly_buckets.keys())
-        trend_values = [
-            round(sum(values) / len(values), 2) if values else 0
-            for values in weekly_buckets.values()
-        ]
+def load_closed_tickets(db, resolved_from=None, resolved_to=None):
+    """
+    Loads closed tickets (optionally only those resolved in [from, to)) into
+    NumPy arrays. Only the timestamp and priority fields are transferred.
+    """
+    query = db.collection('tickets').where('status', '==', 'Closed')
+    if resolved_from is not None:
+        query = query.where('resolved_at', '>=', resolved_from)
+    if resolved_to is not None:
+        query = query.where('resolved_at', '<', resolved_to)
+    docs = query.select(list(TICKET_FIELDS)).stream()
+    return TicketArrays.from_tickets(doc.to_dict() or {} for doc in docs)
 
-        return jsonify({
-            "total_resolved": total_resolved,
-            "avg_resolution_hours": avg_hours,
-            "trend_labels": trend_labels,
-            "trend_values": trend_values
-        }), 200
 
-    except Exception as e:
-        print("Error calculating ticket metrics:", e)
+def ticket_metrics_by_scan(db):
+    """
+    Used until the rollups have been built: all-time totals plus four rolling
+    weeks (Week 4 = the last 7 days), computed with the NumPy engine.
+    """
+    arrays = load_closed_tickets(db)
+
+    week = 7 * 24 * 3600
+    now = int(time.time())
+    edges = [now - offset * week for offset in range(4, -1, -1)]
+    _, _, weekly = bucketed_metrics(arrays, edges)
+
+    total_resolved = len(arrays)
+    avg_hours = round(float(arrays.durations.mean()) / 3600, 1) if total_resolved else 0
+
+    return {
+        "total_resolved": total_resolved,
+        "avg_resolution_hours": avg_hours,
+        "trend_labels": [f"Week {index + 1}" for index in range(4)],
+        "trend_values": [bucket['mean_hours'] for bucket in weekly]
+    }
+
+
+def ticket_percentiles_for_range(db, start, end, granularity):
+    """
+    Mean/median/p90/p99 resolution hours per calendar bucket and priority,
+    computed from the closed tickets resolved inside the buckets.
+    """
+    buckets = rollup_buckets(start, end, granularity)
+    days = [first_day for _, _, first_day in buckets]
+    days.append(next_bucket_start(days[-1], granularity))
+    boundaries = [datetime(day.year, day.month, day.day, tzinfo=timezone.utc) for day in days]
+
+    arrays = load_closed_tickets(db, boundaries[0], boundaries[-1])
+    overall, by_priority, stats = bucketed_metrics(
+        arrays, [int(boundary.timestamp()) for boundary in boundaries]
+    )
+    for (_, label, first_day), bucket in zip(buckets, stats):
+        bucket.update({'label': label, 'start': first_day.isoformat()})
+
+    return {
+        "engine": "numpy",
+        "granularity": granularity,
+        "start": days[0].isoformat(),
+        "end": end.isoformat(),
+        "overall": overall,
+        "by_priority": by_priority,
+        "trend_labels": [bucket['label'] for bucket in stats],
+        "trend_values": [bucket['mean_hours'] for bucket in stats],
+        "buckets": stats,
+    }
+
+
+@app.route('/api/ticket-metrics', methods=['GET'])
+def get_ticket_metrics():
+    """
+    Ticket resolution metrics built from the rollup documents.
+    Without parameters: all-time totals plus the four-week trend.
+    With ?start=YYYY-MM-DD&end=YYYY-MM-DD&granularity=day|week|month: one bucket
+    per period (start defaults to 27 days before end, end to today).
+    Add ?stats=percentiles for mean/median/p90/p99 per bucket and priority,
+    computed from the closed tickets in the range.
+    """
+    try:
+        db = get_db_or_raise()
+    except RuntimeError:
+        return jsonify({"error": "Database connection failed"}), 503
+
+    try:
+        if any(arg in request.args for arg in ('start', 'end', 'granularity', 'stats')):
+            try:
+                end_arg, start_arg = request.args.get('end'), request.args.get('start')
+                end = datetime.strptime(end_arg, '%Y-%m-%d').date() if end_arg \
+                    else datetime.now(timezone.utc).date()
+                start = datetime.strptime(start_arg, '%Y-%m-%d').date() if start_arg \
+                    else end - timedelta(days=27)
+                granularity = request.args.get('granularity', 'day')
+                stats = request.args.get('stats', 'rollups')
+                if stats == 'percentiles':
+                    return jsonify(ticket_percentiles_for_range(db, start, end, granularity)), 200
+                if stats != 'rollups':
+                    raise ValueError("stats must be 'rollups' or 'percentiles'")
+                return jsonify(ticket_metrics_for_range(db, start, end, granularity)), 200
+            except ValueError as err:
+                return jsonify({"error": str(err)}), 400
+
+        metrics = ticket_metrics_from_rollups(db)
+        if metrics is None:
+            metrics = ticket_metrics_by_scan(db)
+        return jsonify(metrics), 200
+
+    except Exception:
+        logger.exception("Error calculating ticket metrics")
         return jsonify({"error": "Database connection failed"}), 503
 
 
 @app.route('/api/lead-kpis', methods=['GET'])
 
 def get_lead_kpis():
-    db = get_db()
-    if db is None:
+    try:
+        db = get_db_or_raise()
+    except RuntimeError:
         return jsonify({"error": "Database connection failed"}), 503
-        
+
     try:
-        # Convert Firestore stream to list to count items
-        leads_stream = db.collection('leads').where('status', '==', 'New').stream()
-        new_leads = list(leads_stream)
-        new_leads_count = len(new_leads)
+        counters = read_kpi_counters(db, 'leads')
+        if counters is not None:
+            new_leads_count = (counters.get('by_status') or {}).get('New', 0)
+        else:
+            new_leads_count = count_documents(db.collection('leads').where('status', '==', 'New'))
 
         return jsonify({
             "new_leads_count": new_leads_count
         }), 200
         
-    except Exception as e:
-        print(f"Error calculating lead KPI: {e}")
+    except Exception:
+        logger.exception("Error calculating lead KPI")
         return jsonify({"error": "Database connection failed"}), 503
 
 
@@ -1237,26 +2594,360 @@ def monitor_page():
     """Renders the System Monitor / Audit Log page."""
     return render_template('monitor.html')
 
+MAX_LOG_LINES = 1000
+MAX_LOG_RECORDS = 500
+LOG_QUERY_PARAMS = ('start', 'end', 'level', 'path', 'status', 'slow', 'limit', 'cursor')
+
+def _parse_log_offset(value):
+    """A `since` cursor from the query string or Last-Event-ID header, or None."""
+    if value is None or value == '':
+        return None
+    offset = int(value)
+    if offset < 0:
+        raise ValueError(value)
+    return offset
+
+def _parse_log_time(value):
+    """Epoch seconds or an ISO 8601 timestamp (UTC unless it has an offset)."""
+    try:
+        return float(value)
+    except ValueError:
+        moment = datetime.fromisoformat(value.replace('Z', '+00:00'))
+        if moment.tzinfo is None:
+            moment = moment.replace(tzinfo=timezone.utc)
+        return moment.timestamp()
+
+def _query_log_store():
+    """Filtered, paginated search of the log store (all workers, all rotations)."""
+    if log_store is None:
+        return jsonify({"error": "Log store is disabled (LOG_STORE_PATH)"}), 503
+    args = request.args
+    try:
+        filters = {
+            'start': _parse_log_time(args['start']) if args.get('start') else None,
+            'end': _parse_log_time(args['end']) if args.get('end') else None,
+            'path_prefix': args.get('path') or None,
+            'cursor': args.get('cursor') or None,
+        }
+        if filters['cursor']:
+            decode_log_cursor(filters['cursor'])
+        if args.get('level'):
+            filters['min_level'] = logging.getLevelName(args['level'].upper())
+            if not isinstance(filters['min_level'], int):
+                raise ValueError(args['level'])
+        if args.get('status'):
+            status = args['status'].lower()
+            filters['status'] = status if re.match(r'^[1-5]xx$', status) else int(status)
+        if args.get('slow', '').lower() in ('1', 'true', 'yes'):
+            filters['min_duration'] = app.config["SLOW_REQUEST_SECONDS"]
+        limit = int(args.get('limit', 100))
+    except ValueError:
+        return jsonify({"error": "Invalid log query parameter"}), 400
+    limit = max(1, min(limit, MAX_LOG_RECORDS))
+
+    try:
+        records, next_cursor = log_store.query(limit=limit, **filters)
+    except Exception:
+        logger.exception("Error querying the log store")
+        return jsonify({"error": "Internal Server Error"}), 500
+    for record in records:
+        record['time'] = datetime.fromtimestamp(record['ts'], timezone.utc).isoformat()
+    return jsonify({"records": records, "next_cursor": next_cursor}), 200
+
 @app.route('/api/logs', methods=['GET'])
 def get_system_logs():
     """
-    Reads the last 50 lines from the application log file.
+    The newest application log lines, newest first.
     Fulfills Epic 9: Log user activities in audit trail & Generate monitoring report.
+
+    ?lines=N (default 50) returns the last N lines; ?since=<offset> returns only
+    the lines appended after a previous response's "offset". "reset" is true when
+    the log was truncated or rotated since that offset.
+
+    With any of start, end (epoch or ISO 8601), level (minimum), path (prefix),
+    status (code or "5xx"), slow=1, limit or cursor, searches the log store
+    instead and returns {"records": [...], "next_cursor": ...}.
     """
+    if any(name in request.args for name in LOG_QUERY_PARAMS):
+        return _query_log_store()
+    try:
+        since = _parse_log_offset(request.args.get('since'))
+        count = int(request.args.get('lines', 50))
+    except ValueError:
+        return jsonify({"error": "since and lines must be non-negative integers"}), 400
+    count = max(0, min(count, MAX_LOG_LINES))
+
     try:
-        log_lines = []
-        if os.path.exists('crm_app.log'):
-            with open('crm_app.log', 'r') as f:
-                # Read all lines and keep the last 50
-                lines = f.readlines()
-                log_lines = lines[-50:]
-                # Reverse them so newest is at the top
-                log_lines.reverse()
-        return jsonify({"logs": log_lines}), 200
+        if not os.path.exists(LOG_FILE):
+            return jsonify({"logs": [], "offset": 0, "reset": since is not None and since > 0}), 200
+        reset = False
+        if since is None:
+            log_lines, offset = log_tail.tail(LOG_FILE, count)
+        else:
+            log_lines, offset, reset = log_tail.read_since(LOG_FILE, since)
+        # Reverse them so newest is at the top
+        log_lines.reverse()
+        return jsonify({"logs": log_lines, "offset": offset, "reset": reset}), 200
     except Exception:
         logger.exception("Error reading log file")
         return jsonify({"logs": ["Error reading logs."]}), 500
 
+@app.route('/api/logs/stream', methods=['GET'])
+def stream_system_logs():
+    """
+    Server-Sent Events: pushes log lines as they are appended. Starts after
+    ?since=<offset> (or the reconnecting browser's Last-Event-ID), otherwise at
+    the current end of the log.
+    """
+    try:
+        since = _parse_log_offset(request.headers.get('Last-Event-ID')
+                                  or request.args.get('since'))
+    except ValueError:
+        return jsonify({"error": "since must be a non-negative integer"}), 400
+    if since is None:
+        since = log_tail.end_offset(LOG_FILE) if os.path.exists(LOG_FILE) else 0
+
+    events = log_tail.sse_events(LOG_FILE, since,
+                                 duration=app.config["LOG_STREAM_MAX_SECONDS"],
+                                 poll_interval=app.config["LOG_STREAM_POLL_SECONDS"])
+    response = Response(events, mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'  # nginx: do not buffer the stream
+    return response
+
+
+@app.cli.command('import-logs')
+@click.argument('paths', nargs=-1, required=True, type=click.Path(exists=True, dir_okay=False))
+def import_logs_command(paths):
+    """Load text log files (e.g. rotated crm_app.log.N.gz) into the log store."""
+    if log_store is None:
+        raise click.UsageError("The log store is disabled (LOG_STORE_PATH).")
+    for path in paths:
+        opener = gzip.open if path.endswith('.gz') else open
+        with opener(path, 'rt', encoding='utf-8', errors='replace') as f:
+            click.echo(f"{path}: imported {import_text_log(log_store, f)} records")
+
+@app.route('/api/admin/profiles', methods=['GET'])
+@admin_required
+def list_profile_captures():
+    """Slow-request captures (metadata and datastore breakdown), newest first."""
+    store = _capture_store(app.config["PROFILE_CAPTURE_DIR"], app.config["PROFILE_MAX_CAPTURES"])
+    return jsonify({"captures": store.list()}), 200
+
+@app.route('/api/admin/profiles/<capture_id>', methods=['GET'])
+@admin_required
+def get_profile_capture(capture_id):
+    """One capture as JSON, or its stacks in collapsed format with ?format=folded."""
+    store = _capture_store(app.config["PROFILE_CAPTURE_DIR"], app.config["PROFILE_MAX_CAPTURES"])
+    try:
+        capture = store.load(capture_id)
+    except KeyError:
+        return jsonify({"error": "Capture not found"}), 404
+    if request.args.get('format') == 'folded':
+        response = make_response(capture['folded'])
+        response.mimetype = 'text/plain'
+        response.headers['Content-Disposition'] = f'attachment; filename="{capture_id}.folded"'
+        return response
+    return jsonify(capture), 200
+
+@app.route('/api/admin/traces', methods=['GET'])
+@admin_required
+def list_traces():
+    """The newest traces kept by this worker, newest first."""
+    return jsonify({"traces": trace_exporter.recent()}), 200
+
+@app.route('/api/admin/traces/<trace_id>', methods=['GET'])
+@admin_required
+def get_trace(trace_id):
+    """One kept trace as OTLP/JSON, or as a text waterfall with ?format=text."""
+    try:
+        trace, spans = trace_exporter.get(trace_id)
+    except KeyError:
+        return jsonify({"error": "Trace not found"}), 404
+    if request.args.get('format') == 'text':
+        response = make_response(tracing.waterfall(trace, spans))
+        response.mimetype = 'text/plain'
+        return response
+    return jsonify(tracing.to_otlp(trace, spans, app.config["TRACE_SERVICE_NAME"])), 200
+
+
+@lru_cache(maxsize=4)
+def _log_analyzer(state_path):
+    return LogAnalyzer(RouteNormalizer(rule.rule for rule in app.url_map.iter_rules()), state_path)
+
+
+LOG_REPORT_HOUR = re.compile(r'^\d{4}-\d{2}-\d{2}(T\d{2})?$')
+
+
+def _report_hour(value, name):
+    if value is not None and not LOG_REPORT_HOUR.match(value):
+        raise ValueError(f"{name} must be YYYY-MM-DD or YYYY-MM-DDTHH (log time)")
+    return value
+
+
+@app.cli.command('analyze-logs')
+@click.argument('paths', nargs=-1, type=click.Path(exists=True, dir_okay=False))
+@click.option('--since', help="First hour to report, YYYY-MM-DD[THH] in log time.")
+@click.option('--until', help="Hour (or day) after the last one to report.")
+@click.option('--route', help="Only this route template, e.g. /api/customer/<string:customer_id>.")
+@click.option('--json', 'as_json', is_flag=True, help="Print the report as JSON.")
+def analyze_logs_command(paths, since, until, route, as_json):
+    """
+    Per-route latency percentiles, error rates and the slowest requests per hour
+    from crm_app.log and its rotated copies (or PATHS, oldest first). Only lines
+    appended since the last run are parsed.
+    """
+    try:
+        since, until = _report_hour(since, '--since'), _report_hour(until, '--until')
+    except ValueError as err:
+        raise click.UsageError(str(err))
+    analyzer = _log_analyzer(app.config["LOG_REPORT_STATE"])
+    for path, found in analyzer.update(paths or rotated_files(LOG_FILE)).items():
+        click.echo(f"{path}: {found} new requests", err=True)
+    report = analyzer.report(since, until, route)
+    click.echo(json.dumps(report, indent=2) if as_json else format_report(report), nl=False)
+
+@app.route('/api/admin/log-report', methods=['GET'])
+@admin_required
+def get_log_report():
+    """
+    The analyze-logs report as JSON for ?since=&until= (YYYY-MM-DD[THH], log
+    time) and ?route=; new log lines are read first unless ?refresh=0.
+    """
+    try:
+        since = _report_hour(request.args.get('since'), 'since')
+        until = _report_hour(request.args.get('until'), 'until')
+    except ValueError as err:
+        return jsonify({"error": str(err)}), 400
+    analyzer = _log_analyzer(app.config["LOG_REPORT_STATE"])
+    if request.args.get('refresh', '1') != '0':
+        analyzer.update(rotated_files(LOG_FILE))
+    return jsonify(analyzer.report(since, until, request.args.get('route'))), 200
+
+# --- Admin: On-Demand Profiling (this worker only) ---
+
+PROFILER_MAX_SECONDS = 60
+_thread_sampling_lock = threading.Lock()
+memory_snapshots = SnapshotRegistry()
+
+@app.route('/api/admin/profiler/stacks', methods=['GET'])
+@admin_required
+def sample_all_threads():
+    """
+    Samples every thread of this worker for ?seconds=N (default 5, max 60), one
+    sample per ?interval_ms (default 10). Returns collapsed stacks for flame graph
+    tools as text, or as JSON with ?format=json.
+    """
+    try:
+        seconds = float(request.args.get('seconds', 5))
+        interval = float(request.args.get('interval_ms', 10)) / 1000
+    except ValueError:
+        return jsonify({"error": "seconds and interval_ms must be numbers"}), 400
+    if not 0 <= seconds <= PROFILER_MAX_SECONDS or interval <= 0:
+        return jsonify({"error": f"seconds must be between 0 and {PROFILER_MAX_SECONDS}"}), 400
+
+    if not _thread_sampling_lock.acquire(blocking=False):
+        return jsonify({"error": "A sampling run is already in progress"}), 409
+    try:
+        stacks, samples = sample_threads(seconds, interval, exclude={threading.get_ident()})
+    finally:
+        _thread_sampling_lock.release()
+
+    if request.args.get('format') == 'json':
+        return jsonify({"pid": os.getpid(), "seconds": seconds, "interval": interval,
+                        "samples": samples, "stacks": dict(stacks)}), 200
+    response = make_response(folded(stacks))
+    response.mimetype = 'text/plain'
+    response.headers['X-Profile-Samples'] = str(samples)
+    return response
+
+def _memory_query_args():
+    group_by = request.args.get('group_by', 'lineno')
+    if group_by not in MEMORY_GROUP_BY:
+        raise ValueError(group_by)
+    return group_by, int(request.args.get('limit', 25))
+
+@app.route('/api/admin/tracemalloc', methods=['GET'])
+@admin_required
+def tracemalloc_status():
+    """Whether this worker traces allocations, traced/peak bytes and its snapshots."""
+    return jsonify(memory_snapshots.status()), 200
+
+@app.route('/api/admin/tracemalloc/start', methods=['POST'])
+@admin_required
+def tracemalloc_start():
+    """Starts tracing allocations (JSON body: {"frames": 25}); it slows the worker down."""
+    data = request.get_json(silent=True) or {}
+    frames = data.get('frames', 25)
+    if not isinstance(frames, int) or not 1 <= frames <= 100:
+        return jsonify({"error": "frames must be an integer between 1 and 100"}), 400
+    memory_snapshots.start(frames)
+    logger.warning("tracemalloc started in pid %s with %d frames", os.getpid(), frames)
+    return jsonify(memory_snapshots.status()), 200
+
+@app.route('/api/admin/tracemalloc/stop', methods=['POST'])
+@admin_required
+def tracemalloc_stop():
+    """Stops tracing and discards the snapshots."""
+    memory_snapshots.stop()
+    return jsonify(memory_snapshots.status()), 200
+
+@app.route('/api/admin/tracemalloc/snapshots', methods=['POST'])
+@admin_required
+def tracemalloc_take_snapshot():
+    """Takes a snapshot; returns its id and largest allocation sites (?group_by, ?limit)."""
+    try:
+        group_by, limit = _memory_query_args()
+    except ValueError:
+        return jsonify({"error": f"group_by must be one of {', '.join(MEMORY_GROUP_BY)}; limit an integer"}), 400
+    try:
+        snapshot_id = memory_snapshots.take()
+    except RuntimeError as exc:
+        return jsonify({"error": str(exc)}), 409
+    return jsonify({"id": snapshot_id, "pid": os.getpid(),
+                    "top": memory_snapshots.top(snapshot_id, group_by, limit)}), 201
+
+@app.route('/api/admin/tracemalloc/snapshots/<int:snapshot_id>', methods=['GET'])
+@admin_required
+def tracemalloc_snapshot(snapshot_id):
+    """Largest allocation sites of one snapshot."""
+    try:
+        group_by, limit = _memory_query_args()
+        return jsonify({"id": snapshot_id, "top": memory_snapshots.top(snapshot_id, group_by, limit)}), 200
+    except ValueError:
+        return jsonify({"error": f"group_by must be one of {', '.join(MEMORY_GROUP_BY)}; limit an integer"}), 400
+    except KeyError:
+        return jsonify({"error": "Snapshot not found"}), 404
+
+@app.route('/api/admin/tracemalloc/diff', methods=['GET'])
+@admin_required
+def tracemalloc_diff():
+    """Allocation sites that grew the most between snapshots ?from=<id> and ?to=<id>."""
+    try:
+        old_id, new_id = int(request.args['from']), int(request.args['to'])
+        group_by, limit = _memory_query_args()
+    except (KeyError, ValueError):
+        return jsonify({"error": "from and to snapshot ids are required; group_by must be one of "
+                                 f"{', '.join(MEMORY_GROUP_BY)}"}), 400
+    try:
+        return jsonify({"from": old_id, "to": new_id, "pid": os.getpid(),
+                        "diff": memory_snapshots.diff(old_id, new_id, group_by, limit)}), 200
+    except KeyError:
+        return jsonify({"error": "Snapshot not found"}), 404
+
+@app.route('/api/cache/stats', methods=['GET'])
+@admin_required
+def get_cache_stats():
+    """Hit/miss/eviction counters of this worker's entity cache."""
+    return jsonify(entity_cache.stats()), 200
+
+@app.route('/api/commit-stats', methods=['GET'])
+@admin_required
+def get_commit_stats():
+    """Datastore commits per endpoint in this worker (requests, commits, max per request)."""
+    with _commit_stats_lock:
+        return jsonify({endpoint: dict(stats) for endpoint, stats in commit_stats.items()}), 200
+
 @app.route('/campaigns')
 def campaigns_page():
     """Render the marketing campaigns dashboard."""
@@ -1278,14 +2969,23 @@ def campaigns_endpoint():
 
         # --- GET: Fetch History ---
         if request.method == 'GET':
-            campaigns = []
-            # Get campaigns sorted by newest first
-            docs = db_conn.collection('campaigns').order_by('created_at', direction=firestore.Query.DESCENDING).stream()
-            for doc in docs:
-                data = doc.to_dict()
-                data['id'] = doc.id
-                campaigns.append(data)
-            return jsonify(campaigns), 200
+            # Get campaigns sorted by newest first, one page at a time
+            campaigns_ref = db_conn.collection('campaigns')
+            if wants_all_pages():
+                campaign_query = campaigns_ref.order_by('created_at', direction=storage.DESCENDING)
+                return jsonify(stream_all(campaign_query)), 200
+
+            try:
+                cursor, page_size = parse_page_args()
+                campaigns, next_cursor = fetch_page(
+                    campaigns_ref,
+                    [('created_at', storage.DESCENDING),
+                     ('__name__', storage.DESCENDING)],
+                    cursor, page_size
+                )
+            except ValueError as err:
+                return jsonify({"error": str(err)}), 400
+            return page_response(campaigns, next_cursor)
 
         # --- POST: Create & Send ---
         data = request.get_json()
@@ -1301,8 +3001,8 @@ def campaigns_endpoint():
         # In a real app, this would run a complex query. For MVP, we mock logic.
         audience_count = 0
         if segment == 'All':
-            # Count actual customers in DB
-            audience_count = len(list(db_conn.collection('customers').stream()))
+            # Count actual customers in DB (server-side count, no document reads)
+            audience_count = count_documents(db_conn.collection('customers'))
         elif segment == 'VIP':
             audience_count = 5 # Mock count
         else:
@@ -1325,7 +3025,7 @@ def campaigns_endpoint():
             # Story: Track open rates (We start at 0, and update later)
             "open_rate": 0, 
             "click_rate": 0,
-            "created_at": firestore.SERVER_TIMESTAMP
+            "created_at": storage.SERVER_TIMESTAMP
         }
         
         db_conn.collection('campaigns').add(new_campaign)
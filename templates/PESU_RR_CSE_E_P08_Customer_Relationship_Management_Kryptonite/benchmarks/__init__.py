@@ -0,0 +1 @@
+"""Endpoint benchmarks run against the in-memory datastore (see benchmarks/endpoints.py)."""
@@ -0,0 +1,98 @@
+"""
+Throughput benchmark for the NumPy ticket metrics engine.
+
+Usage:
+    python benchmarks/bench_ticket_metrics.py                 # 10k, 100k, 1M tickets
+    python benchmarks/bench_ticket_metrics.py --sizes 50000 --granularity week
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ticket_metrics import TicketArrays, bucketed_metrics  # noqa: E402  pylint: disable=wrong-import-position
+
+PRIORITIES = ('Low', 'Medium', 'High')
+BUCKET_SECONDS = {'day': 86400, 'week': 7 * 86400}
+
+
+def synthetic_tickets(count, days=90, seed=42):
+    """Closed tickets resolved over the last 'days' days, as Firestore would return them."""
+    rng = np.random.default_rng(seed)
+    now = datetime.now(timezone.utc)
+    resolved_offsets = rng.uniform(0, days * 86400, count)
+    durations = rng.lognormal(mean=10, sigma=1, size=count)  # ~6h median, long tail
+    priorities = rng.integers(0, len(PRIORITIES), count)
+    tickets = []
+    for offset, duration, priority in zip(resolved_offsets, durations, priorities):
+        resolved = now - timedelta(seconds=float(offset))
+        tickets.append({
+            'created_at': resolved - timedelta(seconds=float(duration)),
+            'resolved_at': resolved,
+            'priority': PRIORITIES[priority],
+        })
+    return tickets
+
+
+def best_of(repeats, func):
+    """Fastest wall time of 'repeats' runs, plus the last result."""
+    best, result = float('inf'), None
+    for _ in range(repeats):
+        started = time.perf_counter()
+        result = func()
+        best = min(best, time.perf_counter() - started)
+    return best, result
+
+
+def run(sizes, granularity, days, repeats):
+    results = []
+    for size in sizes:
+        tickets = synthetic_tickets(size, days=days)
+        load_s, arrays = best_of(repeats, lambda: TicketArrays.from_tickets(tickets))
+
+        step = BUCKET_SECONDS[granularity]
+        end = int(time.time())
+        edges = np.arange(end - days * 86400, end + step, step)
+        compute_s, _ = best_of(repeats, lambda: bucketed_metrics(arrays, edges))
+
+        results.append({
+            'tickets': size,
+            'buckets': len(edges) - 1,
+            'load_seconds': round(load_s, 4),
+            'compute_seconds': round(compute_s, 4),
+            'load_tickets_per_second': int(size / load_s),
+            'compute_tickets_per_second': int(size / compute_s),
+        })
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', default='10000,100000,1000000',
+                        help='comma separated ticket counts (default: %(default)s)')
+    parser.add_argument('--granularity', choices=sorted(BUCKET_SECONDS), default='day')
+    parser.add_argument('--days', type=int, default=90, help='window the tickets are spread over')
+    parser.add_argument('--repeats', type=int, default=3)
+    parser.add_argument('--json', help='also write the results to this file')
+    args = parser.parse_args()
+
+    results = run([int(size) for size in args.sizes.split(',')], args.granularity, args.days, args.repeats)
+
+    print(f"{'tickets':>10} {'buckets':>8} {'load s':>9} {'compute s':>10} {'load t/s':>12} {'compute t/s':>13}")
+    for row in results:
+        print(f"{row['tickets']:>10} {row['buckets']:>8} {row['load_seconds']:>9} {row['compute_seconds']:>10} "
+              f"{row['load_tickets_per_second']:>12} {row['compute_tickets_per_second']:>13}")
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,202 @@
+"""
+Endpoint benchmarks.
+
+Seeds the in-memory datastore with synthetic data, drives the Flask app
+through its test client and records, per endpoint: p50/p99 latency, peak
+traced memory for one request and datastore operations per request.
+
+    python -m benchmarks.endpoints --scale 100k --iterations 50 --output results/100k.json
+    python -m benchmarks.endpoints --scale 1k --latency 0.05 --jitter 0.01   # simulated network
+    python -m benchmarks.endpoints --compare results/before.json results/after.json
+
+The in-memory engine answers a query by scanning its collection, so part of the
+latency growth between scales is the engine's, not the app's; the per-request
+operation and document counts are what to compare across code changes. The 1m
+scale holds about 3.3 million documents in memory and needs several GB of RAM.
+"""
+import argparse
+import json
+import logging
+import platform
+import random
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timezone
+from unittest import mock
+
+import numpy as np
+
+import storage
+from benchmarks.synthetic_data import SCALES, customer_id, load
+
+# name -> (method, path); '{customer_id}' is filled with a random existing customer.
+ENDPOINTS = {
+    'customers': ('GET', '/api/customers'),
+    'sales_kpis': ('GET', '/api/sales-kpis'),
+    'ticket_metrics': ('GET', '/api/ticket-metrics'),
+    'gdpr_export': ('GET', '/api/gdpr/export/{customer_id}'),
+    'check_sla': ('POST', '/api/tickets/check-sla'),
+}
+
+
+def build_derived_data(app_module, db):
+    """Builds the KPI counters and ticket rollups, as a deployed instance has them."""
+    app_module.rebuild_kpi_counters(db)
+    app_module.rebuild_ticket_rollups(db)
+
+
+def _percentile(values, q):
+    return round(float(np.percentile(values, q)) * 1000, 3)
+
+
+def measure(client, store, method, path, customers, iterations, rng):
+    """Runs one endpoint; the first call is reported separately as cold."""
+    def call():
+        target = path.format(customer_id=customer_id(rng.randrange(customers)))
+        started = time.perf_counter()
+        response = client.open(target, method=method)
+        return time.perf_counter() - started, response.status_code
+
+    first, _ = call()
+
+    store.reset_stats()
+    latencies, statuses = [], {}
+    for _ in range(iterations):
+        elapsed, status = call()
+        latencies.append(elapsed)
+        statuses[str(status)] = statuses.get(str(status), 0) + 1
+    stats = store.stats()
+
+    tracemalloc.start()
+    try:
+        call()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return {
+        'first_ms': round(first * 1000, 3),
+        'p50_ms': _percentile(latencies, 50),
+        'p99_ms': _percentile(latencies, 99),
+        'mean_ms': round(sum(latencies) / len(latencies) * 1000, 3),
+        'peak_memory_kb': round(peak / 1024, 1),
+        'status_codes': statuses,
+        'operations_per_request': {op: count / iterations for op, count in stats['operations'].items()},
+        'documents_read_per_request': stats['documents_read'] / iterations,
+        'documents_written_per_request': stats['documents_written'] / iterations,
+    }
+
+
+def run(customers, iterations=50, endpoints=None, seed=42, latency=0.0, jitter=0.0,
+        derived=True, request_logging=False):
+    """Runs the suite and returns the JSON-serialisable results."""
+    import app as app_module  # imported late: importing app configures logging
+
+    db = storage.open_backend('memory', latency=latency, jitter=jitter, seed=seed)
+    started = time.perf_counter()
+    counts = load(db, customers, seed=seed)
+    if derived:
+        build_derived_data(app_module, db)
+    setup_seconds = time.perf_counter() - started
+
+    results = {}
+    app_module.app.config['TESTING'] = True
+    previous_disable = logging.root.manager.disable
+    if not request_logging:
+        logging.disable(logging.INFO)
+    try:
+        with mock.patch.object(app_module, 'get_db', return_value=db), \
+                app_module.app.test_client() as client:
+            for name in endpoints or ENDPOINTS:
+                method, path = ENDPOINTS[name]
+                app_module.entity_cache.clear()
+                results[name] = measure(client, db.store, method, path, customers, iterations,
+                                        random.Random(seed))
+    finally:
+        logging.disable(previous_disable)
+        db.close()
+
+    return {
+        'meta': {
+            'customers': customers,
+            'documents': counts,
+            'iterations': iterations,
+            'seed': seed,
+            'latency_seconds': latency,
+            'jitter_seconds': jitter,
+            'derived_data': derived,
+            'request_logging': request_logging,
+            'setup_seconds': round(setup_seconds, 3),
+            'python': platform.python_version(),
+            'started_at': datetime.now(timezone.utc).isoformat(),
+        },
+        'endpoints': results,
+    }
+
+
+def compare(before, after):
+    """Rows of (endpoint, metric, before, after, ratio) for two result files."""
+    rows = []
+    for name, new in after['endpoints'].items():
+        old = before['endpoints'].get(name)
+        if not old:
+            continue
+        for metric in ('p50_ms', 'p99_ms', 'peak_memory_kb', 'documents_read_per_request'):
+            ratio = round(new[metric] / old[metric], 2) if old[metric] else None
+            rows.append((name, metric, old[metric], new[metric], ratio))
+    return rows
+
+
+def _print_summary(results, out):
+    meta = results['meta']
+    out.write(f"{meta['customers']} customers, {meta['iterations']} iterations, "
+              f"setup {meta['setup_seconds']}s\n")
+    out.write(f"{'endpoint':<16}{'first ms':>10}{'p50 ms':>10}{'p99 ms':>10}{'peak KB':>11}{'reads/req':>11}\n")
+    for name, row in results['endpoints'].items():
+        out.write(f"{name:<16}{row['first_ms']:>10}{row['p50_ms']:>10}{row['p99_ms']:>10}"
+                  f"{row['peak_memory_kb']:>11}{row['documents_read_per_request']:>11}\n")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[1],
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--scale', choices=sorted(SCALES), default='1k')
+    parser.add_argument('--customers', type=int, help='exact customer count (overrides --scale)')
+    parser.add_argument('--iterations', type=int, default=50)
+    parser.add_argument('--endpoint', action='append', choices=sorted(ENDPOINTS), dest='endpoints',
+                        help='run only this endpoint (repeatable)')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--latency', type=float, default=0.0, help='simulated seconds per datastore call')
+    parser.add_argument('--jitter', type=float, default=0.0, help='extra random seconds per call, up to this')
+    parser.add_argument('--no-derived', action='store_true',
+                        help='skip building KPI counters/rollups (measures the fallback paths)')
+    parser.add_argument('--request-logging', action='store_true', help='keep per-request INFO logging on')
+    parser.add_argument('--output', help='write the JSON results here (default: stdout)')
+    parser.add_argument('--compare', nargs=2, metavar=('BEFORE', 'AFTER'), help='compare two result files')
+    args = parser.parse_args(argv)
+
+    if args.compare:
+        with open(args.compare[0]) as f_before, open(args.compare[1]) as f_after:
+            rows = compare(json.load(f_before), json.load(f_after))
+        for name, metric, old, new, ratio in rows:
+            print(f"{name:<16}{metric:<28}{old:>12}{new:>12}{'' if ratio is None else f'{ratio}x':>8}")
+        return 0
+
+    if args.iterations < 1:
+        parser.error('--iterations must be at least 1')
+    results = run(args.customers or SCALES[args.scale], args.iterations, args.endpoints, args.seed,
+                  args.latency, args.jitter, derived=not args.no_derived,
+                  request_logging=args.request_logging)
+    _print_summary(results, sys.stderr)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+    else:
+        json.dump(results, sys.stdout, indent=2)
+        sys.stdout.write('\n')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
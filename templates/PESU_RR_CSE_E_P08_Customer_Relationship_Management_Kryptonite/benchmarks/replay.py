@@ -0,0 +1,340 @@
+"""
+Production log replay.
+
+Reads the request lines of captured logs (crm_app.log text lines or the JSON
+access log, rotated .gz copies included), keeps their order and the gaps
+between them, and sends the same requests again: to the Flask test client
+over a seeded in-memory datastore (the default), or to a running instance.
+Reports latency percentiles per route next to the durations logged in
+production.
+
+    python -m benchmarks.replay crm_app.log crm_app.log.1.gz --speed 10 --concurrency 16
+    python -m benchmarks.replay crm_access.log --speed 0 --customers 100000 --output results/replay.json
+    python -m benchmarks.replay crm_app.log --url http://staging:5000 --header "Cookie: access_token_cookie=..."
+
+Requests are sent on their original schedule divided by --speed (0: as fast
+as --concurrency workers allow). A request whose worker is still busy starts
+late; its latency is reported both from when it was sent and from when it was
+due, so a stalled build does not hide its backlog. The logs hold no request
+bodies, so only GET and HEAD requests are replayed unless --include-writes is
+given (other methods then send an empty JSON object). In local mode the ids
+in paths are mapped, consistently, to ids of the synthetic data; a sampled
+access log (ACCESS_LOG_SAMPLE_RATES) under-represents the sampled routes.
+"""
+import argparse
+import gzip
+import json
+import logging
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from unittest import mock
+
+import numpy as np
+
+import storage
+from benchmarks.endpoints import build_derived_data
+from benchmarks.synthetic_data import SCALES, document_id, load
+from log_report import UNMATCHED, RouteNormalizer
+from log_store import parse_text_log
+
+READ_METHODS = ('GET', 'HEAD')
+# route variable -> collection whose synthetic documents replace the logged id
+ID_VARIABLES = {
+    'customer_id': 'customers',
+    'lead_id': 'leads',
+    'opportunity_id': 'opportunities',
+    'ticket_id': 'tickets',
+    'campaign_id': 'campaigns',
+}
+
+
+def _open_text(path):
+    return gzip.open(path, 'rt', encoding='utf-8') if path.endswith('.gz') else open(path, encoding='utf-8')
+
+
+def _json_records(lines):
+    for line in lines:
+        try:
+            entry = json.loads(line)
+        except ValueError:
+            continue
+        if 'method' not in entry or 'path' not in entry:
+            continue
+        yield {'ts': datetime.fromisoformat(entry['ts']).timestamp(), 'method': entry['method'],
+               'path': entry['path'], 'status': entry.get('status'), 'duration': entry.get('duration') or 0.0,
+               'route': entry.get('route')}
+
+
+def read_requests(paths):
+    """
+    The logged requests of `paths` (text or JSON-lines logs, detected per
+    file) as dicts of arrival (epoch seconds: logged time minus duration),
+    method, path, status, duration and route (JSON logs only), by arrival.
+    """
+    requests = []
+    for path in paths:
+        with _open_text(path) as f:
+            first = f.readline()
+            f.seek(0)
+            if first.lstrip().startswith('{'):
+                records = _json_records(f)
+            else:
+                records = (record for record in parse_text_log(f) if 'method' in record)
+            for record in records:
+                requests.append({'arrival': record['ts'] - record['duration'], 'method': record['method'],
+                                 'path': record['path'], 'status': record['status'],
+                                 'duration': record['duration'], 'route': record.get('route')})
+    requests.sort(key=lambda request: request['arrival'])
+    return requests
+
+
+class IdMapper:
+    """
+    Rewrites the ids in request paths to ids of the synthetic data: the same
+    logged id always becomes the same local one.
+    """
+
+    def __init__(self, rules, counts):
+        self._normalize = RouteNormalizer(rules)
+        self._counts = counts
+        self._positions = {}  # rule -> [(segment index, collection)]
+        for rule in rules:
+            variables = [segment.strip('<>').rsplit(':', 1)[-1] if segment.startswith('<') else None
+                         for segment in rule.strip('/').split('/')]
+            self._positions[rule] = [(index, ID_VARIABLES[name]) for index, name in enumerate(variables)
+                                     if name in ID_VARIABLES]
+
+    def route(self, path):
+        return self._normalize(path)
+
+    def __call__(self, path):
+        rule = self._normalize(path)
+        positions = self._positions.get(rule)
+        if not positions:
+            return path
+        path, _, query = path.partition('?')
+        segments = path.strip('/').split('/')
+        for index, collection in positions:
+            count = self._counts.get(collection)
+            if count and index < len(segments):
+                segments[index] = document_id(collection, zlib.crc32(segments[index].encode()) % count)
+        return '/' + '/'.join(segments) + (f"?{query}" if query else '')
+
+
+def replay(requests, send, speed=1.0, concurrency=8, clock=time.perf_counter, sleep=time.sleep):
+    """
+    Sends `requests` on their logged schedule divided by `speed` (0: no
+    pacing) with at most `concurrency` in flight; `send(request)` returns the
+    status code. Returns one (request, status, latency, lag) tuple per
+    request, lag being how late it started.
+    """
+    results = []
+    lock = threading.Lock()
+
+    def run(request, due):
+        started = clock()
+        try:
+            status = send(request)
+        except Exception:  # connection refused, reset, timeout
+            status = 'error'
+        latency = clock() - started
+        with lock:
+            results.append((request, status, latency, max(started - due, 0.0)))
+
+    if not requests:
+        return results
+    first = requests[0]['arrival']
+    start = clock()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        for request in requests:
+            due = start + (request['arrival'] - first) / speed if speed else start
+            delay = due - clock()
+            if delay > 0:
+                sleep(delay)
+            executor.submit(run, request, due)
+    return results
+
+
+def _ms(values, q):
+    return round(float(np.percentile(values, q)) * 1000, 3)
+
+
+def summarize(results, elapsed):
+    """Per-route latency percentiles of the replay next to the logged ones."""
+    by_route = {}
+    for request, status, latency, lag in results:
+        by_route.setdefault(request['route'] or UNMATCHED, []).append((request, status, latency, lag))
+
+    routes = []
+    for route, rows in by_route.items():
+        latencies = [latency for _, _, latency, _ in rows]
+        from_due = [latency + lag for _, _, latency, lag in rows]
+        logged = [request['duration'] for request, _, _, _ in rows]
+        statuses = {}
+        for _, status, _, _ in rows:
+            statuses[str(status)] = statuses.get(str(status), 0) + 1
+        routes.append({
+            'route': route,
+            'requests': len(rows),
+            'status_codes': statuses,
+            'p50_ms': _ms(latencies, 50),
+            'p95_ms': _ms(latencies, 95),
+            'p99_ms': _ms(latencies, 99),
+            'max_ms': round(max(latencies) * 1000, 3),
+            'p99_from_schedule_ms': _ms(from_due, 99),
+            'logged_p50_ms': _ms(logged, 50),
+            'logged_p95_ms': _ms(logged, 95),
+            'logged_p99_ms': _ms(logged, 99),
+        })
+    routes.sort(key=lambda entry: entry['requests'], reverse=True)
+    lags = [lag for _, _, _, lag in results]
+    return {
+        'requests': len(results),
+        'seconds': round(elapsed, 3),
+        'requests_per_second': round(len(results) / elapsed, 1) if elapsed else None,
+        'max_lag_ms': round(max(lags) * 1000, 3) if lags else 0.0,
+        'routes': routes,
+    }
+
+
+def _http_sender(base_url, headers, timeout):
+    def send(request):
+        data = None
+        request_headers = dict(headers)
+        if request['method'] not in READ_METHODS:
+            data = b'{}'
+            request_headers['Content-Type'] = 'application/json'
+        outgoing = urllib.request.Request(base_url.rstrip('/') + request['path'], data=data,
+                                          headers=request_headers, method=request['method'])
+        try:
+            with urllib.request.urlopen(outgoing, timeout=timeout) as response:  # nosec - operator-given URL
+                response.read()
+                return response.status
+        except urllib.error.HTTPError as error:
+            return error.code
+    return send
+
+
+def _client_sender(flask_app):
+    local = threading.local()
+
+    def send(request):
+        client = getattr(local, 'client', None)
+        if client is None:
+            client = local.client = flask_app.test_client()
+        kwargs = {} if request['method'] in READ_METHODS else {'json': {}}
+        return client.open(request['path'], method=request['method'], **kwargs).status_code
+    return send
+
+
+def run(paths, speed=1.0, concurrency=8, customers=1000, seed=42, latency=0.0, jitter=0.0,
+        include_writes=False, limit=None, url=None, headers=None, timeout=30.0):
+    """Replays the requests of the log files `paths` and returns the JSON-serialisable results."""
+    import app as app_module  # imported late: importing app configures logging
+
+    requests = read_requests(paths)
+    logged = len(requests)
+    if not include_writes:
+        requests = [request for request in requests if request['method'] in READ_METHODS]
+    requests = requests[:limit] if limit else requests
+    rules = [rule.rule for rule in app_module.app.url_map.iter_rules()]
+
+    meta = {'files': list(paths), 'logged_requests': logged, 'replayed_requests': len(requests),
+            'speed': speed, 'concurrency': concurrency, 'include_writes': include_writes}
+    if url:
+        normalize = RouteNormalizer(rules)
+        for request in requests:
+            request['route'] = request['route'] or normalize(request['path'])
+        started = time.perf_counter()
+        results = replay(requests, _http_sender(url, headers or {}, timeout), speed, concurrency)
+        meta.update(url=url)
+        return {'meta': meta, **summarize(results, time.perf_counter() - started)}
+
+    db = storage.open_backend('memory', latency=latency, jitter=jitter, seed=seed)
+    counts = load(db, customers, seed=seed)
+    build_derived_data(app_module, db)
+    mapper = IdMapper(rules, counts)
+    for request in requests:
+        request['route'] = request['route'] or mapper.route(request['path'])
+        request['path'] = mapper(request['path'])
+
+    app_module.app.config['TESTING'] = True
+    previous_disable = logging.root.manager.disable
+    logging.disable(logging.INFO)
+    try:
+        with mock.patch.object(app_module, 'get_db', return_value=db):
+            app_module.entity_cache.clear()
+            started = time.perf_counter()
+            results = replay(requests, _client_sender(app_module.app), speed, concurrency)
+            elapsed = time.perf_counter() - started
+    finally:
+        logging.disable(previous_disable)
+        db.close()
+    meta.update(customers=customers, documents=counts, seed=seed, latency_seconds=latency,
+                jitter_seconds=jitter)
+    return {'meta': meta, **summarize(results, elapsed)}
+
+
+def _print_summary(results, out):
+    out.write(f"{results['requests']} requests in {results['seconds']}s "
+              f"({results['requests_per_second']}/s), max start lag {results['max_lag_ms']} ms\n")
+    out.write(f"{'route':<48}{'reqs':>7}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'due p99':>10}"
+              f"{'log p99':>10}\n")
+    for row in results['routes']:
+        out.write(f"{row['route']:<48}{row['requests']:>7}{row['p50_ms']:>10}{row['p95_ms']:>10}"
+                  f"{row['p99_ms']:>10}{row['p99_from_schedule_ms']:>10}{row['logged_p99_ms']:>10}\n")
+
+
+def _header(value):
+    name, separator, content = value.partition(':')
+    if not separator or not name.strip():
+        raise argparse.ArgumentTypeError(f"expected 'Name: value', got {value!r}")
+    return name.strip(), content.strip()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[1],
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('paths', nargs='+', metavar='LOG', help='crm_app.log or JSON access log files, oldest first')
+    parser.add_argument('--speed', type=float, default=1.0, help='replay this many times faster (0: unpaced)')
+    parser.add_argument('--concurrency', type=int, default=8, help='requests in flight at most')
+    parser.add_argument('--limit', type=int, help='replay only the first N requests')
+    parser.add_argument('--include-writes', action='store_true',
+                        help='also replay POST/PUT/DELETE requests (with an empty JSON body)')
+    parser.add_argument('--url', help='replay against this running instance instead of the test client')
+    parser.add_argument('--header', type=_header, action='append', default=[],
+                        help="extra 'Name: value' header for --url requests (repeatable)")
+    parser.add_argument('--timeout', type=float, default=30.0, help='seconds per --url request')
+    parser.add_argument('--scale', choices=sorted(SCALES), default='1k')
+    parser.add_argument('--customers', type=int, help='exact customer count (overrides --scale)')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--latency', type=float, default=0.0, help='simulated seconds per datastore call')
+    parser.add_argument('--jitter', type=float, default=0.0, help='extra random seconds per call, up to this')
+    parser.add_argument('--output', help='write the JSON results here (default: stdout)')
+    args = parser.parse_args(argv)
+
+    if args.speed < 0:
+        parser.error('--speed must not be negative')
+    if args.concurrency < 1:
+        parser.error('--concurrency must be at least 1')
+    results = run(args.paths, args.speed, args.concurrency, args.customers or SCALES[args.scale], args.seed,
+                  args.latency, args.jitter, args.include_writes, args.limit, args.url, dict(args.header),
+                  args.timeout)
+    _print_summary(results, sys.stderr)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+    else:
+        json.dump(results, sys.stdout, indent=2)
+        sys.stdout.write('\n')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
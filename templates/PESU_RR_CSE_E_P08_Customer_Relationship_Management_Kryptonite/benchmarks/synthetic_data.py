@@ -0,0 +1,157 @@
+"""
+Seeded synthetic CRM data with the document shapes app.py writes.
+
+For N customers the generator produces N loyalty profiles, N/2 leads, N/4
+opportunities, N support tickets and N/1000 (at least 10) campaigns, spread
+over the last 180 days. The same seed and 'now' always give the same data.
+"""
+import random
+import string
+from datetime import datetime, timedelta, timezone
+
+SCALES = {'1k': 1_000, '100k': 100_000, '1m': 1_000_000}
+
+LEAD_STATUSES = ('New', 'New', 'Contacted', 'Qualified', 'Converted')
+LEAD_SOURCES = ('Web', 'Referral', 'Event', 'Cold Call', 'Partner')
+STAGES = ('Qualification', 'Qualification', 'Proposal', 'Negotiation', 'Won', 'Lost')
+TICKET_STATUSES = ('Open', 'Closed', 'Closed', 'Closed', 'Escalated')
+PRIORITIES = ('Low', 'Medium', 'Medium', 'High')
+TIERS = ('Bronze', 'Bronze', 'Silver', 'Gold')
+CHANNELS = ('Email', 'SMS')
+SEGMENTS = ('All', 'VIP', 'New')
+HISTORY_DAYS = 180
+BATCH_SIZE = 500
+
+
+# collection -> document id prefix
+ID_PREFIXES = {'customers': 'cust', 'loyalty_profiles': 'cust', 'leads': 'lead', 'opportunities': 'opp',
+               'tickets': 'ticket', 'campaigns': 'campaign'}
+
+
+def customer_id(n):
+    return f"cust-{n:07d}"
+
+
+def _doc_id(prefix, n):
+    return f"{prefix}-{n:07d}"
+
+
+def document_id(collection, n):
+    """ID of the n-th generated document of a collection."""
+    return _doc_id(ID_PREFIXES[collection], n)
+
+
+def _when(rng, now, days=HISTORY_DAYS):
+    return now - timedelta(seconds=rng.randrange(days * 86400))
+
+
+def generate(customers, seed=42, now=None):
+    """Yields (collection, doc_id, data) for a dataset with 'customers' customers."""
+    rng = random.Random(seed)
+    now = now or datetime.now(timezone.utc)
+
+    for n in range(customers):
+        cid = customer_id(n)
+        created = _when(rng, now)
+        name = f"Customer {n}"
+        yield 'customers', cid, {
+            'name': name,
+            'email': f"customer{n}@example.com",
+            'phone': f"+91{rng.randrange(10 ** 9, 10 ** 10)}",
+            'company': f"Company {rng.randrange(max(customers // 20, 1))}",
+            'loyalty_profile_id': cid,
+            'createdAt': created,
+        }
+        yield 'loyalty_profiles', cid, {
+            'customer_id': cid,
+            'points': rng.randrange(0, 5000),
+            'tier': rng.choice(TIERS),
+            'referral_code': name[:3].upper() + ''.join(rng.choices(string.ascii_uppercase + string.digits, k=5)),
+            'createdAt': created,
+        }
+
+    for n in range(customers // 2):
+        yield 'leads', _doc_id('lead', n), {
+            'name': f"Lead {n}",
+            'email': f"lead{n}@example.com",
+            'source': rng.choice(LEAD_SOURCES),
+            'status': rng.choice(LEAD_STATUSES),
+            'createdAt': _when(rng, now),
+        }
+
+    for n in range(customers // 4):
+        stage = rng.choice(STAGES)
+        yield 'opportunities', _doc_id('opp', n), {
+            'lead_id': _doc_id('lead', rng.randrange(max(customers // 2, 1))),
+            'name': f"Lead {n}",
+            'email': f"lead{n}@example.com",
+            'source': rng.choice(LEAD_SOURCES),
+            'stage': stage,
+            'amount': round(rng.uniform(500, 50000), 2) if stage != 'Qualification' else 0.0,
+            'createdAt': _when(rng, now),
+        }
+
+    for n in range(customers):
+        created = _when(rng, now)
+        status = rng.choice(TICKET_STATUSES)
+        ticket = {
+            'customer_id': customer_id(rng.randrange(customers)),
+            'issue': f"Issue {n}",
+            'status': status,
+            'priority': rng.choice(PRIORITIES),
+            'created_at': created,
+            'sla_deadline': (created + timedelta(hours=24)).isoformat(),
+        }
+        if status == 'Closed':
+            ticket['resolved_at'] = ticket['updated_at'] = min(
+                created + timedelta(seconds=rng.expovariate(1 / 36000)), now)
+        yield 'tickets', _doc_id('ticket', n), ticket
+
+    for n in range(max(customers // 1000, 10)):
+        open_rate = rng.randrange(0, 60)
+        yield 'campaigns', _doc_id('campaign', n), {
+            'name': f"Campaign {n}",
+            'type': rng.choice(CHANNELS),
+            'segment': rng.choice(SEGMENTS),
+            'status': 'Sent',
+            'audience_size': customers,
+            'open_rate': open_rate,
+            'click_rate': int(open_rate * 0.4),
+            'created_at': _when(rng, now),
+        }
+
+
+def load(db, customers, seed=42, now=None):
+    """
+    Writes a generated dataset into 'db' (a storage client) and returns the
+    document count per collection. Stores with a seed() method (the in-memory
+    engine) are filled directly; others through batches of 500 writes.
+    """
+    counts = {}
+    store = getattr(db, 'store', None)
+    direct = hasattr(store, 'seed')
+    pending = {} if direct else []
+
+    def flush():
+        if direct:
+            for collection, documents in pending.items():
+                store.seed(collection, documents)
+            pending.clear()
+            return
+        batch = db.batch()
+        for collection, doc_id, data in pending:
+            batch.set(db.collection(collection).document(doc_id), data)
+        batch.commit()
+        pending.clear()
+
+    for count, (collection, doc_id, data) in enumerate(generate(customers, seed, now), 1):
+        counts[collection] = counts.get(collection, 0) + 1
+        if direct:
+            pending.setdefault(collection, {})[doc_id] = data
+        else:
+            pending.append((collection, doc_id, data))
+        if count % (BATCH_SIZE * (100 if direct else 1)) == 0:
+            flush()
+    if pending:
+        flush()
+    return counts
@@ -0,0 +1,213 @@
+"""Streaming bulk import of records (CSV or NDJSON, optionally gzipped) into Firestore."""
+import csv
+import gzip
+import io
+import json
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from unit_of_work import MAX_BATCH_WRITES
+
+GZIP_MAGIC = b'\x1f\x8b'
+FORMATS = ('csv', 'ndjson')
+_EXTENSIONS = {'.csv': 'csv', '.ndjson': 'ndjson', '.jsonl': 'ndjson', '.json': 'ndjson'}
+_CONTENT_TYPES = {
+    'text/csv': 'csv',
+    'application/csv': 'csv',
+    'application/x-ndjson': 'ndjson',
+    'application/ndjson': 'ndjson',
+    'application/jsonl': 'ndjson',
+}
+
+
+def detect_format(filename=None, content_type=None):
+    """Guesses 'csv' or 'ndjson' from a file name (a trailing .gz is ignored) or a MIME type."""
+    if filename:
+        name = filename.lower()
+        if name.endswith('.gz'):
+            name = name[:-3]
+        for extension, fmt in _EXTENSIONS.items():
+            if name.endswith(extension):
+                return fmt
+    if content_type:
+        return _CONTENT_TYPES.get(content_type.split(';')[0].strip().lower())
+    return None
+
+
+class _RawReader(io.RawIOBase):
+    """Adapts any object with read(n) (e.g. a WSGI input stream) to a raw binary stream."""
+
+    def __init__(self, source):
+        super().__init__()
+        self._source = source
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        data = self._source.read(len(buffer))
+        buffer[:len(data)] = data
+        return len(data)
+
+
+def open_text_stream(source, compressed=None):
+    """
+    Wraps a binary stream for incremental text reading. Gzip input is detected
+    from its magic bytes unless 'compressed' is given explicitly.
+    """
+    buffered = io.BufferedReader(_RawReader(source))
+    if compressed is None:
+        compressed = buffered.peek(2)[:2] == GZIP_MAGIC
+    if compressed:
+        buffered = gzip.GzipFile(fileobj=buffered, mode='rb')
+    return io.TextIOWrapper(buffered, encoding='utf-8-sig', newline='')
+
+
+def iter_records(text_stream, fmt):
+    """
+    Yields (row_number, record) pairs one at a time. Rows that cannot be parsed
+    are yielded with a ValueError in place of the record.
+    """
+    if fmt == 'csv':
+        for row_number, row in enumerate(csv.DictReader(text_stream, restval=''), start=1):
+            row.pop(None, None)  # values beyond the header columns
+            yield row_number, row
+    elif fmt == 'ndjson':
+        row_number = 0
+        for line in text_stream:
+            if not line.strip():
+                continue
+            row_number += 1
+            try:
+                record = json.loads(line)
+            except ValueError as err:
+                yield row_number, ValueError(f"Invalid JSON: {err}")
+                continue
+            if not isinstance(record, dict):
+                yield row_number, ValueError("Each line must be a JSON object")
+                continue
+            yield row_number, record
+    else:
+        raise ValueError(f"Unsupported format '{fmt}' (expected one of {', '.join(FORMATS)})")
+
+
+# Errors that end reading the input partway (undecodable bytes, broken gzip or CSV)
+READ_ERRORS = (OSError, EOFError, UnicodeDecodeError, csv.Error)
+
+
+class ImportReport:
+    """
+    Row counts, per-row errors (capped at max_errors) and throughput of one
+    import. 'aborted' says why reading stopped early, if it did.
+    """
+
+    def __init__(self, max_errors=1000):
+        self.rows = 0
+        self.imported = 0
+        self.failed = 0
+        self.batches = 0
+        self.errors = []
+        self.aborted = None
+        self.max_errors = max_errors
+        self._started = time.perf_counter()
+        self.seconds = 0.0
+
+    def add_error(self, row_number, message):
+        self.failed += 1
+        if len(self.errors) < self.max_errors:
+            self.errors.append({'row': row_number, 'error': message})
+
+    def finish(self):
+        self.seconds = time.perf_counter() - self._started
+
+    @property
+    def rows_per_second(self):
+        return round(self.rows / self.seconds, 1) if self.seconds else 0.0
+
+    def to_dict(self):
+        return {
+            'rows': self.rows,
+            'imported': self.imported,
+            'failed': self.failed,
+            'batches': self.batches,
+            'errors': self.errors,
+            'errors_truncated': self.failed > len(self.errors),
+            'aborted': self.aborted,
+            'seconds': round(self.seconds, 3),
+            'rows_per_second': self.rows_per_second,
+        }
+
+
+def _commit_operations(db_conn, operations):
+    batch = db_conn.batch()
+    for method, ref, args in operations:
+        getattr(batch, method)(ref, *args)
+    batch.commit()
+
+
+def run_import(db_conn, records, build_writes, workers=4, chunk_size=MAX_BATCH_WRITES, max_errors=1000):
+    """
+    Streams 'records' into Firestore.
+
+    build_writes(record) returns the (method, ref, args) operations for one
+    row or raises ValueError to reject it. A row's operations always land in
+    the same batch. Batches touch only the rows' own documents; shared ones
+    such as counters are for the caller to update once, from report.imported.
+
+    Batches of at most chunk_size writes are committed from a pool of
+    'workers' threads. At most 2 * workers batches are in flight, so memory
+    stays bounded however large the input is. If reading 'records' fails
+    partway, the rows read so far are still committed and the error is kept
+    in report.aborted. Returns an ImportReport.
+    """
+    report = ImportReport(max_errors=max_errors)
+    capacity = min(chunk_size, MAX_BATCH_WRITES)
+    pending = {}
+
+    def collect(done):
+        for future in done:
+            row_numbers = pending.pop(future)
+            error = future.exception()
+            if error is None:
+                report.imported += len(row_numbers)
+                report.batches += 1
+            else:
+                for row_number in row_numbers:
+                    report.add_error(row_number, f"Batch commit failed: {error}")
+
+    def submit(operations, row_numbers):
+        while len(pending) >= 2 * workers:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            collect(done)
+        pending[executor.submit(_commit_operations, db_conn, operations)] = row_numbers
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        operations, row_numbers = [], []
+        try:
+            for row_number, record in records:
+                report.rows += 1
+                if isinstance(record, Exception):
+                    report.add_error(row_number, str(record))
+                    continue
+                try:
+                    row_operations = build_writes(record)
+                except ValueError as err:
+                    report.add_error(row_number, str(err))
+                    continue
+                if len(row_operations) > capacity:
+                    report.add_error(row_number, "Row needs more writes than fit in one batch")
+                    continue
+                if len(operations) + len(row_operations) > capacity:
+                    submit(operations, row_numbers)
+                    operations, row_numbers = [], []
+                operations.extend(row_operations)
+                row_numbers.append(row_number)
+        except READ_ERRORS as err:
+            report.aborted = f"Could not read the input after row {report.rows}: {err}"
+
+        if row_numbers:
+            submit(operations, row_numbers)
+        collect(wait(pending).done)
+
+    report.finish()
+    return report
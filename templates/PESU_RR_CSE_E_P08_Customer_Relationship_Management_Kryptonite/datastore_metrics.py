@@ -0,0 +1,460 @@
+"""
+Per-request datastore accounting.
+
+instrument(client, recorder) wraps a datastore client (Firestore, a storage
+backend or a test double) in thin proxies that time every round trip and
+count it in an OperationRecorder: documents read and written, queries, commits
+and transactions. Each round trip also gets a "shape" (operation, collection,
+filter fields and operators, orders), so a request that runs the same shape
+over and over, the signature of an N+1 loop, can be reported. When the
+recorder has a tracer (a tracing.RequestTrace), every round trip is also
+recorded as a span, and transactions and their attempts as spans around them.
+"""
+import threading
+import time
+from collections import Counter
+from contextlib import nullcontext
+
+from storage import TransactionProxy
+
+# Round-trip kinds that are timed; 'reads' and 'writes' also count documents.
+TIMED_KINDS = ('reads', 'queries', 'commits', 'transactions')
+
+
+class OperationRecorder:
+    """Thread-safe counters for one request (bulk imports commit from worker threads)."""
+
+    def __init__(self, tracer=None):
+        self._lock = threading.Lock()
+        self.tracer = tracer
+        self.reads = 0
+        self.writes = 0
+        self.calls = Counter()
+        self.seconds = dict.fromkeys(TIMED_KINDS, 0.0)
+        self.shapes = Counter()
+
+    def record(self, kind, seconds, shape=None, reads=0, writes=0, operation=None, collection=None,
+               started=None):
+        """
+        Counts one round trip of 'seconds'. For the trace, 'started' is when it
+        began if that is earlier than 'seconds' ago (a stream read in between
+        other work).
+        """
+        with self._lock:
+            self.calls[kind] += 1
+            self.seconds[kind] += seconds
+            self.reads += reads
+            self.writes += writes
+            if shape:
+                self.shapes[shape] += 1
+        # transactions are traced as open spans around their round trips (see span())
+        if self.tracer is not None and kind != 'transactions':
+            ended = time.perf_counter()
+            operation = operation or kind
+            self.tracer.add_span(f"{operation} {collection}" if collection else operation,
+                                 ended - seconds if started is None else started, ended, {
+                                     'db.operation.name': operation,
+                                     'db.collection.name': collection,
+                                     'db.response.returned_rows': reads if kind in ('reads', 'queries') else None,
+                                     'crm.db.documents_written': writes or None,
+                                     'crm.db.shape': shape,
+                                     'crm.db.seconds': round(seconds, 6),
+                                 })
+
+    def span(self, name, attributes=None):
+        """Open trace span around a group of round trips (a no-op without a tracer)."""
+        return self.tracer.span(name, attributes) if self.tracer is not None else nullcontext({})
+
+    def add_writes(self, count):
+        with self._lock:
+            self.writes += count
+
+    @property
+    def commits(self):
+        """Commit round trips: direct writes, batch commits and transactions."""
+        with self._lock:
+            return self.calls['commits'] + self.calls['transactions']
+
+    @property
+    def total_seconds(self):
+        return sum(self.seconds.values())
+
+    def repeated_shapes(self, threshold):
+        """[(shape, count)] for shapes issued at least 'threshold' times, most frequent first."""
+        with self._lock:
+            return [(shape, count) for shape, count in self.shapes.most_common() if count >= threshold]
+
+    def summary(self):
+        with self._lock:
+            return {
+                'reads': self.reads,
+                'writes': self.writes,
+                'queries': self.calls['queries'],
+                'commits': self.calls['commits'],
+                'transactions': self.calls['transactions'],
+                'seconds': {kind: round(value, 6) for kind, value in self.seconds.items()},
+            }
+
+    def header_value(self):
+        """Compact form for the X-Datastore-Ops response header."""
+        summary = self.summary()
+        timings = ' '.join(f"{kind}_ms={summary['seconds'][kind] * 1000:.1f}" for kind in TIMED_KINDS)
+        return (f"reads={summary['reads']} writes={summary['writes']} queries={summary['queries']} "
+                f"commits={summary['commits']} transactions={summary['transactions']} {timings}")
+
+    def log_fragment(self):
+        """Suffix for the access log line."""
+        summary = self.summary()
+        return (f"DB: reads={summary['reads']} writes={summary['writes']} queries={summary['queries']} "
+                f"commits={summary['commits']} txns={summary['transactions']} "
+                f"db_time={self.total_seconds:.4f}s")
+
+
+def unwrap(value):
+    """The real object behind a proxy (anything else is returned unchanged)."""
+    if isinstance(value, (_Proxy, InstrumentedTransaction)):
+        return value.wrapped
+    return value
+
+
+def _unwrap_kwargs(kwargs):
+    if 'transaction' in kwargs:
+        kwargs = dict(kwargs, transaction=unwrap(kwargs['transaction']))
+    return kwargs
+
+
+def _timed_stream(iterable_factory, recorder, kind, shape, operation, collection=None):
+    """Yields from a lazily started stream; the round trip is recorded when it ends."""
+    elapsed, count = 0.0, 0
+    first_started = started = time.perf_counter()
+    try:
+        iterator = iter(iterable_factory())
+        elapsed += time.perf_counter() - started
+        while True:
+            started = time.perf_counter()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                elapsed += time.perf_counter() - started
+                return
+            elapsed += time.perf_counter() - started
+            count += 1
+            yield item
+    finally:
+        recorder.record(kind, elapsed, shape, reads=max(count, 1) if kind == 'queries' else count,
+                        operation=operation, collection=collection, started=first_started)
+
+
+class _Proxy:
+    """Delegates everything it does not override to the wrapped object."""
+
+    def __init__(self, wrapped, recorder):
+        self.wrapped = wrapped
+        self._recorder = recorder
+
+    def __getattr__(self, name):
+        return getattr(self.wrapped, name)
+
+    def __eq__(self, other):
+        return self.wrapped == unwrap(other)
+
+    def __hash__(self):
+        return hash(self.wrapped)
+
+    def __repr__(self):
+        return f"<instrumented {self.wrapped!r}>"
+
+
+def _shape_value(value):
+    return getattr(value, 'name', None) or str(value)
+
+
+class InstrumentedQuery(_Proxy):
+    """Query proxy; 'parts' describes the query shape without its values."""
+
+    def __init__(self, wrapped, recorder, collection, parts=()):
+        super().__init__(wrapped, recorder)
+        self._collection = collection
+        self._parts = tuple(parts)
+
+    def _derive(self, wrapped, part=None):
+        parts = self._parts + ((part,) if part else ())
+        return InstrumentedQuery(wrapped, self._recorder, self._collection, parts)
+
+    def _shape(self, operation):
+        return ' '.join((operation, self._collection) + self._parts)
+
+    def where(self, *args, **kwargs):
+        if 'filter' in kwargs:
+            query_filter = kwargs['filter']
+            part = (f"where {getattr(query_filter, 'field_path', '?')} "
+                    f"{getattr(query_filter, 'op_string', '?')}")
+        else:
+            field = args[0] if args else kwargs.get('field_path')
+            op = args[1] if len(args) > 1 else kwargs.get('op_string')
+            part = f"where {field} {op}"
+        return self._derive(self.wrapped.where(*args, **kwargs), part)
+
+    def order_by(self, field_path, *args, **kwargs):
+        direction = args[0] if args else kwargs.get('direction', 'ASCENDING')
+        return self._derive(self.wrapped.order_by(field_path, *args, **kwargs),
+                            f"order_by {field_path} {_shape_value(direction)}")
+
+    def limit(self, count):
+        return self._derive(self.wrapped.limit(count), 'limit')
+
+    def offset(self, num_to_skip):
+        return self._derive(self.wrapped.offset(num_to_skip), 'offset')
+
+    def select(self, field_paths):
+        return self._derive(self.wrapped.select(field_paths), 'select')
+
+    def start_at(self, values):
+        return self._derive(self.wrapped.start_at(unwrap(values)), 'cursor')
+
+    def start_after(self, values):
+        return self._derive(self.wrapped.start_after(unwrap(values)), 'cursor')
+
+    def end_at(self, values):
+        return self._derive(self.wrapped.end_at(unwrap(values)), 'cursor')
+
+    def end_before(self, values):
+        return self._derive(self.wrapped.end_before(unwrap(values)), 'cursor')
+
+    def stream(self, *args, **kwargs):
+        kwargs = _unwrap_kwargs(kwargs)
+        return _timed_stream(lambda: self.wrapped.stream(*args, **kwargs),
+                             self._recorder, 'queries', self._shape('query'), 'stream', self._collection)
+
+    def get(self, *args, **kwargs):
+        kwargs = _unwrap_kwargs(kwargs)
+        return list(_timed_stream(lambda: self.wrapped.get(*args, **kwargs),
+                                  self._recorder, 'queries', self._shape('query'), 'query', self._collection))
+
+    def _aggregation(self, method, *args, **kwargs):
+        wrapped = getattr(self.wrapped, method)(*args, **kwargs)
+        return InstrumentedAggregation(wrapped, self._recorder, self._shape(method), method, self._collection)
+
+    def count(self, *args, **kwargs):
+        return self._aggregation('count', *args, **kwargs)
+
+    def sum(self, *args, **kwargs):
+        return self._aggregation('sum', *args, **kwargs)
+
+    def avg(self, *args, **kwargs):
+        return self._aggregation('avg', *args, **kwargs)
+
+
+class InstrumentedCollection(InstrumentedQuery):
+
+    def __init__(self, wrapped, recorder, path):
+        super().__init__(wrapped, recorder, path)
+
+    def document(self, *args, **kwargs):
+        return InstrumentedDocument(self.wrapped.document(*args, **kwargs), self._recorder, self._collection)
+
+    def add(self, document_data, *args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return self.wrapped.add(document_data, *args, **kwargs)
+        finally:
+            self._recorder.record('commits', time.perf_counter() - started,
+                                  f"add {self._collection}", writes=1, operation='add',
+                                  collection=self._collection)
+
+
+class InstrumentedAggregation(_Proxy):
+
+    def __init__(self, wrapped, recorder, shape, operation, collection):
+        super().__init__(wrapped, recorder)
+        self._shape = shape
+        self._operation = operation
+        self._collection = collection
+
+    def _derive(self, wrapped):
+        return InstrumentedAggregation(wrapped, self._recorder, self._shape, 'aggregate', self._collection)
+
+    def count(self, *args, **kwargs):
+        return self._derive(self.wrapped.count(*args, **kwargs))
+
+    def sum(self, *args, **kwargs):
+        return self._derive(self.wrapped.sum(*args, **kwargs))
+
+    def avg(self, *args, **kwargs):
+        return self._derive(self.wrapped.avg(*args, **kwargs))
+
+    def get(self, *args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return self.wrapped.get(*args, **_unwrap_kwargs(kwargs))
+        finally:
+            # Aggregations are billed as one read per batch of index entries; count the minimum.
+            self._recorder.record('queries', time.perf_counter() - started, self._shape, reads=1,
+                                  operation=self._operation, collection=self._collection)
+
+
+class InstrumentedDocument(_Proxy):
+
+    def __init__(self, wrapped, recorder, collection):
+        super().__init__(wrapped, recorder)
+        self._collection = collection
+
+    def collection(self, collection_id):
+        return InstrumentedCollection(self.wrapped.collection(collection_id), self._recorder,
+                                      f"{self._collection}/*/{collection_id}")
+
+    def get(self, *args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return self.wrapped.get(*args, **_unwrap_kwargs(kwargs))
+        finally:
+            self._recorder.record('reads', time.perf_counter() - started,
+                                  f"get {self._collection}", reads=1, operation='get',
+                                  collection=self._collection)
+
+    def _write(self, method, *args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return getattr(self.wrapped, method)(*args, **kwargs)
+        finally:
+            self._recorder.record('commits', time.perf_counter() - started,
+                                  f"{method} {self._collection}", writes=1, operation=method,
+                                  collection=self._collection)
+
+    def set(self, *args, **kwargs):
+        return self._write('set', *args, **kwargs)
+
+    def create(self, *args, **kwargs):
+        return self._write('create', *args, **kwargs)
+
+    def update(self, *args, **kwargs):
+        return self._write('update', *args, **kwargs)
+
+    def delete(self, *args, **kwargs):
+        return self._write('delete', *args, **kwargs)
+
+
+class InstrumentedBatch(_Proxy):
+    """Counts buffered writes; commit() is the round trip."""
+
+    def __init__(self, wrapped, recorder):
+        super().__init__(wrapped, recorder)
+        self._pending = 0
+        self._collections = set()
+
+    def _buffer(self, method, reference, *args, **kwargs):
+        self._pending += 1
+        if isinstance(reference, InstrumentedDocument):
+            self._collections.add(reference._collection)
+        return getattr(self.wrapped, method)(unwrap(reference), *args, **kwargs)
+
+    def set(self, reference, *args, **kwargs):
+        return self._buffer('set', reference, *args, **kwargs)
+
+    def create(self, reference, *args, **kwargs):
+        return self._buffer('create', reference, *args, **kwargs)
+
+    def update(self, reference, *args, **kwargs):
+        return self._buffer('update', reference, *args, **kwargs)
+
+    def delete(self, reference, *args, **kwargs):
+        return self._buffer('delete', reference, *args, **kwargs)
+
+    def commit(self, *args, **kwargs):
+        pending, self._pending = self._pending, 0
+        collections, self._collections = self._collections, set()
+        started = time.perf_counter()
+        try:
+            return self.wrapped.commit(*args, **kwargs)
+        finally:
+            self._recorder.record('commits', time.perf_counter() - started, writes=pending,
+                                  operation='batch_commit', collection=','.join(sorted(collections)) or None)
+
+
+class InstrumentedTransaction(TransactionProxy):
+    """
+    Handed to @storage.transactional functions in place of the real
+    transaction; the whole run (reads, retries, commit) is timed as one.
+    """
+
+    def __init__(self, wrapped, recorder):
+        super().__init__(wrapped)
+        self._recorder = recorder
+        self._attempts = 0
+
+    def __getattr__(self, name):
+        return getattr(self.wrapped, name)
+
+    def run_transactional(self, run):
+        self._attempts = 0
+        started = time.perf_counter()
+        try:
+            with self._recorder.span('transaction') as attributes:
+                try:
+                    return run()
+                finally:
+                    attributes['crm.db.attempts'] = self._attempts
+        finally:
+            self._recorder.record('transactions', time.perf_counter() - started)
+
+    def run_attempt(self, call):
+        self._attempts += 1
+        with self._recorder.span('transaction attempt', {'crm.db.attempt': self._attempts}):
+            return call()
+
+    def get(self, ref_or_query, *args, **kwargs):
+        if isinstance(ref_or_query, InstrumentedDocument):
+            return ref_or_query.get(*args, transaction=self.wrapped, **kwargs)
+        if isinstance(ref_or_query, InstrumentedQuery):
+            return ref_or_query.stream(*args, transaction=self.wrapped, **kwargs)
+        return self.wrapped.get(ref_or_query, *args, **kwargs)
+
+    def _buffer(self, method, reference, *args, **kwargs):
+        self._recorder.add_writes(1)
+        return getattr(self.wrapped, method)(unwrap(reference), *args, **kwargs)
+
+    def set(self, reference, *args, **kwargs):
+        return self._buffer('set', reference, *args, **kwargs)
+
+    def create(self, reference, *args, **kwargs):
+        return self._buffer('create', reference, *args, **kwargs)
+
+    def update(self, reference, *args, **kwargs):
+        return self._buffer('update', reference, *args, **kwargs)
+
+    def delete(self, reference, *args, **kwargs):
+        return self._buffer('delete', reference, *args, **kwargs)
+
+
+class InstrumentedClient(_Proxy):
+
+    def collection(self, *path):
+        return InstrumentedCollection(self.wrapped.collection(*path), self._recorder, '/'.join(path))
+
+    def document(self, *path):
+        collection = '/'.join('/'.join(path).split('/')[:-1])
+        return InstrumentedDocument(self.wrapped.document(*path), self._recorder, collection)
+
+    def batch(self, *args, **kwargs):
+        return InstrumentedBatch(self.wrapped.batch(*args, **kwargs), self._recorder)
+
+    def transaction(self, *args, **kwargs):
+        return InstrumentedTransaction(self.wrapped.transaction(*args, **kwargs), self._recorder)
+
+    def get_all(self, references, *args, **kwargs):
+        references = list(references)
+        collections = ','.join(sorted({ref._collection for ref in references
+                                       if isinstance(ref, InstrumentedDocument)})) or None
+        references = [unwrap(ref) for ref in references]
+        if not references:
+            return iter(())
+        # One batched round trip; deliberately no shape, since get_all is the N+1 fix.
+        return _timed_stream(lambda: self.wrapped.get_all(references, *args, **_unwrap_kwargs(kwargs)),
+                             self._recorder, 'reads', None, 'get_all', collections)
+
+
+def instrument(client, recorder):
+    """Wraps 'client' so its round trips are counted in 'recorder' (idempotent)."""
+    if isinstance(client, InstrumentedClient):
+        return client
+    return InstrumentedClient(client, recorder)
@@ -0,0 +1,92 @@
+"""Bounded read-through cache for single Firestore documents."""
+import threading
+import time
+from collections import OrderedDict
+
+
+class EntityCache:
+    """
+    LRU cache with a TTL per entry. A loader result of None means "document
+    does not exist" and is cached for the (shorter) negative TTL, so repeated
+    lookups of missing IDs do not hit the database either.
+
+    Writes made by this process must call invalidate(); writes from other
+    workers become visible once the TTL expires.
+    """
+
+    def __init__(self, max_entries=10000, ttl=30.0, negative_ttl=5.0, clock=time.monotonic):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self._clock = clock
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        # Bumped on every invalidation so a load that raced with a write is not stored
+        self._generation = 0
+        self._stats = dict.fromkeys(
+            ('hits', 'negative_hits', 'misses', 'evictions', 'expirations', 'invalidations'), 0)
+
+    @property
+    def enabled(self):
+        return self.max_entries > 0 and self.ttl > 0
+
+    def get_or_load(self, key, loader):
+        """Returns the cached value for 'key', calling loader() on a miss."""
+        if not self.enabled:
+            return loader()
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                value, expires_at = entry
+                if expires_at > self._clock():
+                    self._entries.move_to_end(key)
+                    self._stats['negative_hits' if value is None else 'hits'] += 1
+                    return value
+                del self._entries[key]
+                self._stats['expirations'] += 1
+            self._stats['misses'] += 1
+            generation = self._generation
+
+        value = loader()
+
+        with self._lock:
+            if generation == self._generation:
+                self._store(key, value)
+        return value
+
+    def _store(self, key, value):
+        ttl = self.negative_ttl if value is None else self.ttl
+        if ttl <= 0:
+            return
+        self._entries[key] = (value, self._clock() + ttl)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self._stats['evictions'] += 1
+
+    def invalidate(self, *keys):
+        """Drops the given keys (call after every write to those documents)."""
+        with self._lock:
+            self._generation += 1
+            for key in keys:
+                if self._entries.pop(key, None) is not None:
+                    self._stats['invalidations'] += 1
+
+    def clear(self):
+        """Empties the cache and resets its statistics."""
+        with self._lock:
+            self._generation += 1
+            self._entries.clear()
+            for name in self._stats:
+                self._stats[name] = 0
+
+    def stats(self):
+        """Counters plus current size and hit ratio."""
+        with self._lock:
+            stats = dict(self._stats)
+            stats['size'] = len(self._entries)
+        lookups = stats['hits'] + stats['negative_hits'] + stats['misses']
+        stats['max_entries'] = self.max_entries
+        stats['hit_ratio'] = round((stats['hits'] + stats['negative_hits']) / lookups, 4) if lookups else 0.0
+        return stats
@@ -0,0 +1,151 @@
+"""
+Non-blocking log pipeline.
+
+Request threads only put records on an in-memory queue (QueueHandler); one
+QueueListener thread formats them and writes them to the console, the text
+application log (the format the System Monitor page parses) and, for records
+of the ACCESS_LOGGER, a JSON-lines access log.
+
+Log files rotate when they reach max_bytes or at a time boundary, whichever
+comes first; rotated files are gzipped (crm_app.log.1.gz, .2.gz, ...) on the
+listener thread. Rotation is per process: when several worker processes write
+the same file, disable it (max_bytes=0, when='') and rotate externally, e.g.
+logrotate with copytruncate.
+"""
+import atexit
+import gzip
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import shutil
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+
+TEXT_FORMAT = '%(asctime)s [%(levelname)s] %(message)s'
+ACCESS_LOGGER = 'crm.access'
+ROTATE_WHEN = ('', 'midnight', 'hourly')
+
+
+def _gzip_rotator(source, dest):
+    with open(source, 'rb') as f_in, gzip.open(dest, 'wb') as f_out:
+        shutil.copyfileobj(f_in, f_out)
+    os.remove(source)
+
+
+def _next_boundary(when, now):
+    if when == 'hourly':
+        current = datetime.fromtimestamp(now).replace(minute=0, second=0, microsecond=0)
+        return (current + timedelta(hours=1)).timestamp()
+    if when == 'midnight':
+        current = datetime.fromtimestamp(now).replace(hour=0, minute=0, second=0, microsecond=0)
+        return (current + timedelta(days=1)).timestamp()
+    return None
+
+
+class CompressingRotatingFileHandler(logging.handlers.RotatingFileHandler):
+    """
+    RotatingFileHandler that also rolls over at the next hour or local midnight
+    and gzips the rotated files. max_bytes=0 turns off size-based rotation,
+    when='' time-based rotation.
+    """
+
+    def __init__(self, filename, max_bytes=0, when='', backup_count=7, clock=time.time):
+        if when not in ROTATE_WHEN:
+            raise ValueError(f"when must be one of {ROTATE_WHEN}")
+        if (max_bytes or when) and backup_count < 1:
+            raise ValueError("rotation needs backup_count >= 1")
+        super().__init__(filename, maxBytes=max_bytes, backupCount=backup_count, encoding='utf-8')
+        self.when = when
+        self._clock = clock
+        self.namer = lambda name: f"{name}.gz"
+        self.rotator = _gzip_rotator
+        self.rollover_at = _next_boundary(when, clock())
+
+    def shouldRollover(self, record):
+        if self.rollover_at is not None and self._clock() >= self.rollover_at:
+            return True
+        return bool(super().shouldRollover(record))
+
+    def doRollover(self):
+        super().doRollover()
+        self.rollover_at = _next_boundary(self.when, self._clock())
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per record: ts, level and either the record's `access` dict or its message."""
+
+    def format(self, record):
+        entry = {
+            'ts': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+        }
+        access = getattr(record, 'access', None)
+        if access is not None:
+            entry.update(access)
+        else:
+            entry['message'] = record.getMessage()
+        return json.dumps(entry, separators=(',', ':'), default=str)
+
+
+class _ExcludeAccess(logging.Filter):
+    def filter(self, record):
+        return not (record.name == ACCESS_LOGGER or record.name.startswith(ACCESS_LOGGER + '.'))
+
+
+def build_listener(log_file, access_file=None, max_bytes=0, when='', backup_count=7,
+                   stream=sys.stdout, extra_handlers=()):
+    """
+    The queue and a (not yet started) listener writing to the console, the log
+    files and extra_handlers (which receive the access records too).
+    """
+    text_formatter = logging.Formatter(TEXT_FORMAT)
+    handlers = []
+    for handler in (logging.StreamHandler(stream),
+                    CompressingRotatingFileHandler(log_file, max_bytes, when, backup_count)):
+        handler.setFormatter(text_formatter)
+        handler.addFilter(_ExcludeAccess())
+        handlers.append(handler)
+    if access_file:
+        access_handler = CompressingRotatingFileHandler(access_file, max_bytes, when, backup_count)
+        access_handler.setFormatter(JsonFormatter())
+        access_handler.addFilter(logging.Filter(ACCESS_LOGGER))
+        handlers.append(access_handler)
+    handlers.extend(extra_handlers)
+
+    log_queue = queue.SimpleQueue()
+    return log_queue, logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+
+
+def configure_logging(log_file, access_file=None, max_bytes=0, when='', backup_count=7,
+                      level=logging.INFO, extra_handlers=(), filters=()):
+    """
+    Routes the root logger through the queue; returns the started listener.
+    `filters` run on the calling thread before a record is queued.
+    """
+    log_queue, listener = build_listener(log_file, access_file, max_bytes, when, backup_count,
+                                         extra_handlers=extra_handlers)
+    queue_handler = logging.handlers.QueueHandler(log_queue)
+    for log_filter in filters:
+        queue_handler.addFilter(log_filter)
+    root = logging.getLogger()
+    root.setLevel(level)
+    root.addHandler(queue_handler)
+    logging.getLogger(ACCESS_LOGGER).disabled = not (access_file or extra_handlers)
+    listener.start()
+    atexit.register(listener.stop)  # drains the queue on shutdown
+    return listener
+
+
+def parse_sample_rates(text):
+    """'/api/logs=0.1,/metrics=0' -> {'/api/logs': 0.1, '/metrics': 0.0} (route rule -> rate)."""
+    rates = {}
+    for item in filter(None, (part.strip() for part in text.split(','))):
+        route, _, rate = item.rpartition('=')
+        value = float(rate)
+        if not route or not 0.0 <= value <= 1.0:
+            raise ValueError(f"Invalid access log sample rate: {item!r}")
+        rates[route.strip()] = value
+    return rates
@@ -0,0 +1,352 @@
+"""
+Incremental latency report from the "Request: METHOD PATH | Status: X | Time: Ys"
+lines of the text log (crm_app.log and its rotated, gzipped copies).
+
+The analyzer keeps, per hour and route template, the request count, 4xx and
+5xx counts, latency sum and maximum and a log-scale latency histogram (each
+bucket 10% wider than the previous one, so percentiles are within 10%), and
+the slowest requests of each hour. This state is saved to a gzipped JSON
+file together with how far each log file has been read, so a later run only
+parses what was appended since.
+
+Files are recognised by their first line, not their name: rotation renames
+crm_app.log to crm_app.log.1.gz, .1.gz to .2.gz and so on, and the offset
+reached in crm_app.log still applies to the rotated copy. Rotated copies no
+longer change, so a gzipped file whose size is the one recorded when it was
+last read to the end is skipped without decompressing it again.
+"""
+import glob
+import gzip
+import hashlib
+import heapq
+import json
+import math
+import os
+import re
+import threading
+
+try:
+    import fcntl
+except ImportError:  # Windows: only the in-process lock applies
+    fcntl = None
+
+STATE_VERSION = 2
+UNMATCHED = 'unmatched'
+MIN_SECONDS = 0.0001  # the log rounds durations to 0.1 ms
+GROWTH = 1.1
+
+_REQUEST_LINE = re.compile(
+    rb'^(\d{4}-\d{2}-\d{2} \d{2}):\d{2}:\d{2},\d{3} \[\w+\] '
+    rb'Request: (\S+) (\S+) \| Status: (\d+) \| Time: ([\d.]+)s')
+_VARIABLE = re.compile(r'^<(?:(\w+)(?:\(.*\))?:)?(\w+)>$')
+_FINGERPRINT_BYTES = 4096
+
+
+class RouteNormalizer:
+    """
+    Maps request paths to the route templates (Flask rule strings) they
+    match: a trie of path segments in which a static segment is preferred to
+    a variable one, as in Flask's own routing.
+    """
+
+    def __init__(self, rules):
+        self._root = {}
+        for rule in rules:
+            node = self._root
+            for segment in rule.strip('/').split('/') if rule != '/' else []:
+                variable = _VARIABLE.match(segment)
+                if variable and variable.group(1) == 'path':
+                    key = '**'
+                elif variable or '<' in segment:
+                    key = '*'
+                else:
+                    key = segment
+                node = node.setdefault(key, {})
+            node.setdefault('', rule)
+
+    def __call__(self, path):
+        path = path.split('?', 1)[0]
+        segments = path.strip('/').split('/') if path != '/' else []
+        # most paths match on the first try; backtrack only when that dead-ends
+        node = self._root
+        for segment in segments:
+            node = node.get(segment) or node.get('*')
+            if node is None:
+                break
+        else:
+            if '' in node:
+                return node['']
+        return self._match(self._root, segments, 0) or UNMATCHED
+
+    def _match(self, node, segments, position):
+        if position == len(segments):
+            return node.get('') or (node['**'].get('') if '**' in node else None)
+        segment = segments[position]
+        for key in (segment, '*'):
+            child = node.get(key)
+            if child is not None:
+                rule = self._match(child, segments, position + 1)
+                if rule:
+                    return rule
+        rest = node.get('**')
+        return rest.get('') if rest is not None else None
+
+
+def latency_bucket(seconds):
+    if seconds <= MIN_SECONDS:
+        return 0
+    return int(math.ceil(math.log(seconds / MIN_SECONDS, GROWTH)))
+
+
+def bucket_upper_bound(bucket):
+    return MIN_SECONDS * GROWTH ** bucket
+
+
+def percentile(histogram, count, fraction, peak):
+    """Upper bound of the bucket holding the `fraction` quantile (at most `peak`)."""
+    rank, seen = fraction * count, 0
+    for bucket in sorted(histogram):
+        seen += histogram[bucket]
+        if seen >= rank:
+            return min(bucket_upper_bound(bucket), peak)
+    return peak
+
+
+def fingerprint(first_line):
+    return hashlib.sha1(first_line).hexdigest()
+
+
+def _open(path):
+    return gzip.open(path, 'rb') if path.endswith('.gz') else open(path, 'rb')
+
+
+def rotated_files(log_file):
+    """The log file and its rotated copies (name.N or name.N.gz), oldest first."""
+    def generation(path):
+        suffix = path[len(log_file) + 1:].split('.', 1)[0]
+        return int(suffix) if suffix.isdigit() else None
+
+    rotated = [path for path in glob.glob(glob.escape(log_file) + '.*') if generation(path) is not None]
+    rotated.sort(key=generation, reverse=True)
+    return rotated + ([log_file] if os.path.exists(log_file) else [])
+
+
+class LogAnalyzer:
+    """Aggregated request statistics of the log files read so far."""
+
+    def __init__(self, normalize, state_path=None, top_slow=5):
+        self.normalize = normalize
+        self.state_path = state_path
+        self.top_slow = top_slow
+        self._lock = threading.Lock()
+        self.files = {}   # fingerprint -> [bytes consumed, size of the .gz file read, or None]
+        self.hours = {}   # 'YYYY-MM-DDTHH' -> route -> [count, 4xx, 5xx, sum, max, {bucket: count}]
+        self.slow = {}    # 'YYYY-MM-DDTHH' -> heap of [seconds, method, path, status]
+        if state_path and os.path.exists(state_path):
+            self._load()
+
+    # --- State ---
+
+    def _load(self):
+        with gzip.open(self.state_path, 'rt', encoding='utf-8') as f:
+            state = json.load(f)
+        if state.get('version') != STATE_VERSION:
+            return  # written by another version: start over
+        self.files = state['files']
+        self.hours = {hour: {route: stats[:5] + [{int(bucket): n for bucket, n in stats[5].items()}]
+                             for route, stats in routes.items()}
+                      for hour, routes in state['hours'].items()}
+        self.slow = state['slow']
+
+    def save(self):
+        """Writes the state atomically (no-op without a state_path)."""
+        if not self.state_path:
+            return
+        temporary = f"{self.state_path}.{os.getpid()}.tmp"
+        with gzip.open(temporary, 'wt', encoding='utf-8') as f:
+            json.dump({'version': STATE_VERSION, 'files': self.files, 'hours': self.hours,
+                       'slow': self.slow}, f, separators=(',', ':'))
+        os.replace(temporary, self.state_path)
+
+    # --- Reading ---
+
+    def _parse(self, lines):
+        """Adds the request lines among `lines`; returns (bytes consumed, request lines found)."""
+        consumed = found = 0
+        hour_keys, durations = {}, {}  # log bytes -> parsed value; both sets are small
+        normalize, top_slow, match_line = self.normalize, self.top_slow, _REQUEST_LINE.match
+        for line in lines:
+            if not line.endswith(b'\n'):
+                break  # incomplete last line: read it next time
+            consumed += len(line)
+            if b'Request: ' not in line:
+                continue
+            match = match_line(line)
+            if not match:
+                continue
+            found += 1
+            raw_hour, method, path, status, raw_seconds = match.groups()
+
+            hour_key = hour_keys.get(raw_hour)
+            if hour_key is None:
+                hour_key = hour_keys[raw_hour] = raw_hour.decode().replace(' ', 'T')
+            duration = durations.get(raw_seconds)
+            if duration is None:
+                seconds = float(raw_seconds)
+                duration = durations[raw_seconds] = (seconds, latency_bucket(seconds))
+            seconds, bucket = duration
+            status = int(status)
+            path = path.decode('utf-8', 'replace')
+            route = normalize(path)
+
+            routes = self.hours.get(hour_key)
+            if routes is None:
+                routes = self.hours[hour_key] = {}
+            stats = routes.get(route)
+            if stats is None:
+                stats = routes[route] = [0, 0, 0, 0.0, 0.0, {}]
+            stats[0] += 1
+            if status >= 500:
+                stats[2] += 1
+            elif status >= 400:
+                stats[1] += 1
+            stats[3] += seconds
+            if seconds > stats[4]:
+                stats[4] = seconds
+            histogram = stats[5]
+            histogram[bucket] = histogram.get(bucket, 0) + 1
+
+            slowest = self.slow.get(hour_key)
+            if slowest is None:
+                slowest = self.slow[hour_key] = []
+            if len(slowest) < top_slow:
+                heapq.heappush(slowest, [seconds, method.decode(), path, status])
+            elif seconds > slowest[0][0]:
+                heapq.heapreplace(slowest, [seconds, method.decode(), path, status])
+        return consumed, found
+
+    def read_file(self, path):
+        """Parses what has been appended to `path` since the last read; returns the request lines found."""
+        compressed_size = os.path.getsize(path) if path.endswith('.gz') else None
+        with _open(path) as f:
+            first_line = f.readline(_FINGERPRINT_BYTES)
+            if not first_line.endswith(b'\n'):
+                return 0  # empty, or the first line is still being written
+            key = fingerprint(first_line)
+            offset, read_size = self.files.get(key, (0, None))
+            if compressed_size is not None and compressed_size == read_size:
+                return 0  # seeking would decompress everything up to the offset
+            f.seek(offset)
+            consumed, found = self._parse(f)
+        self.files[key] = [offset + consumed, compressed_size]
+        return found
+
+    def update(self, paths):
+        """
+        Reads the new lines of `paths` (oldest first) and saves the state;
+        returns {path: request lines found}. Concurrent updates of the same
+        state file wait for each other.
+        """
+        with self._lock, self._state_lock():
+            if self.state_path and os.path.exists(self.state_path):
+                self._load()  # another process may have read further
+            found = {path: self.read_file(path) for path in paths}
+            self.save()
+        return found
+
+    def _state_lock(self):
+        if not self.state_path or fcntl is None:
+            return _NoLock()
+        return _FileLock(f"{self.state_path}.lock")
+
+    # --- Reporting ---
+
+    def report(self, since=None, until=None, route=None):
+        """
+        Per-route statistics and the slowest requests per hour for the hours
+        in [since, until) ('YYYY-MM-DDTHH' strings, both optional).
+        """
+        def in_range(hour):
+            return (since is None or hour >= since) and (until is None or hour < until)
+
+        merged = {}
+        hours = []
+        with self._lock:
+            for hour in sorted(filter(in_range, self.hours)):
+                total = 0
+                for name, stats in self.hours[hour].items():
+                    if route and name != route:
+                        continue
+                    total += stats[0]
+                    target = merged.setdefault(name, [0, 0, 0, 0.0, 0.0, {}])
+                    for index in range(4):
+                        target[index] += stats[index]
+                    target[4] = max(target[4], stats[4])
+                    for bucket, count in stats[5].items():
+                        target[5][bucket] = target[5].get(bucket, 0) + count
+                slowest = sorted(self.slow.get(hour, []), reverse=True)
+                if route:
+                    slowest = [entry for entry in slowest if self.normalize(entry[2]) == route]
+                hours.append({'hour': hour, 'requests': total, 'slowest': [
+                    {'seconds': seconds, 'method': method, 'path': path, 'status': status}
+                    for seconds, method, path, status in slowest]})
+
+        routes = []
+        for name, (count, client_errors, errors, total_seconds, peak, histogram) in merged.items():
+            routes.append({
+                'route': name,
+                'requests': count,
+                'error_rate': round(errors / count, 4),
+                'client_error_rate': round(client_errors / count, 4),
+                'avg_ms': round(total_seconds / count * 1000, 2),
+                'p50_ms': round(percentile(histogram, count, 0.50, peak) * 1000, 2),
+                'p95_ms': round(percentile(histogram, count, 0.95, peak) * 1000, 2),
+                'p99_ms': round(percentile(histogram, count, 0.99, peak) * 1000, 2),
+                'max_ms': round(peak * 1000, 2),
+            })
+        routes.sort(key=lambda entry: entry['requests'], reverse=True)
+        return {'since': since, 'until': until, 'routes': routes,
+                'hours': [entry for entry in hours if entry['requests']]}
+
+
+class _NoLock:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+class _FileLock:
+    """Exclusive lock on a file for the duration of the block (POSIX)."""
+
+    def __init__(self, path):
+        self.path = path
+        self._file = None
+
+    def __enter__(self):
+        self._file = open(self.path, 'a')
+        fcntl.flock(self._file, fcntl.LOCK_EX)
+        return self
+
+    def __exit__(self, *exc_info):
+        fcntl.flock(self._file, fcntl.LOCK_UN)
+        self._file.close()
+        return False
+
+
+def format_report(report):
+    """The report as plain text tables."""
+    lines = [f"{'route':<48} {'reqs':>8} {'5xx%':>6} {'4xx%':>6} {'p50ms':>9} {'p95ms':>9} "
+             f"{'p99ms':>9} {'maxms':>9}"]
+    for entry in report['routes']:
+        lines.append(f"{entry['route']:<48} {entry['requests']:>8} {entry['error_rate'] * 100:>6.2f} "
+                     f"{entry['client_error_rate'] * 100:>6.2f} {entry['p50_ms']:>9.1f} {entry['p95_ms']:>9.1f} "
+                     f"{entry['p99_ms']:>9.1f} {entry['max_ms']:>9.1f}")
+    lines.append('')
+    lines.append('Slowest requests per hour')
+    for hour in report['hours']:
+        for entry in hour['slowest']:
+            lines.append(f"{hour['hour']}  {entry['seconds']:>9.4f}s  {entry['status']}  "
+                         f"{entry['method']} {entry['path']}")
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,311 @@
+"""
+Append-only, indexed store of log records in a SQLite file.
+
+Every worker process appends to the same file (WAL mode, one writer at a
+time), so a query sees the records of all workers, independent of how the text
+log files have been rotated. Records older than the retention period are
+pruned as new ones arrive. Access records carry the request fields (method,
+path, route, status, duration, request id); other records carry their level
+and message plus the request they were logged in, when there was one.
+
+Queries filter on a time range, minimum level, path prefix, status (or status
+class) and minimum duration, newest first, and page with a (ts, id) cursor.
+A page first scans a bounded number of the newest rows through the time index
+and, when matches are too rare to fill it there, continues through the index
+of the most selective filter, so neither common nor rare matches scan the
+whole time range.
+"""
+import logging
+import re
+import sqlite3
+import threading
+import time
+from datetime import datetime
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS log_records (
+    id INTEGER PRIMARY KEY,
+    ts REAL NOT NULL,
+    level INTEGER NOT NULL,
+    logger TEXT,
+    message TEXT NOT NULL,
+    request_id TEXT,
+    method TEXT,
+    path TEXT,
+    route TEXT,
+    status INTEGER,
+    duration REAL,
+    pid INTEGER
+)
+"""
+_INDEXES = {
+    'log_records_ts': '(ts)',
+    'log_records_level': '(level, ts)',
+    'log_records_path': '(path, ts)',
+    'log_records_status': '(status, ts)',
+    'log_records_duration': '(duration, ts)',
+}
+COLUMNS = ('ts', 'level', 'logger', 'message', 'request_id', 'method', 'path', 'route',
+           'status', 'duration', 'pid')
+
+_TEXT_LINE = re.compile(r'^(\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2}),(\d{3}) \[(\w+)\] (.*)$')
+_REQUEST_LINE = re.compile(r'^Request: (\S+) (\S+) \| Status: (\d+) \| Time: ([\d.]+)s')
+_STATUS_CLASS = re.compile(r'^([1-5])xx$')
+
+
+def encode_cursor(ts, record_id):
+    return f"{ts!r}:{record_id}"
+
+
+def decode_cursor(cursor):
+    ts, _, record_id = cursor.partition(':')
+    return float(ts), int(record_id)
+
+
+class LogStore:
+    """The log_records table of one SQLite file; each thread gets its own connection."""
+
+    SCAN_ROWS = 2000
+
+    def __init__(self, path='crm_logs.sqlite3', timeout=30.0):
+        self.path = path
+        self._timeout = timeout
+        self._local = threading.local()
+        conn = self._connection()
+        conn.execute(_SCHEMA)
+        for name, columns in _INDEXES.items():
+            conn.execute(f"CREATE INDEX IF NOT EXISTS {name} ON log_records {columns}")
+
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=self._timeout, isolation_level=None,
+                                   check_same_thread=False)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.execute(f'PRAGMA busy_timeout={int(self._timeout * 1000)}')
+            self._local.conn = conn
+        return conn
+
+    # --- Writes ---
+
+    def append_many(self, records):
+        """Inserts dicts with (a subset of) COLUMNS in one transaction; returns the count."""
+        rows = [tuple(record.get(column) for column in COLUMNS) for record in records]
+        if not rows:
+            return 0
+        conn = self._connection()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            conn.executemany(f"INSERT INTO log_records ({', '.join(COLUMNS)}) "
+                             f"VALUES ({', '.join('?' for _ in COLUMNS)})", rows)
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        conn.execute('COMMIT')
+        return len(rows)
+
+    def append(self, record):
+        self.append_many([record])
+
+    def prune(self, before):
+        """Deletes the records older than `before` (epoch seconds); returns the count."""
+        return self._connection().execute("DELETE FROM log_records WHERE ts < ?", (before,)).rowcount
+
+    # --- Queries ---
+
+    @staticmethod
+    def _conditions(start=None, end=None, min_level=None, path_prefix=None, status=None,
+                    min_duration=None, cursor=None):
+        """(time conditions, filter conditions, index for the filters); each condition is (sql, params)."""
+        time_conditions, filters, index = [], [], None
+        if start is not None:
+            time_conditions.append(('ts >= ?', [start]))
+        if end is not None:
+            time_conditions.append(('ts < ?', [end]))
+        if cursor is not None:
+            ts, record_id = decode_cursor(cursor)
+            # 'ts <= ?' keeps this an index range; an OR of ranges would need a sort
+            time_conditions.append(('ts <= ? AND (ts < ? OR id < ?)', [ts, ts, record_id]))
+        # appended from the least to the most selective filter (usually); the last one picks the index
+        if min_level is not None:
+            filters.append(('level >= ?', [min_level]))
+            index = 'log_records_level'
+        if path_prefix:
+            # a range instead of LIKE, so the (path, ts) index applies
+            filters.append(('path >= ? AND path < ?',
+                            [path_prefix, path_prefix[:-1] + chr(ord(path_prefix[-1]) + 1)]))
+            index = 'log_records_path'
+        if status is not None:
+            status_class = _STATUS_CLASS.match(str(status))
+            if status_class:
+                first = int(status_class.group(1)) * 100
+                filters.append(('status BETWEEN ? AND ?', [first, first + 99]))
+            else:
+                filters.append(('status = ?', [int(status)]))
+            index = 'log_records_status'
+        if min_duration is not None:
+            filters.append(('duration >= ?', [min_duration]))
+            index = 'log_records_duration'
+        return time_conditions, filters, index
+
+    @staticmethod
+    def _where(conditions):
+        if not conditions:
+            return '1', []
+        return ' AND '.join(sql for sql, _ in conditions), [param for _, params in conditions for param in params]
+
+    def _plans(self, **filters):
+        """
+        The statements query() runs: a scan of the newest SCAN_ROWS rows in the
+        time range (cheap when matches are common), then, if that did not fill
+        the page, a lookup through the most selective filter's index (cheap when
+        matches are rare).
+        """
+        time_conditions, filter_conditions, index = self._conditions(**filters)
+        time_sql, time_params = self._where(time_conditions)
+        filter_sql, filter_params = self._where(filter_conditions)
+        order = 'ORDER BY ts DESC, id DESC'
+        scan = (f"SELECT id, ts, {filter_sql} FROM log_records INDEXED BY log_records_ts "
+                f"WHERE {time_sql} {order} LIMIT ?", filter_params + time_params + [self.SCAN_ROWS])
+        lookup = (f"SELECT id FROM log_records INDEXED BY {index} WHERE {filter_sql} AND {time_sql} "
+                  f"AND ts <= ? AND (ts < ? OR id < ?) {order} LIMIT ?", filter_params + time_params) \
+            if index else None
+        return scan, lookup
+
+    def query(self, limit=100, **filters):
+        """
+        Matching records (dicts), newest first, and the cursor of the next page
+        (None on the last page). Filters: start/end (epoch seconds), min_level,
+        path_prefix, status (an int or a class such as '5xx'), min_duration, cursor.
+        """
+        conn = self._connection()
+        (scan_sql, scan_params), lookup = self._plans(**filters)
+        scanned = conn.execute(scan_sql, scan_params).fetchall()
+        ids = [record_id for record_id, _, matched in scanned if matched][:limit + 1]
+        if lookup and len(ids) <= limit and len(scanned) == self.SCAN_ROWS:
+            lookup_sql, lookup_params = lookup
+            _, last_ts, _ = scanned[-1]
+            rows = conn.execute(lookup_sql, lookup_params + [last_ts, last_ts, scanned[-1][0],
+                                                            limit + 1 - len(ids)])
+            ids += [record_id for (record_id,) in rows]
+
+        records = self._fetch(conn, ids[:limit])
+        next_cursor = encode_cursor(records[-1]['ts'], records[-1]['id']) if len(ids) > limit else None
+        return records, next_cursor
+
+    @staticmethod
+    def _fetch(conn, ids):
+        if not ids:
+            return []
+        rows = conn.execute(f"SELECT id, {', '.join(COLUMNS)} FROM log_records "
+                            f"WHERE id IN ({', '.join('?' for _ in ids)})", ids)
+        by_id = {}
+        for record_id, *values in rows:
+            record = dict(zip(COLUMNS, values), id=record_id)
+            record['level'] = logging.getLevelName(record['level'])
+            by_id[record_id] = record
+        return [by_id[record_id] for record_id in ids]
+
+    def explain(self, **filters):
+        """SQLite's query plans for query(**filters) (for checking index use)."""
+        scan, lookup = self._plans(**filters)
+        statements = [scan] + ([(lookup[0], lookup[1] + [0.0, 0.0, 0, 1])] if lookup else [])
+        conn = self._connection()
+        return [[row[-1] for row in conn.execute(f"EXPLAIN QUERY PLAN {sql}", params)]
+                for sql, params in statements]
+
+    def close(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+
+class LogStoreHandler(logging.Handler):
+    """
+    Writes records to a LogStore (attach it to the QueueListener, not to a
+    logger, so request threads do not wait for SQLite). Records logged with
+    extra={'log_store': False} are skipped.
+    """
+
+    PRUNE_INTERVAL = 3600.0
+
+    def __init__(self, store, retention_seconds=None, clock=time.time):
+        super().__init__()
+        self.store = store
+        self.retention_seconds = retention_seconds
+        self._clock = clock
+        self._next_prune = clock()
+
+    def emit(self, record):
+        if getattr(record, 'log_store', True) is False:
+            return
+        try:
+            self.store.append(record_to_row(record))
+            if self.retention_seconds and self._clock() >= self._next_prune:
+                self.store.prune(self._clock() - self.retention_seconds)
+                self._next_prune = self._clock() + self.PRUNE_INTERVAL
+        except Exception:
+            self.handleError(record)
+
+
+def record_to_row(record):
+    row = {'ts': record.created, 'level': record.levelno, 'logger': record.name,
+           'pid': record.process, 'request_id': getattr(record, 'request_id', None),
+           'method': getattr(record, 'http_method', None), 'path': getattr(record, 'http_path', None)}
+    access = getattr(record, 'access', None)
+    if access is not None:
+        row.update({column: access.get(column) for column in
+                    ('request_id', 'method', 'path', 'route', 'status', 'duration')})
+        row['message'] = f"{access.get('method')} {access.get('path')} {access.get('status')} {access.get('duration')}s"
+    else:
+        row['message'] = record.getMessage()
+    return row
+
+
+def _level_number(name):
+    number = logging.getLevelName(name)
+    return number if isinstance(number, int) else logging.INFO
+
+
+def parse_text_log(lines):
+    """
+    Records from lines in the crm_app.log text format (for importing old,
+    possibly rotated, log files). Lines without a timestamp (tracebacks) are
+    appended to the previous record's message.
+    """
+    record = None
+    for line in lines:
+        match = _TEXT_LINE.match(line.rstrip('\n'))
+        if not match:
+            if record is not None:
+                record['message'] += '\n' + line.rstrip('\n')
+            continue
+        if record is not None:
+            yield record
+        stamp, millis, level, message = match.groups()
+        record = {
+            'ts': time.mktime(datetime.strptime(stamp, '%Y-%m-%d %H:%M:%S').timetuple()) + int(millis) / 1000,
+            'level': _level_number(level),
+            'logger': 'import',
+            'message': message,
+        }
+        request_line = _REQUEST_LINE.match(message)
+        if request_line:
+            method, path, status, duration = request_line.groups()
+            record.update(method=method, path=path, status=int(status), duration=float(duration))
+    if record is not None:
+        yield record
+
+
+def import_text_log(store, lines, batch_size=5000):
+    """Appends the records of a text log to the store; returns the count."""
+    imported, batch = 0, []
+    for record in parse_text_log(lines):
+        batch.append(record)
+        if len(batch) >= batch_size:
+            imported += store.append_many(batch)
+            batch = []
+    return imported + store.append_many(batch)
+
@@ -0,0 +1,101 @@
+"""
+Reading the end of a large, append-only log file without reading all of it.
+
+tail() seeks backwards from the end in fixed-size blocks until it has seen
+enough newlines, so its cost grows with the lines returned, not with the file
+size. Every read returns a byte offset just past the last complete line; a
+client passes it back as the `since` cursor and read_since() returns only what
+was appended after it. A line still being written (no trailing newline yet) is
+left for the next read.
+
+A cursor beyond the end of the file means the file was truncated or replaced
+by a smaller one (rotation); reading then restarts at the beginning and reports
+reset=True. A rotation that leaves the new file larger than the cursor is not
+detected.
+"""
+import os
+import time
+
+BLOCK_SIZE = 64 * 1024
+MAX_READ_BYTES = 1024 * 1024
+
+
+def _decode(raw_lines):
+    return [line.decode('utf-8', errors='replace') + '\n' for line in raw_lines]
+
+
+def tail(path, count, block_size=BLOCK_SIZE):
+    """The last `count` complete lines (oldest first) and the offset after them."""
+    with open(path, 'rb') as f:
+        position = f.seek(0, os.SEEK_END)
+        buffer = b''
+        newlines = 0
+        # count + 1 newlines: the extra one marks where the first returned line starts
+        while position > 0 and newlines <= count:
+            size = min(block_size, position)
+            position -= size
+            f.seek(position)
+            block = f.read(size)
+            newlines += block.count(b'\n')
+            buffer = block + buffer
+    complete = buffer.rfind(b'\n') + 1
+    offset = position + complete
+    if count <= 0 or not complete:
+        return [], offset
+    lines = buffer[:complete - 1].split(b'\n')
+    return _decode(lines[-count:]), offset
+
+
+def read_since(path, offset, max_bytes=MAX_READ_BYTES):
+    """
+    Complete lines appended after `offset`: (lines, new_offset, reset).
+    At most max_bytes are read per call; the caller continues from new_offset.
+    """
+    with open(path, 'rb') as f:
+        end = f.seek(0, os.SEEK_END)
+        reset = offset > end
+        if reset:
+            offset = 0
+        f.seek(offset)
+        data = f.read(min(end - offset, max_bytes))
+    complete = data.rfind(b'\n') + 1
+    if not complete:
+        if len(data) < max_bytes:
+            return [], offset, reset
+        complete = len(data)  # a single line longer than max_bytes: return it in pieces
+        return _decode([data]), offset + complete, reset
+    return _decode(data[:complete - 1].split(b'\n')), offset + complete, reset
+
+
+def end_offset(path):
+    """The offset after the last complete line (where a live follower starts)."""
+    return tail(path, 0)[1]
+
+
+def sse_events(path, offset, duration, poll_interval=1.0, heartbeat=15.0,
+               retry_ms=3000, sleep=time.sleep, clock=time.monotonic):
+    """
+    Server-Sent Events text for the lines appended after `offset`, for up to
+    `duration` seconds. Each batch of lines is one event whose id is the new
+    offset, so a reconnecting EventSource resumes via Last-Event-ID. A comment
+    line is sent every `heartbeat` seconds without new lines to keep proxies
+    from closing the connection.
+    """
+    started = last_sent = clock()
+    yield f"retry: {retry_ms}\n\n"
+    while True:
+        if os.path.exists(path):
+            lines, offset, reset = read_since(path, offset)
+            if reset:
+                yield "event: reset\ndata:\n\n"
+            if lines:
+                data = ''.join(f"data: {line.rstrip()}\n" for line in lines)
+                yield f"id: {offset}\n{data}\n"
+                last_sent = clock()
+        now = clock()
+        if now - started >= duration:
+            return
+        if now - last_sent >= heartbeat:
+            yield ": keepalive\n\n"
+            last_sent = now
+        sleep(poll_interval)
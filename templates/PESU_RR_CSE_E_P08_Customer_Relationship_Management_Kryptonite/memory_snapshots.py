@@ -0,0 +1,95 @@
+"""
+tracemalloc snapshots of a running process, kept in memory for diffing.
+
+Tracing is off until start() is called (it slows allocations down noticeably)
+and stop() discards it together with the snapshots. Snapshots are numbered per
+process; only the newest `max_snapshots` are kept. Each worker process traces
+and numbers its own allocations.
+"""
+import os
+import threading
+import time
+import tracemalloc
+
+GROUP_BY = ('lineno', 'filename', 'traceback')
+
+_IGNORED = (
+    tracemalloc.Filter(False, tracemalloc.__file__),
+    tracemalloc.Filter(False, '<frozen importlib._bootstrap>'),
+    tracemalloc.Filter(False, '<frozen importlib._bootstrap_external>'),
+    tracemalloc.Filter(False, '<unknown>'),
+)
+
+
+def _location(traceback):
+    return ' <- '.join(f"{frame.filename}:{frame.lineno}" for frame in traceback)
+
+
+def _stat(stat, diff=False):
+    entry = {'location': _location(stat.traceback), 'size': stat.size, 'count': stat.count}
+    if diff:
+        entry.update(size_diff=stat.size_diff, count_diff=stat.count_diff)
+    return entry
+
+
+class SnapshotRegistry:
+    """Numbered snapshots of this process's traced allocations."""
+
+    def __init__(self, max_snapshots=10):
+        self.max_snapshots = max_snapshots
+        self._snapshots = {}
+        self._next_id = 1
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def tracing():
+        return tracemalloc.is_tracing()
+
+    def status(self):
+        current, peak = tracemalloc.get_traced_memory() if self.tracing() else (0, 0)
+        with self._lock:
+            snapshots = [{'id': snapshot_id, 'taken_at': taken_at}
+                         for snapshot_id, (taken_at, _) in sorted(self._snapshots.items())]
+        return {'pid': os.getpid(), 'tracing': self.tracing(), 'frames': tracemalloc.get_traceback_limit(),
+                'traced_bytes': current, 'peak_bytes': peak, 'snapshots': snapshots}
+
+    def start(self, frames=25):
+        """Starts tracing (no-op when already tracing); returns whether it was started."""
+        if self.tracing():
+            return False
+        tracemalloc.start(frames)
+        return True
+
+    def stop(self):
+        with self._lock:
+            self._snapshots.clear()
+        tracemalloc.stop()
+
+    def take(self):
+        """Takes a snapshot; returns its id. Raises RuntimeError when not tracing."""
+        if not self.tracing():
+            raise RuntimeError("tracemalloc is not tracing; start it first")
+        snapshot = tracemalloc.take_snapshot().filter_traces(_IGNORED)
+        with self._lock:
+            snapshot_id = self._next_id
+            self._next_id += 1
+            self._snapshots[snapshot_id] = (time.time(), snapshot)
+            for old_id in sorted(self._snapshots)[:-self.max_snapshots]:
+                del self._snapshots[old_id]
+        return snapshot_id
+
+    def _get(self, snapshot_id):
+        with self._lock:
+            if snapshot_id not in self._snapshots:
+                raise KeyError(snapshot_id)
+            return self._snapshots[snapshot_id][1]
+
+    def top(self, snapshot_id, group_by='lineno', limit=25):
+        """The largest allocation sites of one snapshot."""
+        stats = self._get(snapshot_id).statistics(group_by)
+        return [_stat(stat) for stat in stats[:limit]]
+
+    def diff(self, old_id, new_id, group_by='lineno', limit=25):
+        """Allocation sites ordered by how much they grew (or shrank) between two snapshots."""
+        stats = self._get(new_id).compare_to(self._get(old_id), group_by)
+        return [_stat(stat, diff=True) for stat in stats[:limit]]
@@ -0,0 +1,225 @@
+"""
+In-process metrics registry rendered in the Prometheus text format.
+
+Counters, gauges and histograms live in one lock-protected registry per
+process. When a multiprocess directory is configured (gunicorn workers),
+every process periodically writes a snapshot of its values to
+<dir>/metrics-<pid>.json; rendering merges its own live values with the other
+processes' snapshots. Counters and histograms of exited workers keep counting
+towards the totals, gauges only count for live processes. Empty the directory
+when the server (re)starts.
+"""
+import atexit
+import glob
+import json
+import os
+import threading
+import time
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+SNAPSHOT_PATTERN = 'metrics-*.json'
+
+
+def _escape(value):
+    return str(value).replace('\\', r'\\').replace('\n', r'\n').replace('"', r'\"')
+
+
+def _format_labels(labels, extra=()):
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{key}="{_escape(value)}"' for key, value in pairs) + '}'
+
+
+def _format_number(value):
+    if value == float('inf'):
+        return '+Inf'
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value)) if abs(value) < 1e15 else repr(value)
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except OSError:
+        return True  # exists but owned by someone else
+    return True
+
+
+class MetricsRegistry:
+    """
+    Thread-safe registry. Metric names must be declared with describe()
+    before use; labels are passed as a tuple of (name, value) pairs.
+    """
+
+    def __init__(self, multiprocess_dir=None, flush_interval=5.0, buckets=DEFAULT_BUCKETS,
+                 clock=time.monotonic):
+        self.multiprocess_dir = multiprocess_dir
+        self.flush_interval = flush_interval
+        self.buckets = tuple(sorted(buckets))
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._types = {}
+        self._help = {}
+        self._last_flush = None
+        self.reset()
+        if multiprocess_dir:
+            os.makedirs(multiprocess_dir, exist_ok=True)
+            atexit.register(self._flush_at_exit)
+
+    def reset(self):
+        """Drops every recorded value (declarations are kept)."""
+        with self._lock:
+            self._counters = {}
+            self._gauges = {}
+            self._histograms = {}
+
+    def describe(self, name, kind, help_text):
+        if kind not in ('counter', 'gauge', 'histogram'):
+            raise ValueError(f"Unknown metric type: {kind}")
+        self._types[name] = kind
+        self._help[name] = help_text
+
+    def _check(self, name, kind):
+        if self._types.get(name) != kind:
+            raise KeyError(f"{name} is not a declared {kind}")
+
+    # --- Recording ---
+
+    def inc(self, name, labels=(), amount=1):
+        self._check(name, 'counter')
+        key = (name, tuple(labels))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + amount
+
+    def gauge_add(self, name, amount, labels=()):
+        self._check(name, 'gauge')
+        key = (name, tuple(labels))
+        with self._lock:
+            self._gauges[key] = self._gauges.get(key, 0) + amount
+
+    def observe(self, name, value, labels=()):
+        self._check(name, 'histogram')
+        key = (name, tuple(labels))
+        index = len(self.buckets)
+        for position, bound in enumerate(self.buckets):
+            if value <= bound:
+                index = position
+                break
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                # per-bucket (non-cumulative) counts, +Inf last, then sum
+                histogram = self._histograms[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            histogram[index] += 1
+            histogram[-1] += value
+
+    # --- Multiprocess snapshots ---
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                'pid': os.getpid(),
+                'buckets': list(self.buckets),
+                'counters': [[name, [list(pair) for pair in labels], value]
+                             for (name, labels), value in self._counters.items()],
+                'gauges': [[name, [list(pair) for pair in labels], value]
+                           for (name, labels), value in self._gauges.items()],
+                'histograms': [[name, [list(pair) for pair in labels], list(values)]
+                               for (name, labels), values in self._histograms.items()],
+            }
+
+    def _snapshot_path(self, pid=None):
+        return os.path.join(self.multiprocess_dir, f"metrics-{pid or os.getpid()}.json")
+
+    def flush(self):
+        """Writes this process's snapshot (atomically) to the multiprocess directory."""
+        if not self.multiprocess_dir:
+            return
+        path = self._snapshot_path()
+        temporary = f"{path}.tmp"
+        with open(temporary, 'w') as f:
+            json.dump(self.snapshot(), f, separators=(',', ':'))
+        os.replace(temporary, path)
+        self._last_flush = self._clock()
+
+    def _flush_at_exit(self):
+        try:
+            self.flush()
+        except OSError:
+            pass  # directory already removed
+
+    def maybe_flush(self):
+        """flush() if the last one is older than flush_interval (call after each request)."""
+        if not self.multiprocess_dir:
+            return
+        if self._last_flush is None or self._clock() - self._last_flush >= self.flush_interval:
+            self.flush()
+
+    def _other_snapshots(self):
+        if not self.multiprocess_dir:
+            return []
+        snapshots = []
+        own = self._snapshot_path()
+        for path in glob.glob(os.path.join(self.multiprocess_dir, SNAPSHOT_PATTERN)):
+            if path == own:
+                continue
+            try:
+                with open(path) as f:
+                    snapshots.append(json.load(f))
+            except (OSError, ValueError):
+                continue  # being replaced or truncated; the next scrape will see it
+        return snapshots
+
+    def collect(self):
+        """Merged values: ({(name, labels): value} counters, gauges, histograms)."""
+        counters, gauges, histograms = {}, {}, {}
+        for snapshot in [self.snapshot()] + self._other_snapshots():
+            live = snapshot['pid'] == os.getpid() or _pid_alive(snapshot['pid'])
+            for name, labels, value in snapshot['counters']:
+                key = (name, tuple(tuple(pair) for pair in labels))
+                counters[key] = counters.get(key, 0) + value
+            if live:
+                for name, labels, value in snapshot['gauges']:
+                    key = (name, tuple(tuple(pair) for pair in labels))
+                    gauges[key] = gauges.get(key, 0) + value
+            if snapshot['buckets'] != list(self.buckets):
+                continue  # written with other bucket bounds; cannot be merged
+            for name, labels, values in snapshot['histograms']:
+                key = (name, tuple(tuple(pair) for pair in labels))
+                merged = histograms.setdefault(key, [0] * len(values))
+                for index, value in enumerate(values):
+                    merged[index] += value
+        return counters, gauges, histograms
+
+    # --- Exposition ---
+
+    def render(self):
+        """The merged metrics in the Prometheus text exposition format."""
+        counters, gauges, histograms = self.collect()
+        lines = []
+        for name in sorted(self._types):
+            kind = self._types[name]
+            lines.append(f"# HELP {name} {self._help[name]}")
+            lines.append(f"# TYPE {name} {kind}")
+            if kind == 'histogram':
+                for (metric, labels), values in sorted(histograms.items()):
+                    if metric != name:
+                        continue
+                    cumulative = 0
+                    for bound, count in zip(self.buckets + (float('inf'),), values):
+                        cumulative += count
+                        lines.append(f"{name}_bucket{_format_labels(labels, [('le', _format_number(bound))])} "
+                                     f"{cumulative}")
+                    lines.append(f"{name}_sum{_format_labels(labels)} {_format_number(values[-1])}")
+                    lines.append(f"{name}_count{_format_labels(labels)} {cumulative}")
+            else:
+                values = counters if kind == 'counter' else gauges
+                for (metric, labels), value in sorted(values.items()):
+                    if metric == name:
+                        lines.append(f"{name}{_format_labels(labels)} {_format_number(value)}")
+        return '\n'.join(lines) + '\n'
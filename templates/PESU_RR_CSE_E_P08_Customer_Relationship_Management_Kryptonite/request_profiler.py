@@ -0,0 +1,188 @@
+"""
+Sampling profiler for individual requests (or, on demand, every thread of the
+process), and storage for slow-request captures.
+
+StackSampler runs one background thread that, every `interval` seconds, reads
+the current frame of each thread being profiled (sys._current_frames) and
+counts its stack. Nothing is traced or hooked in the profiled thread itself,
+so the cost is one stack walk per profiled request per interval, and none for
+requests that are not profiled. Stacks are kept in the collapsed format
+("outer;inner;leaf count" per line) read by flame graph tools. sample_threads()
+does the same for every thread of the process for a fixed time.
+
+CaptureStore keeps each capture as one JSON file in a directory that all
+worker processes can share, pruning the oldest beyond `max_captures`.
+"""
+import json
+import os
+import re
+import sys
+import threading
+import time
+from collections import Counter
+
+_CAPTURE_ID = re.compile(r'^[0-9]{8}T[0-9]{6}-[A-Za-z0-9._:-]{1,128}$')
+
+
+def frame_name(frame):
+    code = frame.f_code
+    return f"{frame.f_globals.get('__name__', '?')}:{code.co_name}:{frame.f_lineno}"
+
+
+def collapse(frame, stop_at=None):
+    """'outer;...;leaf' for a frame, outermost first (frames from stop_at outwards are omitted)."""
+    names = []
+    while frame is not None and frame.f_code is not stop_at:
+        names.append(frame_name(frame))
+        frame = frame.f_back
+    return ';'.join(reversed(names))
+
+
+def folded(stacks):
+    """Counter of collapsed stacks -> collapsed-format text, most frequent first."""
+    return ''.join(f"{stack} {count}\n" for stack, count in stacks.most_common())
+
+
+def sample_threads(seconds, interval, exclude=(), sleep=time.sleep, clock=time.monotonic):
+    """
+    Samples every thread of the process (except the `exclude` thread ids) for
+    `seconds`: (Counter of 'thread name;outer;...;leaf' stacks, number of samples).
+    """
+    stacks = Counter()
+    samples = 0
+    deadline = clock() + seconds
+    while True:
+        names = {thread.ident: thread.name.replace(';', ':') for thread in threading.enumerate()}
+        for thread_id, frame in sys._current_frames().items():
+            if thread_id not in exclude:
+                stacks[f"{names.get(thread_id, thread_id)};{collapse(frame)}"] += 1
+        samples += 1
+        if clock() >= deadline:
+            return stacks, samples
+        sleep(interval)
+
+
+class Profile:
+    """Stack counts of one thread while it is registered with a StackSampler."""
+
+    def __init__(self, thread_id, interval):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self.samples = 0
+        self.started = time.perf_counter()
+
+    def folded(self):
+        """The stacks in collapsed format, most frequent first."""
+        return folded(self.stacks)
+
+
+class StackSampler:
+    """One sampling thread for all profiled threads of the process; started on first use."""
+
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self._active = {}
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def start(self, thread_id=None):
+        profile = Profile(thread_id or threading.get_ident(), self.interval)
+        with self._lock:
+            self._active[profile.thread_id] = profile
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='request-profiler', daemon=True)
+                self._thread.start()
+        return profile
+
+    def stop(self, profile):
+        with self._lock:
+            self._active.pop(profile.thread_id, None)
+        return profile
+
+    def sample(self):
+        """Takes one sample of every profiled thread (called by the sampling thread)."""
+        with self._lock:
+            profiles = list(self._active.values())
+        if not profiles:
+            return
+        frames = sys._current_frames()
+        for profile in profiles:
+            frame = frames.get(profile.thread_id)
+            if frame is not None:
+                profile.stacks[collapse(frame)] += 1
+                profile.samples += 1
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            self.sample()
+
+
+class CaptureStore:
+    """Slow-request captures as <capture id>.json files in one directory."""
+
+    def __init__(self, directory, max_captures=200):
+        self.directory = directory
+        self.max_captures = max_captures
+        os.makedirs(directory, exist_ok=True)
+
+    @staticmethod
+    def capture_id(started_at, request_id):
+        return f"{time.strftime('%Y%m%dT%H%M%S', time.gmtime(started_at))}-{request_id}"
+
+    def _path(self, capture_id):
+        if not _CAPTURE_ID.match(capture_id):
+            raise KeyError(capture_id)
+        return os.path.join(self.directory, f"{capture_id}.json")
+
+    def save(self, capture):
+        """Writes the capture (a dict with 'id') atomically and prunes old ones."""
+        path = self._path(capture['id'])
+        temporary = f"{path}.{os.getpid()}.tmp"
+        with open(temporary, 'w') as f:
+            json.dump(capture, f, separators=(',', ':'))
+        os.replace(temporary, path)
+        self.prune()
+
+    def _ids(self):
+        return sorted(name[:-len('.json')] for name in os.listdir(self.directory)
+                      if name.endswith('.json'))
+
+    def prune(self):
+        for capture_id in self._ids()[:-self.max_captures or None]:
+            try:
+                os.remove(self._path(capture_id))
+            except OSError:
+                pass  # removed by another worker
+
+    def list(self):
+        """Summaries (everything but the stacks), newest first."""
+        summaries = []
+        for capture_id in reversed(self._ids()):
+            try:
+                capture = self.load(capture_id)
+            except (KeyError, ValueError):
+                continue  # removed or being written
+            capture.pop('folded', None)
+            summaries.append(capture)
+        return summaries
+
+    def load(self, capture_id):
+        try:
+            with open(self._path(capture_id)) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            raise KeyError(capture_id) from None
+
+
+def parse_route_thresholds(text):
+    """'/api/sales-kpis=0.5,/api/customers=2' -> {route rule: seconds}."""
+    thresholds = {}
+    for item in filter(None, (part.strip() for part in text.split(','))):
+        route, _, seconds = item.rpartition('=')
+        value = float(seconds)
+        if not route or value < 0:
+            raise ValueError(f"Invalid slow-request threshold: {item!r}")
+        thresholds[route.strip()] = value
+    return thresholds
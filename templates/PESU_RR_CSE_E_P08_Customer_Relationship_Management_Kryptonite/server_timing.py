@@ -0,0 +1,82 @@
+"""
+Per-request phase breakdown for the Server-Timing response header.
+
+Phase durations are summed in flask.g: the `timed` decorator and `measure`
+context manager time a block, TimedJSONProvider times jsonify(), and
+track_templates() times render_template() through Flask's signals. Whatever
+the measured phases (and the datastore) do not account for is reported as
+'app', the request's own Python time. Each measurement is two perf_counter()
+calls.
+"""
+import time
+from contextlib import contextmanager
+from functools import wraps
+
+from flask import before_render_template, g, has_request_context, template_rendered
+from flask.json.provider import DefaultJSONProvider
+
+DESCRIPTIONS = {
+    'auth': 'Authentication',
+    'db': 'Datastore',
+    'app': 'Python',
+    'json': 'JSON serialization',
+    'tpl': 'Template rendering',
+    'total': 'Total',
+}
+
+
+def add(phase, seconds):
+    if has_request_context():
+        phases = g.setdefault('server_timing', {})
+        phases[phase] = phases.get(phase, 0.0) + seconds
+
+
+@contextmanager
+def measure(phase):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        add(phase, time.perf_counter() - started)
+
+
+def timed(phase):
+    """Decorator: the function's run time counts towards `phase`."""
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            with measure(phase):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+class TimedJSONProvider(DefaultJSONProvider):
+    """Flask's JSON provider, with jsonify() responses counted as the 'json' phase."""
+
+    def response(self, *args, **kwargs):
+        with measure('json'):
+            return super().response(*args, **kwargs)
+
+
+def _template_started(sender, template, context, **extra):
+    g.template_started = time.perf_counter()
+
+
+def _template_rendered(sender, template, context, **extra):
+    started = g.pop('template_started', None)
+    if started is not None:
+        add('tpl', time.perf_counter() - started)
+
+
+def track_templates(app):
+    """Counts render_template() calls of `app` as the 'tpl' phase."""
+    before_render_template.connect(_template_started, app)
+    template_rendered.connect(_template_rendered, app)
+
+
+def header_value(total, phases):
+    """Server-Timing value for a request that took `total` seconds; durations in ms."""
+    entries = [(name, phases[name]) for name in DESCRIPTIONS if name in phases and name not in ('app', 'total')]
+    entries += [('app', max(total - sum(seconds for _, seconds in entries), 0.0)), ('total', total)]
+    return ', '.join(f'{name};desc="{DESCRIPTIONS[name]}";dur={seconds * 1000:.2f}' for name, seconds in entries)
@@ -36,6 +36,22 @@ function escapeHTML(str = '') {
     });
 }
 
+// List endpoints answer one page at a time; follow X-Next-Cursor until the
+// last page so tables, dropdowns and totals see the whole list.
+async function fetchAllPages(url, pageSize = 500) {
+    const items = [];
+    let cursor = null;
+    do {
+        const params = new URLSearchParams({ page_size: pageSize });
+        if (cursor) params.set('cursor', cursor);
+        const response = await fetch(`${url}${url.includes('?') ? '&' : '?'}${params}`);
+        if (!response.ok) throw new Error(`Failed to fetch ${url} (${response.status})`);
+        items.push(...await response.json());
+        cursor = response.headers.get('X-Next-Cursor');
+    } while (cursor);
+    return items;
+}
+
 /* =========================
    Chart loader utility
    ========================= */
@@ -237,9 +253,7 @@ async function fetchLeadKPIs() {
 
 async function fetchOpenTickets() {
     try {
-        const response = await fetch('/api/tickets');
-        if (!response.ok) throw new Error("Failed to fetch tickets");
-        const tickets = await response.json();
+        const tickets = await fetchAllPages('/api/tickets');
 
         const openTickets = tickets.filter(t => t.status === 'Open').length;
         const el = document.getElementById('stat-open-tickets');
@@ -369,9 +383,7 @@ function initCustomersPage() {
 
     async function loadCustomers() {
         try {
-            const response = await fetch('/api/customers');
-            if (!response.ok) throw new Error('Failed to fetch customers');
-            const customers = await response.json();
+            const customers = await fetchAllPages('/api/customers');
 
             customersTableBody.innerHTML = "";
             if (!Array.isArray(customers) || customers.length === 0) {
@@ -492,9 +504,7 @@ const loadTickets = async () => {
 
     ticketList.innerHTML = '<li>Loading tickets...</li>';
     try {
-        const r = await fetch('/api/tickets');
-        if (!r.ok) throw new Error('Failed to load tickets');
-        const tickets = await r.json();
+        const tickets = await fetchAllPages('/api/tickets');
 
         if (!Array.isArray(tickets) || tickets.length === 0) {
             ticketList.innerHTML = '<li>No recent tickets found.</li>';
@@ -582,9 +592,7 @@ function initTicketsPage() {
         if (!customerSelect) return;
         customerSelect.innerHTML = '<option value="">Loading customers...</option>';
         try {
-            const r = await fetch('/api/customers');
-            if (!r.ok) throw new Error('Failed to load customers');
-            const customers = await r.json();
+            const customers = await fetchAllPages('/api/customers');
             if (!Array.isArray(customers) || customers.length === 0) {
                 customerSelect.innerHTML = '<option value="">No customers found</option>';
                 return;
@@ -0,0 +1,48 @@
+"""
+Pluggable storage for the CRM.
+
+The storage interface is the subset of the Firestore client that app.py uses:
+client.collection()/document()/batch()/transaction()/get_all()/write_option(),
+document get/set/update/delete with preconditions, where/order_by/limit/
+offset/select/cursor queries, count/sum/avg aggregations, and the Increment,
+Maximum, Minimum, SERVER_TIMESTAMP and DELETE_FIELD values exported here.
+
+open_backend() returns such a client for a named backend. 'firestore' is the
+real service (app.get_db initialises it from the service-account key); the
+local engines are LocalClient instances over a DocumentStore.
+"""
+from storage.base import DocumentStore
+from storage.local import LocalClient, TransactionProxy, transactional
+from storage.values import (
+    ASCENDING, DELETE_FIELD, DESCENDING, SERVER_TIMESTAMP, Aborted, AlreadyExists,
+    DeadlineExceeded, FailedPrecondition, Increment, Maximum, MethodNotImplemented, Minimum,
+    NotFound, ServiceUnavailable,
+)
+
+BACKENDS = ('firestore', 'sqlite', 'memory')
+
+
+def open_backend(name, **options):
+    """
+    Opens a local backend by name. Options:
+      sqlite: path (default 'crm.sqlite3', ':memory:' for a throwaway database)
+      memory: latency, jitter, error_rate, error, seed (see storage.memory.MemoryStore)
+    """
+    if name == 'sqlite':
+        from storage.sqlite_backend import SQLiteStore
+        return LocalClient(SQLiteStore(options.get('path', 'crm.sqlite3')))
+    if name == 'memory':
+        from storage.memory import MemoryStore
+        options.pop('path', None)
+        return LocalClient(MemoryStore(**options))
+    if name == 'firestore':
+        raise ValueError("The firestore backend is opened by app.get_db from the service-account key")
+    raise ValueError(f"Unknown storage backend '{name}'. Choose from: {', '.join(BACKENDS)}")
+
+
+__all__ = [
+    'ASCENDING', 'DESCENDING', 'DELETE_FIELD', 'SERVER_TIMESTAMP', 'Increment', 'Maximum', 'Minimum',
+    'Aborted', 'AlreadyExists', 'DeadlineExceeded', 'FailedPrecondition', 'MethodNotImplemented',
+    'NotFound', 'ServiceUnavailable',
+    'BACKENDS', 'DocumentStore', 'LocalClient', 'TransactionProxy', 'open_backend', 'transactional',
+]
@@ -0,0 +1,413 @@
+"""
+Engine-neutral pieces of the local backends: the DocumentStore base class
+plus pure functions implementing Firestore's write and query semantics
+(field paths, transforms, merges, value ordering, filters and cursors).
+"""
+import copy
+import functools
+import threading
+from collections import namedtuple
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
+
+from storage.values import (
+    DELETE_FIELD, DESCENDING, SERVER_TIMESTAMP, Aborted, AlreadyExists,
+    FailedPrecondition, Increment, Maximum, Minimum, NotFound,
+)
+
+# One stored document. Times are timezone-aware UTC datetimes.
+StoredDocument = namedtuple('StoredDocument', 'data create_time update_time')
+
+NAME_FIELD = '__name__'
+INEQUALITY_OPERATORS = ('<', '<=', '>', '>=', '!=', 'not-in')
+_OPERATOR_ALIASES = {'array-contains': 'array_contains', 'array-contains-any': 'array_contains_any'}
+
+
+class Write:
+    """One pending document write. 'kind' is set, update, create or delete."""
+    __slots__ = ('kind', 'collection', 'doc_id', 'data', 'merge', 'precondition')
+
+    def __init__(self, kind, collection, doc_id, data=None, merge=False, precondition=None):
+        self.kind = kind
+        self.collection = collection
+        self.doc_id = doc_id
+        self.data = data
+        self.merge = merge
+        self.precondition = precondition or {}
+
+    @property
+    def key(self):
+        return (self.collection, self.doc_id)
+
+
+class QuerySpec:
+    """
+    A fully resolved query. 'orders' already includes the implicit orderings
+    (inequality field, then __name__); cursors are lists of values aligned with
+    'orders' plus a flag saying whether the boundary itself is included.
+    """
+
+    def __init__(self, collection, filters=(), orders=(), limit=None, offset=0,
+                 start=None, end=None, projection=None):
+        self.collection = collection
+        self.filters = list(filters)
+        self.orders = list(orders)
+        self.limit = limit
+        self.offset = offset
+        self.start = start  # (values, inclusive) or None
+        self.end = end      # (values, inclusive) or None
+        self.projection = projection
+
+
+# --- Field paths ---
+
+def split_field_path(path):
+    """Splits 'a.b' (or '`a.b`.c' with backtick-quoted segments) into its parts."""
+    if '`' not in path:
+        return path.split('.')
+    parts, current, quoted = [], '', False
+    for char in path:
+        if char == '`':
+            quoted = not quoted
+        elif char == '.' and not quoted:
+            parts.append(current)
+            current = ''
+        else:
+            current += char
+    parts.append(current)
+    return parts
+
+
+def get_field(data, path):
+    """Returns (found, value) for a dotted field path."""
+    value = data
+    for part in split_field_path(path):
+        if not isinstance(value, dict) or part not in value:
+            return False, None
+        value = value[part]
+    return True, value
+
+
+def project(data, field_paths):
+    """Copy of 'data' restricted to 'field_paths' (Query.select)."""
+    result = {}
+    for path in field_paths:
+        found, value = get_field(data, path)
+        if not found:
+            continue
+        parts = split_field_path(path)
+        target = result
+        for part in parts[:-1]:
+            target = target.setdefault(part, {})
+        target[parts[-1]] = copy.deepcopy(value)
+    return result
+
+
+# --- Value ordering (Firestore sorts by type first, then by value) ---
+
+def _is_number(value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def as_utc(moment):
+    """Naive datetimes are taken to be UTC, as Firestore does."""
+    if moment.tzinfo is None:
+        return moment.replace(tzinfo=timezone.utc)
+    return moment.astimezone(timezone.utc)
+
+
+def value_key(value):
+    """Sort key that orders values like Firestore: null < bool < number < timestamp < string < bytes < ref < array < map."""
+    if value is None:
+        return (0,)
+    if isinstance(value, bool):
+        return (1, value)
+    if _is_number(value):
+        return (2, value)
+    if isinstance(value, datetime):
+        return (3, as_utc(value))
+    if isinstance(value, str):
+        return (4, value)
+    if isinstance(value, bytes):
+        return (5, value)
+    if hasattr(value, 'path') and hasattr(value, 'id'):
+        return (6, value.path)
+    if isinstance(value, (list, tuple)):
+        return (8, tuple(value_key(item) for item in value))
+    if isinstance(value, dict):
+        return (9, tuple(sorted((key, value_key(item)) for key, item in value.items())))
+    raise TypeError(f"Unsupported value type: {type(value).__name__}")
+
+
+def _compare(left, right):
+    return (left > right) - (left < right)
+
+
+def compare_positions(left, right, orders):
+    """Compares two lists of order-by values under the given (field, direction) orders."""
+    for (_, direction), left_value, right_value in zip(orders, left, right):
+        result = _compare(value_key(left_value), value_key(right_value))
+        if result:
+            return -result if direction == DESCENDING else result
+    return 0
+
+
+# --- Filters ---
+
+def _doc_value(doc_id, data, field):
+    if field == NAME_FIELD:
+        return True, doc_id
+    return get_field(data, field)
+
+
+def normalize_operator(op):
+    return _OPERATOR_ALIASES.get(op, op)
+
+
+def matches(doc_id, data, field, op, value):
+    """Whether one document satisfies one where() filter."""
+    op = normalize_operator(op)
+    found, actual = _doc_value(doc_id, data, field)
+    if not found:
+        return False
+    if op == '==':
+        return value_key(actual) == value_key(value)
+    if op == '!=':
+        return actual is not None and value_key(actual) != value_key(value)
+    if op in ('<', '<=', '>', '>='):
+        left, right = value_key(actual), value_key(value)
+        if left[0] != right[0]:
+            return False  # range filters only match values of the same type
+        return {'<': left < right, '<=': left <= right, '>': left > right, '>=': left >= right}[op]
+    if op == 'in':
+        return value_key(actual) in {value_key(item) for item in value}
+    if op == 'not-in':
+        return actual is not None and value_key(actual) not in {value_key(item) for item in value}
+    if op == 'array_contains':
+        return isinstance(actual, list) and value_key(value) in {value_key(item) for item in actual}
+    if op == 'array_contains_any':
+        return isinstance(actual, list) and bool(
+            {value_key(item) for item in actual} & {value_key(item) for item in value})
+    raise ValueError(f"Unsupported operator: {op}")
+
+
+def execute_query(spec, documents):
+    """
+    Runs 'spec' in Python over an iterable of (doc_id, StoredDocument).
+    Returns the matching (doc_id, StoredDocument) pairs in query order.
+    """
+    order_fields = [field for field, _ in spec.orders]
+    rows = []
+    for doc_id, doc in documents:
+        if not all(matches(doc_id, doc.data, field, op, value) for field, op, value in spec.filters):
+            continue
+        position = []
+        for field in order_fields:
+            found, value = _doc_value(doc_id, doc.data, field)
+            if not found:
+                break  # order_by() excludes documents without the field
+            position.append(value)
+        else:
+            rows.append((position, doc_id, doc))
+
+    rows.sort(key=functools.cmp_to_key(lambda a, b: compare_positions(a[0], b[0], spec.orders)))
+
+    def within(position):
+        if spec.start:
+            values, inclusive = spec.start
+            result = compare_positions(position, values, spec.orders[:len(values)])
+            if result < 0 or (result == 0 and not inclusive):
+                return False
+        if spec.end:
+            values, inclusive = spec.end
+            result = compare_positions(position, values, spec.orders[:len(values)])
+            if result > 0 or (result == 0 and not inclusive):
+                return False
+        return True
+
+    selected = [(doc_id, doc) for position, doc_id, doc in rows if within(position)]
+    selected = selected[spec.offset or 0:]
+    if spec.limit is not None:
+        selected = selected[:spec.limit]
+    return selected
+
+
+def aggregate_documents(documents, aggregations):
+    """count/sum/avg over StoredDocuments. 'aggregations' is a list of (kind, field, alias)."""
+    documents = list(documents)
+    results = []
+    for kind, field, _ in aggregations:
+        if kind == 'count':
+            results.append(len(documents))
+            continue
+        numbers = []
+        for doc in documents:
+            found, value = get_field(doc.data, field)
+            if found and _is_number(value):
+                numbers.append(value)
+        if kind == 'sum':
+            results.append(sum(numbers) if numbers else 0)
+        elif kind == 'avg':
+            results.append(sum(numbers) / len(numbers) if numbers else None)
+        else:
+            raise ValueError(f"Unsupported aggregation: {kind}")
+    return results
+
+
+# --- Writes ---
+
+def _resolve(value, current, found, now):
+    """Replaces transforms and sentinels in 'value' given the stored 'current' value."""
+    if value is SERVER_TIMESTAMP:
+        return now
+    if isinstance(value, Increment):
+        base = current if found and _is_number(current) else 0
+        return base + value.value
+    if isinstance(value, Maximum):
+        return max(current, value.value) if found and _is_number(current) else value.value
+    if isinstance(value, Minimum):
+        return min(current, value.value) if found and _is_number(current) else value.value
+    if isinstance(value, dict):
+        return {key: _resolve(item, None, False, now) for key, item in value.items() if item is not DELETE_FIELD}
+    if isinstance(value, (list, tuple)):
+        return [_resolve(item, None, False, now) for item in value]
+    if isinstance(value, datetime):
+        return as_utc(value)
+    return value
+
+
+def _merge(target, data, now):
+    for key, value in data.items():
+        if value is DELETE_FIELD:
+            target.pop(key, None)
+        elif isinstance(value, dict) and value:
+            existing = target.get(key)
+            target[key] = _merge(existing if isinstance(existing, dict) else {}, value, now)
+        else:
+            target[key] = _resolve(value, target.get(key), key in target, now)
+    return target
+
+
+def _check_precondition(write, current):
+    precondition = write.precondition
+    if precondition.get('exists') is True and current is None:
+        raise NotFound(f"No document to update: {write.collection}/{write.doc_id}")
+    if precondition.get('exists') is False and current is not None:
+        raise AlreadyExists(f"Document already exists: {write.collection}/{write.doc_id}")
+    expected = precondition.get('last_update_time')
+    if expected is not None and (current is None or current.update_time != as_utc(expected)):
+        raise FailedPrecondition(f"Document changed since {expected}: {write.collection}/{write.doc_id}")
+
+
+def apply_write(current, write, now):
+    """
+    Applies one Write to the stored document 'current' (or None) at commit
+    time 'now'. Returns the new StoredDocument, or None if it was deleted.
+    """
+    _check_precondition(write, current)
+    if write.kind == 'delete':
+        return None
+    if write.kind == 'create' and current is not None:
+        raise AlreadyExists(f"Document already exists: {write.collection}/{write.doc_id}")
+    if write.kind == 'update' and current is None:
+        raise NotFound(f"No document to update: {write.collection}/{write.doc_id}")
+
+    if write.kind == 'update':
+        data = copy.deepcopy(current.data)
+        for path, value in write.data.items():
+            parts = split_field_path(path)
+            parent = data
+            for part in parts[:-1]:
+                child = parent.get(part)
+                if not isinstance(child, dict):
+                    child = parent[part] = {}
+                parent = child
+            if value is DELETE_FIELD:
+                parent.pop(parts[-1], None)
+            else:
+                parent[parts[-1]] = _resolve(value, parent.get(parts[-1]), parts[-1] in parent, now)
+    elif write.merge and current is not None:
+        data = _merge(copy.deepcopy(current.data), write.data, now)
+    elif write.merge:
+        data = _merge({}, write.data, now)
+    else:
+        data = _resolve(dict(write.data), None, False, now)
+
+    return StoredDocument(data, current.create_time if current else now, now)
+
+
+# --- Store base class ---
+
+class DocumentStore:
+    """
+    Storage engine behind storage.local.LocalClient.
+
+    Subclasses implement get_many(), scan() and the three commit hooks
+    (_atomic, _load, _save); run_query() and aggregate() default to
+    evaluating the query in Python and can be overridden with native ones.
+    """
+
+    def __init__(self):
+        self._clock_lock = threading.Lock()
+        self._last_commit = datetime.min.replace(tzinfo=timezone.utc)
+
+    def get_many(self, keys):
+        """Returns {(collection, doc_id): StoredDocument} for the keys that exist."""
+        raise NotImplementedError
+
+    def get(self, collection, doc_id):
+        return self.get_many([(collection, doc_id)]).get((collection, doc_id))
+
+    def scan(self, collection):
+        """Yields every (doc_id, StoredDocument) of a collection."""
+        raise NotImplementedError
+
+    def run_query(self, spec):
+        return execute_query(spec, self.scan(spec.collection))
+
+    def aggregate(self, spec, aggregations):
+        return aggregate_documents((doc for _, doc in self.run_query(spec)), aggregations)
+
+    @contextmanager
+    def _atomic(self):
+        """Context in which _load/_save run atomically; yields an engine handle."""
+        raise NotImplementedError
+        yield  # pragma: no cover
+
+    def _load(self, keys, handle):
+        raise NotImplementedError
+
+    def _save(self, changes, handle):
+        raise NotImplementedError
+
+    def _commit_time(self):
+        # Strictly increasing, so update_time identifies a document version.
+        with self._clock_lock:
+            now = datetime.now(timezone.utc)
+            if now <= self._last_commit:
+                now = self._last_commit + timedelta(microseconds=1)
+            self._last_commit = now
+            return now
+
+    def commit(self, writes, read_versions=None):
+        """
+        Applies 'writes' atomically and returns the commit time. For
+        transactions, 'read_versions' maps each key read to the update_time
+        seen (None if missing); any change since raises Aborted.
+        """
+        keys = list(dict.fromkeys([write.key for write in writes] + list(read_versions or {})))
+        with self._atomic() as handle:
+            current = self._load(keys, handle)
+            for key, seen in (read_versions or {}).items():
+                stored = current.get(key)
+                if (stored.update_time if stored else None) != seen:
+                    raise Aborted(f"Transaction conflict on {key[0]}/{key[1]}")
+            now = self._commit_time()
+            changes = {}
+            for write in writes:
+                changes[write.key] = current[write.key] = apply_write(current.get(write.key), write, now)
+            self._save(changes, handle)
+        return now
+
+    def close(self):
+        """Releases engine resources."""
@@ -0,0 +1,514 @@
+"""
+Firestore-compatible client over a local DocumentStore.
+
+Implements the part of google.cloud.firestore.Client that the CRM uses:
+collection/document references, where/order_by/limit/offset/select/cursor
+queries, count/sum/avg aggregations, batches, transactions, get_all and
+write options. Reads return fresh copies, so callers may mutate results.
+"""
+# pylint: disable=protected-access
+import copy
+import functools
+import random
+import secrets
+import string
+import time
+from collections import namedtuple
+from datetime import datetime, timezone
+
+from storage.base import (
+    INEQUALITY_OPERATORS, NAME_FIELD, QuerySpec, Write, normalize_operator, project,
+    split_field_path,
+)
+from storage.values import ASCENDING, DESCENDING, Aborted, firestore_transactional
+
+WriteResult = namedtuple('WriteResult', 'update_time')
+_AUTO_ID_ALPHABET = string.ascii_letters + string.digits
+
+
+def _auto_id():
+    return ''.join(secrets.choice(_AUTO_ID_ALPHABET) for _ in range(20))
+
+
+def _doc_id(value):
+    """Accepts a document ID, a 'collection/id' path or a DocumentReference."""
+    if isinstance(value, DocumentReference):
+        return value.id
+    if isinstance(value, str):
+        return value.rsplit('/', 1)[-1]
+    return value
+
+
+class AggregationResult:
+    """One aggregation value (matches google.cloud.firestore's AggregationResult)."""
+
+    def __init__(self, alias, value, read_time=None):
+        self.alias = alias
+        self.value = value
+        self.read_time = read_time
+
+    def __repr__(self):
+        return f"AggregationResult(alias={self.alias!r}, value={self.value!r})"
+
+
+class WriteOption:
+    """Precondition for a single write (see LocalClient.write_option)."""
+
+    def __init__(self, exists=None, last_update_time=None):
+        self.precondition = {}
+        if exists is not None:
+            self.precondition['exists'] = exists
+        if last_update_time is not None:
+            self.precondition['last_update_time'] = last_update_time
+
+
+def _precondition(option, default=None):
+    precondition = dict(default or {})
+    if option is not None:
+        precondition.update(option.precondition)
+    return precondition
+
+
+class DocumentSnapshot:
+    """Result of reading one document."""
+
+    def __init__(self, reference, data, create_time=None, update_time=None, read_time=None):
+        self._reference = reference
+        self._data = data
+        self.create_time = create_time
+        self.update_time = update_time
+        self.read_time = read_time
+
+    @property
+    def exists(self):
+        return self._data is not None
+
+    @property
+    def id(self):
+        return self._reference.id
+
+    @property
+    def reference(self):
+        return self._reference
+
+    def to_dict(self):
+        return copy.deepcopy(self._data) if self._data is not None else None
+
+    def get(self, field_path):
+        if self._data is None:
+            return None
+        value = self._data
+        for part in split_field_path(field_path):
+            if not isinstance(value, dict) or part not in value:
+                raise KeyError(f"'{field_path}' is not contained in the data")
+            value = value[part]
+        return copy.deepcopy(value)
+
+
+class DocumentReference:
+    """Reference to one document; writes made through it are committed immediately."""
+
+    def __init__(self, client, collection_path, doc_id):
+        self._client = client
+        self._collection_path = collection_path
+        self.id = doc_id
+
+    @property
+    def path(self):
+        return f"{self._collection_path}/{self.id}"
+
+    @property
+    def parent(self):
+        return CollectionReference(self._client, self._collection_path)
+
+    @property
+    def _key(self):
+        return (self._collection_path, self.id)
+
+    def __eq__(self, other):
+        return isinstance(other, DocumentReference) and other.path == self.path
+
+    def __hash__(self):
+        return hash(self.path)
+
+    def __repr__(self):
+        return f"DocumentReference({self.path!r})"
+
+    def collection(self, collection_id):
+        return CollectionReference(self._client, f"{self.path}/{collection_id}")
+
+    def get(self, field_paths=None, transaction=None):
+        if transaction is not None:
+            return transaction._get_document(self, field_paths)
+        return self._client._snapshot(self, self._client._store.get(*self._key), field_paths)
+
+    def _commit(self, write):
+        return WriteResult(self._client._store.commit([write]))
+
+    def create(self, document_data):
+        return self._commit(Write('create', self._collection_path, self.id, document_data))
+
+    def set(self, document_data, merge=False):
+        return self._commit(Write('set', self._collection_path, self.id, document_data, merge=merge))
+
+    def update(self, field_updates, option=None):
+        return self._commit(Write('update', self._collection_path, self.id, field_updates,
+                                  precondition=_precondition(option, {'exists': True})))
+
+    def delete(self, option=None):
+        return self._commit(Write('delete', self._collection_path, self.id,
+                                  precondition=_precondition(option))).update_time
+
+
+class Query:
+    """Immutable query; every method returns a new Query."""
+
+    ASCENDING = ASCENDING
+    DESCENDING = DESCENDING
+
+    def __init__(self, client, collection_path, filters=(), orders=(), limit=None, offset=0,
+                 start=None, end=None, projection=None):
+        self._client = client
+        self._collection_path = collection_path
+        self._filters = tuple(filters)
+        self._orders = tuple(orders)
+        self._limit = limit
+        self._offset = offset
+        self._start = start  # (cursor, inclusive)
+        self._end = end
+        self._projection = projection
+
+    def _copy(self, **changes):
+        state = {
+            'filters': self._filters, 'orders': self._orders, 'limit': self._limit,
+            'offset': self._offset, 'start': self._start, 'end': self._end,
+            'projection': self._projection,
+        }
+        state.update(changes)
+        return Query(self._client, self._collection_path, **state)
+
+    def where(self, field_path=None, op_string=None, value=None, *, filter=None):  # pylint: disable=redefined-builtin
+        if filter is not None:
+            field_path, op_string, value = filter.field_path, filter.op_string, filter.value
+        op_string = normalize_operator(op_string)
+        if field_path == NAME_FIELD:
+            value = [_doc_id(item) for item in value] if op_string in ('in', 'not-in') else _doc_id(value)
+        return self._copy(filters=self._filters + ((field_path, op_string, value),))
+
+    def order_by(self, field_path, direction=ASCENDING):
+        direction = DESCENDING if str(direction).upper().startswith('DESC') else ASCENDING
+        return self._copy(orders=self._orders + ((field_path, direction),))
+
+    def limit(self, count):
+        return self._copy(limit=count)
+
+    def offset(self, num_to_skip):
+        return self._copy(offset=num_to_skip)
+
+    def select(self, field_paths):
+        return self._copy(projection=list(field_paths))
+
+    def start_at(self, document_fields_or_snapshot):
+        return self._copy(start=(document_fields_or_snapshot, True))
+
+    def start_after(self, document_fields_or_snapshot):
+        return self._copy(start=(document_fields_or_snapshot, False))
+
+    def end_at(self, document_fields_or_snapshot):
+        return self._copy(end=(document_fields_or_snapshot, True))
+
+    def end_before(self, document_fields_or_snapshot):
+        return self._copy(end=(document_fields_or_snapshot, False))
+
+    def _effective_orders(self):
+        orders = list(self._orders)
+        if not orders:
+            inequality = next((f for f, op, _ in self._filters if op in INEQUALITY_OPERATORS), None)
+            if inequality and inequality != NAME_FIELD:
+                orders.append((inequality, ASCENDING))
+        if not any(field == NAME_FIELD for field, _ in orders):
+            orders.append((NAME_FIELD, orders[-1][1] if orders else ASCENDING))
+        return orders
+
+    @staticmethod
+    def _cursor_values(cursor, orders):
+        if cursor is None:
+            return None
+        position, inclusive = cursor
+        if isinstance(position, DocumentSnapshot):
+            values = []
+            for field, _ in orders:
+                values.append(position.id if field == NAME_FIELD else position.get(field))
+        elif isinstance(position, dict):
+            values = [position[field] for field, _ in orders if field in position]
+        else:
+            values = list(position)
+        values = [
+            _doc_id(value) if field == NAME_FIELD else value
+            for (field, _), value in zip(orders, values)
+        ]
+        return values, inclusive
+
+    def _spec(self):
+        orders = self._effective_orders()
+        return QuerySpec(
+            self._collection_path, self._filters, orders, self._limit, self._offset,
+            self._cursor_values(self._start, orders), self._cursor_values(self._end, orders),
+            self._projection,
+        )
+
+    def stream(self, transaction=None):
+        spec = self._spec()
+        read_time = datetime.now(timezone.utc)
+        for doc_id, stored in self._client._store.run_query(spec):
+            ref = DocumentReference(self._client, self._collection_path, doc_id)
+            if transaction is not None:
+                transaction._record_read(ref, stored)
+            yield self._client._snapshot(ref, stored, spec.projection, read_time)
+
+    def get(self, transaction=None):
+        return list(self.stream(transaction=transaction))
+
+    def count(self, alias=None):
+        return AggregationQuery(self).count(alias)
+
+    def sum(self, field_ref, alias=None):
+        return AggregationQuery(self).sum(field_ref, alias)
+
+    def avg(self, field_ref, alias=None):
+        return AggregationQuery(self).avg(field_ref, alias)
+
+
+class CollectionReference(Query):
+    """A collection; also the query matching all of its documents."""
+
+    def __init__(self, client, path):
+        super().__init__(client, path)
+
+    @property
+    def id(self):
+        return self._collection_path.rsplit('/', 1)[-1]
+
+    def document(self, document_id=None):
+        return DocumentReference(self._client, self._collection_path, document_id or _auto_id())
+
+    def add(self, document_data, document_id=None):
+        ref = self.document(document_id)
+        return ref.create(document_data).update_time, ref
+
+    def list_documents(self):
+        for doc_id, _ in self._client._store.scan(self._collection_path):
+            yield DocumentReference(self._client, self._collection_path, doc_id)
+
+
+class AggregationQuery:
+    """count()/sum()/avg() over a query; get() returns [[AggregationResult, ...]]."""
+
+    def __init__(self, query):
+        self._query = query
+        self._aggregations = []
+
+    def _add(self, kind, field, alias):
+        self._aggregations.append((kind, field, alias or f"field_{len(self._aggregations) + 1}"))
+        return self
+
+    def count(self, alias=None):
+        return self._add('count', None, alias)
+
+    def sum(self, field_ref, alias=None):
+        return self._add('sum', field_ref, alias)
+
+    def avg(self, field_ref, alias=None):
+        return self._add('avg', field_ref, alias)
+
+    def get(self, transaction=None):  # pylint: disable=unused-argument
+        spec = self._query._spec()
+        spec.projection = None
+        values = self._query._client._store.aggregate(spec, self._aggregations)
+        read_time = datetime.now(timezone.utc)
+        return [[
+            AggregationResult(alias, value, read_time)
+            for (_, _, alias), value in zip(self._aggregations, values)
+        ]]
+
+    def stream(self, transaction=None):
+        yield from self.get(transaction)
+
+
+class WriteBatch:
+    """Collects writes and commits them atomically."""
+
+    def __init__(self, client):
+        self._client = client
+        self._writes = []
+
+    def __len__(self):
+        return len(self._writes)
+
+    def create(self, reference, document_data):
+        self._writes.append(Write('create', reference._collection_path, reference.id, document_data))
+
+    def set(self, reference, document_data, merge=False):
+        self._writes.append(Write('set', reference._collection_path, reference.id, document_data, merge=merge))
+
+    def update(self, reference, field_updates, option=None):
+        self._writes.append(Write('update', reference._collection_path, reference.id, field_updates,
+                                  precondition=_precondition(option, {'exists': True})))
+
+    def delete(self, reference, option=None):
+        self._writes.append(Write('delete', reference._collection_path, reference.id,
+                                  precondition=_precondition(option)))
+
+    def commit(self):
+        writes, self._writes = self._writes, []
+        if not writes:
+            return []
+        commit_time = self._client._store.commit(writes)
+        return [WriteResult(commit_time) for _ in writes]
+
+
+class LocalTransaction(WriteBatch):
+    """
+    Optimistic transaction: reads record the version they saw and the commit
+    fails with Aborted if any of them changed. Run it through
+    storage.transactional, which retries on Aborted.
+    """
+
+    def __init__(self, client, max_attempts=5, read_only=False):
+        super().__init__(client)
+        self._max_attempts = max_attempts
+        self._read_only = read_only
+        self._reads = {}
+
+    def _record_read(self, reference, stored):
+        self._reads.setdefault(reference._key, stored.update_time if stored else None)
+
+    def _get_document(self, reference, field_paths=None):
+        stored = self._client._store.get(*reference._key)
+        self._record_read(reference, stored)
+        return self._client._snapshot(reference, stored, field_paths)
+
+    def get(self, ref_or_query):
+        if isinstance(ref_or_query, DocumentReference):
+            return iter([self._get_document(ref_or_query)])
+        return ref_or_query.stream(transaction=self)
+
+    def get_all(self, references):
+        return [self._get_document(ref) for ref in references]
+
+    def run(self, func, *args, **kwargs):
+        """Calls func(self, *args, **kwargs) and commits, retrying on conflicts."""
+        for attempt in range(1, self._max_attempts + 1):
+            self._reads, self._writes = {}, []
+            result = func(self, *args, **kwargs)
+            if self._read_only and self._writes:
+                raise ValueError("Cannot write in a read-only transaction")
+            try:
+                self._client._store.commit(self._writes, self._reads)
+                return result
+            except Aborted:
+                if attempt == self._max_attempts:
+                    raise
+                time.sleep(random.uniform(0, 0.01 * attempt))  # nosec - jitter only
+            finally:
+                self._reads, self._writes = {}, []
+        return None  # pragma: no cover
+
+
+class TransactionProxy:
+    """
+    Base for objects that stand in for a transaction (e.g. to instrument it).
+    storage.transactional runs the real 'wrapped' transaction, hands the proxy
+    to the decorated function and lets run_transactional() wrap the whole run
+    and run_attempt() each try.
+    """
+
+    def __init__(self, wrapped):
+        self.wrapped = wrapped
+
+    def run_transactional(self, run):
+        return run()
+
+    def run_attempt(self, call):
+        """Wraps each call of the transaction function (one per attempt)."""
+        return call()
+
+
+def transactional(func):
+    """
+    Backend-neutral replacement for firestore.transactional: the decorated
+    function is called as func(transaction, *args) and retried on conflicts.
+    """
+    firestore_version = firestore_transactional(func) if firestore_transactional else None
+
+    def run_on(transaction, target, args, kwargs):
+        if isinstance(transaction, LocalTransaction):
+            return transaction.run(target, *args, **kwargs)
+        if firestore_transactional is None:
+            raise TypeError("Firestore transactions need google-cloud-firestore installed")
+        runner = firestore_version if target is func else firestore_transactional(target)
+        return runner(transaction, *args, **kwargs)
+
+    @functools.wraps(func)
+    def wrapper(transaction, *args, **kwargs):
+        if isinstance(transaction, TransactionProxy):
+            proxy = transaction
+
+            def target(_, *inner_args, **inner_kwargs):
+                return proxy.run_attempt(lambda: func(proxy, *inner_args, **inner_kwargs))
+
+            return proxy.run_transactional(lambda: run_on(proxy.wrapped, target, args, kwargs))
+        return run_on(transaction, func, args, kwargs)
+
+    return wrapper
+
+
+class LocalClient:
+    """Drop-in for the subset of firestore.Client used by the app."""
+
+    def __init__(self, store):
+        self._store = store
+
+    @property
+    def store(self):
+        return self._store
+
+    def _snapshot(self, reference, stored, field_paths=None, read_time=None):
+        read_time = read_time or datetime.now(timezone.utc)
+        if stored is None:
+            return DocumentSnapshot(reference, None, read_time=read_time)
+        data = stored.data if field_paths is None else project(stored.data, field_paths)
+        return DocumentSnapshot(reference, copy.deepcopy(data), stored.create_time,
+                                stored.update_time, read_time)
+
+    def collection(self, *collection_path):
+        return CollectionReference(self, '/'.join(collection_path))
+
+    def document(self, *document_path):
+        path = '/'.join(document_path)
+        collection_path, doc_id = path.rsplit('/', 1)
+        return DocumentReference(self, collection_path, doc_id)
+
+    def batch(self):
+        return WriteBatch(self)
+
+    def transaction(self, max_attempts=5, read_only=False):
+        return LocalTransaction(self, max_attempts=max_attempts, read_only=read_only)
+
+    def get_all(self, references, field_paths=None, transaction=None):
+        references = list(references)
+        if transaction is not None:
+            for ref in references:
+                yield transaction._get_document(ref, field_paths)
+            return
+        stored = self._store.get_many([ref._key for ref in references])
+        read_time = datetime.now(timezone.utc)
+        for ref in references:
+            yield self._snapshot(ref, stored.get(ref._key), field_paths, read_time)
+
+    @staticmethod
+    def write_option(**kwargs):
+        return WriteOption(**kwargs)
+
+    def close(self):
+        self._store.close()
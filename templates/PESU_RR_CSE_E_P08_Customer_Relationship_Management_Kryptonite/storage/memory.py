@@ -0,0 +1,177 @@
+"""
+In-memory document store for tests and benchmarks.
+
+Every store call is one simulated round trip. It can be slowed down
+(latency plus jitter, per operation), made to fail (a random error rate or
+scripted failures), and it counts what it is asked to do, so endpoint
+behaviour can be checked against a production-like latency profile offline.
+"""
+import random
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+from storage.base import DocumentStore, StoredDocument, aggregate_documents, execute_query
+from storage.values import ServiceUnavailable
+
+# The simulated round trips: document lookups, queries, aggregation queries and commits.
+OPERATIONS = ('get', 'query', 'aggregate', 'commit')
+
+
+def _per_operation(value, name):
+    """Expands a number (applies to every operation) or an {operation: number} dict."""
+    if isinstance(value, dict):
+        unknown = set(value) - set(OPERATIONS)
+        if unknown:
+            raise ValueError(f"Unknown {name} operation(s): {', '.join(sorted(unknown))}")
+        return {op: float(value.get(op, 0.0)) for op in OPERATIONS}
+    return {op: float(value) for op in OPERATIONS}
+
+
+class MemoryStore(DocumentStore):
+    """
+    DocumentStore kept in a dict.
+
+    latency / jitter: seconds added to each call; either one number or a
+        dict per operation, e.g. {'query': 0.05, 'commit': 0.08}. Jitter adds
+        a uniform random delay in [0, jitter].
+    error_rate: probability (number or per-operation dict) that a call raises
+        'error' instead of running.
+    seed: makes jitter and random failures reproducible.
+    """
+
+    def __init__(self, latency=0.0, jitter=0.0, error_rate=0.0, error=ServiceUnavailable,
+                 seed=None, sleep=time.sleep):
+        super().__init__()
+        self.latency = _per_operation(latency, 'latency')
+        self.jitter = _per_operation(jitter, 'jitter')
+        self.error_rate = _per_operation(error_rate, 'error_rate')
+        self.error = error
+        self._random = random.Random(seed)
+        self._sleep = sleep
+        self._collections = {}
+        self._lock = threading.RLock()
+        self._scripted = {op: [] for op in OPERATIONS}
+        self.reset_stats()
+
+    # --- Fault injection / accounting ---
+
+    def fail_next(self, operation, error=None, times=1):
+        """Makes the next 'times' calls of 'operation' raise 'error' (an exception class or instance)."""
+        if operation not in OPERATIONS:
+            raise ValueError(f"Unknown operation '{operation}'")
+        with self._lock:
+            self._scripted[operation].extend([error or self.error] * times)
+
+    def reset_stats(self):
+        with self._lock:
+            self.operations = Counter()
+            self.failures = Counter()
+            self.documents_read = 0
+            self.documents_written = 0
+            self.simulated_latency = 0.0
+
+    def stats(self):
+        with self._lock:
+            return {
+                'operations': {op: self.operations[op] for op in OPERATIONS},
+                'round_trips': sum(self.operations.values()),
+                'failures': {op: self.failures[op] for op in OPERATIONS},
+                'documents_read': self.documents_read,
+                'documents_written': self.documents_written,
+                'simulated_latency_seconds': round(self.simulated_latency, 6),
+            }
+
+    def _round_trip(self, operation):
+        """Accounts for one call, sleeps for its latency and raises any injected failure."""
+        with self._lock:
+            self.operations[operation] += 1
+            delay = self.latency[operation]
+            if self.jitter[operation]:
+                delay += self._random.uniform(0, self.jitter[operation])
+            self.simulated_latency += delay
+            error = None
+            if self._scripted[operation]:
+                error = self._scripted[operation].pop(0)
+            elif self.error_rate[operation] and self._random.random() < self.error_rate[operation]:
+                error = self.error
+            if error is not None:
+                self.failures[operation] += 1
+        if delay:
+            self._sleep(delay)
+        if error is not None:
+            if isinstance(error, type):
+                error = error(f"Injected failure in {operation}")
+            raise error
+
+    # --- Seeding ---
+
+    def seed(self, collection, documents):
+        """Loads {doc_id: data} directly, without latency, failures or accounting (nested values are not copied)."""
+        now = datetime.now(timezone.utc)
+        with self._lock:
+            target = self._collections.setdefault(collection, {})
+            for doc_id, data in documents.items():
+                target[doc_id] = StoredDocument(dict(data), now, now)
+
+    # --- DocumentStore ---
+
+    def get_many(self, keys):
+        keys = list(keys)
+        self._round_trip('get')
+        with self._lock:
+            found = {}
+            for collection, doc_id in keys:
+                stored = self._collections.get(collection, {}).get(doc_id)
+                if stored is not None:
+                    found[(collection, doc_id)] = stored
+            self.documents_read += len(keys)
+        return found
+
+    def scan(self, collection):
+        with self._lock:
+            return list(self._collections.get(collection, {}).items())
+
+    def run_query(self, spec):
+        self._round_trip('query')
+        results = execute_query(spec, self.scan(spec.collection))
+        with self._lock:
+            self.documents_read += max(len(results), 1)  # Firestore bills empty queries as one read
+        return results
+
+    def aggregate(self, spec, aggregations):
+        self._round_trip('aggregate')
+        return aggregate_documents((doc for _, doc in execute_query(spec, self.scan(spec.collection))),
+                                   aggregations)
+
+    def commit(self, writes, read_versions=None):
+        self._round_trip('commit')
+        commit_time = super().commit(writes, read_versions)
+        with self._lock:
+            self.documents_written += len(writes)
+        return commit_time
+
+    @contextmanager
+    def _atomic(self):
+        with self._lock:
+            yield self._collections
+
+    def _load(self, keys, handle):
+        return {
+            (collection, doc_id): handle[collection][doc_id]
+            for collection, doc_id in keys
+            if doc_id in handle.get(collection, {})
+        }
+
+    def _save(self, changes, handle):
+        for (collection, doc_id), stored in changes.items():
+            if stored is None:
+                handle.get(collection, {}).pop(doc_id, None)
+            else:
+                handle.setdefault(collection, {})[doc_id] = stored
+
+    def close(self):
+        with self._lock:
+            self._collections.clear()
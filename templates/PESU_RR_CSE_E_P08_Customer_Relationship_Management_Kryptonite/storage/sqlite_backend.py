@@ -0,0 +1,404 @@
+"""
+SQLite document store: one table of JSON documents in WAL mode, with
+expression indexes on the JSON fields the CRM filters and sorts by.
+
+Queries are compiled to SQL when every filter, order and cursor maps onto
+json_extract() comparisons; anything else (array filters, null cursors, odd
+field names) is evaluated in Python over the collection instead.
+
+Filters match Firestore for every value type. Ordering matches it for null,
+number, timestamp and string values; SQL sorts booleans with the numbers and
+arrays/maps with the strings. Strings starting with U+001F are reserved for
+the timestamp encoding.
+"""
+import json
+import re
+import sqlite3
+import threading
+import uuid
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+from storage.base import (
+    NAME_FIELD, DocumentStore, StoredDocument, aggregate_documents, as_utc, execute_query,
+    normalize_operator, project,
+)
+from storage.values import DESCENDING
+
+# Fields queried by app.py; each gets an index on (collection, json_extract(data, '$.field')).
+DEFAULT_INDEXED_FIELDS = (
+    'status', 'stage', 'created_at', 'createdAt', 'resolved_at', 'sla_deadline',
+    'customer_id', 'referral_code',
+)
+
+# Timestamps are stored as tagged, fixed-width ISO strings so they compare correctly in SQL.
+# The tag (a unit separator) also sorts them before ordinary strings, as Firestore does.
+TIMESTAMP_TAG = '\x1fts:'
+_TIMESTAMP_FORMAT = '%Y-%m-%dT%H:%M:%S.%fZ'
+_FIELD_RE = re.compile(r'^[A-Za-z_][A-Za-z0-9_]*(\.[A-Za-z_][A-Za-z0-9_]*)*$')
+_NON_SCALAR = "('true', 'false', 'array', 'object')"
+_KEY_CHUNK = 400  # keeps (collection, id) lookups under SQLite's parameter limit
+
+# A rowid table: SQLite does not use expression indexes on WITHOUT ROWID tables here.
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS documents (
+    collection TEXT NOT NULL,
+    id TEXT NOT NULL,
+    data TEXT NOT NULL,
+    create_time TEXT NOT NULL,
+    update_time TEXT NOT NULL,
+    PRIMARY KEY (collection, id)
+)
+"""
+
+
+class _Unsupported(Exception):
+    """The query cannot be expressed in SQL; fall back to Python evaluation."""
+
+
+def _encode_timestamp(moment):
+    return TIMESTAMP_TAG + as_utc(moment).strftime(_TIMESTAMP_FORMAT)
+
+
+def _json_default(value):
+    if isinstance(value, datetime):
+        return _encode_timestamp(value)
+    raise TypeError(f"Unsupported value type: {type(value).__name__}")
+
+
+def encode_document(data):
+    return json.dumps(data, default=_json_default, separators=(',', ':'), ensure_ascii=False)
+
+
+def _decode(value):
+    if isinstance(value, str) and value.startswith(TIMESTAMP_TAG):
+        return datetime.strptime(value[len(TIMESTAMP_TAG):], _TIMESTAMP_FORMAT).replace(tzinfo=timezone.utc)
+    if isinstance(value, dict):
+        return {key: _decode(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_decode(item) for item in value]
+    return value
+
+
+def decode_document(text):
+    return _decode(json.loads(text))
+
+
+def _row_to_document(row):
+    data, create_time, update_time = row
+    return StoredDocument(decode_document(data), _decode(create_time), _decode(update_time))
+
+
+def _json_path(field):
+    if not _FIELD_RE.match(field):
+        raise _Unsupported(field)
+    return f"'$.{field}'"
+
+
+def _sql_scalar(value):
+    """SQL parameter plus the json_type() values a field must have to compare with it."""
+    if isinstance(value, bool) or value is None:
+        raise _Unsupported(value)
+    if isinstance(value, (int, float)):
+        return value, ('integer', 'real')
+    if isinstance(value, datetime):
+        return _encode_timestamp(value), ('text',)
+    if isinstance(value, str):
+        if value.startswith('\x1f'):
+            raise _Unsupported(value)
+        return value, ('text',)
+    raise _Unsupported(value)
+
+
+class _SqlBuilder:
+    """Translates a QuerySpec into a WHERE / ORDER BY / LIMIT clause."""
+
+    def __init__(self, spec):
+        self.spec = spec
+        self.conditions = ['collection = ?']
+        self.params = [spec.collection]
+
+    @staticmethod
+    def expression(field):
+        if field == NAME_FIELD:
+            return 'id'
+        return f"json_extract(data, {_json_path(field)})"
+
+    def _typed(self, field, value):
+        """(expression, parameter, guard) for comparing 'field' against 'value'."""
+        expr = self.expression(field)
+        if field == NAME_FIELD:
+            if not isinstance(value, str):
+                raise _Unsupported(value)
+            return expr, value, None
+        param, types = _sql_scalar(value)
+        kind = f"json_type(data, {_json_path(field)})"
+        if types == ('text',):
+            if isinstance(value, datetime):
+                guard = f"substr({expr}, 1, {len(TIMESTAMP_TAG)}) = '{TIMESTAMP_TAG}'"
+            else:
+                guard = f"substr({expr}, 1, 1) <> char(31)"
+            return expr, param, f"{kind} = 'text' AND {guard}"
+        return expr, param, f"{kind} IN ('integer', 'real')"
+
+    def add_filter(self, field, op, value):
+        op = normalize_operator(op)
+        if field != NAME_FIELD and op in ('==', '!=') and (value is None or isinstance(value, bool)):
+            json_value = 'null' if value is None else ('true' if value else 'false')
+            if op == '==':
+                self.conditions.append(f"json_type(data, {_json_path(field)}) = '{json_value}'")
+            else:
+                self.conditions.append(f"json_type(data, {_json_path(field)}) NOT IN ('null', '{json_value}')")
+            return
+        if op in ('==', '<', '<=', '>', '>=', '!='):
+            expr, param, guard = self._typed(field, value)
+            sql_op = {'==': '=', '!=': '<>'}.get(op, op)
+            self.params.append(param)
+            if op != '!=':
+                self.conditions.append(f"{expr} {sql_op} ?")
+                if guard:
+                    self.conditions.append(guard)
+            elif field == NAME_FIELD:
+                self.conditions.append(f"{expr} <> ?")
+            else:
+                # SQLite sees booleans as 0/1 and arrays/maps as JSON text; Firestore never equates them.
+                self.conditions.append(f"({expr} <> ? OR json_type(data, {_json_path(field)}) IN {_NON_SCALAR})")
+        elif op in ('in', 'not-in'):
+            if not value:
+                raise _Unsupported(value)
+            typed = [self._typed(field, item) for item in value]
+            expr = typed[0][0]
+            placeholders = ', '.join('?' for _ in typed)
+            self.params.extend(param for _, param, _ in typed)
+            if field == NAME_FIELD:
+                self.conditions.append(f"{expr} {'IN' if op == 'in' else 'NOT IN'} ({placeholders})")
+            elif op == 'in':
+                self.conditions.append(f"{expr} IN ({placeholders})")
+                self.conditions.append(f"json_type(data, {_json_path(field)}) NOT IN {_NON_SCALAR}")
+            else:
+                self.conditions.append(
+                    f"({expr} NOT IN ({placeholders}) OR json_type(data, {_json_path(field)}) IN {_NON_SCALAR})")
+        else:
+            raise _Unsupported(op)
+
+    def _boundary(self, cursor, after):
+        """Lexicographic comparison of the order-by columns against a cursor."""
+        values, inclusive = cursor
+        orders = self.spec.orders[:len(values)]
+        alternatives, params = [], []
+        for index, ((field, direction), value) in enumerate(zip(orders, values)):
+            terms, term_params = [], []
+            for (prev_field, _), prev_value in zip(orders[:index], values[:index]):
+                expr, param, _ = self._typed(prev_field, prev_value)
+                terms.append(f"{expr} = ?")
+                term_params.append(param)
+            expr, param, _ = self._typed(field, value)
+            if (direction != DESCENDING) == after:
+                terms.append(f"{expr} > ?")
+            elif field == NAME_FIELD:
+                terms.append(f"{expr} < ?")
+            else:
+                # nulls sort first, but NULL < ? is never true in SQL
+                terms.append(f"({expr} < ? OR json_type(data, {_json_path(field)}) = 'null')")
+            term_params.append(param)
+            alternatives.append(' AND '.join(terms))
+            params.extend(term_params)
+        if inclusive:
+            terms = []
+            for (field, _), value in zip(orders, values):
+                expr, param, _ = self._typed(field, value)
+                terms.append(f"{expr} = ?")
+                params.append(param)
+            alternatives.append(' AND '.join(terms))
+        self.conditions.append('(' + ' OR '.join(f'({alt})' for alt in alternatives) + ')')
+        self.params.extend(params)
+
+    def build(self):
+        spec = self.spec
+        for field, op, value in spec.filters:
+            self.add_filter(field, op, value)
+
+        order_terms = []
+        for field, direction in spec.orders:
+            if field != NAME_FIELD:
+                self.conditions.append(f"json_type(data, {_json_path(field)}) IS NOT NULL")
+            order_terms.append(f"{self.expression(field)} {'DESC' if direction == DESCENDING else 'ASC'}")
+
+        if spec.start:
+            self._boundary(spec.start, after=True)
+        if spec.end:
+            self._boundary(spec.end, after=False)
+
+        sql = ' WHERE ' + ' AND '.join(self.conditions)
+        if order_terms:
+            sql += ' ORDER BY ' + ', '.join(order_terms)
+        if spec.limit is not None or spec.offset:
+            sql += ' LIMIT ? OFFSET ?'
+            self.params.extend([spec.limit if spec.limit is not None else -1, spec.offset or 0])
+        return sql, self.params
+
+
+class SQLiteStore(DocumentStore):
+    """
+    DocumentStore on a SQLite file. Each thread gets its own connection; WAL
+    mode lets readers proceed while a writer commits. The connections of
+    threads that have exited are closed when the next one is opened, so a
+    server with a thread per request keeps one connection per live thread.
+    path=':memory:' gives a private in-memory database shared by this store's
+    connections (tests only); the first connection keeps it alive.
+    """
+
+    def __init__(self, path='crm.sqlite3', indexed_fields=DEFAULT_INDEXED_FIELDS, timeout=30.0):
+        super().__init__()
+        self.path = path
+        self._timeout = timeout
+        self._local = threading.local()
+        self._connections = {}  # thread -> its connection
+        self._connections_lock = threading.Lock()
+        self._anchor = None
+        if path == ':memory:':
+            self._uri = f"file:crm-{uuid.uuid4().hex}?mode=memory&cache=shared"
+        else:
+            self._uri = None
+
+        conn = self._connection()
+        conn.execute(_SCHEMA)
+        for field in indexed_fields:
+            conn.execute(
+                f'CREATE INDEX IF NOT EXISTS "documents_{field.replace(".", "_")}" '
+                f'ON documents (collection, json_extract(data, {_json_path(field)}))'
+            )
+
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            if self._uri:
+                conn = sqlite3.connect(self._uri, uri=True, timeout=self._timeout,
+                                       isolation_level=None, check_same_thread=False)
+            else:
+                conn = sqlite3.connect(self.path, timeout=self._timeout,
+                                       isolation_level=None, check_same_thread=False)
+                conn.execute('PRAGMA journal_mode=WAL')
+                conn.execute('PRAGMA synchronous=NORMAL')
+            conn.execute(f'PRAGMA busy_timeout={int(self._timeout * 1000)}')
+            self._local.conn = conn
+            with self._connections_lock:
+                self._release_exited_threads()
+                self._connections[threading.current_thread()] = conn
+                if self._anchor is None and self._uri:
+                    self._anchor = conn
+        return conn
+
+    def _release_exited_threads(self):
+        for thread in [thread for thread in self._connections if not thread.is_alive()]:
+            conn = self._connections.pop(thread)
+            if conn is not self._anchor:
+                conn.close()
+
+    # --- Reads ---
+
+    def _select_keys(self, conn, keys):
+        found = {}
+        keys = list(keys)
+        for offset in range(0, len(keys), _KEY_CHUNK):
+            chunk = keys[offset:offset + _KEY_CHUNK]
+            values = ', '.join('(?, ?)' for _ in chunk)
+            params = [part for key in chunk for part in key]
+            rows = conn.execute(
+                f"SELECT collection, id, data, create_time, update_time FROM documents "
+                f"WHERE (collection, id) IN (VALUES {values})", params)
+            for collection, doc_id, *document in rows:
+                found[(collection, doc_id)] = _row_to_document(document)
+        return found
+
+    def get_many(self, keys):
+        return self._select_keys(self._connection(), keys)
+
+    def scan(self, collection):
+        rows = self._connection().execute(
+            "SELECT id, data, create_time, update_time FROM documents WHERE collection = ? ORDER BY id",
+            (collection,))
+        for doc_id, *document in rows:
+            yield doc_id, _row_to_document(document)
+
+    def _compile(self, spec):
+        try:
+            return _SqlBuilder(spec).build()
+        except _Unsupported:
+            return None
+
+    def run_query(self, spec):
+        compiled = self._compile(spec)
+        if compiled is None:
+            return execute_query(spec, self.scan(spec.collection))
+        where, params = compiled
+        rows = self._connection().execute(
+            f"SELECT id, data, create_time, update_time FROM documents{where}", params)
+        return [(doc_id, _row_to_document(document)) for doc_id, *document in rows]
+
+    def aggregate(self, spec, aggregations):
+        compiled = self._compile(spec)
+        if compiled is None or any(field and not _FIELD_RE.match(field) for _, field, _ in aggregations):
+            return aggregate_documents((doc for _, doc in self.run_query(spec)), aggregations)
+        where, params = compiled
+        columns = []
+        for kind, field, _ in aggregations:
+            if kind == 'count':
+                columns.append('COUNT(*)')
+                continue
+            number = (f"CASE WHEN json_type(data, {_json_path(field)}) IN ('integer', 'real') "
+                      f"THEN json_extract(data, {_json_path(field)}) END")
+            columns.append(f"{'SUM' if kind == 'sum' else 'AVG'}({number})")
+        row = self._connection().execute(
+            f"SELECT {', '.join(columns)} FROM (SELECT data FROM documents{where})", params).fetchone()
+        return [0 if kind == 'sum' and value is None else value
+                for (kind, _, _), value in zip(aggregations, row)]
+
+    def explain(self, spec):
+        """EXPLAIN QUERY PLAN rows for a spec (useful to check index usage)."""
+        where, params = self._compile(spec)
+        return [row[-1] for row in self._connection().execute(
+            f"EXPLAIN QUERY PLAN SELECT id FROM documents{where}", params)]
+
+    # --- Writes ---
+
+    @contextmanager
+    def _atomic(self):
+        conn = self._connection()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            yield conn
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        conn.execute('COMMIT')
+
+    def _load(self, keys, handle):
+        return self._select_keys(handle, keys)
+
+    def _save(self, changes, handle):
+        deletes = [key for key, doc in changes.items() if doc is None]
+        upserts = [
+            (collection, doc_id, encode_document(doc.data),
+             _encode_timestamp(doc.create_time), _encode_timestamp(doc.update_time))
+            for (collection, doc_id), doc in changes.items() if doc is not None
+        ]
+        if deletes:
+            handle.executemany("DELETE FROM documents WHERE collection = ? AND id = ?", deletes)
+        if upserts:
+            handle.executemany(
+                "INSERT OR REPLACE INTO documents (collection, id, data, create_time, update_time) "
+                "VALUES (?, ?, ?, ?, ?)", upserts)
+
+    def close(self):
+        with self._connections_lock:
+            for conn in self._connections.values():
+                conn.close()
+            if self._anchor is not None:
+                self._anchor.close()
+            self._connections.clear()
+            self._anchor = None
+        self._local = threading.local()
+
+
+__all__ = ['SQLiteStore', 'DEFAULT_INDEXED_FIELDS', 'encode_document', 'decode_document', 'project']
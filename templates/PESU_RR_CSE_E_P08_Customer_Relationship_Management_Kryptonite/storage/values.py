@@ -0,0 +1,83 @@
+"""
+Write transforms, sentinels, sort directions and errors shared by every backend.
+
+When the Google client libraries are installed these are the Firestore objects
+themselves, so the same application code runs unchanged on Firestore and on
+the local engines. Without them (e.g. on-prem installs running SQLite) small
+stand-ins with the same attributes are used.
+"""
+# pylint: disable=invalid-name,too-few-public-methods
+
+ASCENDING = 'ASCENDING'
+DESCENDING = 'DESCENDING'
+
+try:
+    from google.cloud.firestore import (  # noqa: F401
+        DELETE_FIELD, SERVER_TIMESTAMP, Increment, Maximum, Minimum,
+        transactional as firestore_transactional,
+    )
+except ImportError:
+    firestore_transactional = None
+
+    class _Sentinel:
+        __slots__ = ('description',)
+
+        def __init__(self, description):
+            self.description = description
+
+        def __repr__(self):
+            return f"Sentinel: {self.description}"
+
+    SERVER_TIMESTAMP = _Sentinel("Value used to set a document field to the server timestamp.")
+    DELETE_FIELD = _Sentinel("Value used to delete a field in a document.")
+
+    class _NumericValue:
+        def __init__(self, value):
+            if not isinstance(value, (int, float)):
+                raise ValueError("Value must be an int or float")
+            self.value = value
+
+        def __eq__(self, other):
+            return type(self) is type(other) and self.value == other.value
+
+        def __hash__(self):
+            return hash((type(self).__name__, self.value))
+
+    class Increment(_NumericValue):
+        """Adds 'value' to the stored number (missing/non-numeric fields start from 0)."""
+
+    class Maximum(_NumericValue):
+        """Stores the larger of 'value' and the stored number."""
+
+    class Minimum(_NumericValue):
+        """Stores the smaller of 'value' and the stored number."""
+
+try:
+    from google.api_core.exceptions import (  # noqa: F401
+        Aborted, AlreadyExists, DeadlineExceeded, FailedPrecondition, MethodNotImplemented,
+        NotFound, ServiceUnavailable,
+    )
+except ImportError:
+    class StorageError(Exception):
+        """Base class of the stand-in errors."""
+
+    class NotFound(StorageError):
+        """The document does not exist."""
+
+    class AlreadyExists(StorageError):
+        """The document already exists."""
+
+    class FailedPrecondition(StorageError):
+        """A write precondition (e.g. last_update_time) did not hold."""
+
+    class Aborted(StorageError):
+        """A transaction conflicted with another write and should be retried."""
+
+    class MethodNotImplemented(StorageError):
+        """The backend does not support the operation."""
+
+    class ServiceUnavailable(StorageError):
+        """The backend is temporarily unreachable."""
+
+    class DeadlineExceeded(StorageError):
+        """The operation did not finish before its deadline."""
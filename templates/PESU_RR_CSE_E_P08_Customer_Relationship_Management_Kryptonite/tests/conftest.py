@@ -1,5 +1,6 @@
 import pytest
-from app import app
+import storage
+from app import app, entity_cache
 
 @pytest.fixture
 def client():
@@ -10,4 +11,21 @@ def client():
     app.config['TESTING'] = True
     
     with app.test_client() as client:
-        yield client
\ No newline at end of file
+        yield client
+
+@pytest.fixture(autouse=True)
+def clear_entity_cache():
+    """Each test gets its own mock DB, so cached documents must not leak between tests."""
+    entity_cache.clear()
+    yield
+    entity_cache.clear()
+
+@pytest.fixture
+def memory_db(mocker):
+    """
+    In-memory datastore installed as app.get_db. Use db.store to inject
+    latency/failures (fail_next, latency) and to read operation counts (stats()).
+    """
+    db = storage.open_backend('memory')
+    mocker.patch('app.get_db', return_value=db)
+    return db
@@ -47,7 +47,7 @@ def test_get_customers_success(client, mocker):
     mock_doc2.id = "cust_2"
     mock_doc2.to_dict.return_value = {'name': 'Customer B'}
     mock_stream = [mock_doc1, mock_doc2]
-    mock_db.collection.return_value.stream.return_value = mock_stream
+    mock_db.collection.return_value.order_by.return_value.limit.return_value.stream.return_value = mock_stream
 
     mocker.patch('app.get_db', return_value=mock_db)
     
@@ -56,6 +56,7 @@ def test_get_customers_success(client, mocker):
     assert response.status_code == 200
     assert len(response.json) == 2
     assert response.json[0]['name'] == 'Customer A'
+    assert 'X-Next-Cursor' not in response.headers
 
 # Test 4: Test the dashboard route (/)
 def test_dashboard_route(client):
@@ -124,4 +125,48 @@ def test_password_reset_route(client):
 def test_logout_route(client):
     """Test the logout route."""
     response = client.get('/logout')
-    assert response.status_code == 302 # Should redirect
\ No newline at end of file
+    assert response.status_code == 302 # Should redirect
+# --- Precondition writes (no read before update/delete) ---
+def test_update_customer_missing_maps_to_404(client, mocker):
+    """A NotFound from update() becomes the usual 404, without a prior get()."""
+    from google.api_core.exceptions import NotFound
+    mock_db = mocker.MagicMock()
+    doc_ref = mock_db.collection.return_value.document.return_value
+    doc_ref.update.side_effect = NotFound("no document")
+    mocker.patch('app.get_db', return_value=mock_db)
+
+    response = client.put('/api/customer/cust-999', json={"name": "Updated"})
+
+    assert response.status_code == 404
+    assert response.json['error'] == "Customer not found"
+    doc_ref.get.assert_not_called()
+
+def test_delete_customer_is_one_batch_with_version_precondition(client, mocker):
+    """The delete and the counter decrement go out in one batch, guarded by the version read."""
+    mock_db = mocker.MagicMock()
+    doc_ref = mock_db.collection.return_value.document.return_value
+    doc_ref.get.return_value.exists = True
+    mocker.patch('app.get_db', return_value=mock_db)
+
+    assert client.delete('/api/customer/cust-1').status_code == 200
+    mock_db.write_option.assert_called_with(last_update_time=doc_ref.get.return_value.update_time)
+    batch = mock_db.batch.return_value
+    batch.delete.assert_called_once_with(doc_ref, option=mock_db.write_option.return_value)
+    assert batch.set.call_args.args[1]['total'].value == -1
+    batch.commit.assert_called_once()
+
+    doc_ref.get.return_value.exists = False
+    assert client.delete('/api/customer/cust-999').status_code == 404
+
+def test_assign_missing_lead_maps_to_404(client, mocker):
+    from google.api_core.exceptions import NotFound
+    mock_db = mocker.MagicMock()
+    doc_ref = mock_db.collection.return_value.document.return_value
+    doc_ref.update.side_effect = NotFound("no document")
+    mocker.patch('app.get_db', return_value=mock_db)
+
+    response = client.put('/api/lead/lead-999/assign', json={"rep_id": "rep-1"})
+
+    assert response.status_code == 404
+    assert response.json['error'] == "Lead not found"
+    doc_ref.get.assert_not_called()
@@ -0,0 +1,102 @@
+import gzip
+import json
+from datetime import datetime, timezone
+import storage
+from benchmarks import auth, endpoints, replay
+from benchmarks.synthetic_data import generate, load
+
+NOW = datetime(2025, 6, 1, tzinfo=timezone.utc)
+
+
+def test_generator_is_seeded_and_sized():
+    first = list(generate(40, seed=1, now=NOW))
+    assert first == list(generate(40, seed=1, now=NOW))
+    assert first != list(generate(40, seed=2, now=NOW))
+
+    db = storage.open_backend('memory')
+    counts = load(db, 40, seed=1, now=NOW)
+    assert counts == {'customers': 40, 'loyalty_profiles': 40, 'leads': 20, 'opportunities': 10,
+                      'tickets': 40, 'campaigns': 10}
+    assert db.collection('customers').document('cust-0000007').get().get('loyalty_profile_id') == 'cust-0000007'
+
+
+def test_suite_records_latency_memory_and_operations(tmp_path):
+    output = tmp_path / "results.json"
+    assert endpoints.main(['--customers', '60', '--iterations', '3', '--output', str(output)]) == 0
+
+    results = json.loads(output.read_text())
+    assert set(results['endpoints']) == set(endpoints.ENDPOINTS)
+    gdpr = results['endpoints']['gdpr_export']
+    assert gdpr['status_codes'] == {'200': 3}
+    assert gdpr['operations_per_request'] == {'get': 2.0, 'query': 1.0, 'aggregate': 0.0, 'commit': 0.0}
+    assert gdpr['p99_ms'] >= gdpr['p50_ms'] > 0 and gdpr['peak_memory_kb'] > 0
+    # counters exist, so the KPI endpoint is a single document read
+    assert results['endpoints']['sales_kpis']['operations_per_request']['get'] == 1.0
+
+    rows = endpoints.compare(results, results)
+    assert ('customers', 'p50_ms', results['endpoints']['customers']['p50_ms'],
+            results['endpoints']['customers']['p50_ms'], 1.0) in rows
+
+
+def test_replay_reads_both_log_formats_and_keeps_the_schedule(tmp_path):
+    text_log = tmp_path / "crm_app.log.1.gz"
+    with gzip.open(text_log, 'wt') as f:
+        f.write("2024-05-01 10:00:01,500 [INFO] Request: GET /api/customer/abc | Status: 200 | Time: 0.5s\n")
+        f.write("2024-05-01 10:00:01,600 [WARNING] SLOW REQUEST\n")
+    access_log = tmp_path / "crm_access.log"
+    access_log.write_text(
+        '{"ts":"2024-05-01T10:00:03.000+00:00","level":"INFO","method":"POST","path":"/api/lead/l1/convert",'
+        '"route":"/api/lead/<string:lead_id>/convert","status":200,"duration":0.25}\n')
+
+    requests = replay.read_requests([str(text_log), str(access_log)])
+    assert [(r['method'], r['duration'], r['route']) for r in requests] == [
+        ('GET', 0.5, None), ('POST', 0.25, '/api/lead/<string:lead_id>/convert')]
+    assert requests[1]['arrival'] == datetime(2024, 5, 1, 10, 0, 2, 750000, tzinfo=timezone.utc).timestamp()
+
+    mapper = replay.IdMapper(['/api/customer/<string:customer_id>', '/api/customers'], {'customers': 5})
+    assert mapper('/api/customer/abc') == mapper('/api/customer/abc')
+    assert mapper('/api/customer/abc').startswith('/api/customer/cust-000000')
+    assert mapper('/api/customers?page=2') == '/api/customers?page=2'
+
+    now, sleeps = [0.0], []
+    schedule = [{'arrival': 100.0}, {'arrival': 102.0}, {'arrival': 106.0}]
+
+    def sleep(seconds):
+        sleeps.append(seconds)
+        now[0] += seconds
+
+    results = replay.replay(schedule, lambda request: 200, speed=2, concurrency=1, clock=lambda: now[0],
+                            sleep=sleep)
+    assert sleeps == [1.0, 2.0] and [status for _, status, _, _ in results] == [200] * 3
+
+
+def test_replay_reports_routes_against_the_test_client(tmp_path):
+    log = tmp_path / "crm_app.log"
+    with open(log, 'w') as f:
+        for n in range(6):
+            f.write(f"2024-05-01 10:00:0{n},000 [INFO] Request: GET /api/customer/prod-{n} | Status: 200 "
+                    f"| Time: 0.0{n + 1}s | DB: reads=1 writes=0 queries=0 commits=0 txns=0 db_time=0.0010s\n")
+        f.write("2024-05-01 10:00:07,000 [INFO] Request: GET /api/customers | Status: 200 | Time: 0.2s\n")
+        f.write("2024-05-01 10:00:08,000 [INFO] Request: DELETE /api/customer/prod-1 | Status: 200 | Time: 0.1s\n")
+    output = tmp_path / "replay.json"
+
+    assert replay.main([str(log), '--speed', '0', '--concurrency', '2', '--customers', '20',
+                        '--output', str(output)]) == 0
+
+    results = json.loads(output.read_text())
+    assert results['meta']['logged_requests'] == 8 and results['requests'] == 7
+    routes = {row['route']: row for row in results['routes']}
+    customer = routes['/api/customer/<string:customer_id>']
+    assert customer['requests'] == 6 and customer['status_codes'] == {'200': 6}  # ids mapped to seeded ones
+    assert customer['logged_p50_ms'] == 35.0 and customer['p99_from_schedule_ms'] >= customer['p99_ms'] > 0
+    assert routes['/api/customers']['requests'] == 1
+
+
+def test_auth_benchmark_covers_every_case(tmp_path):
+    output = tmp_path / "auth.json"
+    assert auth.main(['--iterations', '20', '--output', str(output)]) == 0
+
+    cases = json.loads(output.read_text())['cases']
+    assert set(cases) == {'two_pass', 'single_pass_cold', 'single_pass_warm', 'no_token', 'static'}
+    assert cases['single_pass_warm']['cache_hit_ratio'] > 0.9 and cases['single_pass_cold']['cache_hit_ratio'] == 0.0
+    assert all(row['p99_us'] >= row['p50_us'] > 0 for row in cases.values())
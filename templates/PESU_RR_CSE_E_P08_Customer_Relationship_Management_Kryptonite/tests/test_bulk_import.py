@@ -0,0 +1,163 @@
+import gzip
+import io
+import json
+import pytest
+from unittest.mock import MagicMock
+from app import app
+from bulk_import import detect_format, iter_records, open_text_stream, run_import
+
+
+def _db_with_ids(mocker):
+    """Mock DB whose auto-ID document refs get distinct, JSON-friendly IDs."""
+    mock_db = mocker.MagicMock()
+    counter = iter(range(1_000_000))
+
+    def document(doc_id=None):
+        ref = MagicMock()
+        ref.id = doc_id or f"auto-{next(counter)}"
+        ref.path = ref.id
+        return ref
+
+    mock_db.collection.return_value.document.side_effect = document
+    return mock_db
+
+
+def _rows(text, fmt, compressed=False):
+    data = text.encode()
+    if compressed:
+        data = gzip.compress(data)
+    return list(iter_records(open_text_stream(io.BytesIO(data)), fmt))
+
+
+# --- Parsing ---
+
+def test_csv_and_ndjson_parse_the_same_rows():
+    csv_rows = _rows("name,email,phone\nAnn,ann@x.com,123\nBob,bob@x.com\n", 'csv')
+    ndjson_rows = _rows('{"name": "Ann", "email": "ann@x.com", "phone": "123"}\n\n'
+                        '{"name": "Bob", "email": "bob@x.com", "phone": ""}\n', 'ndjson')
+    assert csv_rows == ndjson_rows == [
+        (1, {'name': 'Ann', 'email': 'ann@x.com', 'phone': '123'}),
+        (2, {'name': 'Bob', 'email': 'bob@x.com', 'phone': ''}),
+    ]
+
+
+def test_gzip_is_detected_from_magic_bytes():
+    assert _rows("name,email\nAnn,ann@x.com\n", 'csv', compressed=True) == [
+        (1, {'name': 'Ann', 'email': 'ann@x.com'})
+    ]
+
+
+def test_ndjson_bad_lines_become_row_errors():
+    rows = _rows('{"name": "Ann"}\nnot json\n[1, 2]\n', 'ndjson')
+    assert rows[0] == (1, {'name': 'Ann'})
+    assert isinstance(rows[1][1], ValueError) and rows[1][0] == 2
+    assert "JSON object" in str(rows[2][1])
+
+
+@pytest.mark.parametrize("filename,content_type,expected", [
+    ("customers.csv.gz", None, 'csv'),
+    ("export.jsonl", None, 'ndjson'),
+    (None, "application/x-ndjson; charset=utf-8", 'ndjson'),
+    ("data.xlsx", None, None),
+])
+def test_detect_format(filename, content_type, expected):
+    assert detect_format(filename, content_type) == expected
+
+
+# --- Batching ---
+
+def test_run_import_keeps_rows_whole_and_batches_bounded():
+    mock_db = MagicMock()
+    records = [(n, {'n': n}) for n in range(1, 11)]
+
+    # three writes per row, batches of at most 7 writes -> 2 rows per batch
+    report = run_import(mock_db, records, lambda r: [('set', r['n'], ({},))] * 3, chunk_size=7, workers=2)
+
+    assert report.imported == 10 and report.failed == 0
+    assert report.batches == 5
+    assert mock_db.batch.return_value.commit.call_count == 5
+    assert mock_db.batch.return_value.set.call_count == 30
+
+
+def test_run_import_reports_failed_batches_per_row():
+    mock_db = MagicMock()
+    mock_db.batch.return_value.commit.side_effect = RuntimeError("deadline exceeded")
+
+    report = run_import(mock_db, [(1, {}), (2, {})], lambda r: [('set', 'x', ({},))])
+
+    assert report.imported == 0
+    assert [e['row'] for e in report.errors] == [1, 2]
+    assert "deadline exceeded" in report.errors[0]['error']
+
+
+# --- Endpoint / CLI ---
+
+def test_import_endpoint_validates_rows_like_create_customer(client, mocker):
+    mock_db = _db_with_ids(mocker)
+    mocker.patch('app.get_db', return_value=mock_db)
+    body = "\n".join(json.dumps(r) for r in [
+        {"name": "Ann", "email": "ann@x.com"},
+        {"name": "No Email"},
+        {"name": "Bob", "email": "bob@x.com", "company": "Acme"},
+    ])
+
+    response = client.post('/api/customers/import', data=gzip.compress(body.encode()),
+                           content_type='application/x-ndjson')
+
+    assert response.status_code == 200
+    report = response.get_json()
+    assert (report['rows'], report['imported'], report['failed']) == (3, 2, 1)
+    assert report['errors'] == [{'row': 2, 'error': 'Name and email are required'}]
+    assert report['rows_per_second'] >= 0
+
+    writes = [c.args for c in mock_db.batch.return_value.set.call_args_list]
+    loyalty = [data for _, data, *_ in writes if 'referral_code' in data]
+    assert [p['referral_code'][:3] for p in loyalty] == ["ANN", "BOB"]
+
+
+def test_import_increments_the_counter_once_after_all_batches(client, memory_db):
+    body = "name,email\n" + "".join(f"C{n},c{n}@x.com\n" for n in range(600))
+    memory_db.store.reset_stats()
+
+    response = client.post('/api/customers/import?workers=4', data=body, content_type='text/csv')
+
+    assert response.get_json()['batches'] == 3  # 250 customers (500 writes) per batch
+    counters = memory_db.collection('kpi_counters').document('customers').get().to_dict()
+    assert counters['total'] == 600
+    stats = memory_db.store.stats()  # the three batches, then one counter write
+    assert stats['operations']['commit'] == 4 and stats['documents_written'] == 1201
+
+
+def test_read_error_keeps_the_rows_imported_before_it(client, memory_db):
+    body = ("name,email\n" + "".join(f"C{n},c{n}@x.com\n" for n in range(3000))).encode() + b"\xff\n"
+
+    response = client.post('/api/customers/import', data=body, content_type='text/csv')
+
+    assert response.status_code == 200
+    report = response.get_json()
+    assert report['imported'] == len(memory_db.collection('customers').get()) > 0
+    assert "Could not read the input" in report['aborted']
+    counters = memory_db.collection('kpi_counters').document('customers').get().to_dict()
+    assert counters['total'] == report['imported']
+
+    response = client.post('/api/customers/import', data=b"name,email\n\xff\n", content_type='text/csv')
+    assert response.status_code == 400 and "Could not read the input" in response.get_json()['error']
+
+
+def test_import_endpoint_rejects_unknown_format(client, mocker):
+    mocker.patch('app.get_db', return_value=mocker.MagicMock())
+    response = client.post('/api/customers/import', data=b"x", content_type='application/pdf')
+    assert response.status_code == 400
+
+
+def test_import_customers_command(tmp_path, mocker):
+    mock_db = _db_with_ids(mocker)
+    mocker.patch('app.get_db_or_raise', return_value=mock_db)
+    path = tmp_path / "customers.csv"
+    path.write_text("name,email\nAnn,ann@x.com\n,missing@x.com\n")
+
+    result = app.test_cli_runner().invoke(args=['import-customers', str(path)])
+
+    assert result.exit_code == 0
+    assert "Imported 1 of 2 rows" in result.output
+    assert "row 2: Name and email are required" in result.output
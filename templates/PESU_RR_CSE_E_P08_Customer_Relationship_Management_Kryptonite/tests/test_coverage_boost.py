@@ -40,7 +40,7 @@ def test_get_campaigns_success(client, mocker):
     # Also mock the ID property which is accessed in the loop
     mock_campaign.id = "camp-123" 
     
-    mock_db.collection.return_value.order_by.return_value.stream.return_value = [mock_campaign]
+    mock_db.collection.return_value.order_by.return_value.order_by.return_value.limit.return_value.stream.return_value = [mock_campaign]
     mocker.patch('app.get_db', return_value=mock_db)
     
     response = client.get('/api/campaigns')
@@ -17,12 +17,13 @@ def test_get_db_helpers(mocker):
     get_db()
 
 # --- TEST 2: System Monitor ---
-def test_monitor_routes(client, mocker):
+def test_monitor_routes(client, mocker, tmp_path):
     client.get('/monitor')
-    with patch('os.path.exists', return_value=True):
-        with patch('builtins.open', mocker.mock_open(read_data="Log")):
-            resp = client.get('/api/logs')
-            assert resp.status_code == 200
+    log_file = tmp_path / 'crm_app.log'
+    log_file.write_text("Log\n")
+    with patch('app.LOG_FILE', str(log_file)):
+        resp = client.get('/api/logs')
+        assert resp.status_code == 200
     with patch('os.path.exists', return_value=False):
         resp = client.get('/api/logs')
         assert resp.status_code == 200
@@ -41,8 +42,7 @@ def test_middleware_logic(client, mocker):
     try:
         app.config['TESTING'] = False
         client.get('/customers')
-        mocker.patch('app.verify_jwt_in_request', return_value=None)
-        mocker.patch('app.get_jwt', return_value={"role": "TestUser"})
+        mocker.patch('app.verified_claims', return_value={"role": "TestUser"})
         client.get('/login')
     finally:
         app.config['TESTING'] = original_testing
@@ -194,7 +194,7 @@ def test_ticket_complete_workflow(client, mocker):
     mock_doc2.id = "ticket-2"
     mock_doc2.to_dict.return_value = {"issue": "Problem 2", "status": "Closed", "priority": "Low"}
     
-    mock_db.collection.return_value.order_by.return_value.limit.return_value.stream.return_value = [mock_doc1, mock_doc2]
+    mock_db.collection.return_value.order_by.return_value.order_by.return_value.limit.return_value.stream.return_value = [mock_doc1, mock_doc2]
     resp = client.get('/api/tickets')
     
     # CREATE TICKET: Success
@@ -596,9 +596,8 @@ def test_campaign_audience_counting(client, mocker):
     mock_db = mocker.MagicMock()
     mocker.patch('app.get_db', return_value=mock_db)
     
-    # Mock customer collection for 'All' segment
-    mock_customers = [mocker.MagicMock() for _ in range(15)]
-    mock_db.collection.return_value.stream.return_value = mock_customers
+    # Mock the server-side count() of the customer collection for 'All' segment
+    mock_db.collection.return_value.count.return_value.get.return_value = [[mocker.MagicMock(alias='count', value=15)]]
     mock_db.collection.return_value.add.return_value = (None, mocker.MagicMock())
     
     resp = client.post('/api/campaigns', json={
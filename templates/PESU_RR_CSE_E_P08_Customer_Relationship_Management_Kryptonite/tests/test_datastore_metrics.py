@@ -0,0 +1,76 @@
+import storage
+from app import app
+from datastore_metrics import OperationRecorder, instrument
+
+
+def _ops(response):
+    return dict(part.split('=') for part in response.headers['X-Datastore-Ops'].split())
+
+
+# --- Recorder / proxies ---
+
+def test_proxies_count_reads_queries_and_commits():
+    recorder = OperationRecorder()
+    db = instrument(storage.open_backend('memory'), recorder)
+    batch = db.batch()
+    for n in range(3):
+        batch.set(db.collection('tickets').document(f"t{n}"), {'status': 'Open', 'n': n})
+    batch.commit()
+    list(db.collection('tickets').where('status', '==', 'Open').order_by('n').stream())
+    db.collection('tickets').document('t0').get()
+    list(db.get_all([db.collection('tickets').document('t1'), db.collection('tickets').document('t2')]))
+
+    summary = recorder.summary()
+    assert (summary['reads'], summary['writes'], summary['queries'], summary['commits']) == (3 + 1 + 2, 3, 1, 1)
+    assert recorder.shapes == {'query tickets where status == order_by n ASCENDING': 1, 'get tickets': 1}
+
+
+def test_repeated_shapes_are_reported_regardless_of_values():
+    recorder = OperationRecorder()
+    db = instrument(storage.open_backend('memory'), recorder)
+    for n in range(6):
+        list(db.collection('tickets').where('customer_id', '==', f"c{n}").stream())
+        db.collection('customers').document(f"c{n}").get()
+    db.collection('leads').document('l1').get()
+
+    assert recorder.repeated_shapes(5) == [('query tickets where customer_id ==', 6), ('get customers', 6)]
+
+
+# --- Request integration ---
+
+def test_response_header_and_access_log(client, memory_db, mocker):
+    mock_logger = mocker.patch('app.logger')
+    customer_id = client.post('/api/customer', json={'name': 'Ann Lee', 'email': 'ann@x.com'}).get_json()['id']
+
+    response = client.get(f'/api/gdpr/export/{customer_id}')
+
+    assert _ops(response)['reads'] == '3' and _ops(response)['queries'] == '1'
+    call = mock_logger.info.call_args_list[-1]
+    line = call.args[0] % call.args[1:]
+    assert f"Request: GET /api/gdpr/export/{customer_id} | Status: 200 | Time:" in line
+    assert "DB: reads=3 writes=0 queries=1 commits=0 txns=0 db_time=" in line
+
+
+def test_transactions_are_timed_as_one_round_trip(client, memory_db):
+    memory_db.collection('loyalty_profiles').document('c1').set({'points': 100})
+
+    response = client.post('/api/loyalty/c1/redeem', json={'points_to_redeem': 40})
+
+    assert response.get_json()['new_points_balance'] == 60
+    ops = _ops(response)
+    assert (ops['transactions'], ops['reads'], ops['writes']) == ('1', '1', '1')
+
+
+def test_n_plus_one_warning(client, memory_db, mocker):
+    mock_logger = mocker.patch('app.logger')
+    mocker.patch.dict(app.config, {'N_PLUS_ONE_THRESHOLD': 1})
+
+    client.get('/api/gdpr/export/missing')
+
+    warnings = [c.args[0] % c.args[1:] for c in mock_logger.warning.call_args_list]
+    assert warnings == ["N+1 SUSPECT: GET /api/gdpr/export/missing issued 'get customers' 1 times"]
+
+
+def test_metrics_can_be_disabled(client, memory_db, mocker):
+    mocker.patch.dict(app.config, {'DATASTORE_METRICS': False})
+    assert 'X-Datastore-Ops' not in client.get('/api/sales-kpis').headers
@@ -0,0 +1,151 @@
+from unittest.mock import MagicMock
+from entity_cache import EntityCache
+from flask_jwt_extended import create_access_token
+from app import app
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def _db_with_doc(mocker, data):
+    """Mock DB whose every document(...).get() returns 'data' (None = missing)."""
+    mock_db = mocker.MagicMock()
+    snapshot = mock_db.collection.return_value.document.return_value.get.return_value
+    snapshot.exists = data is not None
+    snapshot.to_dict.return_value = data
+    mocker.patch('app.get_db', return_value=mock_db)
+    return mock_db
+
+
+# --- EntityCache ---
+
+def test_cache_hits_until_ttl_expires():
+    clock = FakeClock()
+    cache = EntityCache(max_entries=10, ttl=30, negative_ttl=5, clock=clock)
+    loader = MagicMock(return_value={'name': 'Ann'})
+
+    assert cache.get_or_load('a', loader) == {'name': 'Ann'}
+    assert cache.get_or_load('a', loader) == {'name': 'Ann'}
+    assert loader.call_count == 1
+
+    clock.now = 31
+    cache.get_or_load('a', loader)
+    assert loader.call_count == 2
+    stats = cache.stats()
+    assert (stats['hits'], stats['misses'], stats['expirations']) == (1, 2, 1)
+
+
+def test_cache_negative_entries_use_shorter_ttl():
+    clock = FakeClock()
+    cache = EntityCache(max_entries=10, ttl=30, negative_ttl=5, clock=clock)
+    loader = MagicMock(return_value=None)
+
+    cache.get_or_load('missing', loader)
+    cache.get_or_load('missing', loader)
+    assert loader.call_count == 1
+    assert cache.stats()['negative_hits'] == 1
+
+    clock.now = 6
+    cache.get_or_load('missing', loader)
+    assert loader.call_count == 2
+
+
+def test_cache_evicts_least_recently_used():
+    cache = EntityCache(max_entries=2, ttl=30)
+    cache.get_or_load('a', lambda: 1)
+    cache.get_or_load('b', lambda: 2)
+    cache.get_or_load('a', lambda: 1)  # 'a' becomes most recent
+    cache.get_or_load('c', lambda: 3)
+
+    assert cache.get_or_load('a', lambda: 'reloaded') == 1
+    assert cache.get_or_load('b', lambda: 'reloaded') == 'reloaded'
+    assert cache.stats()['evictions'] == 2
+
+
+def test_cache_skips_store_when_invalidated_during_load():
+    cache = EntityCache(max_entries=10, ttl=30)
+
+    def racing_loader():
+        cache.invalidate('a')  # a write lands while we are reading
+        return 'stale'
+
+    cache.get_or_load('a', racing_loader)
+    assert cache.get_or_load('a', lambda: 'fresh') == 'fresh'
+
+
+def test_cache_disabled_with_zero_size():
+    cache = EntityCache(max_entries=0)
+    loader = MagicMock(return_value=1)
+    cache.get_or_load('a', loader)
+    cache.get_or_load('a', loader)
+    assert loader.call_count == 2
+    assert cache.stats()['size'] == 0
+
+
+# --- Endpoints ---
+
+def test_customer_details_served_from_cache(client, mocker):
+    mock_db = _db_with_doc(mocker, {'name': 'Ann'})
+
+    first = client.get('/api/customer/c-1')
+    second = client.get('/api/customer/c-1')
+
+    assert first.get_json() == second.get_json() == {'name': 'Ann'}
+    assert mock_db.collection.return_value.document.return_value.get.call_count == 1
+
+
+def test_missing_customer_is_negatively_cached(client, mocker):
+    mock_db = _db_with_doc(mocker, None)
+
+    assert client.get('/api/customer/ghost').status_code == 404
+    assert client.get('/api/customer/ghost').status_code == 404
+    assert mock_db.collection.return_value.document.return_value.get.call_count == 1
+
+
+def test_update_invalidates_cached_customer(client, mocker):
+    mock_db = _db_with_doc(mocker, {'name': 'Ann'})
+    doc_ref = mock_db.collection.return_value.document.return_value
+
+    client.get('/api/customer/c-1')
+    client.put('/api/customer/c-1', json={'name': 'Anna'})
+    doc_ref.get.return_value.to_dict.return_value = {'name': 'Anna'}
+
+    assert client.get('/api/customer/c-1').get_json() == {'name': 'Anna'}
+    # initial read, then one re-read after the write invalidated the entry
+    assert doc_ref.get.call_count == 2
+
+
+def test_loyalty_profile_invalidated_after_redeem(client, mocker):
+    mock_db = _db_with_doc(mocker, {'points': 100})
+    mocker.patch('app.redeem_transaction', return_value=50)
+    doc_ref = mock_db.collection.return_value.document.return_value
+
+    client.get('/api/loyalty/c-1')
+    client.post('/api/loyalty/c-1/redeem', json={'points_to_redeem': 50})
+    client.get('/api/loyalty/c-1')
+
+    assert doc_ref.get.call_count == 2
+
+
+def test_cache_stats_endpoint(client, mocker):
+    _db_with_doc(mocker, {'name': 'Ann'})
+    client.get('/api/customer/c-1')
+    client.get('/api/customer/c-1')
+
+    stats = client.get('/api/cache/stats').get_json()
+
+    assert (stats['hits'], stats['misses'], stats['size']) == (1, 1, 1)
+    assert stats['hit_ratio'] == 0.5
+
+
+def test_cache_stats_require_admin(client, mocker):
+    mocker.patch.dict(app.config, {'TESTING': False})
+    with app.app_context():
+        token = create_access_token(identity='user@crm.com', additional_claims={'role': 'User'})
+    client.set_cookie('access_token_cookie', token)
+    assert client.get('/api/cache/stats').status_code == 403
@@ -13,18 +13,11 @@ def test_get_customer_kpis_success(client, mocker):
     mock_db = mocker.MagicMock()
     
     # --- Mock Data ---
-    # Customer 1: Created 40 days ago
-    mock_cust1 = mocker.MagicMock()
-    mock_cust1.to_dict.return_value = {
-        'createdAt': datetime.now(timezone.utc) - timedelta(days=40)
-    }
-    # Customer 2: Created 10 days ago
-    mock_cust2 = mocker.MagicMock()
-    mock_cust2.to_dict.return_value = {
-        'createdAt': datetime.now(timezone.utc) - timedelta(days=10)
-    }
-    
-    mock_db.collection.return_value.stream.return_value = [mock_cust1, mock_cust2]
+    # Two customers in total (server-side count), one created in the last 30 days
+    customers = mock_db.collection.return_value
+    customers.document.return_value.get.return_value.exists = False  # no counters yet
+    customers.count.return_value.get.return_value = [[mocker.MagicMock(alias='count', value=2)]]
+    customers.where.return_value.count.return_value.get.return_value = [[mocker.MagicMock(alias='count', value=1)]]
     mocker.patch('app.get_db', return_value=mock_db)
     
     # --- Run Test ---
@@ -35,6 +28,43 @@ def test_get_customer_kpis_success(client, mocker):
     assert data['total_customers'] == 2
     assert data['new_customers_last_30_days'] == 1
 
+    # The 30-day window is a range filter, not a client-side scan
+    field, op, since = customers.where.call_args[0]
+    assert (field, op) == ('createdAt', '>=')
+    assert timedelta(days=29) < datetime.now(timezone.utc) - since < timedelta(days=31)
+    customers.stream.assert_not_called()
+
+def test_get_customer_kpis_falls_back_without_aggregation(client, mocker):
+    """Backends without count() support are counted by streaming."""
+    mock_db = mocker.MagicMock()
+    customers = mock_db.collection.return_value
+    customers.document.return_value.get.return_value.exists = False
+    customers.count.side_effect = NotImplementedError
+    customers.where.return_value.count.side_effect = NotImplementedError
+    customers.stream.return_value = [mocker.MagicMock(), mocker.MagicMock()]
+    customers.where.return_value.stream.return_value = [mocker.MagicMock()]
+    mocker.patch('app.get_db', return_value=mock_db)
+
+    response = client.get('/api/customer-kpis')
+
+    assert response.status_code == 200
+    assert response.get_json() == {'total_customers': 2, 'new_customers_last_30_days': 1}
+
+def test_get_lead_kpis_uses_count_query(client, mocker):
+    """Test GET /api/lead-kpis - counts 'New' leads on the server"""
+    mock_db = mocker.MagicMock()
+    leads = mock_db.collection.return_value
+    leads.document.return_value.get.return_value.exists = False
+    leads.where.return_value.count.return_value.get.return_value = [[mocker.MagicMock(alias='count', value=7)]]
+    mocker.patch('app.get_db', return_value=mock_db)
+
+    response = client.get('/api/lead-kpis')
+
+    assert response.status_code == 200
+    assert response.get_json()['new_leads_count'] == 7
+    leads.where.assert_called_once_with('status', '==', 'New')
+    leads.where.return_value.stream.assert_not_called()
+
 def test_get_customer_kpis_db_failure(client, mocker):
     """Test GET /api/customer-kpis - failure (503)"""
     mocker.patch('app.get_db_or_raise', side_effect=RuntimeError("Database connection failed"))
@@ -65,11 +95,14 @@ def test_get_ticket_metrics_success(client, mocker):
         'resolved_at': today - timedelta(days=8) # 48h resolution
     }
     
-    mock_db.collection.return_value.stream.return_value = [mock_ticket1, mock_ticket2]
+    # No rollups yet, so only the closed tickets are loaded and bucketed
+    closed_query = mock_db.collection.return_value.where.return_value
+    closed_query.select.return_value.stream.return_value = [mock_ticket1, mock_ticket2]
     mocker.patch('app.get_db', return_value=mock_db)
 
     # --- Run Test ---
     response = client.get('/api/ticket-metrics')
+    mock_db.collection.return_value.where.assert_called_with('status', '==', 'Closed')
     
     assert response.status_code == 200
     data = response.get_json()
@@ -100,4 +133,12 @@ def test_kpi_report_page_route(client):
     """Test that the /report/kpis page loads."""
     response = client.get('/report/kpis')
     assert response.status_code == 200
-    assert response.content_type == 'text/html; charset=utf-8'
\ No newline at end of file
+    assert response.content_type == 'text/html; charset=utf-8'
+
+def test_lead_kpis_are_instrumented(client, memory_db):
+    memory_db.collection('leads').document('l-1').set({'status': 'New'})
+
+    response = client.get('/api/lead-kpis')
+
+    assert response.get_json() == {"new_leads_count": 1}
+    assert 'queries=1' in response.headers['X-Datastore-Ops']
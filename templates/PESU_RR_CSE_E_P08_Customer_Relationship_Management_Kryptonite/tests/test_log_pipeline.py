@@ -0,0 +1,108 @@
+import gzip
+import io
+import json
+import logging
+import pytest
+from app import app
+import log_pipeline
+
+
+def _record(message, name='crm', **extra):
+    record = logging.LogRecord(name, logging.INFO, __file__, 1, message, None, None)
+    record.__dict__.update(extra)
+    return record
+
+
+# --- Rotation ---
+
+def test_size_rotation_gzips_rotated_files(tmp_path):
+    path = tmp_path / 'app.log'
+    handler = log_pipeline.CompressingRotatingFileHandler(str(path), max_bytes=100, backup_count=2)
+    for n in range(30):
+        handler.emit(_record(f"message number {n:02d}"))
+    handler.close()
+
+    assert path.stat().st_size <= 100
+    assert sorted(p.name for p in tmp_path.iterdir()) == ['app.log', 'app.log.1.gz', 'app.log.2.gz']
+    with gzip.open(tmp_path / 'app.log.1.gz', 'rt') as f:
+        assert 'message number' in f.read()
+
+
+def test_time_rotation_at_the_boundary(tmp_path):
+    now = [1_000_000.0]
+    path = tmp_path / 'app.log'
+    handler = log_pipeline.CompressingRotatingFileHandler(str(path), when='hourly', backup_count=1,
+                                                          clock=lambda: now[0])
+    handler.emit(_record('before'))
+    now[0] = handler.rollover_at
+    handler.emit(_record('after'))
+    handler.close()
+
+    assert path.read_text() == 'after\n'
+    with gzip.open(tmp_path / 'app.log.1.gz', 'rt') as f:
+        assert f.read() == 'before\n'
+    with pytest.raises(ValueError):
+        log_pipeline.CompressingRotatingFileHandler(str(path), when='weekly')
+
+
+# --- Pipeline ---
+
+def test_app_log_files_do_not_rotate_by_default():
+    """Several workers would rename the shared files from under each other."""
+    import app as app_module
+    rotating = [h for h in app_module.log_listener.handlers
+                if isinstance(h, log_pipeline.CompressingRotatingFileHandler)]
+
+    assert rotating and all(h.maxBytes == 0 and h.rollover_at is None for h in rotating)
+
+
+def test_listener_routes_access_records_to_the_json_log(tmp_path):
+    stream = io.StringIO()
+    log_queue, listener = log_pipeline.build_listener(
+        str(tmp_path / 'app.log'), str(tmp_path / 'access.log'), stream=stream)
+    listener.start()
+    log_queue.put(_record('Request: GET /x | Status: 200'))
+    log_queue.put(_record('access', name=log_pipeline.ACCESS_LOGGER, access={'path': '/x', 'status': 200}))
+    listener.stop()
+    for handler in listener.handlers:
+        handler.close()
+
+    assert '[INFO] Request: GET /x | Status: 200\n' in (tmp_path / 'app.log').read_text()
+    assert 'access' not in stream.getvalue()
+    entry = json.loads((tmp_path / 'access.log').read_text())
+    assert (entry['level'], entry['path'], entry['status']) == ('INFO', '/x', 200)
+
+
+def test_parse_sample_rates():
+    assert log_pipeline.parse_sample_rates(' /api/logs=0.1, /metrics=0 ,') == {'/api/logs': 0.1, '/metrics': 0.0}
+    with pytest.raises(ValueError):
+        log_pipeline.parse_sample_rates('/api/logs=2')
+
+
+# --- Request integration ---
+
+def test_access_record_and_request_id(client, memory_db, mocker):
+    mock_access = mocker.patch('app.access_logger')
+
+    generated = client.get('/api/sales-kpis')
+    echoed = client.get('/api/sales-kpis', headers={'X-Request-ID': 'abc-123'})
+
+    assert len(generated.headers['X-Request-ID']) == 32
+    assert echoed.headers['X-Request-ID'] == 'abc-123'
+    record = mock_access.info.call_args.kwargs['extra']['access']
+    assert record['request_id'] == 'abc-123'
+    assert (record['method'], record['route'], record['status'], record['sample_rate']) == \
+        ('GET', '/api/sales-kpis', 200, 1.0)
+    assert record['db']['reads'] > 0 and record['duration'] >= 0
+
+
+def test_sampled_routes_still_log_errors(client, memory_db, mocker):
+    mock_logger = mocker.patch('app.logger')
+    mocker.patch.dict(app.config, {'ACCESS_LOG_SAMPLE_RATES': {
+        '/api/customer/<string:customer_id>': 0.0, '/api/sales-kpis': 0.0}})
+
+    client.get('/api/customer/missing')
+    client.get('/api/sales-kpis')
+
+    logged = [c.args[0] % c.args[1:] for c in mock_logger.info.call_args_list]
+    assert [line.split(' | ')[:2] for line in logged] == [['Request: GET /api/customer/missing', 'Status: 404']]
@@ -0,0 +1,103 @@
+import gzip
+import json
+import os
+import pytest
+from app import app
+from log_report import LogAnalyzer, RouteNormalizer, rotated_files
+
+RULES = ['/', '/api/customers', '/api/customer/<string:customer_id>', '/api/customer/export',
+         '/api/lead/<string:lead_id>/convert', '/static/<path:filename>']
+
+
+def _line(hour, path, status=200, seconds=0.01, method='GET'):
+    return (f"2024-05-01 {hour:02d}:15:00,123 [INFO] Request: {method} {path} | Status: {status} "
+            f"| Time: {seconds}s | DB: reads=1 writes=0 queries=0 commits=0 txns=0 db_time=0.0010s\n")
+
+
+def test_paths_are_normalized_to_route_templates():
+    normalize = RouteNormalizer(RULES)
+
+    assert normalize('/api/customer/abc123') == '/api/customer/<string:customer_id>'
+    assert normalize('/api/customer/export') == '/api/customer/export'  # static beats variable
+    assert normalize('/api/lead/l1/convert?x=1') == '/api/lead/<string:lead_id>/convert'
+    assert normalize('/static/css/site.css') == '/static/<path:filename>'
+    assert normalize('/') == '/' and normalize('/wp-login.php') == 'unmatched'
+
+
+def test_reads_incrementally_and_follows_rotation(tmp_path):
+    log = str(tmp_path / 'crm_app.log')
+    state = str(tmp_path / 'state.json.gz')
+    with open(log, 'w') as f:
+        f.write(_line(10, '/api/customer/c1'))
+        f.write("2024-05-01 10:16:00,000 [WARNING] not a request\n")
+        f.write(_line(10, '/api/customer/c2', status=500, seconds=0.5))
+        f.write(_line(11, '/api/customers')[:30])  # still being written
+
+    assert LogAnalyzer(RouteNormalizer(RULES), state).update(rotated_files(log)) == {log: 2}
+
+    # the partial line is completed, then the file is rotated and a new one started
+    with open(log, 'a') as f:
+        f.write(_line(11, '/api/customers')[30:])
+    with open(log, 'rb') as f_in, gzip.open(f"{log}.1.gz", 'wb') as f_out:
+        f_out.write(f_in.read())
+    with open(log, 'w') as f:
+        f.write(_line(12, '/api/customers', status=404))
+    analyzer = LogAnalyzer(RouteNormalizer(RULES), state)
+
+    assert rotated_files(log) == [f"{log}.1.gz", log]
+    assert analyzer.update(rotated_files(log)) == {f"{log}.1.gz": 1, log: 1}
+    assert analyzer.update(rotated_files(log)) == {f"{log}.1.gz": 0, log: 0}
+    routes = {entry['route']: entry for entry in analyzer.report()['routes']}
+    assert routes['/api/customer/<string:customer_id>']['requests'] == 2
+    assert routes['/api/customers']['client_error_rate'] == 0.5
+
+
+def test_unchanged_rotated_copies_are_not_decompressed_again(tmp_path, mocker):
+    log = str(tmp_path / 'crm_app.log')
+    with gzip.open(f"{log}.1.gz", 'wt') as f:
+        f.writelines(_line(9, f'/api/customer/c{n}') for n in range(100))
+    with open(log, 'w') as f:
+        f.write(_line(10, '/api/customers'))
+    analyzer = LogAnalyzer(RouteNormalizer(RULES), str(tmp_path / 'state.json.gz'))
+    assert analyzer.update(rotated_files(log)) == {f"{log}.1.gz": 100, log: 1}
+
+    parse = mocker.spy(analyzer, '_parse')
+    assert analyzer.update(rotated_files(log)) == {f"{log}.1.gz": 0, log: 0}
+    assert parse.call_count == 1  # only the live log
+
+
+def test_report_percentiles_error_rates_and_slowest(tmp_path):
+    log = str(tmp_path / 'crm_app.log')
+    with open(log, 'w') as f:
+        for n in range(100):
+            f.write(_line(10, f"/api/customer/c{n}", status=500 if n < 5 else 200, seconds=(n + 1) / 1000))
+        f.write(_line(11, '/api/customers', seconds=2.5))
+    analyzer = LogAnalyzer(RouteNormalizer(RULES))
+    analyzer.update([log])
+
+    report = analyzer.report(since='2024-05-01T10', until='2024-05-01T11')
+    (customer,) = report['routes']
+    assert customer['requests'] == 100 and customer['error_rate'] == 0.05
+    assert customer['p50_ms'] == pytest.approx(50, rel=0.1)
+    assert customer['p99_ms'] == pytest.approx(99, rel=0.1) and customer['max_ms'] == 100.0
+    (hour,) = report['hours']
+    assert [entry['path'] for entry in hour['slowest']] == [f"/api/customer/c{n}" for n in (99, 98, 97, 96, 95)]
+    assert analyzer.report(route='/api/customers')['routes'][0]['max_ms'] == 2500.0
+
+
+def test_cli_and_admin_endpoint(client, tmp_path, mocker):
+    log = str(tmp_path / 'crm_app.log')
+    with open(log, 'w') as f:
+        f.write(_line(9, '/api/lead/l1/convert', method='POST', seconds=0.2))
+    mocker.patch('app.LOG_FILE', log)
+    mocker.patch.dict(app.config, {"LOG_REPORT_STATE": str(tmp_path / 'state.json.gz')})
+
+    result = app.test_cli_runner().invoke(args=['analyze-logs', '--json', '--since', '2024-05-01'])
+    assert result.exit_code == 0, result.output
+    assert json.loads(result.output[result.output.index('{'):])['routes'][0]['route'] == \
+        '/api/lead/<string:lead_id>/convert'
+    assert os.path.exists(tmp_path / 'state.json.gz')
+
+    data = client.get('/api/admin/log-report?until=2024-05-02').get_json()
+    assert data['routes'][0]['requests'] == 1 and data['hours'][0]['hour'] == '2024-05-01T09'
+    assert client.get('/api/admin/log-report?since=yesterday').status_code == 400
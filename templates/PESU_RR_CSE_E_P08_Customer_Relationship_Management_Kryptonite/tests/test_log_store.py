@@ -0,0 +1,120 @@
+import gzip
+import logging
+import pytest
+from app import RequestContextFilter, app
+from log_store import LogStore, LogStoreHandler, import_text_log, parse_text_log
+
+NOW = 1_700_000_000.0
+
+
+@pytest.fixture
+def store(tmp_path, mocker):
+    log_store = LogStore(str(tmp_path / 'logs.sqlite3'))
+    records = []
+    for n in range(300):
+        records.append({
+            'ts': NOW + n, 'level': logging.ERROR if n % 50 == 0 else logging.INFO,
+            'message': f"record {n}", 'path': '/api/tickets' if n % 3 == 0 else f"/api/customer/c{n}",
+            'status': 500 if n % 50 == 0 else 200, 'duration': 2.0 if n % 100 == 7 else 0.01,
+        })
+    log_store.append_many(records)
+    mocker.patch('app.log_store', log_store)
+    return log_store
+
+
+def _numbers(records):
+    return [int(record['message'].split()[1]) for record in records]
+
+
+# --- Store ---
+
+@pytest.mark.parametrize('scan_rows', [2000, 10])  # 10: rare matches continue through the filter's index
+def test_filters_and_pagination(store, mocker, scan_rows):
+    mocker.patch.object(LogStore, 'SCAN_ROWS', scan_rows)
+
+    errors, cursor = store.query(min_level=logging.ERROR, limit=4)
+    assert _numbers(errors) == [250, 200, 150, 100] and errors[0]['level'] == 'ERROR'
+    rest, cursor = store.query(min_level=logging.ERROR, limit=4, cursor=cursor)
+    assert _numbers(rest) == [50, 0] and cursor is None
+
+    assert _numbers(store.query(status='5xx', end=NOW + 100)[0]) == [50, 0]
+    assert _numbers(store.query(min_duration=1.0)[0]) == [207, 107, 7]
+    assert _numbers(store.query(path_prefix='/api/customer/c29', start=NOW + 290)[0]) == [299, 298, 296, 295, 293, 292, 290]
+
+
+def test_queries_use_the_indexes(store):
+    plans = store.explain(path_prefix='/api/tickets', start=NOW)
+    assert 'log_records_ts' in plans[0][0] and 'log_records_path' in plans[1][0]
+    assert 'log_records_duration' in store.explain(min_duration=1.0)[1][0]
+
+
+def test_handler_stores_access_records_and_prunes(tmp_path):
+    log_store = LogStore(str(tmp_path / 'logs.sqlite3'))
+    clock = [NOW]
+    handler = LogStoreHandler(log_store, retention_seconds=60, clock=lambda: clock[0])
+    old = logging.LogRecord('app', logging.WARNING, __file__, 1, 'slow %s', ('thing',), None)
+    old.created = NOW - 120
+    handler.emit(old)
+    skipped = logging.LogRecord('app', logging.INFO, __file__, 1, 'Request: ...', None, None)
+    skipped.log_store = False
+    handler.emit(skipped)
+    access = logging.LogRecord('crm.access', logging.INFO, __file__, 1, 'access', None, None)
+    access.created = NOW
+    access.access = {'request_id': 'r1', 'method': 'GET', 'path': '/api/x', 'route': '/api/x',
+                     'status': 404, 'duration': 0.5}
+    handler.emit(access)  # the first emit after start-up prunes
+
+    (record,), _ = log_store.query()
+    assert (record['request_id'], record['status'], record['message']) == ('r1', 404, 'GET /api/x 404 0.5s')
+
+
+def test_parse_text_log():
+    lines = [
+        "2024-01-02 03:04:05,678 [INFO] Request: GET /api/leads | Status: 200 | Time: 0.012s | DB: reads=1\n",
+        "2024-01-02 03:04:06,000 [ERROR] Boom\n",
+        "Traceback (most recent call last):\n",
+        "2024-01-02 03:04:07,000 [WARNING] PERFORMANCE ALERT\n",
+    ]
+    request, error, warning = parse_text_log(lines)
+    assert (request['method'], request['path'], request['status'], request['duration']) == ('GET', '/api/leads', 200, 0.012)
+    assert error['level'] == logging.ERROR and error['message'] == 'Boom\nTraceback (most recent call last):'
+    assert round(warning['ts'] - request['ts'], 3) == 1.322
+
+
+# --- App integration ---
+
+def test_logs_query_api(client, store):
+    first = client.get('/api/logs?level=error&limit=2').get_json()
+    assert _numbers(first['records']) == [250, 200] and first['records'][0]['time'].startswith('2023-11-14T')
+    second = client.get(f"/api/logs?level=error&limit=2&cursor={first['next_cursor']}").get_json()
+    assert _numbers(second['records']) == [150, 100]
+
+    slow = client.get(f'/api/logs?slow=1&path=/api/customer&start={NOW + 100}').get_json()
+    assert _numbers(slow['records']) == [107]
+    assert _numbers(client.get('/api/logs?status=5xx&end=2023-11-14T22:14:10Z').get_json()['records']) == [0]
+
+    assert client.get('/api/logs?level=LOUD').status_code == 400
+    assert client.get('/api/logs?cursor=abc').status_code == 400
+
+
+def test_logs_query_api_disabled(client, mocker):
+    mocker.patch('app.log_store', None)
+    assert client.get('/api/logs?level=error').status_code == 503
+
+
+def test_request_context_filter_tags_records():
+    record = logging.LogRecord('app', logging.WARNING, __file__, 1, 'N+1', None, None)
+    with app.test_request_context('/api/tickets', method='POST'):
+        RequestContextFilter().filter(record)
+    assert (record.http_method, record.http_path) == ('POST', '/api/tickets')
+
+
+def test_import_logs_command(tmp_path, store):
+    rotated = tmp_path / 'crm_app.log.1.gz'
+    with gzip.open(rotated, 'wt') as f:
+        f.write("2024-01-02 03:04:05,678 [ERROR] Old failure\n")
+
+    result = app.test_cli_runner().invoke(args=['import-logs', str(rotated)])
+
+    assert 'imported 1 records' in result.output
+    assert any(r['message'] == 'Old failure' for r in store.query(min_level=logging.ERROR, limit=50)[0])
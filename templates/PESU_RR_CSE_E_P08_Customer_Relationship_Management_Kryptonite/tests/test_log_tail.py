@@ -0,0 +1,96 @@
+import pytest
+from app import app
+import log_tail
+
+
+@pytest.fixture
+def log_file(tmp_path, mocker):
+    path = tmp_path / 'crm_app.log'
+    path.write_bytes(b''.join(f"line {n}\n".encode() for n in range(1000)))
+    mocker.patch('app.LOG_FILE', str(path))
+    return path
+
+
+# --- Reader ---
+
+def test_tail_reads_only_the_last_blocks(log_file, mocker):
+    real_open = open
+    reads = []
+
+    def tracking_open(*args, **kwargs):
+        f = real_open(*args, **kwargs)
+        original_read = f.read
+        f.read = lambda size=-1: reads.append(size) or original_read(size)
+        return f
+
+    mocker.patch('builtins.open', tracking_open)
+    lines, offset = log_tail.tail(str(log_file), 3, block_size=16)
+
+    assert lines == ['line 997\n', 'line 998\n', 'line 999\n']
+    assert offset == log_file.stat().st_size
+    assert sum(reads) <= 32 and -1 not in reads
+
+
+def test_tail_handles_short_files_and_partial_last_line(tmp_path):
+    path = tmp_path / 'log'
+    path.write_bytes(b'first\nsecond\nthird (still being writ')
+    assert log_tail.tail(str(path), 10, block_size=4) == (['first\n', 'second\n'], 13)
+    path.write_bytes(b'')
+    assert log_tail.tail(str(path), 5) == ([], 0)
+
+
+def test_read_since_returns_appended_lines_and_detects_rotation(tmp_path):
+    path = tmp_path / 'log'
+    path.write_bytes(b'a\nb\n')
+    _, offset = log_tail.tail(str(path), 1)
+    with open(path, 'ab') as f:
+        f.write(b'c\nd\npart')
+    assert log_tail.read_since(str(path), offset) == (['c\n', 'd\n'], 8, False)
+
+    path.write_bytes(b'new\n')  # rotated: the cursor is past the end
+    assert log_tail.read_since(str(path), 8) == (['new\n'], 4, True)
+
+
+def test_sse_events_push_appended_lines(tmp_path):
+    path = tmp_path / 'log'
+    path.write_bytes(b'old\n')
+    clock = iter(range(100)).__next__
+
+    def append(_seconds):
+        with open(path, 'ab') as f:
+            f.write(b'x [INFO] one\ntwo\n')
+
+    events = list(log_tail.sse_events(str(path), 4, duration=3, heartbeat=2,
+                                      sleep=append, clock=clock))
+
+    assert events[0] == 'retry: 3000\n\n'
+    assert events[1] == 'id: 21\ndata: x [INFO] one\ndata: two\n\n'
+    assert ': keepalive\n\n' not in events[:2]
+
+
+# --- Endpoints ---
+
+def test_logs_endpoint_tail_and_since_cursor(client, log_file):
+    first = client.get('/api/logs').get_json()
+    assert first['logs'][0] == 'line 999\n' and len(first['logs']) == 50
+    assert client.get('/api/logs?lines=2').get_json()['logs'] == ['line 999\n', 'line 998\n']
+
+    with open(log_file, 'a') as f:
+        f.write('line 1000\nline 1001\n')
+    update = client.get(f"/api/logs?since={first['offset']}").get_json()
+    assert update['logs'] == ['line 1001\n', 'line 1000\n'] and update['reset'] is False
+    assert client.get(f"/api/logs?since={update['offset']}").get_json()['logs'] == []
+
+    assert client.get('/api/logs?since=-1').status_code == 400
+
+
+def test_logs_stream_resumes_from_last_event_id(client, log_file, mocker):
+    mocker.patch.dict(app.config, {'LOG_STREAM_MAX_SECONDS': 0})
+    offset = log_file.stat().st_size
+    with open(log_file, 'a') as f:
+        f.write('fresh\n')
+
+    response = client.get('/api/logs/stream', headers={'Last-Event-ID': str(offset)})
+
+    assert response.mimetype == 'text/event-stream'
+    assert f"id: {offset + 6}\ndata: fresh\n\n" in response.get_data(as_text=True)
@@ -0,0 +1,42 @@
+import pytest
+from app import memory_snapshots
+
+_retained = []
+
+
+@pytest.fixture
+def tracing():
+    yield
+    memory_snapshots.stop()
+    _retained.clear()
+
+
+def _grow():
+    _retained.extend(bytearray(1024) for _ in range(200))
+
+
+def test_snapshot_diff_finds_the_growing_allocation_site(client, tracing):
+    assert client.post('/api/admin/tracemalloc/snapshots').status_code == 409  # not tracing yet
+    assert client.post('/api/admin/tracemalloc/start', json={'frames': 5}).get_json()['tracing'] is True
+
+    first = client.post('/api/admin/tracemalloc/snapshots').get_json()['id']
+    _grow()
+    second = client.post('/api/admin/tracemalloc/snapshots?limit=3').get_json()
+    assert len(second['top']) == 3
+
+    diff = client.get(f"/api/admin/tracemalloc/diff?from={first}&to={second['id']}").get_json()['diff']
+    assert 'test_memory_snapshots.py' in diff[0]['location'] and diff[0]['size_diff'] >= 200 * 1024
+
+    status = client.get('/api/admin/tracemalloc').get_json()
+    assert [s['id'] for s in status['snapshots']] == [first, second['id']] and status['traced_bytes'] > 0
+    assert client.get(f"/api/admin/tracemalloc/snapshots/{first}?group_by=filename").status_code == 200
+
+
+def test_errors_and_stop(client, tracing):
+    client.post('/api/admin/tracemalloc/start')
+    assert client.get('/api/admin/tracemalloc/diff?from=1').status_code == 400
+    assert client.get('/api/admin/tracemalloc/diff?from=998&to=999').status_code == 404
+    assert client.post('/api/admin/tracemalloc/snapshots?group_by=module').status_code == 400
+    assert client.post('/api/admin/tracemalloc/start', json={'frames': 0}).status_code == 400
+
+    assert client.post('/api/admin/tracemalloc/stop').get_json()['tracing'] is False
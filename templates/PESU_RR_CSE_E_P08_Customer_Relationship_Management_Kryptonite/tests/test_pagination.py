@@ -0,0 +1,137 @@
+import pytest
+from datetime import datetime, timezone
+from unittest.mock import MagicMock
+from app import app, encode_cursor, decode_cursor
+
+
+def _doc(doc_id, data):
+    doc = MagicMock()
+    doc.id = doc_id
+    doc.to_dict.return_value = data
+    return doc
+
+
+# --- Cursor encoding ---
+
+def test_cursor_round_trip_keeps_datetimes():
+    created = datetime(2025, 1, 2, 3, 4, 5, tzinfo=timezone.utc)
+    token = encode_cursor([created, "doc-9"])
+    assert decode_cursor(token) == [created, "doc-9"]
+
+
+def test_decode_cursor_rejects_garbage():
+    with pytest.raises(ValueError):
+        decode_cursor("not-a-cursor!!")
+
+
+# --- /api/customers ---
+
+def test_get_customers_returns_next_cursor(client, mocker):
+    """A full page plus one extra doc means there is another page."""
+    mock_db = mocker.MagicMock()
+    docs = [_doc(f"cust-{i}", {"name": f"C{i}"}) for i in range(3)]
+    query = mock_db.collection.return_value.order_by.return_value
+    query.limit.return_value.stream.return_value = docs
+    mocker.patch('app.get_db', return_value=mock_db)
+
+    response = client.get('/api/customers?page_size=2')
+
+    assert response.status_code == 200
+    assert [c['id'] for c in response.json] == ["cust-0", "cust-1"]
+    query.limit.assert_called_once_with(3)
+    assert decode_cursor(response.headers['X-Next-Cursor']) == ["cust-1"]
+
+
+def test_get_customers_resumes_after_cursor(client, mocker):
+    mock_db = mocker.MagicMock()
+    query = mock_db.collection.return_value.order_by.return_value
+    query.start_after.return_value.limit.return_value.stream.return_value = [
+        _doc("cust-2", {"name": "C2"})
+    ]
+    mocker.patch('app.get_db', return_value=mock_db)
+
+    response = client.get(f'/api/customers?page_size=2&cursor={encode_cursor(["cust-1"])}')
+
+    assert response.status_code == 200
+    query.start_after.assert_called_once_with({'__name__': 'cust-1'})
+    assert response.json[0]['id'] == "cust-2"
+    assert 'X-Next-Cursor' not in response.headers
+
+
+@pytest.mark.parametrize("query_string", [
+    "cursor=bogus", "page_size=0", "page_size=abc", "page_size=100000"
+])
+def test_get_customers_rejects_bad_page_args(client, mocker, query_string):
+    mocker.patch('app.get_db', return_value=mocker.MagicMock())
+    response = client.get(f'/api/customers?{query_string}')
+    assert response.status_code == 400
+
+
+def test_get_customers_all_flag_streams_everything(client, mocker):
+    """The legacy unpaginated read is only used behind ?all=true."""
+    mock_db = mocker.MagicMock()
+    mock_db.collection.return_value.stream.return_value = [
+        _doc("cust-1", {"name": "A"}), _doc("cust-2", {"name": "B"})
+    ]
+    mocker.patch('app.get_db', return_value=mock_db)
+
+    response = client.get('/api/customers?all=true')
+
+    assert response.status_code == 200
+    assert len(response.json) == 2
+    mock_db.collection.return_value.order_by.assert_not_called()
+
+
+# --- Other list endpoints ---
+
+def test_get_leads_paginates(client, mocker):
+    mock_db = mocker.MagicMock()
+    query = mock_db.collection.return_value.order_by.return_value
+    query.limit.return_value.stream.return_value = [_doc("lead-1", {"status": "New"})]
+    mocker.patch('app.get_db', return_value=mock_db)
+
+    response = client.get('/api/leads?page_size=10')
+
+    assert response.status_code == 200
+    assert response.json[0]['id'] == "lead-1"
+    query.limit.assert_called_once_with(11)
+
+
+def test_get_tickets_cursor_uses_created_at_and_id(client, mocker):
+    mock_db = mocker.MagicMock()
+    created = datetime(2025, 5, 1, tzinfo=timezone.utc)
+    query = mock_db.collection.return_value.order_by.return_value.order_by.return_value
+    query.limit.return_value.stream.return_value = [
+        _doc("t-2", {"created_at": created}), _doc("t-1", {"created_at": created})
+    ]
+    mocker.patch('app.get_db', return_value=mock_db)
+
+    response = client.get('/api/tickets?page_size=1')
+
+    assert response.status_code == 200
+    assert len(response.json) == 1
+    assert decode_cursor(response.headers['X-Next-Cursor']) == [created, "t-2"]
+
+
+def test_get_tickets_default_page_is_twenty(client, mocker):
+    mock_db = mocker.MagicMock()
+    query = mock_db.collection.return_value.order_by.return_value.order_by.return_value
+    query.limit.return_value.stream.return_value = []
+    mocker.patch('app.get_db', return_value=mock_db)
+
+    client.get('/api/tickets')
+
+    query.limit.assert_called_once_with(21)
+
+
+def test_get_campaigns_all_flag(client, mocker):
+    mock_db = mocker.MagicMock()
+    mock_db.collection.return_value.order_by.return_value.stream.return_value = [
+        _doc("camp-1", {"name": "Blast"})
+    ]
+    mocker.patch('app.get_db', return_value=mock_db)
+
+    response = client.get('/api/campaigns?all=1')
+
+    assert response.status_code == 200
+    assert response.json[0]['name'] == "Blast"
@@ -0,0 +1,109 @@
+import json
+import os
+import subprocess  # nosec - used to obtain the pid of an exited process
+import sys
+import threading
+import pytest
+from app import app, metrics
+from request_metrics import MetricsRegistry
+
+
+def _registry(**kwargs):
+    registry = MetricsRegistry(buckets=(0.1, 1.0), **kwargs)
+    registry.describe('requests_total', 'counter', 'Requests.')
+    registry.describe('in_flight', 'gauge', 'In flight.')
+    registry.describe('latency_seconds', 'histogram', 'Latency.')
+    return registry
+
+
+# --- Registry ---
+
+def test_render_prometheus_text_format():
+    registry = _registry()
+    registry.inc('requests_total', (('route', '/a "b"'),), 2)
+    for value in (0.05, 0.5, 3):
+        registry.observe('latency_seconds', value, (('route', '/a'),))
+
+    text = registry.render()
+    assert '# TYPE requests_total counter\nrequests_total{route="/a \\"b\\""} 2\n' in text
+    assert 'latency_seconds_bucket{route="/a",le="0.1"} 1\n' in text
+    assert 'latency_seconds_bucket{route="/a",le="1"} 2\n' in text
+    assert 'latency_seconds_bucket{route="/a",le="+Inf"} 3\n' in text
+    assert 'latency_seconds_sum{route="/a"} 3.55\n' in text
+    assert 'latency_seconds_count{route="/a"} 3\n' in text
+    with pytest.raises(KeyError):
+        registry.inc('latency_seconds')
+
+
+def test_concurrent_updates_are_not_lost():
+    registry = _registry()
+
+    def work():
+        for _ in range(1000):
+            registry.inc('requests_total')
+            registry.observe('latency_seconds', 0.01)
+
+    threads = [threading.Thread(target=work) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert 'requests_total 8000\n' in registry.render()
+    assert 'latency_seconds_count 8000\n' in registry.render()
+
+
+def test_multiprocess_snapshots_are_merged(tmp_path):
+    exited = subprocess.run([sys.executable, '-c', 'import os; print(os.getpid())'],  # nosec
+                            capture_output=True, text=True, check=True)
+    dead_pid = int(exited.stdout)
+    (tmp_path / f"metrics-{dead_pid}.json").write_text(json.dumps({
+        'pid': dead_pid, 'buckets': [0.1, 1.0],
+        'counters': [['requests_total', [], 5]],
+        'gauges': [['in_flight', [], 3]],
+        'histograms': [['latency_seconds', [], [1, 0, 0, 0.05]]],
+    }))
+    worker = _registry()
+    worker.inc('requests_total', amount=2)
+    worker.gauge_add('in_flight', 1)
+    worker.observe('latency_seconds', 0.5)
+    live_snapshot = dict(worker.snapshot(), pid=os.getppid())  # stands in for another live worker
+    (tmp_path / f"metrics-{os.getppid()}.json").write_text(json.dumps(live_snapshot))
+
+    scraper = _registry(multiprocess_dir=str(tmp_path))
+    text = scraper.render()
+    assert 'requests_total 7\n' in text           # counters of exited workers still count
+    assert 'in_flight 1\n' in text                # gauges only from live processes
+    assert 'latency_seconds_count 2\n' in text
+
+
+# --- App integration ---
+
+def test_metrics_endpoint_reports_requests_and_datastore_time(client, memory_db):
+    metrics.reset()
+    client.get('/api/sales-kpis')
+    client.get('/api/customer/missing')
+
+    text = client.get('/metrics').get_data(as_text=True)
+
+    assert 'crm_http_requests_total{route="/api/sales-kpis",method="GET",status="2xx"} 1\n' in text
+    assert 'crm_http_requests_total{route="/api/customer/<string:customer_id>",method="GET",status="4xx"} 1\n' in text
+    assert 'crm_http_request_duration_seconds_count{route="/api/sales-kpis",method="GET"} 1\n' in text
+    assert 'crm_datastore_operations_total{kind="reads"} 2\n' in text
+    assert 'crm_http_requests_in_flight 1\n' in text  # the scrape itself
+
+
+def test_metrics_token(client, mocker):
+    mocker.patch.dict(app.config, {'METRICS_TOKEN': 's3cret'})
+    assert client.get('/metrics').status_code == 401
+    assert client.get('/metrics', headers={'Authorization': 'Bearer s3cret'}).status_code == 200
+
+
+def test_metrics_need_a_login_or_a_configured_token(client, mocker):
+    mocker.patch.dict(app.config, {'TESTING': False, 'METRICS_TOKEN': None})
+    response = client.get('/metrics', headers={'Authorization': 'Bearer '})
+    assert response.status_code == 302 and response.headers['Location'].endswith('/login')
+
+    mocker.patch.dict(app.config, {'METRICS_TOKEN': 's3cret'})
+    assert client.get('/metrics').status_code == 401
+    assert client.get('/metrics', headers={'Authorization': 'Bearer s3cret'}).status_code == 200
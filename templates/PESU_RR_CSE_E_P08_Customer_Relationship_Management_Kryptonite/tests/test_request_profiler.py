@@ -0,0 +1,95 @@
+import threading
+import pytest
+from flask_jwt_extended import create_access_token
+from app import app
+from request_profiler import CaptureStore, StackSampler, parse_route_thresholds, sample_threads
+
+
+def _busy_worker(stop):
+    while not stop.is_set():
+        sum(range(1000))
+
+
+def test_sampler_counts_stacks_of_profiled_threads():
+    stop = threading.Event()
+    worker = threading.Thread(target=_busy_worker, args=(stop,))
+    worker.start()
+    sampler = StackSampler(interval=60)  # sampled by hand below
+    try:
+        profile = sampler.start(worker.ident)
+        for _ in range(5):
+            sampler.sample()
+        sampler.stop(profile)
+        sampler.sample()  # no longer profiled
+    finally:
+        stop.set()
+        worker.join()
+
+    assert profile.samples == 5
+    stack, count = profile.stacks.most_common(1)[0]
+    assert f"{__name__}:_busy_worker:" in stack and stack.startswith('threading:')
+    assert profile.folded().endswith(f" {count}\n")
+
+
+def test_capture_store_prunes_and_rejects_bad_ids(tmp_path):
+    store = CaptureStore(str(tmp_path), max_captures=2)
+    for n in range(3):
+        store.save({'id': CaptureStore.capture_id(1_700_000_000 + n, f"req{n}"), 'folded': 'a;b 1\n'})
+
+    assert [c['id'] for c in store.list()] == ['20231114T221322-req2', '20231114T221321-req1']
+    assert 'folded' not in store.list()[0]
+    for bad in ('../etc/passwd', '20231114T221320-req0'):
+        with pytest.raises(KeyError):
+            store.load(bad)
+
+
+def test_parse_route_thresholds():
+    assert parse_route_thresholds('/api/a=0.5, /api/b=2') == {'/api/a': 0.5, '/api/b': 2.0}
+
+
+def test_slow_requests_are_captured_and_downloadable(client, memory_db, mocker, tmp_path):
+    mocker.patch.dict(app.config, {'PROFILE_SAMPLE_RATE': 1.0, 'PROFILE_CAPTURE_DIR': str(tmp_path),
+                                   'SLOW_ROUTE_THRESHOLDS': {'/api/sales-kpis': 0.0}})
+    client.get('/api/sales-kpis', headers={'X-Request-ID': 'slow-1'})
+    client.get('/api/customers')  # under the default threshold: not kept
+
+    (capture,) = client.get('/api/admin/profiles').get_json()['captures']
+    assert (capture['request_id'], capture['route'], capture['status'], capture['threshold']) == \
+        ('slow-1', '/api/sales-kpis', 200, 0.0)
+    assert capture['datastore']['reads'] > 0 and 'shapes' in capture['datastore']
+
+    folded = client.get(f"/api/admin/profiles/{capture['id']}?format=folded")
+    assert folded.mimetype == 'text/plain' and 'attachment' in folded.headers['Content-Disposition']
+    assert client.get('/api/admin/profiles/20990101T000000-missing').status_code == 404
+
+
+def test_profile_endpoints_require_admin(client, mocker):
+    mocker.patch.dict(app.config, {'TESTING': False})
+    with app.app_context():
+        token = create_access_token(identity='user@crm.com', additional_claims={'role': 'User'})
+    client.set_cookie('access_token_cookie', token)
+    assert client.get('/api/admin/profiles').status_code == 403
+
+
+# --- On-demand sampling ---
+
+def test_sample_threads_prefixes_thread_names():
+    stop = threading.Event()
+    worker = threading.Thread(target=_busy_worker, args=(stop,), name='busy;worker')
+    worker.start()
+    try:
+        stacks, samples = sample_threads(0, 0.01, exclude={threading.get_ident()})
+    finally:
+        stop.set()
+        worker.join()
+
+    assert samples == 1
+    assert any(stack.startswith('busy:worker;') and '_busy_worker' in stack for stack in stacks)
+    assert not any(stack.startswith('MainThread;') for stack in stacks)
+
+
+def test_profiler_stacks_endpoint(client):
+    text = client.get('/api/admin/profiler/stacks?seconds=0')
+    assert text.mimetype == 'text/plain' and text.headers['X-Profile-Samples'] == '1'
+    assert client.get('/api/admin/profiler/stacks?seconds=0&format=json').get_json()['samples'] == 1
+    assert client.get('/api/admin/profiler/stacks?seconds=600').status_code == 400
@@ -0,0 +1,42 @@
+import pytest
+from app import app
+from server_timing import header_value
+
+
+def _timings(response):
+    """Server-Timing header -> {metric name: duration in ms}."""
+    timings = {}
+    for entry in response.headers['Server-Timing'].split(', '):
+        name, *params = entry.split(';')
+        timings[name] = float(dict(param.split('=', 1) for param in params)['dur'])
+    return timings
+
+
+def test_header_value_reports_the_remainder_as_app():
+    value = header_value(0.010, {'auth': 0.001, 'db': 0.004})
+
+    assert value == ('auth;desc="Authentication";dur=1.00, db;desc="Datastore";dur=4.00, '
+                     'app;desc="Python";dur=5.00, total;desc="Total";dur=10.00')
+    assert 'app;desc="Python";dur=0.00' in header_value(0.001, {'db': 0.002})
+
+
+def test_api_request_has_auth_db_and_json_phases(client, memory_db):
+    customer_id = client.post('/api/customer', json={'name': 'Ann Lee', 'email': 'ann@x.com'}).get_json()['id']
+
+    timings = _timings(client.get(f'/api/gdpr/export/{customer_id}'))
+
+    assert list(timings) == ['auth', 'db', 'json', 'app', 'total']
+    assert timings['total'] >= timings['db'] + timings['json']
+    assert timings['total'] == pytest.approx(sum(v for k, v in timings.items() if k != 'total'), abs=0.05)
+
+
+def test_page_has_template_phase(client):
+    timings = _timings(client.get('/monitor'))
+
+    assert 'tpl' in timings and 'json' not in timings
+
+
+def test_header_can_be_disabled(client, mocker):
+    mocker.patch.dict(app.config, {"SERVER_TIMING": False})
+
+    assert 'Server-Timing' not in client.get('/monitor').headers
@@ -42,7 +42,7 @@ def test_get_tickets_success(client):
     mock_doc = MagicMock()
     mock_doc.id = "ticket-abc"
     mock_doc.to_dict.return_value = {"issue": "It's broken", "status": "Open"}
-    mock_db.collection.return_value.order_by.return_value.limit.return_value.stream.return_value = [mock_doc]
+    mock_db.collection.return_value.order_by.return_value.order_by.return_value.limit.return_value.stream.return_value = [mock_doc]
     
     with patch('app.get_db', return_value=mock_db):
         response = client.get('/api/tickets')
@@ -162,15 +162,21 @@ def test_get_sales_kpis_success(client):
     """Test GET /api/sales-kpis - success"""
     mock_db = MagicMock()
     
-    # Create fake opportunity data
-    mock_opp1 = MagicMock()
-    mock_opp1.to_dict.return_value = {"stage": "Won", "amount": 1000}
-    mock_opp2 = MagicMock()
-    mock_opp2.to_dict.return_value = {"stage": "Lost", "amount": 500}
-    mock_opp3 = MagicMock()
-    mock_opp3.to_dict.return_value = {"stage": "Negotiation", "amount": 2000}
-    
-    mock_db.collection.return_value.stream.return_value = [mock_opp1, mock_opp2, mock_opp3]
+    # Fake aggregation results: 3 opportunities, 1 Won (1000), 1 Lost; sum before count, as Firestore may return them
+    def where_side_effect(field, op, stage):
+        query = MagicMock()
+        if stage == 'Won':
+            query.count.return_value.sum.return_value.get.return_value = [
+                [MagicMock(alias='total', value=1000), MagicMock(alias='count', value=1)]
+            ]
+        else:
+            query.count.return_value.get.return_value = [[MagicMock(alias='count', value=1)]]
+        return query
+
+    opportunities = mock_db.collection.return_value
+    opportunities.document.return_value.get.return_value.exists = False  # no counters yet
+    opportunities.count.return_value.get.return_value = [[MagicMock(alias='count', value=3)]]
+    opportunities.where.side_effect = where_side_effect
     
     with patch('app.get_db', return_value=mock_db):
         response = client.get('/api/sales-kpis')
@@ -220,10 +226,10 @@ def test_get_customer_kpis_success(client, mocker):
     from datetime import datetime, timedelta
     now = datetime.now()
     
-    mock_cust1 = mocker.MagicMock(to_dict=lambda: {"name": "Old", "createdAt": now - timedelta(days=60)})
-    mock_cust2 = mocker.MagicMock(to_dict=lambda: {"name": "New", "createdAt": now - timedelta(days=10)})
-    
-    mock_db.collection.return_value.stream.return_value = [mock_cust1, mock_cust2]
+    customers = mock_db.collection.return_value
+    customers.document.return_value.get.return_value.exists = False
+    customers.count.return_value.get.return_value = [[mocker.MagicMock(alias='count', value=2)]]
+    customers.where.return_value.count.return_value.get.return_value = [[mocker.MagicMock(alias='count', value=1)]]
     mocker.patch('app.get_db', return_value=mock_db)
     
     response = client.get('/api/customer-kpis')
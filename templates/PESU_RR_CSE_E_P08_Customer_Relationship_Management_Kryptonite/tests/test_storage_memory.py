@@ -0,0 +1,87 @@
+import pytest
+import storage
+from storage.memory import MemoryStore
+
+
+def _store(**options):
+    delays = []
+    store = MemoryStore(sleep=delays.append, **options)
+    return storage.LocalClient(store), store, delays
+
+
+# --- Fault injection / accounting ---
+
+def test_latency_and_jitter_per_operation_are_reproducible():
+    def run():
+        db, _, delays = _store(latency={'get': 0.05, 'commit': 0.08}, jitter={'get': 0.01}, seed=7)
+        ref = db.collection('customers').document('c1')
+        ref.set({'name': 'Ann'})
+        ref.get()
+        ref.get()
+        return delays
+
+    delays = run()
+    assert delays[0] == 0.08
+    assert all(0.05 <= delay <= 0.06 for delay in delays[1:])
+    assert run() == delays
+
+
+def test_scripted_and_random_failures():
+    db, store, _ = _store()
+    store.fail_next('commit', storage.DeadlineExceeded)
+    ref = db.collection('leads').document('l1')
+    with pytest.raises(storage.DeadlineExceeded):
+        ref.set({'status': 'New'})
+    ref.set({'status': 'New'})
+    assert ref.get().get('status') == 'New'
+
+    flaky, flaky_store, _ = _store(error_rate={'query': 1.0})
+    with pytest.raises(storage.ServiceUnavailable):
+        flaky.collection('leads').get()
+    assert flaky_store.stats()['failures']['query'] == 1
+    with pytest.raises(ValueError):
+        MemoryStore(latency={'listen': 1})
+
+
+def test_operation_counts():
+    db, store, _ = _store()
+    store.seed('tickets', {f"t{n}": {'status': 'Open', 'n': n} for n in range(5)})
+    list(db.collection('tickets').where('n', '>=', 3).stream())
+    db.collection('tickets').count().get()
+    list(db.get_all([db.collection('tickets').document('t0'), db.collection('tickets').document('nope')]))
+
+    stats = store.stats()
+    assert stats['operations'] == {'get': 1, 'query': 1, 'aggregate': 1, 'commit': 0}
+    assert stats['documents_read'] == 2 + 2
+    store.reset_stats()
+    assert store.stats()['round_trips'] == 0
+
+
+# --- Endpoints against the fake ---
+
+def test_customer_lifecycle_round_trips(client, memory_db):
+    store = memory_db.store
+    created = client.post('/api/customer', json={'name': 'Ann Lee', 'email': 'ann@x.com'})
+    customer_id = created.get_json()['id']
+    assert store.stats()['operations']['commit'] == 1  # customer, loyalty profile and counter in one batch
+
+    store.reset_stats()
+    client.get(f'/api/customer/{customer_id}')
+    client.get(f'/api/customer/{customer_id}')
+    assert store.stats()['operations']['get'] == 1  # second read is served from the entity cache
+
+
+def test_ticket_close_commits_once(client, memory_db):
+    ticket_id = client.post('/api/tickets', json={'customer_id': 'c1', 'issue': 'Login'}).get_json()['ticket_id']
+    memory_db.store.reset_stats()
+
+    assert client.put(f'/api/ticket/{ticket_id}/close').status_code == 200
+    assert memory_db.store.stats()['operations'] == {'get': 1, 'query': 0, 'aggregate': 0, 'commit': 1}
+    assert memory_db.collection('kpi_counters').document('tickets').get().get('closed') == 1
+
+
+def test_injected_commit_failure_surfaces_as_error(client, memory_db):
+    memory_db.store.fail_next('commit')
+    response = client.post('/api/customer', json={'name': 'Ann Lee', 'email': 'ann@x.com'})
+    assert response.status_code == 500
+    assert memory_db.collection('customers').get() == []
@@ -0,0 +1,182 @@
+import threading
+from datetime import datetime, timedelta, timezone
+import pytest
+import storage
+from storage.base import QuerySpec
+
+
+@pytest.fixture
+def db(tmp_path):
+    client = storage.open_backend('sqlite', path=str(tmp_path / "crm.sqlite3"))
+    yield client
+    client.close()
+
+
+def _ids(docs):
+    return [doc.id for doc in docs]
+
+
+# --- Documents ---
+
+def test_round_trip_keeps_types_and_server_timestamp(db):
+    moment = datetime(2024, 5, 1, 12, 30, tzinfo=timezone.utc)
+    ref = db.collection('customers').document('c1')
+    ref.set({'name': 'Ann', 'tags': ['vip'], 'joined': moment, 'score': 1.5,
+             'active': True, 'createdAt': storage.SERVER_TIMESTAMP})
+
+    snapshot = ref.get()
+    data = snapshot.to_dict()
+    assert snapshot.exists and snapshot.id == 'c1'
+    assert data['joined'] == moment and data['tags'] == ['vip'] and data['active'] is True
+    assert isinstance(data['createdAt'], datetime) and data['createdAt'] == snapshot.update_time
+    assert not db.collection('customers').document('missing').get().exists
+
+
+def test_transforms_and_nested_merge(db):
+    ref = db.collection('kpi_counters').document('leads')
+    ref.set({'total': storage.Increment(2), 'by_status': {'New': storage.Increment(2)}}, merge=True)
+    ref.set({'total': storage.Increment(1), 'by_status': {'Converted': storage.Increment(1)},
+             'fastest': storage.Minimum(30)}, merge=True)
+    ref.update({'by_status.New': storage.Increment(-1), 'fastest': storage.Minimum(50)})
+
+    assert ref.get().to_dict() == {'total': 3, 'by_status': {'New': 1, 'Converted': 1}, 'fastest': 30}
+
+
+def test_update_and_delete_preconditions(db):
+    ref = db.collection('customers').document('ghost')
+    with pytest.raises(storage.NotFound):
+        ref.update({'name': 'x'})
+    with pytest.raises(storage.NotFound):
+        ref.delete(option=db.write_option(exists=True))
+    ref.delete()  # plain deletes of missing documents succeed, as in Firestore
+
+    ref.create({'name': 'Ann'})
+    with pytest.raises(storage.AlreadyExists):
+        ref.create({'name': 'Ann'})
+
+
+# --- Queries ---
+
+def _seed_tickets(db):
+    base = datetime(2024, 1, 1, tzinfo=timezone.utc)
+    batch = db.batch()
+    for n in range(10):
+        batch.set(db.collection('tickets').document(f"t{n}"), {
+            'status': 'Closed' if n % 2 else 'Open',
+            'created_at': base + timedelta(hours=n),
+            'priority': n,
+        })
+    batch.set(db.collection('tickets').document('untimed'), {'status': 'Open', 'priority': 'high'})
+    batch.commit()
+
+
+def test_where_order_limit_and_select(db):
+    _seed_tickets(db)
+    tickets = db.collection('tickets')
+
+    open_recent = tickets.where('status', '==', 'Open').order_by(
+        'created_at', direction=storage.DESCENDING).limit(3).get()
+    assert _ids(open_recent) == ['t8', 't6', 't4']
+
+    ranged = tickets.where('priority', '>=', 7).select(['priority']).get()
+    assert [doc.to_dict() for doc in ranged] == [{'priority': 7}, {'priority': 8}, {'priority': 9}]
+    assert _ids(tickets.where('status', 'in', ['Open']).where('priority', '==', 'high').get()) == ['untimed']
+
+
+def test_cursor_pagination_matches_python_evaluation(db):
+    _seed_tickets(db)
+    query = db.collection('tickets').order_by('created_at', direction=storage.DESCENDING).limit(4)
+
+    pages, cursor = [], None
+    while True:
+        page = (query.start_after(cursor) if cursor else query).get()
+        if not page:
+            break
+        pages.append(_ids(page))
+        cursor = page[-1]
+
+    assert pages == [['t9', 't8', 't7', 't6'], ['t5', 't4', 't3', 't2'], ['t1', 't0']]
+
+
+def test_count_and_sum_aggregations(db):
+    _seed_tickets(db)
+    results = db.collection('tickets').where('status', '==', 'Closed').count(alias='count') \
+        .sum('priority', alias='total').get()[0]
+    assert (results[0].alias, results[0].value) == ('count', 5)
+    assert results[1].value == 1 + 3 + 5 + 7 + 9
+
+
+def test_filtered_queries_use_expression_indexes(db):
+    spec = QuerySpec('tickets', filters=[('status', '==', 'Open')])
+    plan = " ".join(db.store.explain(spec))
+    assert "documents_status" in plan
+
+
+def test_database_uses_wal_journal(db):
+    assert db.store._connection().execute('PRAGMA journal_mode').fetchone()[0] == 'wal'
+
+
+# --- Transactions / batches ---
+
+def test_transaction_retries_after_conflicting_write(db):
+    ref = db.collection('loyalty_profiles').document('p1')
+    ref.set({'points': 100})
+    attempts = []
+
+    @storage.transactional
+    def redeem(transaction):
+        points = ref.get(transaction=transaction).get('points')
+        attempts.append(points)
+        if len(attempts) == 1:
+            # Another writer commits between our read and our commit.
+            threading.Thread(target=ref.update, args=({'points': storage.Increment(50)},)).run()
+        transaction.update(ref, {'points': points - 30})
+
+    redeem(db.transaction())
+
+    assert attempts == [100, 150]
+    assert ref.get().get('points') == 120
+
+
+@pytest.mark.parametrize('path', ['file', ':memory:'])
+def test_connections_of_exited_threads_are_closed(tmp_path, path):
+    db = storage.open_backend('sqlite', path=str(tmp_path / "crm.sqlite3") if path == 'file' else path)
+    db.collection('customers').document('c1').set({'name': 'Ann'})
+
+    def read():
+        assert db.collection('customers').document('c1').get().exists
+
+    for _ in range(50):  # one thread per request, as the development server does
+        worker = threading.Thread(target=read)
+        worker.start()
+        worker.join()
+
+    assert len(db.store._connections) <= 2  # this thread's and the last worker's
+    read()  # the in-memory database survived its creating connection's peers
+    db.close()
+
+
+def test_failed_batch_writes_nothing(db):
+    batch = db.batch()
+    batch.set(db.collection('customers').document('c1'), {'name': 'Ann'})
+    batch.update(db.collection('customers').document('missing'), {'name': 'x'})
+    with pytest.raises(storage.NotFound):
+        batch.commit()
+    assert not db.collection('customers').document('c1').get().exists
+
+
+# --- App integration ---
+
+def test_app_runs_on_sqlite_backend(client, mocker, tmp_path):
+    db = storage.open_backend('sqlite', path=str(tmp_path / "app.sqlite3"))
+    mocker.patch('app.get_db', return_value=db)
+
+    created = client.post('/api/customer', json={'name': 'Ann Lee', 'email': 'ann@x.com'})
+    customer_id = created.get_json()['id']
+    client.put(f'/api/customer/{customer_id}', json={'phone': '555'})
+
+    assert client.get(f'/api/customer/{customer_id}').get_json()['phone'] == '555'
+    assert [c['id'] for c in client.get('/api/customers').get_json()] == [customer_id]
+    assert db.collection('kpi_counters').document('customers').get().get('total') == 1
+    assert client.delete(f'/api/customer/{customer_id}').status_code == 200
+    assert client.delete(f'/api/customer/{customer_id}').status_code == 404
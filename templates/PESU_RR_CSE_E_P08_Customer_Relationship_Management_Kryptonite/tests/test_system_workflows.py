@@ -1,4 +1,5 @@
 import json
+from datetime import datetime, timezone
 import pytest
 from app import app
 from unittest.mock import MagicMock, patch
@@ -73,14 +74,19 @@ def test_system_lead_to_kpi_workflow(client, mocker):
     mock_opp_ref = mocker.MagicMock()
     mock_opp_ref.id = "opp-456"
     mock_opp_doc = mocker.MagicMock(exists=True)
+    mock_opp_doc.to_dict.return_value = {'stage': 'Qualification', 'amount': 5000}
     mock_opp_ref.get.return_value = mock_opp_doc
 
+    mock_counters_ref = mocker.MagicMock()
+
     # Mock the various document() calls
     def doc_side_effect(path=None):
         if path == "lead-123":
             return mock_lead_ref
         if path == "opp-456":
             return mock_opp_ref
+        if path == "opportunities":
+            return mock_counters_ref
         return mocker.MagicMock(id="new-doc-id") # Default mock for new docs
 
     mock_db.collection.return_value.document = doc_side_effect
@@ -94,11 +100,21 @@ def test_system_lead_to_kpi_workflow(client, mocker):
     response_update = client.put('/api/opportunity/opp-456/status', json=update_data)
     assert response_update.status_code == 200
 
+    # The Won transition must move the counters: Qualification -> Won, +5000 revenue
+    transaction = mock_db.transaction.return_value
+    counter_args, counter_kwargs = transaction.set.call_args
+    assert counter_args[0] is mock_counters_ref
+    assert counter_kwargs == {'merge': True}
+    assert counter_args[1]['by_stage']['Won'].value == 1
+    assert counter_args[1]['by_stage']['Qualification'].value == -1
+    assert counter_args[1]['revenue_won'].value == 5000
+
     # --- Mocking for Step 3: Check Sales KPI ---
-    # Mock the stream() call for the KPI endpoint
-    mock_won_opp = mocker.MagicMock()
-    mock_won_opp.to_dict.return_value = {"stage": "Won", "amount": 5000}
-    mock_db.collection.return_value.stream.return_value = [mock_won_opp]
+    # The KPI endpoint reads the materialized counters document
+    mock_counters_ref.get.return_value = mocker.MagicMock(exists=True)
+    mock_counters_ref.get.return_value.to_dict.return_value = {
+        'total': 1, 'by_stage': {'Won': 1}, 'revenue_won': 5000.0, 'built_at': datetime.now(timezone.utc)
+    }
 
     # === STEP 3: Check Sales KPI (from Epic 6) ===
     response_kpi = client.get('/api/sales-kpis')
@@ -0,0 +1,105 @@
+import numpy as np
+import pytest
+from datetime import datetime, timedelta, timezone
+from unittest.mock import MagicMock
+from app import app
+from ticket_metrics import TicketArrays, bucketed_metrics, epoch_seconds
+
+BASE = datetime(2025, 6, 2, tzinfo=timezone.utc)  # a Monday
+
+
+def _ticket(resolved_offset_h, duration_h, priority="Medium"):
+    resolved = BASE + timedelta(hours=resolved_offset_h)
+    return {"created_at": resolved - timedelta(hours=duration_h), "resolved_at": resolved,
+            "priority": priority}
+
+
+# --- Engine ---
+
+def test_epoch_seconds_accepts_common_formats():
+    expected = int(BASE.timestamp())
+    assert epoch_seconds(BASE) == expected
+    assert epoch_seconds(BASE.replace(tzinfo=None)) == expected
+    assert epoch_seconds(BASE.isoformat()) == expected
+    assert epoch_seconds(MagicMock(**{'to_datetime.return_value': BASE})) == expected
+    assert epoch_seconds("yesterday") is None
+    assert epoch_seconds(None) is None
+
+
+def test_from_tickets_skips_incomplete_rows():
+    arrays = TicketArrays.from_tickets([_ticket(1, 2), {"created_at": BASE}, {}])
+    assert len(arrays) == 1
+    assert arrays.durations.dtype == np.int64
+    assert arrays.durations[0] == 7200
+
+
+def test_bucketed_metrics_match_numpy_percentiles():
+    rng = np.random.default_rng(7)
+    tickets = [
+        _ticket(float(offset), float(duration), priority)
+        for offset, duration, priority in zip(
+            rng.uniform(0, 48, 500), rng.uniform(0, 30, 500), rng.choice(["High", "Low"], 500))
+    ]
+    arrays = TicketArrays.from_tickets(tickets)
+    day = 24 * 3600
+    start = int(BASE.timestamp())
+
+    overall, by_priority, buckets = bucketed_metrics(arrays, [start, start + day, start + 2 * day])
+
+    assert overall['count'] == 500
+    assert [b['count'] for b in buckets] == [
+        int(np.sum(arrays.resolved < start + day)), int(np.sum(arrays.resolved >= start + day))
+    ]
+    first_day = arrays.durations[arrays.resolved < start + day]
+    for name, q in (('median', 50), ('p90', 90), ('p99', 99)):
+        assert buckets[0][f'{name}_hours'] == round(float(np.percentile(first_day, q)) / 3600, 2)
+    assert buckets[0]['mean_hours'] == round(float(first_day.mean()) / 3600, 2)
+
+    high = arrays.durations[arrays.priority_codes == arrays.priorities.index("High")]
+    assert by_priority["High"]['count'] == len(high)
+    assert by_priority["High"]['p90_hours'] == round(float(np.percentile(high, 90)) / 3600, 2)
+    assert sum(b['by_priority'].get("Low", {}).get('count', 0) for b in buckets) == by_priority["Low"]['count']
+
+
+def test_bucketed_metrics_handles_empty_and_out_of_range():
+    start = int(BASE.timestamp())
+    arrays = TicketArrays.from_tickets([_ticket(-5, 1), _ticket(100, 1)])
+
+    overall, by_priority, buckets = bucketed_metrics(arrays, [start, start + 3600])
+
+    assert overall == {'count': 0, 'mean_hours': 0.0, 'median_hours': 0.0,
+                       'p90_hours': 0.0, 'p99_hours': 0.0}
+    assert by_priority == {}
+    assert buckets[0]['count'] == 0 and buckets[0]['by_priority'] == {}
+
+
+# --- Endpoint ---
+
+def test_ticket_metrics_percentiles_endpoint(client, mocker):
+    mock_db = mocker.MagicMock()
+    docs = [MagicMock(**{'to_dict.return_value': _ticket(h, d, "High")}) for h, d in ((2, 1), (3, 3), (30, 10))]
+    query = mock_db.collection.return_value.where.return_value.where.return_value.where.return_value
+    query.select.return_value.stream.return_value = docs
+    mocker.patch('app.get_db', return_value=mock_db)
+
+    response = client.get('/api/ticket-metrics?stats=percentiles&start=2025-06-02&end=2025-06-03')
+
+    assert response.status_code == 200
+    data = response.get_json()
+    assert data['engine'] == "numpy"
+    assert data['trend_labels'] == ["2025-06-02", "2025-06-03"]
+    assert [b['count'] for b in data['buckets']] == [2, 1]
+    assert data['buckets'][0]['median_hours'] == 2.0
+    assert data['overall']['p99_hours'] == pytest.approx(9.86, abs=0.01)
+    # Only closed tickets resolved inside the window are requested
+    where = mock_db.collection.return_value.where
+    assert where.call_args[0] == ('status', '==', 'Closed')
+    assert where.return_value.where.call_args[0][:2] == ('resolved_at', '>=')
+    assert where.return_value.where.return_value.where.call_args[0] == (
+        'resolved_at', '<', datetime(2025, 6, 4, tzinfo=timezone.utc))
+
+
+def test_ticket_metrics_rejects_unknown_stats(client, mocker):
+    mocker.patch('app.get_db', return_value=mocker.MagicMock())
+    response = client.get('/api/ticket-metrics?stats=histogram')
+    assert response.status_code == 400
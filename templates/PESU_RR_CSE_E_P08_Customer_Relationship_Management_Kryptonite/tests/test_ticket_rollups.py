@@ -0,0 +1,206 @@
+import pytest
+from datetime import date, datetime, timedelta, timezone
+from unittest.mock import MagicMock, patch
+from app import app, rollup_id, rollup_buckets, compute_ticket_rollups
+
+
+def _snapshot(doc_id, data):
+    snap = MagicMock(exists=True)
+    snap.id = doc_id
+    snap.to_dict.return_value = data
+    return snap
+
+
+def _rollup(resolved, total_hours, min_hours, max_hours, by_priority=None):
+    return {
+        'resolved': resolved,
+        'total_seconds': total_hours * 3600,
+        'min_seconds': min_hours * 3600,
+        'max_seconds': max_hours * 3600,
+        'by_priority': by_priority or {},
+    }
+
+
+# --- Bucket helpers ---
+
+def test_rollup_ids_per_granularity():
+    day = date(2025, 1, 1)  # ISO week 1 of 2025
+    assert rollup_id('day', day) == "day-2025-01-01"
+    assert rollup_id('week', day) == "week-2025-W01"
+    assert rollup_id('month', day) == "month-2025-01"
+
+
+def test_rollup_buckets_align_to_calendar():
+    weeks = rollup_buckets(date(2025, 3, 5), date(2025, 3, 20), 'week')
+    assert [first_day for _, _, first_day in weeks] == [
+        date(2025, 3, 3), date(2025, 3, 10), date(2025, 3, 17)
+    ]
+    months = rollup_buckets(date(2024, 11, 15), date(2025, 2, 1), 'month')
+    assert [label for _, label, _ in months] == ["2024-11", "2024-12", "2025-01", "2025-02"]
+
+
+@pytest.mark.parametrize("start,end,granularity", [
+    (date(2025, 1, 2), date(2025, 1, 1), 'day'),
+    (date(2025, 1, 1), date(2025, 1, 2), 'year'),
+    (date(2020, 1, 1), date(2025, 1, 1), 'day'),
+])
+def test_rollup_buckets_reject_bad_ranges(start, end, granularity):
+    with pytest.raises(ValueError):
+        rollup_buckets(start, end, granularity)
+
+
+# --- Writes on close ---
+
+def test_close_ticket_writes_rollups(client, mocker):
+    mock_db = mocker.MagicMock()
+    created = datetime.now(timezone.utc) - timedelta(hours=10)
+    ticket_doc = MagicMock(exists=True)
+    ticket_doc.to_dict.return_value = {"status": "Open", "priority": "High", "created_at": created}
+
+    refs = {}
+
+    def document(doc_id=None):
+        ref = refs.setdefault(doc_id, MagicMock(id=doc_id))
+        ref.get.return_value = ticket_doc
+        return ref
+
+    mock_db.collection.return_value.document.side_effect = document
+    mocker.patch('app.get_db_or_raise', return_value=mock_db)
+
+    response = client.put('/api/ticket/t-1/close')
+
+    assert response.status_code == 200
+    today = datetime.now(timezone.utc).date()
+    writes = {c.args[0].id: c.args[1] for c in mock_db.batch.return_value.set.call_args_list}
+    for doc_id in (rollup_id('day', today), rollup_id('week', today), rollup_id('month', today), 'all'):
+        payload = writes[doc_id]
+        assert payload['resolved'].value == 1
+        assert 35990 < payload['min_seconds'].value < 36100
+        assert payload['max_seconds'].value == payload['min_seconds'].value
+        assert payload['by_priority']['High']['resolved'].value == 1
+    mock_db.batch.return_value.commit.assert_called_once()
+
+
+def test_concurrent_close_counts_the_ticket_once(client, memory_db):
+    ticket_ref = memory_db.collection('tickets').document('t-1')
+    ticket_ref.set({'status': 'Open', 'priority': 'Low',
+                    'created_at': datetime.now(timezone.utc) - timedelta(hours=2)})
+    stale = ticket_ref.get()
+    assert client.put('/api/ticket/t-1/close').status_code == 200
+
+    # A second close that read the ticket before the first one committed
+    with patch.object(type(ticket_ref), 'get', return_value=stale):
+        response = client.put('/api/ticket/t-1/close')
+
+    assert response.status_code == 409
+    assert memory_db.collection('kpi_counters').document('tickets').get().to_dict()['closed'] == 1
+    assert memory_db.collection('ticket_rollups').document('all').get().to_dict()['resolved'] == 1
+
+
+# --- Reads ---
+
+def test_ticket_metrics_default_view_from_rollups(client, mocker):
+    mock_db = mocker.MagicMock()
+    today = datetime.now(timezone.utc).date()
+    mock_db.get_all.return_value = [
+        _snapshot('all', {**_rollup(3, 90, 10, 50, {'High': _rollup(1, 10, 10, 10)}), 'built_at': today}),
+        _snapshot(rollup_id('day', today), _rollup(2, 40, 10, 30)),
+        _snapshot(rollup_id('day', today - timedelta(days=20)), _rollup(1, 50, 50, 50)),
+    ]
+    mocker.patch('app.get_db', return_value=mock_db)
+
+    response = client.get('/api/ticket-metrics')
+
+    assert response.status_code == 200
+    data = response.get_json()
+    assert data['total_resolved'] == 3
+    assert data['avg_resolution_hours'] == 30.0
+    assert data['trend_labels'] == ['Week 1', 'Week 2', 'Week 3', 'Week 4']
+    assert data['trend_values'] == [0, 50.0, 0, 20.0]
+    assert data['by_priority']['High']['resolved'] == 1
+    # 28 daily rollups plus the all-time document, fetched in one call
+    assert len(mock_db.get_all.call_args[0][0]) == 29
+    mock_db.collection.return_value.stream.assert_not_called()
+
+
+def test_ticket_metrics_custom_range_by_month(client, mocker):
+    mock_db = mocker.MagicMock()
+    mock_db.get_all.return_value = [
+        _snapshot('all', {**_rollup(9, 90, 1, 30), 'built_at': datetime(2025, 1, 1)}),
+        _snapshot('month-2025-02', _rollup(4, 40, 2, 20, {'Low': _rollup(4, 40, 2, 20)})),
+    ]
+    mocker.patch('app.get_db', return_value=mock_db)
+
+    response = client.get('/api/ticket-metrics?start=2025-01-10&end=2025-03-05&granularity=month')
+
+    assert response.status_code == 200
+    data = response.get_json()
+    assert data['trend_labels'] == ['2025-01', '2025-02', '2025-03']
+    assert data['trend_values'] == [0, 10.0, 0]
+    feb = data['buckets'][1]
+    assert (feb['resolved'], feb['min_resolution_hours'], feb['max_resolution_hours']) == (4, 2.0, 20.0)
+    assert data['total_resolved'] == 4
+    mock_db.collection.return_value.where.assert_not_called()
+
+
+def test_ticket_metrics_scan_until_rollups_are_built(client, memory_db):
+    """A close after deploy creates the all-time rollup; it only counts that one ticket."""
+    now = datetime.now(timezone.utc)
+    for index in range(3):
+        memory_db.collection('tickets').document(f't-{index}').set({
+            'status': 'Closed' if index else 'Open', 'priority': 'High',
+            'created_at': now - timedelta(hours=4), 'resolved_at': now - timedelta(hours=1)})
+    assert client.put('/api/ticket/t-0/close').status_code == 200
+    assert memory_db.collection('ticket_rollups').document('all').get().exists
+
+    assert client.get('/api/ticket-metrics').get_json()['total_resolved'] == 3
+    month = client.get('/api/ticket-metrics?granularity=month').get_json()
+    assert month['total_resolved'] == 3
+
+    assert app.test_cli_runner().invoke(args=['rebuild-ticket-rollups']).exit_code == 0
+    memory_db.collection('tickets').document('t-0').delete()  # the rollups no longer scan
+    assert client.get('/api/ticket-metrics').get_json()['total_resolved'] == 3
+
+
+@pytest.mark.parametrize("query", ["granularity=year", "start=2025-02-01&end=2025-01-01", "end=yesterday"])
+def test_ticket_metrics_rejects_bad_range(client, mocker, query):
+    mocker.patch('app.get_db', return_value=mocker.MagicMock())
+    response = client.get(f'/api/ticket-metrics?{query}')
+    assert response.status_code == 400
+
+
+# --- Rebuild ---
+
+def test_compute_ticket_rollups_from_closed_tickets():
+    mock_db = MagicMock()
+    resolved = datetime(2025, 4, 2, 12, tzinfo=timezone.utc)
+    tickets = [
+        {"status": "Closed", "priority": "High", "created_at": resolved - timedelta(hours=2), "resolved_at": resolved},
+        {"status": "Closed", "priority": "Low", "created_at": resolved - timedelta(hours=6), "resolved_at": resolved},
+        {"status": "Closed", "priority": "Low"},  # missing timestamps are skipped
+    ]
+    mock_db.collection.return_value.where.return_value.stream.return_value = [
+        MagicMock(**{'to_dict.return_value': t}) for t in tickets
+    ]
+
+    rollups = compute_ticket_rollups(mock_db)
+
+    day = rollups['day-2025-04-02']
+    assert (day['resolved'], day['min_seconds'], day['max_seconds']) == (2, 7200, 21600)
+    assert rollups['all']['by_priority']['Low']['resolved'] == 1
+    assert set(rollups) == {'day-2025-04-02', 'week-2025-W14', 'month-2025-04', 'all'}
+
+
+def test_rebuild_ticket_rollups_command(mocker):
+    mock_db = MagicMock()
+    mock_db.collection.return_value.where.return_value.stream.return_value = []
+    mock_db.collection.return_value.stream.return_value = [MagicMock()]  # one stale rollup
+    mocker.patch('app.get_db_or_raise', return_value=mock_db)
+
+    result = app.test_cli_runner().invoke(args=['rebuild-ticket-rollups'])
+
+    assert result.exit_code == 0
+    assert "Rebuilt 1 ticket rollup documents." in result.output  # the stamped, empty all-time rollup
+    mock_db.batch.return_value.delete.assert_called_once()
+    stamped = mock_db.batch.return_value.set.call_args[0][1]
+    assert stamped['resolved'] == 0 and stamped['built_at']
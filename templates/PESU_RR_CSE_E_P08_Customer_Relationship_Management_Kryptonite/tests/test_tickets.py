@@ -64,7 +64,7 @@ def test_get_tickets_success(client, mocker):
     mock_query.stream.return_value = [mock_ticket_doc]
 
     mock_collection = mocker.MagicMock()
-    mock_collection.order_by.return_value.limit.return_value = mock_query
+    mock_collection.order_by.return_value.order_by.return_value.limit.return_value = mock_query
     mock_db.collection.return_value = mock_collection
 
     mocker.patch('app.get_db', return_value=mock_db)
@@ -100,15 +100,14 @@ def test_close_ticket_happy_path(client, mocker):
         "issue": "Device broken",
         "status": "Resolved"
     }
-    # Spy the update call
-    update_spy = mocker.MagicMock()
-
     mock_doc_ref = mocker.MagicMock()
     mock_doc_ref.get.return_value = mock_ticket_doc
-    mock_doc_ref.update = update_spy
 
+    # Spy the batched update call (the ticket and its KPI counter commit together)
+    mock_batch = mocker.MagicMock()
     mock_db = mocker.MagicMock()
     mock_db.collection.return_value.document.return_value = mock_doc_ref
+    mock_db.batch.return_value = mock_batch
     mocker.patch('app.get_db_or_raise', return_value=mock_db)
 
     response = client.put('/api/ticket/T-12345/close')
@@ -118,12 +117,14 @@ def test_close_ticket_happy_path(client, mocker):
     assert body["message"] == "Ticket closed"
 
     # Validate update payload
-    assert update_spy.call_count == 1
-    args, _ = update_spy.call_args
-    assert isinstance(args, tuple) and len(args) == 1
-    payload = args[0]
+    assert mock_batch.update.call_count == 1
+    args, _ = mock_batch.update.call_args
+    assert isinstance(args, tuple) and len(args) == 2
+    assert args[0] is mock_doc_ref
+    payload = args[1]
     assert payload["status"] == "Closed"
     assert "resolved_at" in payload and "updated_at" in payload
+    mock_batch.commit.assert_called_once()
 
 
 def test_check_sla_breaches_escalates_ticket(client, mocker):
@@ -0,0 +1,65 @@
+import pytest
+from timeseries import ALL_ROUTES, TimeSeriesStore
+
+
+class FakeClock:
+    def __init__(self, now=1_700_000_000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+def test_requests_are_downsampled_into_every_resolution():
+    clock = FakeClock()
+    store = TimeSeriesStore(resolutions=((1, 10), (60, 5)), clock=clock)
+    for seconds, error in ((0.010, False), (0.030, True)):
+        store.observe('/api/customers', seconds, error)
+    clock.now += 1
+    store.observe('/api/customers', 0.020)
+
+    fine = store.series('/api/customers', window=3)
+    assert [p['count'] for p in fine] == [0, 2, 1]
+    assert fine[1]['errors'] == 1 and fine[1]['avg_ms'] == 20.0 and fine[1]['max_ms'] == 30.0
+    coarse = store.series('/api/customers', window=60)
+    assert len(coarse) == 1 and coarse[0]['count'] == 3 and coarse[0]['max_ms'] == 30.0
+    assert store.routes() == ['/api/customers']
+
+
+def test_slots_are_reused_once_they_scroll_out():
+    clock = FakeClock()
+    store = TimeSeriesStore(resolutions=((1, 10),), clock=clock)
+    store.observe('/x', 0.5)
+    clock.now += 10  # same slot, next lap of the ring
+    store.observe('/x', 0.1)
+
+    points = store.series('/x', window=10)
+    assert len(points) == 10 and sum(p['count'] for p in points) == 1
+    assert points[-1]['max_ms'] == 100.0
+
+
+def test_all_routes_series_has_percentiles():
+    store = TimeSeriesStore(resolutions=((60, 5),), buckets=(0.01, 0.1, 1.0), clock=FakeClock())
+    for _ in range(90):
+        store.observe('/fast', 0.005)
+    for _ in range(10):
+        store.observe('/slow', 0.5)
+
+    point = store.series(ALL_ROUTES, window=60)[0]
+    assert point['count'] == 100
+    assert point['p50_ms'] <= 10.0 and 100.0 < point['p99_ms'] <= 500.0
+    assert 'p95_ms' not in store.series('/fast', window=60)[0]
+    with pytest.raises(KeyError):
+        store.series('/unknown')
+
+
+def test_timeseries_endpoint(client, memory_db):
+    client.get('/api/customers')
+
+    data = client.get('/api/timeseries?route=/api/customers&window=600').get_json()
+    assert data['step'] == 1 and len(data['points']) == 600 and '/api/customers' in data['routes']
+    assert sum(p['count'] for p in data['points']) >= 1
+    assert client.get('/api/timeseries?window=86400').get_json()['step'] == 60
+    assert client.get('/api/timeseries?window=0').status_code == 400
+    assert client.get('/api/timeseries?step=7').status_code == 400
+    assert client.get('/api/timeseries?route=/nope').status_code == 404
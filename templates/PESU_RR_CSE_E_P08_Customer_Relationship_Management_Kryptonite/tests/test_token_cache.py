@@ -0,0 +1,82 @@
+from datetime import timedelta
+import pytest
+from flask_jwt_extended import create_access_token, create_refresh_token, decode_token
+from app import app, token_cache
+from token_cache import VerifiedTokenCache
+
+
+class FakeClock:
+    def __init__(self, now=1_700_000_000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def secured(client, mocker):
+    """The client with the login check switched on, and an empty token cache."""
+    mocker.patch.dict(app.config, {'TESTING': False})
+    token_cache.clear()
+    yield client
+    token_cache.clear()
+
+
+def _token(role='User', expires=timedelta(minutes=15), create=create_access_token):
+    with app.app_context():
+        return create(identity='user@crm.com', additional_claims={'role': role}, expires_delta=expires)
+
+
+# --- VerifiedTokenCache ---
+
+def test_entries_expire_with_the_token():
+    clock = FakeClock()
+    cache = VerifiedTokenCache(max_entries=10, max_ttl=300, clock=clock)
+    cache.put('short', {'exp': clock.now + 60, 'role': 'User'})
+    cache.put('long', {'exp': clock.now + 3600})
+    cache.put('expired', {'exp': clock.now - 1})
+
+    assert cache.get('short') == {'exp': clock.now + 60, 'role': 'User'}
+    assert cache.get('expired') is None
+    clock.now += 61
+    assert cache.get('short') is None and cache.get('long') is not None
+    clock.now += 300  # max_ttl caps tokens that live longer
+    assert cache.get('long') is None
+    stats = cache.stats()
+    assert (stats['hits'], stats['misses'], stats['expirations'], stats['size']) == (2, 3, 2, 0)
+
+
+def test_least_recently_used_token_is_evicted():
+    cache = VerifiedTokenCache(max_entries=2, clock=FakeClock())
+    for name in ('a', 'b'):
+        cache.put(name, {})
+    cache.get('a')
+    cache.put('c', {})
+
+    assert cache.get('b') is None and cache.get('a') == {} and cache.get('c') == {}
+    assert cache.stats()['evictions'] == 1
+    assert VerifiedTokenCache(max_entries=0).get('a') is None
+
+
+# --- Middleware ---
+
+def test_token_is_verified_once_and_sets_the_role(secured, memory_db, mocker):
+    decode = mocker.patch('app.decode_token', wraps=decode_token)
+    secured.set_cookie('access_token_cookie', _token(role='Admin'))
+
+    for _ in range(3):
+        assert secured.get('/api/admin/traces').status_code == 200  # admin_required sees g.role
+    assert decode.call_count == 1 and token_cache.stats()['hits'] == 2
+
+    secured.get('/static/css/style.css')
+    assert token_cache.stats()['hits'] == 2  # static assets skip auth
+
+
+def test_invalid_expired_or_refresh_tokens_redirect_to_login(secured, memory_db):
+    assert secured.get('/customers').status_code == 302
+    for token in (_token() + 'x', _token(expires=timedelta(seconds=-1)), _token(create=create_refresh_token)):
+        secured.set_cookie('access_token_cookie', token)
+        response = secured.get('/customers')
+        assert response.status_code == 302 and response.headers['Location'].endswith('/login')
+    assert token_cache.stats()['size'] == 0
+    assert secured.get('/login').status_code == 200
@@ -0,0 +1,91 @@
+import json
+import pytest
+import storage
+from app import app
+from datastore_metrics import OperationRecorder, instrument
+from tracing import RequestTrace, TraceExporter, parse_traceparent
+
+
+@pytest.fixture
+def exporter(tmp_path, mocker):
+    mocker.patch.dict(app.config, {"TRACE_SAMPLE_RATE": 1.0})
+    exporter = TraceExporter(str(tmp_path / 'traces.jsonl'), keep=10)
+    mocker.patch('app.trace_exporter', exporter)
+    return exporter
+
+
+def _spans(exporter, response):
+    _, spans = exporter.get(response.headers['X-Trace-ID'])
+    return spans
+
+
+def test_parse_traceparent():
+    assert parse_traceparent('00-4bf92f3577b34da6a3ce929d0e0e4736-00f067aa0ba902b7-01') == \
+        ('4bf92f3577b34da6a3ce929d0e0e4736', '00f067aa0ba902b7', True)
+    assert parse_traceparent('00-4bf92f3577b34da6a3ce929d0e0e4736-00f067aa0ba902b7-00')[2] is False
+    assert parse_traceparent('00-' + '0' * 32 + '-00f067aa0ba902b7-01') is None
+    assert parse_traceparent('garbage') is None and parse_traceparent(None) is None
+
+
+def test_recorder_spans_carry_operation_collection_and_size():
+    trace = RequestTrace('test')
+    db = instrument(storage.open_backend('memory'), OperationRecorder(tracer=trace))
+    batch = db.batch()
+    for n in range(3):
+        batch.set(db.collection('tickets').document(f"t{n}"), {'customer_id': 'c1'})
+    batch.commit()
+    list(db.collection('tickets').where('customer_id', '==', 'c1').stream())
+    db.collection('customers').document('c1').get()
+
+    spans = trace.finish()
+    assert [span['name'] for span in spans] == ['test', 'batch_commit tickets', 'stream tickets', 'get customers']
+    assert all(span['parent_span_id'] == trace.root['span_id'] for span in spans[1:])
+    attributes = [span['attributes'] for span in spans[1:]]
+    assert attributes[0]['crm.db.documents_written'] == 3
+    assert attributes[1]['db.response.returned_rows'] == 3 and attributes[1]['db.operation.name'] == 'stream'
+    assert attributes[2]['db.collection.name'] == 'customers'
+
+
+def test_convert_lead_waterfall(client, memory_db, exporter):
+    memory_db.collection('leads').document('l1').set({'name': 'Ann', 'status': 'New'})
+
+    response = client.post('/api/lead/l1/convert')
+
+    spans = _spans(exporter, response)
+    assert spans[0]['name'] == 'POST /api/lead/<string:lead_id>/convert'
+    assert spans[0]['attributes']['http.response.status_code'] == 200
+    assert [span['name'] for span in spans[1:]] == ['get leads', 'batch_commit kpi_counters,leads,opportunities']
+
+    text = client.get(f"/api/admin/traces/{response.headers['X-Trace-ID']}?format=text").get_data(as_text=True)
+    assert '  get leads' in text and '|#' in text
+    listed = client.get('/api/admin/traces').get_json()['traces']
+    assert response.headers['X-Trace-ID'] in [trace['trace_id'] for trace in listed]
+
+
+def test_transaction_attempts_are_parents_of_their_reads(client, memory_db, exporter):
+    memory_db.collection('loyalty_profiles').document('c1').set({'points': 100})
+
+    spans = _spans(exporter, client.post('/api/loyalty/c1/redeem', json={'points_to_redeem': 40}))
+
+    by_name = {span['name']: span for span in spans}
+    transaction, attempt = by_name['transaction'], by_name['transaction attempt']
+    assert transaction['attributes']['crm.db.attempts'] == 1
+    assert attempt['parent_span_id'] == transaction['span_id']
+    assert by_name['get loyalty_profiles']['parent_span_id'] == attempt['span_id']
+
+
+def test_traceparent_continues_the_callers_trace_and_exports_otlp(client, memory_db, exporter):
+    response = client.get('/api/customers', headers={
+        'traceparent': '00-4bf92f3577b34da6a3ce929d0e0e4736-00f067aa0ba902b7-01'})
+    unsampled = client.get('/api/customers', headers={
+        'traceparent': '00-4bf92f3577b34da6a3ce929d0e0e4736-00f067aa0ba902b7-00'})
+    exporter.close()
+
+    assert response.headers['X-Trace-ID'] == '4bf92f3577b34da6a3ce929d0e0e4736'
+    assert 'X-Trace-ID' not in unsampled.headers
+    with open(exporter.path) as f:
+        lines = [json.loads(line) for line in f]
+    spans = lines[0]['resourceSpans'][0]['scopeSpans'][0]['spans']
+    assert spans[0]['parentSpanId'] == '00f067aa0ba902b7' and spans[0]['kind'] == 2
+    assert int(spans[0]['endTimeUnixNano']) >= int(spans[0]['startTimeUnixNano'])
+    assert {'key': 'http.route', 'value': {'stringValue': '/api/customers'}} in spans[0]['attributes']
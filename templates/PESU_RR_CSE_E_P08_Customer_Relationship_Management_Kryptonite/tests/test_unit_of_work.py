@@ -0,0 +1,145 @@
+import pytest
+from unittest.mock import MagicMock
+from flask_jwt_extended import create_access_token
+from app import app, commit_stats
+from unit_of_work import UnitOfWork
+
+
+@pytest.fixture(autouse=True)
+def clear_commit_stats():
+    commit_stats.clear()
+    yield
+    commit_stats.clear()
+
+
+# --- UnitOfWork ---
+
+def test_flush_applies_all_writes_in_one_batch():
+    mock_db = MagicMock()
+    uow = UnitOfWork(mock_db)
+    done = MagicMock()
+    uow.set('a', {'x': 1})
+    uow.set('b', {'y': 2}, merge=True)
+    uow.update('c', {'z': 3})
+    uow.delete('d')
+    uow.after_commit(done)
+
+    assert uow.flush() == 4
+
+    batch = mock_db.batch.return_value
+    batch.set.assert_any_call('a', {'x': 1})
+    batch.set.assert_any_call('b', {'y': 2}, merge=True)
+    batch.update.assert_called_once_with('c', {'z': 3})
+    batch.delete.assert_called_once_with('d')
+    batch.commit.assert_called_once()
+    done.assert_called_once()
+    assert (uow.commits, uow.pending) == (1, 0)
+    assert uow.flush() == 0  # nothing left, no empty commit
+    assert uow.commits == 1
+
+
+def test_callbacks_skipped_when_commit_fails():
+    mock_db = MagicMock()
+    mock_db.batch.return_value.commit.side_effect = RuntimeError("aborted")
+    uow = UnitOfWork(mock_db)
+    done = MagicMock()
+    uow.set('a', {})
+    uow.after_commit(done)
+
+    with pytest.raises(RuntimeError):
+        uow.flush()
+    done.assert_not_called()
+    assert uow.commits == 0
+
+
+def test_discard_and_batch_limit():
+    uow = UnitOfWork(MagicMock())
+    for i in range(501):
+        uow.delete(i)
+    with pytest.raises(ValueError):
+        uow.flush()
+
+    uow.set('a', {})
+    assert uow.discard() == 1
+    assert uow.pending == 0
+
+
+# --- Request scoping ---
+
+def test_create_customer_makes_one_commit(client, mocker):
+    mock_db = mocker.MagicMock()
+    customer_ref = MagicMock(id="cust-1")
+    mock_db.collection.return_value.document.return_value = customer_ref
+    mocker.patch('app.get_db', return_value=mock_db)
+
+    response = client.post('/api/customer', json={"name": "Ann", "email": "ann@test.com"})
+
+    assert response.status_code == 201
+    assert response.headers['X-Commit-Count'] == "1"
+    mock_db.batch.return_value.commit.assert_called_once()
+    customer_ref.update.assert_not_called()
+    customer_payload = mock_db.batch.return_value.set.call_args_list[0].args[1]
+    assert customer_payload['loyalty_profile_id'] == "cust-1"
+
+
+def test_error_response_drops_queued_writes(client, mocker):
+    mock_db = mocker.MagicMock()
+    lead_doc = mock_db.collection.return_value.document.return_value.get.return_value
+    lead_doc.exists = True
+    lead_doc.to_dict.return_value = {"name": "L", "status": "New"}
+    mocker.patch('app.get_db', return_value=mock_db)
+    # Fail after the lead update has been queued
+    mocker.patch('app.kpi_counter_ref', side_effect=RuntimeError("boom"))
+
+    response = client.post('/api/lead/lead-1/convert')
+
+    assert response.status_code == 500
+    assert response.headers['X-Commit-Count'] == "0"
+    mock_db.batch.return_value.commit.assert_not_called()
+
+
+def test_failed_flush_turns_response_into_500(client, mocker):
+    mock_db = mocker.MagicMock()
+    mock_db.collection.return_value.document.return_value.id = "lead-1"
+    mock_db.batch.return_value.commit.side_effect = RuntimeError("unavailable")
+    mocker.patch('app.get_db', return_value=mock_db)
+
+    response = client.post('/api/lead', json={"name": "L", "email": "l@test.com", "source": "Web"})
+
+    assert response.status_code == 500
+    assert response.get_json() == {"error": "Internal Server Error"}
+
+
+def test_commit_stats_endpoint(client, mocker):
+    mock_db = mocker.MagicMock()
+    mock_db.collection.return_value.document.return_value.id = "lead-1"
+    mocker.patch('app.get_db', return_value=mock_db)
+    client.post('/api/lead', json={"name": "L", "email": "l@test.com", "source": "Web"})
+    client.post('/api/lead', json={"name": "L", "email": "l@test.com", "source": "Web"})
+
+    stats = client.get('/api/commit-stats').get_json()
+
+    assert stats['capture_lead'] == {'requests': 2, 'commits': 2, 'max_commits': 1}
+
+
+def test_commits_outside_the_unit_of_work_are_counted(client, memory_db):
+    memory_db.collection('customers').document('c-1').set({'name': 'Ann', 'email': 'ann@test.com'})
+    memory_db.collection('opportunities').document('o-1').set({'stage': 'Proposal', 'amount': 10})
+
+    deleted = client.delete('/api/customer/c-1')  # its own batch
+    moved = client.put('/api/opportunity/o-1/status', json={'stage': 'Won'})  # a transaction
+    page = client.get('/api/customers')
+
+    assert [r.headers['X-Commit-Count'] for r in (deleted, moved, page)] == ["1", "1", "0"]
+    stats = client.get('/api/commit-stats').get_json()
+    assert stats['delete_customer']['commits'] == 1
+    assert stats['update_opportunity_status']['commits'] == 1
+    assert stats['get_customers'] == {'requests': 1, 'commits': 0, 'max_commits': 0}
+
+
+def test_commit_stats_require_admin(client, mocker):
+    mocker.patch.dict(app.config, {'TESTING': False})
+    with app.app_context():
+        token = create_access_token(identity='user@crm.com', additional_claims={'role': 'User'})
+    client.set_cookie('access_token_cookie', token)
+    assert client.get('/api/commit-stats').status_code == 403
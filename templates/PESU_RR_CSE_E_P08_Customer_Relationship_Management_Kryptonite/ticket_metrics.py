@@ -0,0 +1,141 @@
+"""Vectorized ticket resolution metrics (Epic 6) backed by NumPy."""
+from datetime import datetime, timezone
+
+import numpy as np
+
+PERCENTILES = {'median': 0.5, 'p90': 0.9, 'p99': 0.99}
+TICKET_FIELDS = ('created_at', 'createdAt', 'resolved_at', 'closedAt', 'priority')
+
+
+def epoch_seconds(ts):
+    """Converts Firestore/ISO/datetime timestamps to UTC epoch seconds (or None)."""
+    if ts is None:
+        return None
+    if hasattr(ts, "to_datetime"):
+        try:
+            ts = ts.to_datetime()
+        except Exception:  # pylint: disable=broad-exception-caught
+            return None
+    if isinstance(ts, str):
+        try:
+            ts = datetime.fromisoformat(ts)
+        except ValueError:
+            return None
+    if not isinstance(ts, datetime):
+        return None
+    if ts.tzinfo is None:
+        ts = ts.replace(tzinfo=timezone.utc)
+    return int(ts.timestamp())
+
+
+class TicketArrays:
+    """
+    Closed tickets as parallel int64 arrays: resolution epoch, resolution
+    duration in seconds and a priority code (index into 'priorities').
+    """
+
+    def __init__(self, resolved, durations, priority_codes, priorities):
+        self.resolved = resolved
+        self.durations = durations
+        self.priority_codes = priority_codes
+        self.priorities = priorities
+
+    def __len__(self):
+        return len(self.resolved)
+
+    @classmethod
+    def from_tickets(cls, tickets):
+        """Builds the arrays from ticket dicts, skipping ones without both timestamps."""
+        created, resolved, codes = [], [], []
+        priorities = {}
+        for ticket in tickets:
+            start = epoch_seconds(ticket.get('created_at') or ticket.get('createdAt'))
+            end = epoch_seconds(ticket.get('resolved_at') or ticket.get('closedAt'))
+            if start is None or end is None:
+                continue
+            created.append(start)
+            resolved.append(end)
+            priority = ticket.get('priority', 'Medium')
+            codes.append(priorities.setdefault(priority, len(priorities)))
+
+        resolved = np.asarray(resolved, dtype=np.int64)
+        durations = np.maximum(resolved - np.asarray(created, dtype=np.int64), 0)
+        return cls(resolved, durations, np.asarray(codes, dtype=np.int64), list(priorities))
+
+
+def _segment_stats(keys, durations, n_segments):
+    """
+    Count, mean and percentiles of 'durations' grouped by integer 'keys'
+    (0..n_segments-1) without a Python loop over tickets. Empty segments get 0.
+    """
+    order = np.lexsort((durations, keys))
+    sorted_keys, sorted_durations = keys[order], durations[order].astype(np.float64)
+
+    counts = np.bincount(sorted_keys, minlength=n_segments)
+    sums = np.bincount(sorted_keys, weights=sorted_durations, minlength=n_segments)
+    starts = np.searchsorted(sorted_keys, np.arange(n_segments), side='left')
+
+    stats = {'count': counts}
+    with np.errstate(invalid='ignore', divide='ignore'):
+        stats['mean'] = np.where(counts > 0, sums / np.maximum(counts, 1), 0.0)
+
+    last = np.maximum(counts - 1, 0)
+    for name, q in PERCENTILES.items():
+        if not len(sorted_durations):
+            stats[name] = np.zeros(n_segments)
+            continue
+        # Linear interpolation between the two closest ranks (numpy's default method)
+        position = last * q
+        lower = np.floor(position).astype(np.int64)
+        upper = np.minimum(lower + 1, last)
+        fraction = position - lower
+        lo_idx = np.minimum(starts + lower, len(sorted_durations) - 1)
+        hi_idx = np.minimum(starts + upper, len(sorted_durations) - 1)
+        values = sorted_durations[lo_idx] * (1 - fraction) + sorted_durations[hi_idx] * fraction
+        stats[name] = np.where(counts > 0, values, 0.0)
+    return stats
+
+
+def _as_hours(stats, index):
+    """Picks one segment out of _segment_stats and converts seconds to hours."""
+    summary = {'count': int(stats['count'][index])}
+    for name in ('mean',) + tuple(PERCENTILES):
+        summary[f"{name}_hours"] = round(float(stats[name][index]) / 3600, 2)
+    return summary
+
+
+def bucketed_metrics(arrays, edges):
+    """
+    Resolution statistics per bucket and per priority.
+    'edges' are ascending epoch seconds; bucket i covers [edges[i], edges[i+1]).
+    Tickets resolved outside the edges are ignored.
+    Returns (overall, by_priority, buckets) where buckets is a list of dicts
+    with their own 'by_priority'.
+    """
+    edges = np.asarray(edges, dtype=np.int64)
+    n_buckets = len(edges) - 1
+    n_priorities = len(arrays.priorities)
+
+    bucket = np.searchsorted(edges, arrays.resolved, side='right') - 1
+    inside = (bucket >= 0) & (bucket < n_buckets)
+    bucket, durations, codes = bucket[inside], arrays.durations[inside], arrays.priority_codes[inside]
+
+    overall = _segment_stats(np.zeros(len(durations), dtype=np.int64), durations, 1)
+    per_priority = _segment_stats(codes, durations, max(n_priorities, 1))
+    per_bucket = _segment_stats(bucket, durations, n_buckets)
+    per_cell = _segment_stats(bucket * n_priorities + codes, durations,
+                              max(n_buckets * n_priorities, 1))
+
+    def priorities_of(stats, offset=0):
+        return {
+            priority: _as_hours(stats, offset + code)
+            for code, priority in enumerate(arrays.priorities)
+            if stats['count'][offset + code]
+        }
+
+    buckets = []
+    for index in range(n_buckets):
+        summary = _as_hours(per_bucket, index)
+        summary['by_priority'] = priorities_of(per_cell, index * n_priorities)
+        buckets.append(summary)
+    return _as_hours(overall, 0), priorities_of(per_priority), buckets
@@ -0,0 +1,146 @@
+"""
+Fixed-memory, multi-resolution time series of request latency and throughput.
+
+Every route has one ring buffer per resolution (by default 1 s slots for the
+last 10 minutes, 1 min slots for the last day and 1 h slots for the last 30
+days). A request is added to the current slot of each ring, so the coarser
+series are downsampled as they are written and stay exact for counts, sums
+and maxima. A slot is reused once its period has scrolled out of the ring, so
+memory is allocated once per route and never grows. The series of all routes
+together ('*') also keeps a latency histogram per slot for percentiles.
+
+The series live in the memory of one process; each worker keeps its own.
+"""
+import threading
+import time
+from array import array
+
+from request_metrics import DEFAULT_BUCKETS
+
+ALL_ROUTES = '*'
+# (slot seconds, slots): 10 minutes, 1 day, 30 days
+RESOLUTIONS = ((1, 600), (60, 1440), (3600, 720))
+
+
+class Ring:
+    """`slots` slots of `step` seconds; period n (= t // step) lives in slot n % slots."""
+
+    def __init__(self, step, slots, buckets=()):
+        self.step = step
+        self.slots = slots
+        self.buckets = tuple(buckets)
+        self.period = array('q', [-1]) * slots
+        self.count = array('I', [0]) * slots
+        self.errors = array('I', [0]) * slots
+        self.total = array('d', [0.0]) * slots
+        self.peak = array('d', [0.0]) * slots
+        # per slot: one count per bucket plus +Inf
+        self.histogram = array('I', [0]) * (slots * (len(self.buckets) + 1)) if self.buckets else None
+
+    def add(self, now, seconds, error, bucket=None):
+        period = int(now // self.step)
+        index = period % self.slots
+        if self.period[index] != period:
+            self.period[index] = period
+            self.count[index] = self.errors[index] = 0
+            self.total[index] = self.peak[index] = 0.0
+            if self.histogram is not None:
+                width = len(self.buckets) + 1
+                self.histogram[index * width:(index + 1) * width] = array('I', [0]) * width
+        self.count[index] += 1
+        self.errors[index] += error
+        self.total[index] += seconds
+        if seconds > self.peak[index]:
+            self.peak[index] = seconds
+        if self.histogram is not None:
+            self.histogram[index * (len(self.buckets) + 1) + bucket] += 1
+
+    def _percentile(self, index, fraction):
+        """Latency below which `fraction` of the slot's requests fell (interpolated within a bucket)."""
+        width = len(self.buckets) + 1
+        counts = self.histogram[index * width:(index + 1) * width]
+        rank = fraction * self.count[index]
+        seen, lower = 0, 0.0
+        for position, count in enumerate(counts):
+            if count and seen + count >= rank:
+                upper = self.buckets[position] if position < len(self.buckets) else self.peak[index]
+                upper = min(upper, self.peak[index])
+                return lower + (upper - lower) * (rank - seen) / count
+            seen += count
+            if position < len(self.buckets):
+                lower = self.buckets[position]
+        return self.peak[index]
+
+    def points(self, start, end):
+        """One point per period from `start` to `end` (epoch seconds), oldest first; empty periods are zero."""
+        first = max(int(start // self.step), int(end // self.step) - self.slots + 1)
+        points = []
+        for period in range(first, int(end // self.step) + 1):
+            index = period % self.slots
+            point = {'t': period * self.step, 'count': 0, 'errors': 0, 'avg_ms': None, 'max_ms': None}
+            count = self.count[index] if self.period[index] == period else 0
+            if count:
+                point.update(count=count, errors=self.errors[index],
+                             avg_ms=round(self.total[index] / count * 1000, 3),
+                             max_ms=round(self.peak[index] * 1000, 3))
+                if self.histogram is not None:
+                    for name, fraction in (('p50_ms', 0.5), ('p95_ms', 0.95), ('p99_ms', 0.99)):
+                        point[name] = round(self._percentile(index, fraction) * 1000, 3)
+            points.append(point)
+        return points
+
+
+class TimeSeriesStore:
+    """Per-route rings for every resolution, plus the all-routes series."""
+
+    def __init__(self, resolutions=RESOLUTIONS, buckets=DEFAULT_BUCKETS, clock=time.time):
+        self.resolutions = tuple(sorted(resolutions))
+        self.buckets = tuple(sorted(buckets))
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._rings = {ALL_ROUTES: self._new_rings(self.buckets)}
+
+    def _new_rings(self, buckets=()):
+        return [Ring(step, slots, buckets) for step, slots in self.resolutions]
+
+    def observe(self, route, seconds, error=False):
+        """Adds one request of `seconds` (error: it failed) to the current slots."""
+        now = self._clock()
+        bucket = len(self.buckets)
+        for position, bound in enumerate(self.buckets):
+            if seconds <= bound:
+                bucket = position
+                break
+        with self._lock:
+            rings = self._rings.get(route)
+            if rings is None:
+                rings = self._rings[route] = self._new_rings()
+            for ring in rings:
+                ring.add(now, seconds, bool(error))
+            for ring in self._rings[ALL_ROUTES]:
+                ring.add(now, seconds, bool(error), bucket)
+
+    def routes(self):
+        with self._lock:
+            return sorted(route for route in self._rings if route != ALL_ROUTES)
+
+    def resolution_for(self, window):
+        """The finest slot length whose ring covers `window` seconds (the coarsest if none does)."""
+        for step, slots in self.resolutions:
+            if window <= step * slots:
+                return step
+        return self.resolutions[-1][0]
+
+    def series(self, route=ALL_ROUTES, window=600, step=None):
+        """
+        Points of the last `window` seconds at `step` (chosen from the window
+        when None); KeyError for a route without requests or an unknown step.
+        """
+        step = step or self.resolution_for(window)
+        end = self._clock()
+        with self._lock:
+            rings = self._rings[route]
+            for ring in rings:
+                if ring.step == step:
+                    return ring.points(end - window + step, end)
+        raise KeyError(step)
@@ -0,0 +1,83 @@
+"""Bounded cache of verified JWTs, so a returning token skips signature verification."""
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+
+def token_digest(token):
+    return hashlib.sha256(token.encode('utf-8')).digest()
+
+
+class VerifiedTokenCache:
+    """
+    LRU map of token digest -> decoded claims. An entry lives until the
+    token's `exp` claim, and at most `max_ttl` seconds, so a token is never
+    accepted from the cache after it expired. Only tokens that passed full
+    verification may be stored; the key is a digest of the whole token, so
+    any change to header, claims or signature misses.
+    """
+
+    def __init__(self, max_entries=10000, max_ttl=300.0, clock=time.time):
+        self.max_entries = max_entries
+        self.max_ttl = max_ttl
+        self._clock = clock  # wall clock: `exp` is a Unix timestamp
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = dict.fromkeys(('hits', 'misses', 'evictions', 'expirations'), 0)
+
+    @property
+    def enabled(self):
+        return self.max_entries > 0 and self.max_ttl > 0
+
+    def get(self, token):
+        """The cached claims of `token`, or None when it is not cached (or has expired)."""
+        if not self.enabled:
+            return None
+        key = token_digest(token)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                claims, expires_at = entry
+                if expires_at > self._clock():
+                    self._entries.move_to_end(key)
+                    self._stats['hits'] += 1
+                    return claims
+                del self._entries[key]
+                self._stats['expirations'] += 1
+            self._stats['misses'] += 1
+        return None
+
+    def put(self, token, claims):
+        """Stores the claims of a verified token until its `exp` (capped at max_ttl)."""
+        if not self.enabled:
+            return
+        now = self._clock()
+        expires_at = now + self.max_ttl
+        if claims.get('exp') is not None:
+            expires_at = min(expires_at, float(claims['exp']))
+        if expires_at <= now:
+            return
+        key = token_digest(token)
+        with self._lock:
+            self._entries[key] = (claims, expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self._stats['evictions'] += 1
+
+    def clear(self):
+        """Empties the cache and resets its statistics (e.g. after rotating the signing key)."""
+        with self._lock:
+            self._entries.clear()
+            for name in self._stats:
+                self._stats[name] = 0
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats['size'] = len(self._entries)
+        lookups = stats['hits'] + stats['misses']
+        stats['max_entries'] = self.max_entries
+        stats['hit_ratio'] = round(stats['hits'] / lookups, 4) if lookups else 0.0
+        return stats
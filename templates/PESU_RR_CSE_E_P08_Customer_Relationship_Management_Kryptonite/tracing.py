@@ -0,0 +1,261 @@
+"""
+Request tracing in the OpenTelemetry span model, without the SDK.
+
+A RequestTrace is the root span of one request plus the spans recorded under
+it: datastore round trips (reported by datastore_metrics.OperationRecorder
+after they finish) and open spans such as transactions (`with trace.span()`),
+which become the parents of what runs inside them on the same thread. Spans
+from other threads (bulk import workers) hang off the root span.
+
+TraceExporter keeps the newest traces of this process in memory (for the
+admin waterfall view) and appends each one, on a background thread, to a file
+of OTLP/JSON ExportTraceServiceRequest lines: the format of the OpenTelemetry
+Collector's file exporter, which its otlpjsonfile receiver (and so Jaeger,
+Tempo, ...) can read back.
+"""
+import atexit
+import json
+import logging
+import os
+import queue
+import re
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+# OTLP SpanKind and StatusCode values
+KIND_INTERNAL, KIND_SERVER, KIND_CLIENT = 1, 2, 3
+STATUS_UNSET, STATUS_OK, STATUS_ERROR = 0, 1, 2
+
+_TRACEPARENT = re.compile(r'^00-([0-9a-f]{32})-([0-9a-f]{16})-([0-9a-f]{2})$')
+
+
+def parse_traceparent(header):
+    """W3C traceparent header -> (trace id, parent span id, sampled), or None if absent/invalid."""
+    match = _TRACEPARENT.match((header or '').strip().lower())
+    if not match or match.group(1) == '0' * 32 or match.group(2) == '0' * 16:
+        return None
+    trace_id, span_id, flags = match.groups()
+    return trace_id, span_id, bool(int(flags, 16) & 1)
+
+
+def _new_id(size):
+    return os.urandom(size).hex()
+
+
+class RequestTrace:
+    """The spans of one request; safe to record into from several threads."""
+
+    def __init__(self, name, attributes=None, trace_id=None, parent_span_id=None):
+        self.trace_id = trace_id or _new_id(16)
+        # perf_counter() readings are converted to wall-clock nanoseconds with this offset
+        self._epoch_offset = time.time_ns() - time.perf_counter_ns()
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self.spans = []
+        self.root = self._new_span(name, KIND_SERVER, parent_span_id, time.perf_counter(), attributes)
+
+    def _new_span(self, name, kind, parent_span_id, started, attributes):
+        return {'name': name, 'kind': kind, 'span_id': _new_id(8), 'parent_span_id': parent_span_id,
+                'start': started, 'end': None, 'attributes': dict(attributes or {}), 'status': STATUS_UNSET,
+                'status_message': None}
+
+    def _stack(self):
+        stack = getattr(self._local, 'stack', None)
+        if stack is None:
+            stack = self._local.stack = []
+        return stack
+
+    def _parent_id(self):
+        stack = self._stack()
+        return stack[-1]['span_id'] if stack else self.root['span_id']
+
+    def add_span(self, name, started, ended, attributes=None, kind=KIND_CLIENT, error=None):
+        """Records a finished span (perf_counter() start/end) under the current one."""
+        span = self._new_span(name, kind, self._parent_id(), started, attributes)
+        span['end'] = ended
+        if error is not None:
+            span['status'], span['status_message'] = STATUS_ERROR, repr(error)
+        with self._lock:
+            self.spans.append(span)
+
+    @contextmanager
+    def span(self, name, attributes=None, kind=KIND_INTERNAL):
+        """Open span; spans recorded inside the block on this thread are its children."""
+        span = self._new_span(name, kind, self._parent_id(), time.perf_counter(), attributes)
+        stack = self._stack()
+        stack.append(span)
+        try:
+            yield span['attributes']
+        except BaseException as exc:
+            span['status'], span['status_message'] = STATUS_ERROR, repr(exc)
+            raise
+        finally:
+            stack.pop()
+            span['end'] = time.perf_counter()
+            with self._lock:
+                self.spans.append(span)
+
+    def finish(self, attributes=None, error=None):
+        """Ends the root span; returns all spans, root first, in start order."""
+        self.root['end'] = time.perf_counter()
+        self.root['attributes'].update(attributes or {})
+        if error is not None:
+            self.root['status'], self.root['status_message'] = STATUS_ERROR, repr(error)
+        with self._lock:
+            return [self.root] + sorted(self.spans, key=lambda span: span['start'])
+
+    def unix_nano(self, perf_seconds):
+        return self._epoch_offset + int(perf_seconds * 1e9)
+
+
+def _otlp_value(value):
+    if isinstance(value, bool):
+        return {'boolValue': value}
+    if isinstance(value, int):
+        return {'intValue': str(value)}  # int64 is a string in OTLP/JSON
+    if isinstance(value, float):
+        return {'doubleValue': value}
+    return {'stringValue': str(value)}
+
+
+def _otlp_attributes(attributes):
+    return [{'key': key, 'value': _otlp_value(value)} for key, value in attributes.items() if value is not None]
+
+
+def to_otlp(trace, spans, service_name):
+    """One OTLP/JSON ExportTraceServiceRequest with the spans of a trace."""
+    otlp_spans = []
+    for span in spans:
+        entry = {
+            'traceId': trace.trace_id,
+            'spanId': span['span_id'],
+            'name': span['name'],
+            'kind': span['kind'],
+            'startTimeUnixNano': str(trace.unix_nano(span['start'])),
+            'endTimeUnixNano': str(trace.unix_nano(span['end'])),
+            'attributes': _otlp_attributes(span['attributes']),
+            'status': {'code': span['status']},
+        }
+        if span['parent_span_id']:
+            entry['parentSpanId'] = span['parent_span_id']
+        if span['status_message']:
+            entry['status']['message'] = span['status_message']
+        otlp_spans.append(entry)
+    return {'resourceSpans': [{
+        'resource': {'attributes': _otlp_attributes({'service.name': service_name,
+                                                     'process.pid': os.getpid()})},
+        'scopeSpans': [{'scope': {'name': 'crm.tracing'}, 'spans': otlp_spans}],
+    }]}
+
+
+def summarize(trace, spans):
+    """Short description of a finished trace (for listings)."""
+    root = spans[0]
+    return {'trace_id': trace.trace_id, 'name': root['name'], 'spans': len(spans),
+            'started_at': trace.unix_nano(root['start']) / 1e9,
+            'duration_ms': round((root['end'] - root['start']) * 1000, 3),
+            'status': root['attributes'].get('http.response.status_code')}
+
+
+def waterfall(trace, spans, width=40):
+    """The spans as text: offset and duration in ms, indented name and a bar on a common time axis."""
+    root = spans[0]
+    total = max(root['end'] - root['start'], 1e-9)
+    depth = {root['span_id']: 0}
+    children = {}
+    for span in spans[1:]:
+        children.setdefault(span['parent_span_id'], []).append(span)
+
+    ordered = []
+
+    def visit(span, level):
+        depth[span['span_id']] = level
+        ordered.append(span)
+        for child in children.get(span['span_id'], []):
+            visit(child, level + 1)
+
+    visit(root, 0)
+    # spans whose parent is not in the trace (should not happen) go last
+    ordered += [span for span in spans if span['span_id'] not in depth]
+
+    lines = [f"trace {trace.trace_id}", f"{'start':>9} {'ms':>9}  span"]
+    for span in ordered:
+        offset, duration = span['start'] - root['start'], span['end'] - span['start']
+        first = min(int(offset / total * width), width - 1)
+        bar = ' ' * first + '#' * max(1, round(duration / total * width))
+        label = '  ' * depth.get(span['span_id'], 0) + span['name']
+        if span['status'] == STATUS_ERROR:
+            label += ' !'
+        lines.append(f"{offset * 1000:9.2f} {duration * 1000:9.2f}  {label:<48} |{bar[:width]:<{width}}|")
+    return '\n'.join(lines) + '\n'
+
+
+class TraceExporter:
+    """
+    Keeps the newest `keep` traces of this process and appends every trace to
+    `path` (OTLP/JSON lines; '' keeps them in memory only) from one background
+    thread, started on first use. Rotate the file externally (copytruncate).
+    """
+
+    def __init__(self, path='', service_name='crm-app', keep=200):
+        self.path = path
+        self.service_name = service_name
+        self._recent = deque(maxlen=keep)
+        self._lock = threading.Lock()
+        self._queue = queue.SimpleQueue()
+        self._thread = None
+
+    def export(self, trace, spans):
+        with self._lock:
+            self._recent.append((trace, spans))
+            if self.path and (self._thread is None or not self._thread.is_alive()):
+                self._thread = threading.Thread(target=self._run, name='trace-exporter', daemon=True)
+                self._thread.start()
+                atexit.register(self.close)
+        if self.path:
+            self._queue.put((trace, spans))
+
+    def recent(self):
+        """Summaries of the kept traces, newest first."""
+        with self._lock:
+            kept = list(self._recent)
+        return [summarize(trace, spans) for trace, spans in reversed(kept)]
+
+    def get(self, trace_id):
+        """(trace, spans) of a kept trace; KeyError if it is not (or no longer) kept."""
+        with self._lock:
+            for trace, spans in self._recent:
+                if trace.trace_id == trace_id:
+                    return trace, spans
+        raise KeyError(trace_id)
+
+    def _write(self, batch):
+        with open(self.path, 'a', encoding='utf-8') as f:
+            for trace, spans in batch:
+                f.write(json.dumps(to_otlp(trace, spans, self.service_name), separators=(',', ':')) + '\n')
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            while True:  # write whatever has queued up meanwhile with one open()
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            stop = None in batch
+            try:
+                self._write([item for item in batch if item is not None])
+            except OSError:
+                # tracing must never take the app down; the traces stay in memory
+                logging.getLogger(__name__).warning("Could not write traces to %s", self.path, exc_info=True)
+            if stop:
+                return
+
+    def close(self):
+        """Writes out the queued traces (called at exit)."""
+        thread = self._thread
+        if thread is not None and thread.is_alive():
+            self._queue.put(None)
+            thread.join(timeout=5)
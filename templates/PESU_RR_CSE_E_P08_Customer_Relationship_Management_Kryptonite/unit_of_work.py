@@ -0,0 +1,63 @@
+"""Collects the Firestore writes of one request and commits them as a single batch."""
+
+# Firestore rejects batches with more than 500 writes.
+MAX_BATCH_WRITES = 500
+
+
+class UnitOfWork:
+    """
+    Buffers set/update/delete calls and applies them in one WriteBatch on
+    flush(), so a request makes one round trip and its documents change
+    together or not at all. Callbacks registered with after_commit() run
+    only once the batch has been committed.
+    """
+
+    def __init__(self, db_conn):
+        self._db = db_conn
+        self._writes = []
+        self._callbacks = []
+        self.commits = 0
+
+    def set(self, ref, data, merge=False):
+        kwargs = {'merge': True} if merge else {}
+        self._writes.append(('set', ref, (data,), kwargs))
+
+    def update(self, ref, data, option=None):
+        kwargs = {'option': option} if option is not None else {}
+        self._writes.append(('update', ref, (data,), kwargs))
+
+    def delete(self, ref):
+        self._writes.append(('delete', ref, (), {}))
+
+    def after_commit(self, callback):
+        """Runs 'callback' after the next successful flush (e.g. cache invalidation)."""
+        self._callbacks.append(callback)
+
+    @property
+    def pending(self):
+        return len(self._writes)
+
+    def flush(self):
+        """Commits the buffered writes (if any). Returns the number of writes committed."""
+        writes, callbacks = self._writes, self._callbacks
+        self._writes, self._callbacks = [], []
+        if not writes:
+            return 0
+        if len(writes) > MAX_BATCH_WRITES:
+            raise ValueError(f"Unit of work has {len(writes)} writes; the limit is {MAX_BATCH_WRITES}")
+
+        batch = self._db.batch()
+        for method, ref, args, kwargs in writes:
+            getattr(batch, method)(ref, *args, **kwargs)
+        batch.commit()
+        self.commits += 1
+
+        for callback in callbacks:
+            callback()
+        return len(writes)
+
+    def discard(self):
+        """Drops the buffered writes without committing. Returns how many were dropped."""
+        dropped = len(self._writes)
+        self._writes, self._callbacks = [], []
+        return dropped